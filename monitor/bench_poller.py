@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+轮询引擎离线压测
+在本机启动假 Showroom API (fake_showroom_server.py)，用 StatusPoller 跑若干轮，
+按同一份脚本化的开播/下播事件比较不同轮询模式:
+    status  - 每轮对所有成员发单房间请求（原有模式）
+    onlives - 每轮先拉 onlives 列表，只对状态可能变化的成员发单房间请求
+    adaptive - AdaptivePollScheduler 按开播规律分级检查（生产默认 ADAPTIVE_POLLING=True），
+               开播历史按脚本合成: --history-hit 比例的开播成员在当前时段有规律（hot），
+               其余成员部分近期开过播（warm），剩下的休眠（dormant）；间隔按 --interval / 5 缩放
+
+输出每种模式的每轮请求数与开播/下播检测延迟
+客户端分别绑定 127.0.0.2、127.0.0.3 ... 模拟多出口 IP（Linux 下 127/8 全部可用）
+
+限流场景: --throttle 让假服务器对指定来源 IP 返回 429 / 非 JSON 页面，
+--pool 启用 IPPoolManager，对比被限流 IP 分到的流量与检测延迟
+
+端到端: 检测结果经 DBWritePipeline 写入本地假 sink（--db-sink stub，按 --db-latency-ms 模拟提交耗时），
+统计「脚本化开播 → LIVE_STATUS 提交」延迟、每 IP 请求速率（平均 / 峰值）、事件循环滞后与写入队列深度；
+--members 可以给多个规模（逗号分隔），一次跑完 277 / 500 / 1000 的扩容回归
+
+使用示例:
+    python bench_poller.py --members 277 --rounds 24 --interval 5 --events 20
+    python bench_poller.py --mode onlives --interval 2 --rounds 10
+    python bench_poller.py --mode adaptive --rounds 36 --history-hit 0.3
+    python bench_poller.py --mode status --pool both --throttle 127.0.0.3:429:0.9,127.0.0.4:html:1 --throttle-until 30
+    python bench_poller.py --mode status --pool on --members 277,500,1000 --rounds 12 --db-latency-ms 40
+"""
+
+import sys
+import time
+import random
+import asyncio
+import argparse
+import threading
+
+import httpx
+
+from datetime import datetime, timedelta
+
+from showroom_api import HttpxFetcher, OnlivesDiscovery
+from status_poller import StatusPoller
+from poll_scheduler import AdaptivePollScheduler
+from ip_pool import IPPoolManager
+from db_write_pipeline import DBWritePipeline
+from fake_showroom_server import FakeShowroomServer
+
+MODES = ('status', 'onlives', 'adaptive')
+HISTORY_DAYS = 60
+
+
+def make_members(count: int) -> list:
+    """生成与 fake_showroom_server.make_rooms 对应的假成员"""
+    return [{
+        'id': f"bench_{i:04d}",
+        'room_id': 100000 + i,
+        'room_url_key': f"48_Bench_{i:04d}",
+        'name_en': f"Bench {i:04d}",
+    } for i in range(count)]
+
+
+def make_clients(ip_count: int, timeout: float = 10) -> list:
+    """创建绑定不同本地地址的客户端（对应生产环境里的多出口 IP）"""
+    clients = []
+    for i in range(ip_count):
+        ip = f"127.0.0.{i + 2}"
+        client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(local_address=ip), timeout=timeout)
+        client._bound_ip = ip
+        clients.append(client)
+    return clients
+
+
+def parse_throttle(spec: str) -> dict:
+    """解析 --throttle: "127.0.0.3:429:0.9,127.0.0.4:html:1" → 假服务器的 ip_rules"""
+    rules = {}
+    for item in filter(None, (spec or "").split(",")):
+        parts = item.split(":")
+        ip, mode = parts[0], parts[1]
+        ratio = float(parts[2]) if len(parts) > 2 else 1.0
+        if mode == "slow":
+            rules[ip] = {"extra_latency_ms": ratio}
+        else:
+            rules[ip] = {"mode": mode, "ratio": ratio}
+    return rules
+
+
+def make_script(members: list, rounds: int, interval: float, events: int,
+                initial_live: int, seed: int) -> tuple:
+    """
+    生成脚本化事件（两种模式共用同一份，保证可比）
+    返回: (initial_live_ids, [(offset_seconds, member, is_live), ...])
+    """
+    rng = random.Random(seed)
+    duration = rounds * interval
+    pool = list(members)
+    rng.shuffle(pool)
+
+    initial = pool[:initial_live]
+    candidates = pool[initial_live:]
+
+    script = []
+    # 第一轮用来建立基线，最后两轮留给检测收尾
+    first, last = interval * 1.5, max(interval * 1.5, duration - interval * 2)
+    for member in candidates[:events]:
+        start = rng.uniform(first, last)
+        script.append((start, member, True))
+        # 一半的直播在压测结束前下播
+        if rng.random() < 0.5:
+            end = start + rng.uniform(interval * 2, max(interval * 2, duration - start - interval * 2))
+            if end < duration - interval * 2:
+                script.append((end, member, False))
+    script.sort(key=lambda e: e[0])
+    return [m['id'] for m in initial], script
+
+
+def make_history(members: list, script: list, hit_ratio: float, seed: int, now: float = None) -> list:
+    """
+    合成开播历史 [(member_id, started_at)]（对应 SHOWROOM_LIVE_HISTORY）:
+        脚本里开播的成员按 hit_ratio 抽取，过去 HISTORY_DAYS 天每天在当前时段开播 → hot
+        其余成员约三成 3 天前开过一次（时段与现在错开）→ warm，其它没有记录 → dormant
+    """
+    rng = random.Random(seed)
+    now = datetime.fromtimestamp(now if now is not None else time.time())
+    starters = {member['id'] for _, member, is_live in script if is_live}
+    rows = []
+    for member in members:
+        if member['id'] in starters:
+            if rng.random() < hit_ratio:
+                rows += [(member['id'], now - timedelta(days=d)) for d in range(1, HISTORY_DAYS + 1)]
+        elif rng.random() < 0.3:
+            rows.append((member['id'], now - timedelta(days=3, hours=6)))
+    return rows
+
+
+def make_scheduler(members: list, script: list, args) -> AdaptivePollScheduler:
+    """与 monitor_showroom 相同的分级参数（config 默认值），按 --interval / 5 缩放到压测的时间尺度"""
+    scale = args.interval / 5
+    scheduler = AdaptivePollScheduler(
+        live_interval=5 * scale, hot_interval=5 * scale, warm_interval=15 * scale,
+        dormant_min_interval=30 * scale, dormant_max_interval=60 * scale, max_latency=60 * scale,
+        cooldown_seconds=600 * scale,
+    )
+    scheduler.sync_members(members)
+    scheduler.load_history(make_history(members, script, args.history_hit, args.seed), HISTORY_DAYS)
+    return scheduler
+
+
+class StubLiveStatusSink:
+    """
+    DBWritePipeline 的假写入端：按配置的耗时「提交」一批记录，并记下每条记录的提交时间
+    （代替 OracleLiveStatusSink 的 executemany + commit，在管道的执行器线程里调用）
+    """
+
+    def __init__(self, commit_latency_ms: float = 20, per_row_ms: float = 0.05):
+        self.commit_latency_ms = commit_latency_ms
+        self.per_row_ms = per_row_ms
+        self.commits = []            # [(member_id, is_live, 提交时间)]
+        self._lock = threading.Lock()
+
+    def write_batch(self, records: list):
+        time.sleep((self.commit_latency_ms + self.per_row_ms * len(records)) / 1000)
+        committed_at = time.time()
+        with self._lock:
+            self.commits.extend((r['member_id'], bool(r['is_live_flag']), committed_at) for r in records)
+
+
+def commit_latencies(events: list, commits: list) -> dict:
+    """
+    每个脚本事件到第一次提交对应状态的延迟
+    events: [(事件时间, member_id, is_live)]；commits: [(member_id, is_live, 提交时间)]
+    """
+    by_key = {}
+    for member_id, is_live, committed_at in commits:
+        by_key.setdefault((member_id, is_live), []).append(committed_at)
+    result = {True: [], False: []}
+    for event_time, member_id, is_live in events:
+        times = by_key.get((member_id, is_live), ())
+        first = next((t for t in sorted(times) if t >= event_time), None)
+        if first is not None:
+            result[is_live].append(first - event_time)
+    return result
+
+
+async def watch_loop(pipeline, stop: asyncio.Event, tick: float = 0.05) -> dict:
+    """采样事件循环滞后（sleep 实际超出的时间）与写入队列深度"""
+    loop = asyncio.get_running_loop()
+    lags, depths = [], []
+    while not stop.is_set():
+        before = loop.time()
+        await asyncio.sleep(tick)
+        lags.append(loop.time() - before - tick)
+        if pipeline:
+            depths.append(pipeline.qsize())
+    return {'lags': lags, 'depths': depths}
+
+
+def ip_rates(server: FakeShowroomServer, duration: float) -> dict:
+    """{ip: (平均请求/秒, 峰值请求/秒)}"""
+    peaks = {}
+    for (ip, _), count in server.requests_by_ip_second.items():
+        peaks[ip] = max(peaks.get(ip, 0), count)
+    return {ip: (round(total / duration, 1) if duration else 0.0, peaks.get(ip, 0))
+            for ip, total in sorted(server.requests_by_ip.items())}
+
+
+def percentile(samples: list, q: float):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(q * len(samples)))], 2)
+
+
+async def run_mode(mode: str, use_pool: bool, server: FakeShowroomServer, members: list,
+                   initial_live: list, script: list, args) -> dict:
+    """用指定模式跑完整个脚本，返回统计结果"""
+    for m in members:
+        server.set_live(m['room_url_key'], m['id'] in initial_live)
+    throttle_rules = parse_throttle(args.throttle)
+    for ip, rule in throttle_rules.items():
+        server.set_ip_rule(ip, rule)
+    server.reset_stats()
+
+    pending = {}        # {(member_id, is_live): 事件发生时间}
+    latencies = {True: [], False: []}
+    events = []         # [(事件时间, member_id, is_live)]，用于计算提交延迟
+
+    sink = pipeline = None
+    if args.db_sink == 'stub':
+        sink = StubLiveStatusSink(args.db_latency_ms)
+        pipeline = DBWritePipeline(sink, max_batch=args.db_batch, max_delay=args.db_delay,
+                                   maxsize=args.db_queue, name="Bench-DB")
+        await pipeline.start()
+
+    async def on_status(member, is_live_flag, started_at):
+        key = (member['id'], bool(is_live_flag))
+        event_time = pending.pop(key, None)
+        if event_time is not None:
+            latencies[bool(is_live_flag)].append(time.time() - event_time)
+        if pipeline:
+            # 与 monitor_showroom.save_to_db 相同：每个检测结果都入队（队列满时反压到轮询端）
+            await pipeline.put({'member_id': member['id'], 'room_id': member['room_id'],
+                                'is_live_flag': is_live_flag, 'started_at': started_at})
+
+    clients = make_clients(args.ips)
+    discovery = OnlivesDiscovery(args.interval, args.verify_interval) if mode == 'onlives' else None
+    scheduler = make_scheduler(members, script, args) if mode == 'adaptive' else None
+    ip_pool = None
+    if use_pool:
+        # 压测时长较短，隔离时长按轮询周期缩放
+        ip_pool = IPPoolManager(clients, rate_per_second=args.ip_rate, burst=args.ip_rate * 2,
+                                quarantine_seconds=args.interval * 2, max_quarantine_seconds=args.interval * 8)
+    poller = StatusPoller(clients, on_status, request_interval=args.interval,
+                          fetcher=HttpxFetcher(server.base_url), discovery=discovery, ip_pool=ip_pool,
+                          scheduler=scheduler)
+
+    bench_start = time.time()
+
+    async def play_script():
+        for offset, member, is_live_flag in script:
+            await asyncio.sleep(max(0.0, bench_start + offset - time.time()))
+            now = time.time()
+            server.set_live(member['room_url_key'], is_live_flag, now)
+            pending[(member['id'], is_live_flag)] = now
+            events.append((now, member['id'], is_live_flag))
+
+    async def lift_throttle():
+        # 限流解除后，被隔离的 IP 应在探测成功后重新分到流量
+        await asyncio.sleep(args.throttle_until)
+        for ip in throttle_rules:
+            server.set_ip_rule(ip, None)
+
+    script_task = asyncio.create_task(play_script())
+    lift_task = asyncio.create_task(lift_throttle()) if throttle_rules and args.throttle_until else None
+    watch_stop = asyncio.Event()
+    watch_task = asyncio.create_task(watch_loop(pipeline, watch_stop))
+    per_round = []
+    round_times = []
+    try:
+        for r in range(args.rounds):
+            round_start = bench_start + r * args.interval
+            await asyncio.sleep(max(0.0, round_start - time.time()))
+            await poller.run_round(members, round_start)
+            round_times.append(time.time() - round_start)
+            per_round.append(poller.last_round['status_requests'] + poller.last_round['onlives_requests'])
+    finally:
+        duration = time.time() - bench_start
+        script_task.cancel()
+        if lift_task:
+            lift_task.cancel()
+        if pipeline:
+            await pipeline.stop()
+        watch_stop.set()
+        watch = await watch_task
+        for ip in throttle_rules:
+            server.set_ip_rule(ip, None)
+        for client in clients:
+            await client.aclose()
+
+    committed = commit_latencies(events, sink.commits) if sink else {True: [], False: []}
+    pipeline_stats = pipeline.stats_snapshot() if pipeline else None
+
+    # 第一轮是基线（所有成员都要确认一次），不计入稳态请求数
+    steady = per_round[1:] or per_round
+    return {
+        'mode': f"{mode}+pool" if use_pool else mode,
+        'members': len(members),
+        'throttled_ips': sorted(throttle_rules),
+        'rounds': len(per_round),
+        'requests_total': sum(per_round),
+        'requests_first_round': per_round[0] if per_round else 0,
+        'requests_per_round': round(sum(steady) / len(steady), 1) if steady else 0,
+        'requests_by_ip': dict(sorted(server.requests_by_ip.items())),
+        'throttled_by_ip': dict(sorted(server.throttled_by_ip.items())),
+        'pool': ip_pool.stats_snapshot() if ip_pool else None,
+        'tiers': scheduler.stats_snapshot() if scheduler else None,
+        'start_events': sum(1 for e in script if e[2]),
+        'end_events': sum(1 for e in script if not e[2]),
+        'start_detected': len(latencies[True]),
+        'end_detected': len(latencies[False]),
+        'start_p50': percentile(latencies[True], 0.5),
+        'start_p90': percentile(latencies[True], 0.9),
+        'start_max': percentile(latencies[True], 1.0),
+        'end_p50': percentile(latencies[False], 0.5),
+        'end_p90': percentile(latencies[False], 0.9),
+        'commit_detected': len(committed[True]),
+        'commit_p50': percentile(committed[True], 0.5),
+        'commit_p90': percentile(committed[True], 0.9),
+        'commit_max': percentile(committed[True], 1.0),
+        'commit_end_p50': percentile(committed[False], 0.5),
+        'round_p50': percentile(round_times, 0.5),
+        'round_max': percentile(round_times, 1.0),
+        'ip_rates': ip_rates(server, duration),
+        'loop_lag_p50': _ms(percentile(watch['lags'], 0.5)),
+        'loop_lag_p99': _ms(percentile(watch['lags'], 0.99)),
+        'loop_lag_max': _ms(max(watch['lags'], default=None)),
+        'queue_p99': percentile(watch['depths'], 0.99),
+        'queue_max': pipeline_stats['max_depth'] if pipeline_stats else None,
+        'pipeline': pipeline_stats,
+        'errors': poller.stats['errors'],
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def print_report(results: list):
+    print("\n" + "=" * 78)
+    print(f"{'成员':>5} {'模式':<12} {'首轮请求':>8} {'稳态请求/轮':>11} {'开播检测':>9} "
+          f"{'开播p50':>8} {'开播p90':>8} {'开播max':>8} {'下播检测':>9} {'下播p50':>8}")
+    print("-" * 78)
+    for r in results:
+        print(f"{r['members']:>5} {r['mode']:<12} {r['requests_first_round']:>8} {r['requests_per_round']:>11} "
+              f"{r['start_detected']:>4}/{r['start_events']:<4} "
+              f"{str(r['start_p50']):>8} {str(r['start_p90']):>8} {str(r['start_max']):>8} "
+              f"{r['end_detected']:>4}/{r['end_events']:<4} {str(r['end_p50']):>8}")
+    print("=" * 78)
+    if any(r['pipeline'] for r in results):
+        print(f"{'成员':>5} {'模式':<12} {'提交':>9} {'提交p50':>8} {'提交p90':>8} {'提交max':>8} "
+              f"{'下播提交p50':>11} {'轮耗时p50':>9} {'循环滞后p99/max(ms)':>20} {'队列p99/max':>12}")
+        print("-" * 78)
+        for r in results:
+            if not r['pipeline']:
+                continue
+            print(f"{r['members']:>5} {r['mode']:<12} {r['commit_detected']:>4}/{r['start_events']:<4} "
+                  f"{str(r['commit_p50']):>8} {str(r['commit_p90']):>8} {str(r['commit_max']):>8} "
+                  f"{str(r['commit_end_p50']):>11} {str(r['round_p50']):>9} "
+                  f"{str(r['loop_lag_p99']) + '/' + str(r['loop_lag_max']):>20} "
+                  f"{str(r['queue_p99']) + '/' + str(r['queue_max']):>12}")
+        print("=" * 78)
+    for r in results:
+        print(f"[{r['members']} {r['mode']}] 各 IP 请求数: {r['requests_by_ip']}  代码级异常: {r['errors']}")
+        print(f"[{r['members']} {r['mode']}] 各 IP 请求速率 (平均/峰值 次/秒): {r['ip_rates']}")
+        if r['pipeline']:
+            p = r['pipeline']
+            print(f"[{r['members']} {r['mode']}] 写入管道: 提交 {p['committed']} 行 / {p['batches']} 批, "
+                  f"合并 {p['coalesced']}, 反压 {p['backpressure_waits']}, 入队→提交 p99={p['commit_p99']}s")
+        if r['tiers']:
+            for tier, t in r['tiers'].items():
+                print(f"   {tier:<7} 成员 {t['members']:>4} | 间隔 {t['interval']}s | 检查 {t['polls']} 次 "
+                      f"(最大间隔 {t['max_gap']}s)")
+        if r['throttled_by_ip']:
+            print(f"[{r['mode']}] 被限流响应数: {r['throttled_by_ip']}")
+            print(f"[{r['mode']}] 限流 IP 流量占比: {throttled_share(r):.1%} "
+                  f"(均分时为 {len(r['throttled_ips']) / max(1, len(r['requests_by_ip'])):.1%})")
+        if r['pool']:
+            for ip, s in r['pool'].items():
+                print(f"   {ip}: {s['state']:<11} 成功率 {s['success_rate']} p50={s['latency_p50']}s "
+                      f"p99={s['latency_p99']}s 隔离 {s['quarantine_count']} 次 累计 {s['totals']}")
+
+
+def throttled_share(result: dict) -> float:
+    total = sum(result['requests_by_ip'].values())
+    throttled = sum(result['requests_by_ip'].get(ip, 0) for ip in result['throttled_ips'])
+    return throttled / total if total else 0.0
+
+
+async def main_async(args):
+    sizes = [int(x) for x in str(args.members).split(",") if x.strip()]
+    all_members = make_members(max(sizes))
+    rooms = {m['room_url_key']: m['room_id'] for m in all_members}
+    server = FakeShowroomServer(rooms, latency_median_ms=args.latency_ms).start()
+
+    modes = MODES if args.mode == 'all' else (args.mode,)
+    pool_options = {'off': (False,), 'on': (True,), 'both': (False, True)}[args.pool]
+
+    results = []
+    try:
+        for size in sizes:
+            members = all_members[:size]
+            initial_live, script = make_script(members, args.rounds, args.interval,
+                                               args.events, args.initial_live, args.seed)
+            print(f"🚀 压测: {size} 个成员, {args.ips} 个 IP, {args.rounds} 轮 × {args.interval}s, "
+                  f"{len(script)} 个脚本事件, 写入端 {args.db_sink}, 服务器 {server.base_url}")
+            for mode in modes:
+                for use_pool in pool_options:
+                    print(f"▶️ 运行模式: {mode}{' + IP池' if use_pool else ''}")
+                    results.append(await run_mode(mode, use_pool, server, members, initial_live, script, args))
+    finally:
+        server.stop()
+
+    print_report(results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='直播状态轮询引擎离线压测')
+    parser.add_argument('--mode', choices=MODES + ('all',), default='all')
+    parser.add_argument('--members', default='277', help='成员数量，逗号分隔可依次跑多个规模（如 277,500,1000）')
+    parser.add_argument('--ips', type=int, default=4, help='模拟出口 IP 数量')
+    parser.add_argument('--rounds', type=int, default=24, help='每种模式的轮数')
+    parser.add_argument('--interval', type=float, default=5, help='每轮时长（秒）')
+    parser.add_argument('--events', type=int, default=20, help='脚本化开播事件数')
+    parser.add_argument('--initial-live', type=int, default=5, help='开始时已在直播的成员数')
+    parser.add_argument('--verify-interval', type=float, default=60, help='onlives 模式的单房间校验周期（秒）')
+    parser.add_argument('--history-hit', type=float, default=0.5,
+                        help='adaptive 模式: 脚本开播成员中在当前时段有开播规律（hot）的比例')
+    parser.add_argument('--latency-ms', type=float, default=30, help='假服务器响应延迟中位数（毫秒）')
+    parser.add_argument('--seed', type=int, default=48)
+    parser.add_argument('--pool', choices=('off', 'on', 'both'), default='off', help='是否启用 IPPoolManager')
+    parser.add_argument('--ip-rate', type=float, default=20, help='IP 池单 IP 令牌桶速率（请求/秒）')
+    parser.add_argument('--throttle', default='',
+                        help='限流规则 ip:模式:比例，模式为 429 / html / slow(比例处填额外毫秒)，逗号分隔')
+    parser.add_argument('--throttle-until', type=float, default=0, help='多少秒后解除限流（0 表示不解除）')
+    parser.add_argument('--db-sink', choices=('stub', 'off'), default='stub', help='检测结果是否经写入管道写入假 sink')
+    parser.add_argument('--db-latency-ms', type=float, default=20, help='假 sink 每批提交耗时（毫秒）')
+    parser.add_argument('--db-batch', type=int, default=300, help='写入管道每批最多行数')
+    parser.add_argument('--db-delay', type=float, default=0.25, help='写入管道攒批最长等待（秒）')
+    parser.add_argument('--db-queue', type=int, default=1000, help='写入管道队列上限')
+    args = parser.parse_args()
+
+    if args.ips > 250:
+        sys.exit("❌ --ips 最多 250 个")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
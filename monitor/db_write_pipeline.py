@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+asyncio 原生的数据库批量写入管道
+供 monitor_showroom.py 调用：替代「线程 + queue.Queue 忙轮询」的写入线程
+
+    生产者 (StatusPoller 回调) --await put()--> asyncio.Queue (有界，满了就反压)
+        --> 微批次 (满 max_batch 行或距第一条 max_delay 秒即刷新，按 member_id 合并)
+        --> 单线程执行器里调用 sink.write_batch(records)（阻塞的 cx_Oracle executemany + commit）
+
+sink 接口:
+    open()                   在写入线程里建立连接（可选）
+    write_batch(records)     写入并提交一批记录，失败时抛出异常（管道会保留记录并重试）
+    close()                  释放连接（可选）
+
+本模块不依赖 config.py / 数据库，bench_poller.py 可以接一个假 sink 做压测
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_STOP = object()
+
+
+class DBWritePipeline:
+    """有界队列 + 时间/行数双上限的微批次写入"""
+
+    def __init__(self, sink, max_batch: int = 300, max_delay: float = 0.25,
+                 maxsize: int = 1000, retry_delay: float = 5.0, name: str = "DB-Pipeline"):
+        """
+        参数:
+            sink: 写入端（见模块说明）
+            max_batch: 一批最多多少行（合并后）
+            max_delay: 一批从第一条入队起最多等待多久（秒）
+            maxsize: 队列上限，满了以后 put() 会等待（反压到轮询端）
+            retry_delay: 写入失败后多久重试（秒）
+            name: 日志与执行器线程名
+        """
+        self.sink = sink
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.maxsize = maxsize
+        self.retry_delay = retry_delay
+        self.name = name
+
+        self._queue = None
+        self._task = None
+        self._get_task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._retry = {}            # 写入失败、等待重试的记录 {member_id: (enqueued_at, record)}
+
+        # 指标
+        self.commit_latencies = deque(maxlen=2000)   # 入队 → 提交（秒）
+        self.batch_sizes = deque(maxlen=500)
+        self.stats = {
+            'enqueued': 0,
+            'committed': 0,
+            'coalesced': 0,
+            'batches': 0,
+            'failures': 0,
+            'backpressure_waits': 0,
+            'max_depth': 0,
+        }
+
+    # ========================= 生命周期 =========================
+
+    async def start(self):
+        """在写入线程里打开 sink，并启动消费协程"""
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        if hasattr(self.sink, 'open'):
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.sink.open)
+        self._task = asyncio.create_task(self._run(), name=self.name)
+        logging.info(f"[{self.name}] 🚀 写入管道启动 (每批 ≤{self.max_batch} 行 / ≤{self.max_delay * 1000:.0f}ms, 队列上限 {self.maxsize})")
+
+    async def stop(self, timeout: float = 30):
+        """写完队列里剩余的记录后停止"""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"[{self.name}] ⚠️ 停止超时，仍有 {self._queue.qsize()} 条未写入")
+            self._task.cancel()
+        if hasattr(self.sink, 'close'):
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.sink.close)
+        self._executor.shutdown(wait=True)
+        self._task = None
+        logging.info(f"[{self.name}] 写入管道已停止")
+
+    # ========================= 生产端 =========================
+
+    async def put(self, record: dict):
+        """入队一条记录；队列满时等待（反压），而不是丢弃或阻塞事件循环"""
+        if self._queue.full():
+            self.stats['backpressure_waits'] += 1
+        await self._queue.put((time.time(), record))
+        self.stats['enqueued'] += 1
+        depth = self._queue.qsize()
+        if depth > self.stats['max_depth']:
+            self.stats['max_depth'] = depth
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    # ========================= 消费端 =========================
+
+    async def _next_item(self, timeout):
+        """
+        取下一条记录，超时返回 None
+        get() 任务超时后不取消而是留到下次继续等，避免取消竞争导致记录丢失
+        """
+        if self._get_task is None:
+            self._get_task = asyncio.ensure_future(self._queue.get())
+        done, _ = await asyncio.wait({self._get_task}, timeout=timeout)
+        if not done:
+            return None
+        item = self._get_task.result()
+        self._get_task = None
+        return item
+
+    def _coalesce(self, pending: dict, enqueued_at: float, record: dict):
+        """
+        按 member_id 合并：保留最新状态，但沿用最早一条的 prev_is_live 和入队时间，
+        这样批次内「未开播 → 开播 → 开播」仍会被识别为一次开播
+        """
+        member_id = record['member_id']
+        earlier = pending.get(member_id)
+        if earlier is not None:
+            first_enqueued, first_record = earlier
+            record = dict(record, prev_is_live=first_record.get('prev_is_live', False))
+            enqueued_at = first_enqueued
+            self.stats['coalesced'] += 1
+        pending[member_id] = (enqueued_at, record)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        # 停止后仍有待重试的记录时继续重试，直到 stop() 超时
+        while not stopping or self._retry:
+            pending = dict(self._retry)
+            self._retry = {}
+
+            # 1. 等第一条（有待重试记录时不等）
+            if not stopping:
+                item = await self._next_item(0 if pending else None)
+                if item is _STOP:
+                    stopping = True
+                elif item is not None:
+                    self._coalesce(pending, *item)
+
+            # 2. 攒批：满 max_batch 行或到 max_delay 即刷新
+            deadline = loop.time() + self.max_delay
+            while not stopping and len(pending) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                item = await self._next_item(remaining)
+                if item is None:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                self._coalesce(pending, *item)
+
+            # 3. 停止时把队列里剩下的也一起写掉
+            while stopping and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not _STOP:
+                    self._coalesce(pending, *item)
+
+            if pending:
+                await self._flush(loop, pending)
+
+    async def _flush(self, loop, pending: dict):
+        records = [record for _, record in pending.values()]
+        try:
+            await loop.run_in_executor(self._executor, self.sink.write_batch, records)
+        except Exception as e:
+            self.stats['failures'] += 1
+            logging.error(f"[{self.name}] 批量写入失败 ({len(records)} 行)，{self.retry_delay:.0f} 秒后重试: {e}")
+            # 保留记录，下一批与新记录合并后重试；失败期间队列会逐渐填满，形成反压
+            self._retry = pending
+            await asyncio.sleep(self.retry_delay)
+            return
+
+        committed_at = time.time()
+        for enqueued_at, _ in pending.values():
+            self.commit_latencies.append(committed_at - enqueued_at)
+        self.batch_sizes.append(len(records))
+        self.stats['committed'] += len(records)
+        self.stats['batches'] += 1
+
+    # ========================= 指标 =========================
+
+    def stats_snapshot(self) -> dict:
+        latencies = sorted(self.commit_latencies)
+        sizes = sorted(self.batch_sizes)
+        return dict(
+            self.stats,
+            depth=self.qsize(),
+            retry_pending=len(self._retry),
+            commit_p50=_percentile(latencies, 0.5),
+            commit_p99=_percentile(latencies, 0.99),
+            commit_max=round(latencies[-1], 3) if latencies else None,
+            batch_p50=sizes[len(sizes) // 2] if sizes else None,
+            batch_max=sizes[-1] if sizes else None,
+        )
+
+    def log_stats(self):
+        s = self.stats_snapshot()
+        logging.info(
+            f"📊 [{self.name}] 入队 {s['enqueued']} | 提交 {s['committed']} 行 / {s['batches']} 批 "
+            f"(批大小 p50={s['batch_p50']} max={s['batch_max']}) | 合并 {s['coalesced']} | "
+            f"入队→提交 p50={s['commit_p50']}s p99={s['commit_p99']}s | "
+            f"队列 {s['depth']} (峰值 {s['max_depth']}) | 失败 {s['failures']} | 反压 {s['backpressure_waits']}"
+        )
+
+
+def _percentile(sorted_samples: list, q: float):
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, int(q * len(sorted_samples)))
+    return round(sorted_samples[index], 3)
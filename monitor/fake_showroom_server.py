@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+本地假 Showroom API 服务器（离线压测/调试用）
+只依赖标准库，实现 monitor 用到的两个接口:
+    GET /api/room/status?room_url_key=...
+    GET /api/live/onlives
+
+支持:
+    - 可配置的响应延迟分布（对数正态）
+    - 按来源 IP 的限流模拟（429 / 非 JSON 页面 / 额外延迟），
+      客户端绑定 127.0.0.x 不同地址即可模拟多出口 IP
+    - 运行时切换房间直播状态（脚本化开播/下播事件）
+    - 按来源 IP / 接口统计请求数
+
+使用示例:
+    python fake_showroom_server.py --port 18080 --rooms 300
+"""
+
+import time
+import json
+import random
+import asyncio
+import argparse
+import threading
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+
+
+class FakeShowroomServer:
+    """在独立线程的事件循环中运行的假 Showroom API"""
+
+    def __init__(self, rooms: dict, host: str = "127.0.0.1", port: int = 0,
+                 latency_median_ms: float = 30, latency_sigma: float = 0.5,
+                 ip_rules: dict = None):
+        """
+        参数:
+            rooms: {room_url_key: room_id}
+            latency_median_ms / latency_sigma: 响应延迟的对数正态分布参数
+            ip_rules: 按来源 IP 的限流规则，例如
+                {"127.0.0.3": {"mode": "429", "ratio": 0.8},
+                 "127.0.0.4": {"mode": "html", "ratio": 1.0},
+                 "127.0.0.5": {"extra_latency_ms": 400}}
+        """
+        self.host = host
+        self.port = port
+        self.latency_median_ms = latency_median_ms
+        self.latency_sigma = latency_sigma
+        self.ip_rules = dict(ip_rules or {})
+
+        self._lock = threading.Lock()
+        self._rooms = {key: {'room_id': room_id, 'is_live': False, 'started_at': None}
+                       for key, room_id in rooms.items()}
+
+        self.requests_by_ip = Counter()
+        self.requests_by_ip_second = Counter()     # {(ip, 整数秒): 请求数}，用于统计每 IP 峰值速率
+        self.requests_by_path = Counter()
+        self.throttled_by_ip = Counter()
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    # ========================= 状态控制 =========================
+
+    def set_live(self, room_url_key: str, is_live: bool, started_at: float = None):
+        """切换房间直播状态（线程安全）"""
+        with self._lock:
+            room = self._rooms[room_url_key]
+            room['is_live'] = is_live
+            room['started_at'] = int(started_at or time.time()) if is_live else None
+
+    def set_ip_rule(self, ip: str, rule: dict = None):
+        """运行时修改某个来源 IP 的限流规则，rule 为 None 时解除"""
+        with self._lock:
+            if rule:
+                self.ip_rules[ip] = rule
+            else:
+                self.ip_rules.pop(ip, None)
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests_by_ip.clear()
+            self.requests_by_ip_second.clear()
+            self.requests_by_path.clear()
+            self.throttled_by_ip.clear()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # ========================= 请求处理 =========================
+
+    def _route(self, path: str, query: dict):
+        with self._lock:
+            if path == "/api/room/status":
+                key = (query.get("room_url_key") or [""])[0]
+                room = self._rooms.get(key)
+                if room is None:
+                    return 404, {"errors": [{"message": "not found"}]}
+                body = {"room_id": room['room_id'], "room_url_key": key, "is_live": room['is_live']}
+                if room['is_live']:
+                    body["started_at"] = room['started_at']
+                return 200, body
+
+            if path == "/api/live/onlives":
+                lives = [{"room_id": r['room_id'], "room_url_key": key, "started_at": r['started_at']}
+                         for key, r in self._rooms.items() if r['is_live']]
+                return 200, {"onlives": [{"genre_id": 0, "genre_name": "Idol", "lives": lives}]}
+
+        return 404, {"errors": [{"message": "not found"}]}
+
+    async def _handle(self, reader, writer):
+        peer_ip = (writer.get_extra_info("peername") or ("?",))[0]
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                # 读完请求头（GET 没有请求体）
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+
+                try:
+                    _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    break
+                parts = urlsplit(target)
+
+                with self._lock:
+                    self.requests_by_ip[peer_ip] += 1
+                    self.requests_by_ip_second[(peer_ip, int(time.time()))] += 1
+                    self.requests_by_path[parts.path] += 1
+                    rule = dict(self.ip_rules.get(peer_ip) or {})
+
+                delay = random.lognormvariate(0, self.latency_sigma) * self.latency_median_ms
+                delay += rule.get("extra_latency_ms", 0)
+                await asyncio.sleep(delay / 1000.0)
+
+                mode = rule.get("mode")
+                if mode and random.random() < rule.get("ratio", 1.0):
+                    with self._lock:
+                        self.throttled_by_ip[peer_ip] += 1
+                    if mode == "429":
+                        status, payload, ctype = 429, b'{"errors":[{"message":"Too Many Requests"}]}', "application/json"
+                    else:
+                        status, payload, ctype = 200, b"<html><body>Access denied</body></html>", "text/html"
+                else:
+                    status, body = self._route(parts.path, parse_qs(parts.query))
+                    payload, ctype = json.dumps(body).encode(), "application/json"
+
+                reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests"}.get(status, "OK")
+                writer.write(
+                    f"HTTP/1.1 {status} {reason}\r\n"
+                    f"Content-Type: {ctype}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    # ========================= 生命周期 =========================
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+
+        async def _start():
+            self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+            self.port = self._server.sockets[0].getsockname()[1]
+
+        self._loop.run_until_complete(_start())
+        self._ready.set()
+        self._loop.run_forever()
+
+        self._server.close()
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()
+
+    def start(self):
+        """在后台线程启动服务器，返回后 base_url 即可使用"""
+        self._thread = threading.Thread(target=self._run, name="FakeShowroom", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=10)
+        return self
+
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+def make_rooms(count: int) -> dict:
+    """生成 count 个假房间 {room_url_key: room_id}"""
+    return {f"48_Bench_{i:04d}": 100000 + i for i in range(count)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地假 Showroom API 服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--rooms', type=int, default=300, help='房间数量')
+    parser.add_argument('--live', type=int, default=10, help='初始直播中的房间数量')
+    parser.add_argument('--latency-ms', type=float, default=30, help='响应延迟中位数（毫秒）')
+    args = parser.parse_args()
+
+    rooms = make_rooms(args.rooms)
+    server = FakeShowroomServer(rooms, host=args.host, port=args.port, latency_median_ms=args.latency_ms).start()
+    for key in random.sample(list(rooms), min(args.live, len(rooms))):
+        server.set_live(key, True)
+
+    print(f"假 Showroom API 已启动: {server.base_url} ({args.rooms} 个房间, {args.live} 个直播中)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"请求统计: {dict(server.requests_by_path)}")
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+检测器成员分片：一致性哈希环 + 租约式交接
+供 monitor_showroom.py 调用：多台检测器按 ADMIN.INSTANCES 中存活的实例分摊成员
+
+    - 每个实例在环上放 vnodes 个虚拟节点，成员按 member_id 的哈希落到顺时针第一个节点
+    - 实例加入/退出时只有约 1/N 的成员换主，其余成员不动
+    - 交接：失去的成员继续轮询 handoff_grace 秒（租约未到期）后才放手，
+      新主在发现环变化时立即开始轮询，两边至少重叠一个刷新周期，期间不会有成员无人轮询
+
+本模块不依赖 config.py / 数据库
+"""
+
+import bisect
+import hashlib
+import logging
+
+
+def _hash(key: str) -> int:
+    """64 位稳定哈希（不能用内置 hash()，它在每个进程里都不同）"""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """带虚拟节点的一致性哈希环"""
+
+    def __init__(self, nodes=(), vnodes: int = 128):
+        self.vnodes = vnodes
+        self.nodes = tuple(sorted(set(nodes)))
+        points = []
+        for node in self.nodes:
+            for i in range(vnodes):
+                points.append((_hash(f"{node}#{i}"), node))
+        points.sort()
+        self._keys = [p[0] for p in points]
+        self._owners = [p[1] for p in points]
+
+    def node_for(self, key: str):
+        """key 所属的节点；环为空时返回 None"""
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._owners[index]
+
+    def assign(self, keys) -> dict:
+        """{node: [key, ...]}"""
+        result = {node: [] for node in self.nodes}
+        for key in keys:
+            node = self.node_for(key)
+            if node is not None:
+                result[node].append(key)
+        return result
+
+
+class ShardCoordinator:
+    """
+    维护本实例负责的成员集合
+        owned:    当前环上属于本实例的成员
+        draining: 已经不属于本实例、但租约未到期仍继续轮询的成员 {member_id: 到期时间}
+    """
+
+    def __init__(self, instance_id: str, vnodes: int = 128, handoff_grace: float = 30):
+        self.instance_id = instance_id
+        self.vnodes = vnodes
+        self.handoff_grace = handoff_grace
+        self.ring = HashRing([instance_id], vnodes)
+        self.owned = set()
+        self.draining = {}
+        self.stats = {'rebalances': 0, 'gained': 0, 'released': 0}
+
+    def update(self, active_instances, member_ids, now: float) -> bool:
+        """
+        用最新的存活实例列表与成员列表重算分片
+        本实例总是被视为存活（心跳写入失败时也不能把自己的成员全部放掉）
+        返回: 本实例负责的成员是否发生变化
+        """
+        nodes = set(active_instances) | {self.instance_id}
+        if tuple(sorted(nodes)) != self.ring.nodes:
+            old_nodes = self.ring.nodes
+            self.ring = HashRing(nodes, self.vnodes)
+            self.stats['rebalances'] += 1
+            logging.info(f"🔀 [分片] 检测器集合变化: {list(old_nodes)} → {list(self.ring.nodes)}")
+
+        new_owned = {m for m in member_ids if self.ring.node_for(m) == self.instance_id}
+        gained = new_owned - self.owned
+        released = self.owned - new_owned
+
+        for member_id in gained:
+            self.draining.pop(member_id, None)
+        for member_id in released:
+            # 已删除的成员不需要交接
+            if member_id in member_ids:
+                self.draining[member_id] = now + self.handoff_grace
+
+        expired = [m for m, until in self.draining.items() if until <= now or m not in member_ids]
+        for member_id in expired:
+            del self.draining[member_id]
+
+        self.owned = new_owned
+        if gained or released:
+            self.stats['gained'] += len(gained)
+            self.stats['released'] += len(released)
+            logging.info(
+                f"🔀 [分片] {self.instance_id} 负责 {len(self.owned)} 个成员 "
+                f"(+{len(gained)} / -{len(released)}，交接中 {len(self.draining)})"
+            )
+        return bool(gained or released or expired)
+
+    def polled_ids(self) -> set:
+        """本实例应当轮询的成员（负责的 + 交接中的）"""
+        return self.owned | set(self.draining)
+
+
+if __name__ == "__main__":
+    # 自检：增减一台检测器时换主的成员比例应接近 1/N，且分布大致均衡
+    members = [f"member_{i:04d}" for i in range(1000)]
+    nodes = ["monitor-1", "monitor-2", "monitor-3"]
+    before = HashRing(nodes)
+    for label, changed in (("加入 monitor-4", nodes + ["monitor-4"]), ("移除 monitor-3", nodes[:2])):
+        after = HashRing(changed)
+        moved = sum(1 for m in members if before.node_for(m) != after.node_for(m))
+        sizes = {node: len(keys) for node, keys in after.assign(members).items()}
+        print(f"{label}: 换主 {moved}/{len(members)} ({moved / len(members):.1%}) | 分布 {sizes}")
+
+    # 交接：移除实例后，新主立即接手，旧主在 handoff_grace 内继续轮询
+    coord = ShardCoordinator("monitor-1", handoff_grace=30)
+    coord.update(nodes, members, now=0)
+    owned_before = set(coord.owned)
+    coord.update(nodes + ["monitor-4"], members, now=10)
+    assert coord.polled_ids() >= owned_before, "交接期内不应放掉任何成员"
+    coord.update(nodes + ["monitor-4"], members, now=45)
+    assert coord.polled_ids() == coord.owned and not coord.draining
+    print(f"交接自检通过: {len(owned_before)} → {len(coord.owned)} 个成员，统计 {coord.stats}")
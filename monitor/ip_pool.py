@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+出口 IP 池管理
+供 status_poller.py 调用：替代「每轮随机打乱 IP 列表」的盲目分配
+
+功能:
+    - 每个 IP 的滑动窗口健康统计：成功率、p50/p99 延迟、429 / 非 JSON / 网络错误次数
+    - 每个 IP 一个令牌桶，限制单 IP 请求速率
+    - 连续失败或成功率过低时自动隔离，隔离到期后先放行单个探测请求，
+      探测成功才重新启用（多次隔离时隔离时长指数增长）
+    - 按权重选择 IP：成功率高、延迟低、当前空闲的 IP 更容易被选中
+
+本模块不依赖 config.py，参数全部由调用方传入
+"""
+
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+
+# IP 状态
+HEALTHY = 'healthy'
+QUARANTINED = 'quarantined'
+PROBING = 'probing'
+
+# 单次请求结果分类
+RESULT_OK = 'ok'
+RESULT_THROTTLED = 'throttled'         # HTTP 429
+RESULT_INVALID_JSON = 'invalid_json'   # 200 但不是 JSON（通常是限流页面）
+RESULT_HTTP_ERROR = 'http_error'       # 其它非 200
+RESULT_NETWORK_ERROR = 'network_error' # 超时 / 连接失败
+
+
+def classify_result(status_code, valid: bool) -> str:
+    """根据状态码和响应是否可用，归类一次请求的结果"""
+    if status_code is None:
+        return RESULT_NETWORK_ERROR
+    if status_code == 429:
+        return RESULT_THROTTLED
+    if status_code != 200:
+        return RESULT_HTTP_ERROR
+    return RESULT_OK if valid else RESULT_INVALID_JSON
+
+
+class _IPState:
+    """单个出口 IP 的运行时状态"""
+
+    def __init__(self, ip: str, client, burst: float, now: float):
+        self.ip = ip
+        self.client = client
+        self.state = HEALTHY
+        self.samples = deque()      # [(ts, result, latency)]
+        self.tokens = burst
+        self.token_time = now
+        self.inflight = 0
+        self.consecutive_failures = 0
+        self.quarantined_until = 0.0
+        self.quarantine_seconds = 0.0
+        self.quarantine_count = 0
+        self.probe_successes = 0
+        self.totals = {
+            'requests': 0,
+            RESULT_OK: 0,
+            RESULT_THROTTLED: 0,
+            RESULT_INVALID_JSON: 0,
+            RESULT_HTTP_ERROR: 0,
+            RESULT_NETWORK_ERROR: 0,
+        }
+
+
+class IPPoolManager:
+    """带健康检查与限速的出口 IP 客户端池"""
+
+    def __init__(self, clients: list,
+                 rate_per_second: float = 3.0,
+                 burst: float = 5.0,
+                 window_seconds: float = 300,
+                 min_samples: int = 10,
+                 min_success_rate: float = 0.6,
+                 max_consecutive_failures: int = 5,
+                 quarantine_seconds: float = 60,
+                 max_quarantine_seconds: float = 900,
+                 probe_successes: int = 2,
+                 latency_floor: float = 0.05):
+        """
+        参数:
+            clients: httpx.AsyncClient 列表（带 _bound_ip 属性时用它作为 IP 名）
+            rate_per_second / burst: 单 IP 令牌桶的速率与容量
+            window_seconds: 健康统计的滑动窗口（秒）
+            min_samples: 窗口内样本少于该数量时不按成功率隔离
+            min_success_rate: 窗口成功率低于该值时隔离
+            max_consecutive_failures: 连续失败达到该次数时立即隔离
+            quarantine_seconds / max_quarantine_seconds: 首次隔离时长与上限（每次翻倍）
+            probe_successes: 探测期内需要连续成功的次数
+            latency_floor: 计算权重时延迟的下限（秒），避免极小延迟导致权重失衡
+        """
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.min_success_rate = min_success_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.quarantine_seconds = quarantine_seconds
+        self.max_quarantine_seconds = max_quarantine_seconds
+        self.probe_successes = probe_successes
+        self.latency_floor = latency_floor
+
+        now = time.monotonic()
+        self._ips = []
+        self._by_client = {}
+        for i, client in enumerate(clients):
+            ip = getattr(client, '_bound_ip', None) or f"client-{i}"
+            ip_state = _IPState(ip, client, burst, now)
+            self._ips.append(ip_state)
+            self._by_client[id(client)] = ip_state
+
+    def __len__(self):
+        return len(self._ips)
+
+    # ========================= 选择 =========================
+
+    def _refill(self, s: _IPState, now: float):
+        s.tokens = min(self.burst, s.tokens + (now - s.token_time) * self.rate_per_second)
+        s.token_time = now
+
+    def _prune(self, s: _IPState, now: float):
+        cutoff = now - self.window_seconds
+        while s.samples and s.samples[0][0] < cutoff:
+            s.samples.popleft()
+
+    def _weight(self, s: _IPState) -> float:
+        """成功率越高、p50 延迟越低、在途请求越少，权重越大"""
+        n = len(s.samples)
+        ok = sum(1 for _, result, _ in s.samples if result == RESULT_OK)
+        # 拉普拉斯平滑：新 IP 没有样本时按成功率 1 处理
+        success_rate = (ok + 1) / (n + 1)
+        latencies = sorted(lat for _, result, lat in s.samples if result == RESULT_OK)
+        p50 = latencies[len(latencies) // 2] if latencies else self.latency_floor
+        return (success_rate ** 2) / max(p50, self.latency_floor) / (1 + s.inflight)
+
+    def _candidates(self, now: float) -> list:
+        candidates = []
+        for s in self._ips:
+            if s.state == QUARANTINED and now >= s.quarantined_until:
+                s.state = PROBING
+                s.probe_successes = 0
+                logging.info(f"🔎 [IP池] {s.ip} 隔离到期，进入探测")
+            if s.state == QUARANTINED:
+                continue
+            # 探测期同一时间只放行一个请求
+            if s.state == PROBING and s.inflight > 0:
+                continue
+            self._refill(s, now)
+            if s.tokens >= 1:
+                candidates.append(s)
+        return candidates
+
+    def _pick(self, now: float):
+        candidates = self._candidates(now)
+        if not candidates:
+            return None
+
+        # 探测中的 IP 优先放行，尽快得出是否恢复的结论
+        probing = [s for s in candidates if s.state == PROBING]
+        if probing:
+            return probing[0]
+
+        for s in candidates:
+            self._prune(s, now)
+        weights = [self._weight(s) for s in candidates]
+        return random.choices(candidates, weights=weights, k=1)[0]
+
+    async def acquire(self):
+        """
+        选出一个客户端（必要时等待令牌），用完必须调用 release()
+        所有 IP 都被隔离时，提前释放最早到期的那个，保证请求不会被完全卡死
+        """
+        while True:
+            now = time.monotonic()
+            s = self._pick(now)
+            if s is not None:
+                s.tokens -= 1
+                s.inflight += 1
+                return s.client
+
+            active = [x for x in self._ips if x.state != QUARANTINED]
+            if not active:
+                earliest = min(self._ips, key=lambda x: x.quarantined_until)
+                logging.warning(f"⚠️ [IP池] 所有 IP 均被隔离，提前探测 {earliest.ip}")
+                earliest.quarantined_until = now
+                continue
+
+            # 等到最早一个令牌可用（或探测请求结束）
+            waits = [(1 - x.tokens) / self.rate_per_second for x in active if x.tokens < 1]
+            await asyncio.sleep(min(max(min(waits, default=0.05), 0.01), 1.0))
+
+    def release(self, client, latency: float, status_code, valid: bool = True):
+        """登记一次请求的结果（acquire 之后必须调用，异常时 status_code 传 None）"""
+        s = self._by_client.get(id(client))
+        if s is None:
+            return
+        now = time.monotonic()
+        s.inflight = max(0, s.inflight - 1)
+
+        result = classify_result(status_code, valid)
+        s.samples.append((now, result, latency))
+        s.totals['requests'] += 1
+        s.totals[result] += 1
+        self._prune(s, now)
+
+        if result == RESULT_OK:
+            s.consecutive_failures = 0
+            if s.state == PROBING:
+                s.probe_successes += 1
+                if s.probe_successes >= self.probe_successes:
+                    self._readmit(s)
+            return
+
+        s.consecutive_failures += 1
+        if s.state == PROBING:
+            self._quarantine(s, now, f"探测失败 ({result})")
+            return
+
+        if s.consecutive_failures >= self.max_consecutive_failures:
+            self._quarantine(s, now, f"连续失败 {s.consecutive_failures} 次 ({result})")
+            return
+
+        if len(s.samples) >= self.min_samples:
+            ok = sum(1 for _, r, _ in s.samples if r == RESULT_OK)
+            success_rate = ok / len(s.samples)
+            if success_rate < self.min_success_rate:
+                self._quarantine(s, now, f"成功率 {success_rate:.0%}")
+
+    def _quarantine(self, s: _IPState, now: float, reason: str):
+        if s.quarantine_seconds:
+            s.quarantine_seconds = min(s.quarantine_seconds * 2, self.max_quarantine_seconds)
+        else:
+            s.quarantine_seconds = self.quarantine_seconds
+        s.state = QUARANTINED
+        s.quarantined_until = now + s.quarantine_seconds
+        s.quarantine_count += 1
+        s.consecutive_failures = 0
+        logging.warning(f"🚫 [IP池] 隔离 {s.ip} {s.quarantine_seconds:.0f} 秒: {reason}")
+
+    def _readmit(self, s: _IPState):
+        s.state = HEALTHY
+        # 清空窗口，避免隔离前的失败样本让它立刻再次被隔离
+        s.samples.clear()
+        # 恢复后再次出问题时从一半的时长重新开始翻倍
+        s.quarantine_seconds = s.quarantine_seconds / 2 if s.quarantine_seconds > self.quarantine_seconds else 0
+        logging.info(f"✅ [IP池] {s.ip} 探测成功，重新启用")
+
+    # ========================= 指标 =========================
+
+    def stats_snapshot(self) -> dict:
+        """每个 IP 的状态、窗口内成功率/延迟与累计错误分类"""
+        now = time.monotonic()
+        snapshot = {}
+        for s in self._ips:
+            self._prune(s, now)
+            self._refill(s, now)
+            n = len(s.samples)
+            ok = sum(1 for _, r, _ in s.samples if r == RESULT_OK)
+            latencies = sorted(lat for _, r, lat in s.samples if r == RESULT_OK)
+            snapshot[s.ip] = {
+                'state': s.state,
+                'window_requests': n,
+                'success_rate': round(ok / n, 3) if n else None,
+                'latency_p50': _percentile(latencies, 0.5),
+                'latency_p99': _percentile(latencies, 0.99),
+                'window_throttled': sum(1 for _, r, _ in s.samples if r == RESULT_THROTTLED),
+                'window_invalid_json': sum(1 for _, r, _ in s.samples if r == RESULT_INVALID_JSON),
+                'tokens': round(s.tokens, 2),
+                'inflight': s.inflight,
+                'weight': round(self._weight(s), 2),
+                'quarantine_count': s.quarantine_count,
+                'quarantine_remaining': round(max(0.0, s.quarantined_until - now), 1) if s.state == QUARANTINED else 0,
+                'totals': dict(s.totals),
+            }
+        return snapshot
+
+    def log_stats(self):
+        snapshot = self.stats_snapshot()
+        states = {HEALTHY: 0, QUARANTINED: 0, PROBING: 0}
+        for s in snapshot.values():
+            states[s['state']] += 1
+        logging.info(
+            f"📊 [IP池] 健康 {states[HEALTHY]} | 隔离 {states[QUARANTINED]} | 探测 {states[PROBING]} "
+            f"(共 {len(snapshot)} 个 IP)"
+        )
+        for ip, s in snapshot.items():
+            if s['state'] != HEALTHY or (s['success_rate'] is not None and s['success_rate'] < 0.9):
+                logging.info(
+                    f"   {ip}: {s['state']} | 成功率 {s['success_rate']} | "
+                    f"p50={s['latency_p50']}s p99={s['latency_p99']}s | "
+                    f"429={s['window_throttled']} 非JSON={s['window_invalid_json']} | "
+                    f"剩余隔离 {s['quarantine_remaining']}s"
+                )
+
+
+def _percentile(sorted_samples: list, q: float):
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, int(q * len(sorted_samples)))
+    return round(sorted_samples[index], 3)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+LIVE_STATUS 差分写入模块
+供 monitor_showroom.py 的数据库写入线程调用：
+只有 IS_LIVE / STARTED_AT / ROOM_ID 发生变化的成员才执行 MERGE，
+未变化成员的 CHECK_TIME 由低频批量心跳统一刷新
+"""
+
+import time
+import logging
+
+
+class LiveStatusDeltaTracker:
+    """记录每个成员最后一次成功写入 LIVE_STATUS 的内容，用于过滤无变化的行"""
+
+    def __init__(self, heartbeat_interval: float = 60, enabled: bool = True):
+        """
+        参数:
+            heartbeat_interval: 未变化成员刷新 CHECK_TIME 的间隔（秒）
+            enabled: False 时退化为原来的全量写入模式
+        """
+        self.enabled = enabled
+        self.heartbeat_interval = heartbeat_interval
+        # 格式: { member_id: (room_id, is_live, started_at) }
+        self._last_written = {}
+        # 自上次心跳以来被跳过、等待刷新 CHECK_TIME 的成员
+        self._pending_heartbeat = set()
+        self._last_heartbeat = time.time()
+        # 周期计数器（由 pop_stats 取走并清零）与累计计数器
+        self._period = {'written': 0, 'skipped': 0, 'heartbeat': 0}
+        self.totals = {'written': 0, 'skipped': 0, 'heartbeat': 0}
+
+    @staticmethod
+    def _row_key(row: dict):
+        return (row['room_id'], bool(row['is_live_flag']), row['started_at'])
+
+    def split(self, rows: list):
+        """
+        将一批状态拆分为 (需要 MERGE 的行, 可以跳过的行)
+        注意：只做判断，不修改快照，快照在 commit() 中更新
+        """
+        if not self.enabled:
+            return list(rows), []
+
+        changed, unchanged = [], []
+        for row in rows:
+            if self._last_written.get(row['member_id']) == self._row_key(row):
+                unchanged.append(row)
+            else:
+                changed.append(row)
+        return changed, unchanged
+
+    def heartbeat_due(self, now: float = None) -> bool:
+        """是否到了刷新未变化成员 CHECK_TIME 的时间"""
+        if not self.enabled or not self._pending_heartbeat:
+            return False
+        now = now if now is not None else time.time()
+        return now - self._last_heartbeat >= self.heartbeat_interval
+
+    def pending_heartbeat_ids(self) -> list:
+        """返回待刷新 CHECK_TIME 的成员ID列表（不清空，提交成功后再调用 commit）"""
+        return sorted(self._pending_heartbeat)
+
+    def commit(self, changed_rows: list, unchanged_rows: list, heartbeat_ids: list = None):
+        """
+        数据库提交成功后调用：更新快照与计数器
+        提交失败时不要调用，这样下一轮会重新 MERGE
+        """
+        for row in changed_rows:
+            self._last_written[row['member_id']] = self._row_key(row)
+            self._pending_heartbeat.discard(row['member_id'])
+
+        if self.enabled:
+            for row in unchanged_rows:
+                self._pending_heartbeat.add(row['member_id'])
+
+        if heartbeat_ids:
+            self._pending_heartbeat.difference_update(heartbeat_ids)
+            self._last_heartbeat = time.time()
+
+        for key, count in (('written', len(changed_rows)),
+                           ('skipped', len(unchanged_rows)),
+                           ('heartbeat', len(heartbeat_ids or []))):
+            self._period[key] += count
+            self.totals[key] += count
+
+    def invalidate(self, member_ids=None):
+        """
+        丢弃快照，强制下一轮重新 MERGE
+        参数:
+            member_ids: 指定成员；None 表示全部（例如重连后无法确认 DB 状态）
+        """
+        if member_ids is None:
+            self._last_written.clear()
+            self._pending_heartbeat.clear()
+            return
+        for member_id in member_ids:
+            self._last_written.pop(member_id, None)
+            self._pending_heartbeat.discard(member_id)
+
+    def pop_stats(self) -> dict:
+        """取出本周期的计数（写入/跳过/心跳）并清零"""
+        stats = dict(self._period)
+        for key in self._period:
+            self._period[key] = 0
+        return stats
+
+    def saved_ratio(self) -> float:
+        """累计跳过的 MERGE 行占比"""
+        total = self.totals['written'] + self.totals['skipped']
+        return self.totals['skipped'] / total if total else 0.0
+
+    def log_summary(self, period_seconds: float):
+        """输出周期汇总日志，无任何写入时保持安静"""
+        stats = self.pop_stats()
+        if not any(stats.values()):
+            return
+        logging.info(
+            f"✅ [周期汇总] 过去 {period_seconds:.0f} 秒: MERGE {stats['written']} 条 | "
+            f"跳过 {stats['skipped']} 条 | 心跳 {stats['heartbeat']} 条 | "
+            f"累计节省 {self.saved_ratio() * 100:.1f}%"
+        )
@@ -2,165 +2,347 @@
 """
 负载均衡器模块
 供 monitor_showroom.py 调用，在发现新直播时分配录制器
+（批量接口由独立的分配管道调用，不阻塞直播状态写入）
+选择哪台录制器由 placement_policy.PlacementPolicy 决定（容量 / 心跳 / 资源指标 / 粘性）
 """
 
+import time
 import logging
 import cx_Oracle
 from datetime import datetime
 
+from placement_policy import PlacementPolicy, make_node
+
 
 class LoadBalancer:
-    """负载均衡器：将新直播分配给负载最小的录制器"""
+    """负载均衡器：按放置策略将新直播分配给最合适的录制器"""
     
-    def __init__(self, db_connection):
+    def __init__(self, db_connection, snapshot_ttl: float = 30, policy: PlacementPolicy = None):
         """
         初始化负载均衡器
         
         参数:
             db_connection: 数据库连接对象
+            snapshot_ttl: 录制器负载快照的有效期（秒），过期后重新从数据库读取
+                （其它检测器实例也会写 MEMBER_INSTANCES，本地计数只在有效期内可信）
+            policy: 放置策略，默认 PlacementPolicy()（resource 模式 + 粘性放置）
         """
         self.conn = db_connection
+        self.snapshot_ttl = snapshot_ttl
+        self.policy = policy or PlacementPolicy()
+        self._member_db_ids = {}    # {member_id: ADMIN.MEMBERS.ID}
+        self._nodes = {}            # {recorder_id: make_node()}，load 在分配/清除时增量维护
+        self._assigned = {}         # {member_db_id: recorder_id}
+        self._metrics_available = True
+        self._snapshot_time = 0.0
     
-    def assign_recorder(self, member_id: str) -> str:
+    # ========================= 缓存 =========================
+    
+    def _refresh_member_ids(self, cursor):
+        """一次性读取所有成员的数据库ID（成员表很小，全量读取比逐个查询更省往返）"""
+        cursor.execute("SELECT MEMBER_ID, ID FROM ADMIN.MEMBERS")
+        self._member_db_ids = {member_id: db_id for member_id, db_id in cursor.fetchall()}
+    
+    def _resolve_member_ids(self, cursor, member_ids):
+        """member_id → ADMIN.MEMBERS.ID，缓存未命中时整体刷新一次"""
+        if any(m not in self._member_db_ids for m in member_ids):
+            self._refresh_member_ids(cursor)
+        resolved = {}
+        for member_id in member_ids:
+            member_db_id = self._member_db_ids.get(member_id)
+            if member_db_id is None:
+                logging.error(f"未找到成员: {member_id}")
+            else:
+                resolved[member_id] = member_db_id
+        return resolved
+    
+    def _refresh_snapshot(self, cursor):
+        """读取所有可用录制器（容量、心跳、资源指标）与现有分配，重建负载计数"""
+        now = time.time()
+        # 心跳年龄在数据库里算，避免数据库与本机时区/时钟不一致
+        cursor.execute("""
+            SELECT 
+                INSTANCE_ID,
+                MAX_CAPACITY,
+                (CAST(SYSTIMESTAMP AS DATE) - CAST(LAST_HEARTBEAT AS DATE)) * 86400 AS HEARTBEAT_AGE
+            FROM ADMIN.INSTANCES
+            WHERE INSTANCE_TYPE = 'recorder'
+              AND STATUS = 'active'
+        """)
+        nodes = {}
+        for instance_id, max_capacity, heartbeat_age in cursor.fetchall():
+            nodes[instance_id] = make_node(
+                instance_id,
+                max_capacity=max_capacity,
+                last_heartbeat=now - float(heartbeat_age) if heartbeat_age is not None else None,
+            )
+        
+        cursor.execute("""
+            SELECT MEMBER_ID, INSTANCE_ID
+            FROM ADMIN.MEMBER_INSTANCES
+            WHERE INSTANCE_TYPE = 'recorder'
+              AND ENABLED = 1
+        """)
+        assigned = {}
+        for member_db_id, recorder_id in cursor.fetchall():
+            assigned[member_db_id] = recorder_id
+            if recorder_id in nodes:
+                nodes[recorder_id]['load'] += 1
+        
+        if self.policy.mode == 'resource' and self._metrics_available:
+            self._load_metrics(cursor, nodes, now)
+        
+        self._nodes = nodes
+        self._assigned = assigned
+        self._snapshot_time = now
+    
+    def _load_metrics(self, cursor, nodes, now):
+        """读取录制器上报的资源指标（表不存在时只按容量放置）"""
+        try:
+            cursor.execute("""
+                SELECT 
+                    INSTANCE_ID,
+                    WRITE_BYTES_PER_SEC,
+                    NET_RECV_BYTES_PER_SEC,
+                    DISK_FREE_BYTES,
+                    LOAD_AVG_1M,
+                    CPU_COUNT,
+                    (CAST(SYSTIMESTAMP AS DATE) - CAST(REPORTED_AT AS DATE)) * 86400 AS REPORT_AGE
+                FROM ADMIN.INSTANCE_METRICS
+            """)
+        except cx_Oracle.DatabaseError as e:
+            self._metrics_available = False
+            logging.warning(f"读取 ADMIN.INSTANCE_METRICS 失败，放置时不使用资源指标: {e}")
+            return
+        
+        for instance_id, write_bps, recv_bps, disk_free, load_avg, cpu_count, report_age in cursor.fetchall():
+            node = nodes.get(instance_id)
+            if node is None:
+                continue
+            node['metrics'] = {
+                'write_bytes_per_sec': write_bps,
+                'net_recv_bytes_per_sec': recv_bps,
+                'disk_free_bytes': disk_free,
+                'load_avg': load_avg,
+                'cpu_count': cpu_count,
+                'reported_at': now - float(report_age) if report_age is not None else None,
+            }
+    
+    def _confirm_assigned(self, cursor, member_db_ids):
         """
-        为直播成员分配录制器
+        快照里已有分配的成员，一次查询确认 MEMBER_INSTANCES 里的记录是否还在:
+        {member_db_id: recorder_id}（快照期间可能已被其它检测器 / 分片交接 / manage_instances 清除）
+        """
+        member_db_ids = list(member_db_ids)
+        confirmed = {}
+        # Oracle 的 IN 列表最多 1000 项，分批绑定（通常一批就够）
+        for start in range(0, len(member_db_ids), 500):
+            chunk = member_db_ids[start:start + 500]
+            binds = {f"m{i}": member_db_id for i, member_db_id in enumerate(chunk)}
+            placeholders = ", ".join(f":{name}" for name in binds)
+            cursor.execute(f"""
+                SELECT MEMBER_ID, INSTANCE_ID
+                FROM ADMIN.MEMBER_INSTANCES
+                WHERE INSTANCE_TYPE = 'recorder'
+                  AND ENABLED = 1
+                  AND MEMBER_ID IN ({placeholders})
+            """, binds)
+            for member_db_id, recorder_id in cursor.fetchall():
+                confirmed[member_db_id] = recorder_id
+        return confirmed
+    
+    def invalidate(self):
+        """丢弃负载快照（例如分配冲突或重连后），下次分配时重新读取"""
+        self._snapshot_time = 0.0
+    
+    def _pick_recorder(self, member_db_id):
+        """按放置策略选择录制器，返回 (recorder_id, 原因)；没有可用录制器时 recorder_id 为 None"""
+        return self.policy.choose(list(self._nodes.values()), previous=self.policy.previous(member_db_id))
+    
+    # ========================= 批量接口 =========================
+    
+    def assign_recorders(self, member_ids: list) -> dict:
+        """
+        为一批新开播成员分配录制器：一次负载快照 + 一次 executemany INSERT + 一次提交
+        选录制器之前先用一次查询确认这批成员在 MEMBER_INSTANCES 里的现状
+        （快照有效期内可能已被其它实例 / 人工分配或清除）
         
         参数:
-            member_id: 成员ID (字符串，如 'okabe_rin')
+            member_ids: 成员ID列表 (字符串，如 ['okabe_rin', ...])
         
         返回:
-            分配的录制器实例ID (如 'recorder-a')，失败返回 None
+            {member_id: recorder_id}，未能分配的成员不在结果中
         """
+        if not member_ids:
+            return {}
+        
+        cursor = self.conn.cursor()
         try:
-            cursor = self.conn.cursor()
-            
-            # 1. 获取成员的数据库ID
-            cursor.execute("""
-                SELECT ID FROM ADMIN.MEMBERS WHERE MEMBER_ID = :member_id
-            """, {'member_id': member_id})
-            
-            result = cursor.fetchone()
-            if not result:
-                logging.error(f"未找到成员: {member_id}")
-                cursor.close()
-                return None
-            
-            member_db_id = result[0]
-            
-            # 2. 检查是否已经分配（避免重复分配）
-            cursor.execute("""
-                SELECT INSTANCE_ID 
-                FROM ADMIN.MEMBER_INSTANCES
-                WHERE MEMBER_ID = :member_id
-                  AND INSTANCE_TYPE = 'recorder'
-                  AND ENABLED = 1
-            """, {'member_id': member_db_id})
-            
-            existing = cursor.fetchone()
-            if existing:
-                # 已经分配过了，直接返回
-                recorder_id = existing[0]
-                logging.debug(f"{member_id} 已分配给 {recorder_id}")
-                cursor.close()
-                return recorder_id
-            
-            # 3. 查询所有可用录制器及其当前负载
-            cursor.execute("""
-                SELECT 
-                    i.INSTANCE_ID,
-                    COUNT(mi.ID) as load_count
-                FROM ADMIN.INSTANCES i
-                LEFT JOIN ADMIN.MEMBER_INSTANCES mi 
-                    ON i.INSTANCE_ID = mi.INSTANCE_ID 
-                    AND mi.INSTANCE_TYPE = 'recorder'
-                    AND mi.ENABLED = 1
-                WHERE i.INSTANCE_TYPE = 'recorder'
-                  AND i.STATUS = 'active'
-                GROUP BY i.INSTANCE_ID
-                ORDER BY load_count ASC
-            """)
-            
-            recorders = cursor.fetchall()
+            if time.time() - self._snapshot_time > self.snapshot_ttl:
+                self._refresh_snapshot(cursor)
             
-            if not recorders:
+            if not self._nodes:
                 logging.error("没有可用的录制器实例！")
-                cursor.close()
-                return None
+                return {}
             
-            # 4. 选择负载最小的录制器
-            recorder_id = recorders[0][0]
-            current_load = recorders[0][1]
+            resolved = self._resolve_member_ids(cursor, member_ids)
             
-            # 5. 写入分配
-            cursor.execute("""
-                INSERT INTO ADMIN.MEMBER_INSTANCES (
-                    MEMBER_ID, 
-                    INSTANCE_ID, 
-                    INSTANCE_TYPE, 
-                    ENABLED, 
-                    ASSIGNED_BY
-                ) VALUES (
-                    :member_id, 
-                    :instance_id, 
-                    'recorder', 
-                    1, 
-                    'auto-on-live'
-                )
-            """, {
-                'member_id': member_db_id,
-                'instance_id': recorder_id
-            })
+            # 快照里的分配只是缓存：以数据库为准，已分配的直接返回，已被清除的按新直播重新分配
+            confirmed = self._confirm_assigned(cursor, resolved.values()) if resolved else {}
+            for member_db_id in resolved.values():
+                cached, actual = self._assigned.get(member_db_id), confirmed.get(member_db_id)
+                if cached == actual:
+                    continue
+                if cached in self._nodes:
+                    self._nodes[cached]['load'] = max(0, self._nodes[cached]['load'] - 1)
+                if actual:
+                    self._assigned[member_db_id] = actual
+                    if actual in self._nodes:
+                        self._nodes[actual]['load'] += 1
+                else:
+                    self._assigned.pop(member_db_id, None)
             
-            self.conn.commit()
+            result = {}
+            inserts = []
+            for member_id, member_db_id in resolved.items():
+                # 已经分配过了，直接返回（避免重复分配）
+                existing = confirmed.get(member_db_id)
+                if existing:
+                    logging.debug(f"{member_id} 已分配给 {existing}")
+                    result[member_id] = existing
+                    continue
+                
+                # 按策略选择录制器，并立即更新本地计数（同一批内也能均匀分散、不超容量）
+                recorder_id, reason = self._pick_recorder(member_db_id)
+                if recorder_id is None:
+                    logging.error(f"[分配拒绝] {member_id}: 没有可用的录制器 {reason}")
+                    continue
+                node = self._nodes[recorder_id]
+                current_load = node['load']
+                node['load'] += 1
+                self._assigned[member_db_id] = recorder_id
+                inserts.append((member_id, member_db_id, recorder_id, current_load))
+                if reason == 'sticky':
+                    logging.debug(f"{member_id} 重新开播，沿用上次的录制器 {recorder_id}")
             
-            logging.info(f"✓ {member_id} → {recorder_id} (负载: {current_load})")
+            if inserts:
+                cursor.executemany("""
+                    INSERT INTO ADMIN.MEMBER_INSTANCES (
+                        MEMBER_ID, 
+                        INSTANCE_ID, 
+                        INSTANCE_TYPE, 
+                        ENABLED, 
+                        ASSIGNED_BY
+                    ) VALUES (
+                        :member_id, 
+                        :instance_id, 
+                        'recorder', 
+                        1, 
+                        'auto-on-live'
+                    )
+                """, [{'member_id': db_id, 'instance_id': rec} for _, db_id, rec, _ in inserts],
+                    batcherrors=True)
+                
+                # 唯一约束冲突的行说明已被其它实例分配，快照作废
+                failed = {err.offset for err in cursor.getbatcherrors()}
+                self.conn.commit()
+                
+                for i, (member_id, member_db_id, recorder_id, current_load) in enumerate(inserts):
+                    if i in failed:
+                        logging.debug(f"{member_id} 分配时发生约束冲突（可能已分配）")
+                        continue
+                    result[member_id] = recorder_id
+                    capacity = self._nodes[recorder_id].get('max_capacity')
+                    logging.info(f"✓ {member_id} → {recorder_id} (负载: {current_load}/{capacity or '-'})")
+                if failed:
+                    self.invalidate()
             
-            cursor.close()
-            return recorder_id
+            return result
             
-        except cx_Oracle.IntegrityError as e:
-            # 唯一约束冲突，说明已经分配过了
-            self.conn.rollback()
-            logging.debug(f"{member_id} 分配时发生约束冲突（可能已分配）: {e}")
-            return None
         except Exception as e:
             self.conn.rollback()
-            logging.error(f"分配录制器失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
+            self.invalidate()
+            logging.error(f"批量分配录制器失败: {e}")
+            raise
+        finally:
+            cursor.close()
     
-    def clear_assignment(self, member_id: str):
+    def clear_assignments(self, member_ids: list):
         """
-        清除成员的录制器分配（直播结束时调用）
+        批量清除成员的录制器分配（直播结束时调用），一次 executemany DELETE + 一次提交
         
         参数:
-            member_id: 成员ID (字符串)
+            member_ids: 成员ID列表 (字符串)
         """
+        if not member_ids:
+            return
+        
+        cursor = self.conn.cursor()
         try:
-            cursor = self.conn.cursor()
+            resolved = self._resolve_member_ids(cursor, member_ids)
+            if not resolved:
+                return
             
             # 删除自动分配的记录
-            cursor.execute("""
+            cursor.executemany("""
                 DELETE FROM ADMIN.MEMBER_INSTANCES
-                WHERE MEMBER_ID = (
-                    SELECT ID FROM ADMIN.MEMBERS WHERE MEMBER_ID = :member_id
-                )
+                WHERE MEMBER_ID = :member_id
                 AND INSTANCE_TYPE = 'recorder'
                 AND ASSIGNED_BY = 'auto-on-live'
-            """, {'member_id': member_id})
-            
-            deleted_count = cursor.rowcount
+            """, [{'member_id': db_id} for db_id in resolved.values()], arraydmlrowcounts=True)
             
-            if deleted_count > 0:
+            row_counts = cursor.getarraydmlrowcounts()
+            if sum(row_counts):
                 self.conn.commit()
-                logging.debug(f"✓ 清除 {member_id} 的录制器分配")
             
-            cursor.close()
+            for (member_id, member_db_id), deleted_count in zip(resolved.items(), row_counts):
+                if deleted_count <= 0:
+                    continue
+                recorder_id = self._assigned.pop(member_db_id, None)
+                if recorder_id in self._nodes:
+                    node = self._nodes[recorder_id]
+                    node['load'] = max(0, node['load'] - 1)
+                if recorder_id:
+                    self.policy.remember(member_db_id, recorder_id)
+                logging.debug(f"✓ 清除 {member_id} 的录制器分配")
             
         except Exception as e:
             self.conn.rollback()
-            logging.error(f"清除分配失败: {e}")
+            self.invalidate()
+            logging.error(f"批量清除分配失败: {e}")
+            raise
+        finally:
+            cursor.close()
+    
+    # ========================= 单成员接口（兼容旧调用） =========================
+    
+    def assign_recorder(self, member_id: str) -> str:
+        """
+        为直播成员分配录制器
+        
+        参数:
+            member_id: 成员ID (字符串，如 'okabe_rin')
+        
+        返回:
+            分配的录制器实例ID (如 'recorder-a')，失败返回 None
+        """
+        try:
+            return self.assign_recorders([member_id]).get(member_id)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def clear_assignment(self, member_id: str):
+        """
+        清除成员的录制器分配（直播结束时调用）
+        
+        参数:
+            member_id: 成员ID (字符串)
+        """
+        try:
+            self.clear_assignments([member_id])
+        except Exception:
             import traceback
             traceback.print_exc()
     
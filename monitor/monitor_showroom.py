@@ -5,13 +5,10 @@ import sys
 import cx_Oracle
 import asyncio
 import httpx
-import random
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 sys.path.insert(0, str(Path(__file__).parent.parent / "shared"))
 from datetime import datetime
-from queue import Queue
-from threading import Thread
 from logger_config import setup_logger
 
 # ============================================================
@@ -24,6 +21,15 @@ setup_logger()
 # ============================================================
 from config import *
 from load_balancer_module import LoadBalancer
+from placement_policy import PlacementPolicy
+from hash_ring import ShardCoordinator
+from db_members_loader import get_member_registry
+from live_status_delta import LiveStatusDeltaTracker
+from poll_scheduler import AdaptivePollScheduler
+from showroom_api import HttpxFetcher, OnlivesDiscovery, SHOWROOM_API_BASE
+from status_poller import StatusPoller
+from ip_pool import IPPoolManager
+from db_write_pipeline import DBWritePipeline
 
 # ==== 配置 ====
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -36,63 +42,88 @@ sys.path.insert(0, str(Path(__file__).parent))
 INSTANCE_ID = os.getenv("INSTANCE_ID")
 MEMBER_ID = sys.argv[1] if len(sys.argv) > 1 else os.getenv("MEMBER_ID")
 
-# 模式1: 多检测器实例模式（自动检测）
-if INSTANCE_ID:
-    # 从实例ID提取索引 (monitor-a → 0, monitor-b → 1, ...)
-    instance_index = ord(INSTANCE_ID[-1]) - ord('a')
-    
-    # ✅ 自动从数据库查询检测器实例总数
+def refresh_monitor_heartbeat(instance_id):
+    """
+    写入本检测器的心跳，并返回心跳未过期的检测器实例列表
+    心跳就是租约：实例停止续约 MONITOR_HEARTBEAT_TIMEOUT 秒后，其它实例接管它的成员
+    返回: [instance_id, ...]，数据库不可用时返回 None
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
     try:
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM ADMIN.INSTANCES 
-                WHERE INSTANCE_TYPE = 'monitor' 
-                  AND STATUS = 'active'
-            """)
-            instance_count = cursor.fetchone()[0]
-            cursor.close()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ADMIN.INSTANCES
+            SET LAST_HEARTBEAT = CURRENT_TIMESTAMP
+            WHERE INSTANCE_ID = :instance_id
+        """, {'instance_id': instance_id})
+        cursor.execute("""
+            SELECT INSTANCE_ID
+            FROM ADMIN.INSTANCES 
+            WHERE INSTANCE_TYPE = 'monitor' 
+              AND STATUS = 'active'
+              AND LAST_HEARTBEAT >= SYSTIMESTAMP - NUMTODSINTERVAL(:timeout, 'SECOND')
+        """, {'timeout': MONITOR_HEARTBEAT_TIMEOUT})
+        active = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        cursor.close()
+        return active
+    except Exception as e:
+        logging.error(f"更新检测器心跳失败: {e}")
+        return None
+    finally:
+        try:
             conn.close()
-            
-            if instance_count == 0:
-                print(f"⚠️  警告: 数据库中没有活跃的检测器实例，使用单实例模式")
-                instance_count = 1
-        else:
-            print(f"⚠️  警告: 无法连接数据库，使用单实例模式")
-            instance_count = 1
+        except:
+            pass
+
+def release_monitor_heartbeat(instance_id):
+    """正常退出时让心跳立即过期，其它实例在下一个刷新周期内接管本实例的成员"""
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ADMIN.INSTANCES
+            SET LAST_HEARTBEAT = NULL
+            WHERE INSTANCE_ID = :instance_id
+        """, {'instance_id': instance_id})
+        conn.commit()
+        cursor.close()
     except Exception as e:
-        print(f"⚠️  警告: 查询实例数失败 ({e})，使用单实例模式")
-        instance_count = 1
+        logging.error(f"释放检测器心跳失败: {e}")
+    finally:
+        try:
+            conn.close()
+        except:
+            pass
+
+# 多检测器分片（一致性哈希），None 表示不分片
+shard = None
+
+# 模式1: 多检测器实例模式（一致性哈希分片，运行中定期按心跳重新分配）
+if INSTANCE_ID:
+    shard = ShardCoordinator(INSTANCE_ID, vnodes=SHARD_VNODES, handoff_grace=SHARD_HANDOFF_GRACE)
+    
+    active_monitors = refresh_monitor_heartbeat(INSTANCE_ID)
+    if active_monitors is None:
+        print(f"⚠️  警告: 无法连接数据库，暂时监控所有成员，稍后按心跳重新分片")
+        active_monitors = [INSTANCE_ID]
+    
+    shard.update(active_monitors, [m['id'] for m in ENABLED_MEMBERS], time.time())
+    polled_ids = shard.polled_ids()
+    MEMBERS = [m for m in ENABLED_MEMBERS if m['id'] in polled_ids]
     
-    # 单实例模式（只有1台检测器）
+    instance_count = len(shard.ring.nodes)
     if instance_count == 1:
-        MEMBERS = ENABLED_MEMBERS
         print(f"✅ 单检测器模式: {INSTANCE_ID}")
         print(f"   监控所有成员: {len(MEMBERS)} 个")
-    
-    # 多实例模式（2台或更多）
     else:
-        if instance_index >= instance_count:
-            print(f"❌ 错误: 实例索引 {instance_index} 超出范围")
-            print(f"   当前活跃实例数: {instance_count}")
-            print(f"   请使用 monitor-a 到 monitor-{chr(ord('a') + instance_count - 1)}")
-            sys.exit(1)
-        
-        # 计算分配范围
-        all_members = ENABLED_MEMBERS
-        chunk_size = len(all_members) // instance_count
-        
-        start = instance_index * chunk_size
-        # 最后一个实例包含所有剩余成员
-        end = start + chunk_size if instance_index < instance_count - 1 else len(all_members)
-        
-        MEMBERS = all_members[start:end]
-        
         print(f"🔀 多检测器模式: {INSTANCE_ID}")
-        print(f"   总实例数: {instance_count} (自动检测)")
-        print(f"   本实例负责: {len(MEMBERS)} 个成员 (第 {start+1}-{end} 个)")
+        print(f"   存活实例: {', '.join(shard.ring.nodes)} (按心跳自动检测)")
+        print(f"   本实例负责: {len(MEMBERS)} 个成员 (一致性哈希)")
         print(f"   成员示例: {', '.join(m['id'] for m in MEMBERS[:3])}{'...' if len(MEMBERS) > 3 else ''}")
 
 # 模式2: 传统模式（向后兼容）
@@ -112,8 +143,10 @@ else:
     MEMBERS = [ENABLED_MEMBERS[0]]
     print(f"⚠️  未指定成员，使用默认: {MEMBERS[0]['id']}")
 
-# ==== 数据库队列 (不需要锁了,因为异步是单线程) ====
-db_queue = Queue(maxsize=1000)
+# ==== 数据库写入管道 (asyncio 队列 + 单线程执行器) ====
+db_pipeline = None
+# ==== 录制器分配管道 (独立连接 + 独立执行器，不阻塞状态写入) ====
+assign_pipeline = None
 
 def reconnect_db(max_retries=3):
     """
@@ -140,409 +173,315 @@ def reconnect_db(max_retries=3):
     return None, None
 
 # ==== 数据库连接 ====
-def save_to_db(member_id, room_id, is_live_flag, started_at, prev_status, member):
-    """将数据放入队列,由专门线程写入数据库"""
-    db_queue.put({
+async def save_to_db(member_id, room_id, is_live_flag, started_at, prev_status, member):
+    """将数据放入写入管道（队列满时等待，形成反压）"""
+    prev_is_live = prev_status.get(member_id, {}).get('is_live', False)
+    await db_pipeline.put({
         'member_id': member_id,
         'room_id': room_id,
         'is_live_flag': is_live_flag,
         'started_at': started_at,
-        'prev_is_live': prev_status.get(member_id, {}).get('is_live', False),
+        'prev_is_live': prev_is_live,
         'group_name': member.get('group_name', ''),
         'team_name': member.get('team_name', '')
     })
+    # ✅ 开播/下播时交给分配管道处理录制器分配，与状态写入互不等待
+    if is_live_flag and not prev_is_live:
+        await assign_pipeline.put({'member_id': member_id, 'action': 'assign'})
+    elif not is_live_flag and prev_is_live:
+        await assign_pipeline.put({'member_id': member_id, 'action': 'clear'})
     return True
 
-def db_writer_thread(stop_flag):
-    logging.info("[DB-Writer] 🚀 数据库写入线程启动 (实时全量模式)")
-    conn = get_db_connection()
-    cursor = None
-    # ✅ 新增：初始化负载均衡器（用于给录制器分配）
-    load_balancer = LoadBalancer(conn)
-    # 新增：用于统计日志的变量
-    total_processed_in_round = 0
-    last_log_time = time.time()
-
-    # ✅ 优化：将 SQL 语句定义在循环外，使用绑定变量，提高解析效率
-    merge_sql = f"""
-        MERGE /*+ NO_PARALLEL */ INTO {DB_TABLE} target
-        USING (SELECT :member_id_param AS MEMBER_ID_VAL FROM DUAL) source
-        ON (target.MEMBER_ID = source.MEMBER_ID_VAL)
-        WHEN MATCHED THEN
-            UPDATE SET ROOM_ID = :room_id_param, IS_LIVE = :live_flag_param,
-                       STARTED_AT = NVL(:started_at_param, target.STARTED_AT), 
-                       CHECK_TIME = :check_time_param, GROUP_NAME = :group_name_param, TEAM_NAME = :team_name_param
-        WHEN NOT MATCHED THEN
-            INSERT (MEMBER_ID, ROOM_ID, IS_LIVE, STARTED_AT, CHECK_TIME, GROUP_NAME, TEAM_NAME)
-            VALUES (:member_id_param, :room_id_param, :live_flag_param, :started_at_param, :check_time_param, :group_name_param, :team_name_param)
+class OracleLiveStatusSink:
     """
-    
-    insert_history_sql = f"INSERT INTO {DB_HISTORY_TABLE} (MEMBER_ID, ROOM_ID, STARTED_AT) VALUES (:member_id, :room_id, :started_at)"
-    
-    update_history_sql = f"""
-        UPDATE {DB_HISTORY_TABLE}
-        SET ENDED_AT = :ended_at,
-            DURATION_MINUTES = ROUND(EXTRACT(DAY FROM (:ended_at - STARTED_AT)) * 1440 + EXTRACT(HOUR FROM (:ended_at - STARTED_AT)) * 60 + EXTRACT(MINUTE FROM (:ended_at - STARTED_AT)) + EXTRACT(SECOND FROM (:ended_at - STARTED_AT)) / 60, 2),
-            UPDATED_AT = SYSTIMESTAMP
-        WHERE ID = (SELECT MAX(ID) FROM {DB_HISTORY_TABLE} WHERE MEMBER_ID = :member_id AND ENDED_AT IS NULL)
+    DBWritePipeline 的 Oracle 写入端
+    所有方法都在管道的单线程执行器里调用，连接与差分快照只属于这个线程
     """
-    # ✅ 心跳计数器（移到这里）
-    last_check_time = time.time() # 改用时间戳
-    
-    while not stop_flag[0] or not db_queue.empty():
-        # --- A. 检查并确保连接可用 ---
-        current_time = time.time()  # ✅ 必须放在 if 之前定义
-        
-        # 只要连接没了，或者超过30秒没检查，就触发检测
-        if conn is None or cursor is None or (current_time - last_check_time > 30):
-            need_reconnect = False
-            try:
-                if conn and cursor:
-                    # ✅ 主动心跳检测
-                    cursor.execute("SELECT 1 FROM DUAL")
-                    cursor.fetchone()
-                    last_check_time = current_time # 只有成功才更新时间
-                else:
-                    need_reconnect = True
-            except Exception as hb_error:
-                logging.warning(f"[DB-Writer] 心跳检测失败: {hb_error}")
-                need_reconnect = True
-
-            # 执行重连逻辑
-            if need_reconnect:
-                logging.warning("[DB-Writer] 正在尝试恢复数据库连接...")
-                conn, cursor = reconnect_db()
-                if conn:
-                    load_balancer = LoadBalancer(conn)
-                    last_check_time = time.time() # 重连成功，重置时间
-                else:
-                    # ✅ 核心保护：连不上就休眠并跳过本次循环，数据会留在队列里
-                    time.sleep(5)
-                    continue
-        try:
-            # 1. 阻塞等待队列中的第一个数据，超时 1 秒
-            data = db_queue.get(timeout=1.0)
-            batch_buffer = [data]
-            # 2. 【核心】瞬间排空队列里剩余的所有数据 (这 277 条会瞬间被拿出来)
-            while not db_queue.empty():
-                try:
-                    batch_buffer.append(db_queue.get_nowait())
-                except:
-                    break
-                
-            # 3. 按 member_id 去重，只保留本轮最新的状态
-            unique_buffer = {d['member_id']: d for d in batch_buffer}
-            final_list = list(unique_buffer.values())
-            # 4. 执行批量操作
-            if final_list and conn:
-                if cursor is None: cursor = conn.cursor()
-                all_bind_params = []
-                history_inserts = []
-                history_updates = []
-                check_time = datetime.now()
-                for d in final_list:
-                    all_bind_params.append({
-                        'member_id_param': d['member_id'],
-                        'room_id_param': d['room_id'],
-                        'live_flag_param': 1 if d['is_live_flag'] else 0,
-                        'started_at_param': d['started_at'],
-                        'check_time_param': check_time,
-                        'group_name_param': d['group_name'],
-                        'team_name_param': d['team_name']
-                    })
-                    # 历史表逻辑
-                    if d['is_live_flag'] and not d['prev_is_live']:
-                        # 开播：插入历史记录
-                        history_inserts.append({
-                            'member_id': d['member_id'], 
-                            'room_id': d['room_id'], 
-                            'started_at': d['started_at']
-                        })
-                        # ✅ 新增：立即分配录制器
-                        try:
-                            recorder_id = load_balancer.assign_recorder(d['member_id'])
-                            if recorder_id:
-                                logging.info(f"[分配] {d['member_id']} → {recorder_id}")
-                        except Exception as e:
-                            logging.error(f"[分配失败] {d['member_id']}: {e}")
-                    elif not d['is_live_flag'] and d['prev_is_live']:
-                        # 下播：更新历史记录
-                        history_updates.append({
-                            'ended_at': check_time, 
-                            'member_id': d['member_id']
-                        })
-                        # ✅ 新增：清除分配
-                        try:
-                            load_balancer.clear_assignment(d['member_id'])
-                            logging.debug(f"[清除分配] {d['member_id']}")
-                        except Exception as e:
-                            logging.error(f"[清除失败] {d['member_id']}: {e}")
-                # 5. 一次性写入并提交 (这是 277 条数据最快的入库方式)
-                cursor.executemany(merge_sql, all_bind_params)
-                if history_inserts: cursor.executemany(insert_history_sql, history_inserts)
-                if history_updates: cursor.executemany(update_history_sql, history_updates)
-                conn.commit()
-                # ✅ 累加处理数量，但不立刻打日志
-                total_processed_in_round += len(final_list)
-            # 4. 重点：判断是否达到 5 秒的日志周期
-            current_time = time.time()
-            if current_time - last_log_time >= 5.0:
-                if total_processed_in_round > 0:
-                    logging.info(f"✅ [周期汇总] 过去 5 秒内实时入库共计: {total_processed_in_round} 条记录")
-                # 重置计数器
-                total_processed_in_round = 0
-                last_log_time = current_time
-            # 标记完成
-            for _ in range(len(batch_buffer)):
-                db_queue.task_done()
-        except Exception as e:
-            if 'data' in locals():
-                error_obj = None
-                # 判断是否是数据库连接错误
-                if isinstance(e, cx_Oracle.DatabaseError):
-                    error_obj, = e.args
-                    logging.error(f"[DB-Writer] 数据库错误: {error_obj.code} - {error_obj.message}")
-                else:
-                    logging.error(f"[DB-Writer] 数据库写入错误: {e}")
-                # 安全回滚
-                try:
-                    if conn:
-                        conn.rollback()
-                except Exception as rollback_error:
-                    logging.warning(f"[DB-Writer] 回滚失败（连接可能已断开）: {rollback_error}")
-                # 🔥 关键：如果是连接错误，尝试重连
-                if error_obj and error_obj.code in [3113, 3114, 1089, 1090, 28, 12535, 12537]:
-                    logging.warning(f"[DB-Writer] 检测到连接错误 (ORA-{error_obj.code})，开始重连...")
-                    # 关闭旧连接
-                    try:
-                        if cursor:
-                            cursor.close()
-                        if conn:
-                            conn.close()
-                    except:
-                        pass
-                    
-                    # 重连
-                    conn, cursor = reconnect_db()
-                    # 重新初始化 LoadBalancer
-                    if conn:
-                        try:
-                            load_balancer = LoadBalancer(conn)
-                            logging.info("[DB-Writer] LoadBalancer 已重新初始化")
-                        except Exception as lb_error:
-                            logging.error(f"[DB-Writer] LoadBalancer 初始化失败: {lb_error}")
-                    else:
-                        logging.error("[DB-Writer] ❌ 重连失败，将在下次循环继续尝试")
-                        time.sleep(5)  # 等待5秒再继续
-            continue
 
-    # ✅ while 循环结束后，线程退出前处理剩余数据
-    if batch_buffer and conn and cursor:
-        try:
-            logging.info(f"[DB-Writer] 🔄 处理退出前剩余的 {len(batch_buffer)} 条数据")
-            # ✅ 在循环外准备批量参数列表
-            all_bind_params = []
-            history_inserts = []
-            history_updates = []
-
-            for data in batch_buffer:
-                member_id = data['member_id']
-                room_id = data['room_id']
-                is_live_flag = data['is_live_flag']
-                started_at = data['started_at']
-                prev_is_live = data['prev_is_live']
-                check_time = datetime.now()
-                
-                # 收集主表参数
-                all_bind_params.append({
-                    'member_id_param': member_id,
-                    'room_id_param': room_id,
-                    'live_flag_param': 1 if is_live_flag else 0,
-                    'started_at_param': started_at,
-                    'check_time_param': check_time,
-                    'group_name_param': data['group_name'],
-                    'team_name_param': data['team_name']
-                })
-                
-                # 收集历史表操作
-                if is_live_flag and not prev_is_live:
-                    history_inserts.append({
-                        'member_id': member_id,
-                        'room_id': room_id,
-                        'started_at': started_at
-                    })
-                    
-                    # ✅ 新增：分配录制器
-                    try:
-                        recorder_id = load_balancer.assign_recorder(member_id)
-                        if recorder_id:
-                            logging.info(f"[退出前分配] {member_id} → {recorder_id}")
-                    except Exception as e:
-                        logging.error(f"[退出前分配失败] {member_id}: {e}")
-                        
-                elif not is_live_flag and prev_is_live:
-                    history_updates.append({
-                        'ended_at': check_time,
-                        'member_id': member_id
-                    })
-                    
-                    # ✅ 新增：清除分配
-                    try:
-                        load_balancer.clear_assignment(member_id)
-                    except Exception as e:
-                        logging.error(f"[退出前清除失败] {member_id}: {e}")
-
-            # ✅ 批量执行 - 只调用一次!
-            if all_bind_params:
-                cursor.executemany(merge_sql, all_bind_params)
-            
-            if history_inserts:
-                cursor.executemany(insert_history_sql, history_inserts)
-                logging.info(f"批量插入 {len(history_inserts)} 条开播记录")
-            
-            if history_updates:
-                cursor.executemany(update_history_sql, history_updates)
-                logging.info(f"批量更新 {len(history_updates)} 条结束记录")
-            
-            conn.commit()
-            logging.info(f"[DB-Writer] ✅ 退出前提交剩余 {len(batch_buffer)} 条")
-        except Exception as e:
-            logging.error(f"退出前提交失败: {e}")
-    
-    # ✅ 线程退出时清理资源
-    if cursor:
+    # 需要重连的 ORA 错误码
+    CONNECTION_ERROR_CODES = (3113, 3114, 1089, 1090, 28, 12535, 12537)
+
+    def __init__(self):
+        self.conn = None
+        self.cursor = None
+        # ✅ 差分写入：只 MERGE 状态变化的成员，其余成员按心跳周期刷新 CHECK_TIME
+        self.delta_tracker = LiveStatusDeltaTracker(heartbeat_interval=DB_HEARTBEAT_INTERVAL, enabled=DB_DELTA_WRITE)
+        self.last_check_time = time.time()
+        self.last_log_time = time.time()
+
+        # ✅ 优化：SQL 语句只定义一次，使用绑定变量，提高解析效率
+        self.merge_sql = f"""
+            MERGE /*+ NO_PARALLEL */ INTO {DB_TABLE} target
+            USING (SELECT :member_id_param AS MEMBER_ID_VAL FROM DUAL) source
+            ON (target.MEMBER_ID = source.MEMBER_ID_VAL)
+            WHEN MATCHED THEN
+                UPDATE SET ROOM_ID = :room_id_param, IS_LIVE = :live_flag_param,
+                           STARTED_AT = NVL(:started_at_param, target.STARTED_AT), 
+                           CHECK_TIME = :check_time_param, GROUP_NAME = :group_name_param, TEAM_NAME = :team_name_param
+            WHEN NOT MATCHED THEN
+                INSERT (MEMBER_ID, ROOM_ID, IS_LIVE, STARTED_AT, CHECK_TIME, GROUP_NAME, TEAM_NAME)
+                VALUES (:member_id_param, :room_id_param, :live_flag_param, :started_at_param, :check_time_param, :group_name_param, :team_name_param)
+        """
+
+        # 分片交接期间新旧两个检测器可能同时检测到同一次开播，同一 STARTED_AT 只插入一次
+        self.insert_history_sql = f"""
+            INSERT INTO {DB_HISTORY_TABLE} (MEMBER_ID, ROOM_ID, STARTED_AT)
+            SELECT :member_id, :room_id, :started_at FROM DUAL
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {DB_HISTORY_TABLE} WHERE MEMBER_ID = :member_id AND STARTED_AT = :started_at
+            )
+        """
+
+        self.update_history_sql = f"""
+            UPDATE {DB_HISTORY_TABLE}
+            SET ENDED_AT = :ended_at,
+                DURATION_MINUTES = ROUND(EXTRACT(DAY FROM (:ended_at - STARTED_AT)) * 1440 + EXTRACT(HOUR FROM (:ended_at - STARTED_AT)) * 60 + EXTRACT(MINUTE FROM (:ended_at - STARTED_AT)) + EXTRACT(SECOND FROM (:ended_at - STARTED_AT)) / 60, 2),
+                UPDATED_AT = SYSTIMESTAMP
+            WHERE ID = (SELECT MAX(ID) FROM {DB_HISTORY_TABLE} WHERE MEMBER_ID = :member_id AND ENDED_AT IS NULL)
+        """
+
+        # 心跳：未变化成员只刷新 CHECK_TIME（executemany 一次往返完成）
+        self.heartbeat_sql = f"UPDATE {DB_TABLE} SET CHECK_TIME = :check_time_param WHERE MEMBER_ID = :member_id_param"
+
+    def open(self):
+        mode_desc = "差分模式" if DB_DELTA_WRITE else "实时全量模式"
+        logging.info(f"[DB-Writer] 🚀 数据库写入端启动 ({mode_desc})")
+        self.conn = get_db_connection()
+        if self.conn:
+            self.cursor = self.conn.cursor()
+
+    def _ensure_connection(self):
+        """连接不存在或超过 30 秒未检查时做一次心跳检测，失败则重连"""
+        current_time = time.time()
+        if self.conn and self.cursor and current_time - self.last_check_time <= 30:
+            return True
+
         try:
-            cursor.close()
-        except:
-            pass
-    if conn:
+            if self.conn and self.cursor:
+                # ✅ 主动心跳检测
+                self.cursor.execute("SELECT 1 FROM DUAL")
+                self.cursor.fetchone()
+                self.last_check_time = current_time  # 只有成功才更新时间
+                return True
+        except Exception as hb_error:
+            logging.warning(f"[DB-Writer] 心跳检测失败: {hb_error}")
+
+        logging.warning("[DB-Writer] 正在尝试恢复数据库连接...")
+        self._reconnect()
+        return self.conn is not None
+
+    def _reconnect(self):
+        # 关闭旧连接
         try:
-            conn.close()
+            if self.cursor:
+                self.cursor.close()
+            if self.conn:
+                self.conn.close()
         except:
             pass
-    
-    logging.info("[DB-Writer] 数据库写入线程已停止")
 
-# ==== 异步HTTP请求 ====
-async def is_live_async(member_id, room_url_key, client):
-    """异步检查直播状态"""
-    url = f"https://www.showroom-live.com/api/room/status?room_url_key={room_url_key}"
+        self.conn, self.cursor = reconnect_db()
+        # 连接断开时的提交结果未知，丢弃快照强制全量 MERGE 一次
+        self.delta_tracker.invalidate()
+        if self.conn:
+            self.last_check_time = time.time()  # 重连成功，重置时间
 
-    try:
-        res = await client.get(url)
-        if res.status_code != 200:
-            logging.warning(f"[{member_id}] 请求异常: {res.status_code}")
-            return None, None
-        
-        try:
-            data = res.json()
-        except ValueError:
-            logging.warning(f"[{member_id}] 返回非JSON内容,可能被限流")
-            return None, None
+    def write_batch(self, records):
+        """写入一批（已按 member_id 合并的）记录；失败时回滚并抛出，由管道保留记录重试"""
+        # ✅ 核心保护：连不上就抛出，记录会留在管道里
+        if not self._ensure_connection():
+            raise ConnectionError("数据库不可用")
 
-        is_live_flag = data.get("is_live", False)
-        started_at_raw = data.get("started_at") if is_live_flag else None
-        
-        if started_at_raw:
-            started_at = datetime.fromtimestamp(started_at_raw)
-        else:
-            started_at = None
-        
-        return is_live_flag, started_at
-    except Exception as e:
-        logging.exception(f"[{member_id}] 获取直播状态失败")
-        return False, None
-
-def generate_key(member):
-    """生成room_url_key"""
-    name_en = member.get("name_en", "")
-    parts = name_en.split(" ")
-    if len(parts) == 2:
-        key_suffix = f"{parts[1]}_{parts[0]}" 
-    else:
-        key_suffix = name_en.replace(" ", "_")
-    return f"48_{key_suffix}"
-
-async def check_single_member(member, client, previous_status, last_db_write_time):
-    member_id = member["id"]
-    room_id = member["room_id"]
-    name_jp = member["name_jp"]
-    room_url_key = member.get("room_url_key") or generate_key(member)
-    
-    # 1. 异步获取当前直播状态
-    is_live_flag, started_at = await is_live_async(member_id, room_url_key, client)
-    
-    if is_live_flag is not None:
-        # 获取上一次的状态
-        prev_record = previous_status.get(member_id, {})
-        
-        # 直接写入数据库，不再判断 60 秒心跳
-        save_to_db(member_id, room_id, is_live_flag, started_at, previous_status, member)
-        
-        # 更新内存状态
-        previous_status[member_id] = {'is_live': is_live_flag, 'started_at': started_at}
+        try:
+            self._write(records)
+        except Exception as e:
+            error_obj = None
+            # 判断是否是数据库连接错误
+            if isinstance(e, cx_Oracle.DatabaseError):
+                error_obj, = e.args
+                logging.error(f"[DB-Writer] 数据库错误: {error_obj.code} - {error_obj.message}")
+            else:
+                logging.error(f"[DB-Writer] 数据库写入错误: {e}")
+            # 安全回滚
+            try:
+                if self.conn:
+                    self.conn.rollback()
+            except Exception as rollback_error:
+                logging.warning(f"[DB-Writer] 回滚失败（连接可能已断开）: {rollback_error}")
+            # 🔥 关键：如果是连接错误，尝试重连
+            if error_obj and error_obj.code in self.CONNECTION_ERROR_CODES:
+                logging.warning(f"[DB-Writer] 检测到连接错误 (ORA-{error_obj.code})，开始重连...")
+                self._reconnect()
+                if not self.conn:
+                    logging.error("[DB-Writer] ❌ 重连失败，将在下次写入时继续尝试")
+            raise
+
+        # 每 5 秒输出一次差分写入统计
+        current_time = time.time()
+        if current_time - self.last_log_time >= 5.0:
+            self.delta_tracker.log_summary(current_time - self.last_log_time)
+            self.last_log_time = current_time
+
+    def _write(self, records):
+        all_bind_params = []
+        history_inserts = []
+        history_updates = []
+        check_time = datetime.now()
+        # 差分：只有 IS_LIVE / STARTED_AT / ROOM_ID 变化的成员才需要 MERGE
+        changed_list, unchanged_list = self.delta_tracker.split(records)
+        for d in changed_list:
+            all_bind_params.append({
+                'member_id_param': d['member_id'],
+                'room_id_param': d['room_id'],
+                'live_flag_param': 1 if d['is_live_flag'] else 0,
+                'started_at_param': d['started_at'],
+                'check_time_param': check_time,
+                'group_name_param': d['group_name'],
+                'team_name_param': d['team_name']
+            })
+        for d in records:
+            # 历史表逻辑
+            if d['is_live_flag'] and not d['prev_is_live']:
+                # 开播：插入历史记录
+                history_inserts.append({
+                    'member_id': d['member_id'], 
+                    'room_id': d['room_id'], 
+                    'started_at': d['started_at']
+                })
+            elif not d['is_live_flag'] and d['prev_is_live']:
+                # 下播：更新历史记录
+                history_updates.append({
+                    'ended_at': check_time, 
+                    'member_id': d['member_id']
+                })
+        # 心跳到期：批量刷新未变化成员的 CHECK_TIME
+        heartbeat_ids = self.delta_tracker.pending_heartbeat_ids() if self.delta_tracker.heartbeat_due() else []
+        # 一次性写入并提交
+        cursor = self.cursor
+        if all_bind_params: cursor.executemany(self.merge_sql, all_bind_params)
+        if heartbeat_ids:
+            cursor.executemany(self.heartbeat_sql, [
+                {'member_id_param': m, 'check_time_param': check_time} for m in heartbeat_ids
+            ])
+        if history_inserts: cursor.executemany(self.insert_history_sql, history_inserts)
+        if history_updates: cursor.executemany(self.update_history_sql, history_updates)
+        self.conn.commit()
+        # ✅ 提交成功后才更新快照，失败时下一批会重新 MERGE
+        self.delta_tracker.commit(changed_list, unchanged_list, heartbeat_ids)
+
+    def close(self):
+        # ✅ 退出时清理资源
+        if self.cursor:
+            try:
+                self.cursor.close()
+            except:
+                pass
+        if self.conn:
+            try:
+                self.conn.close()
+            except:
+                pass
+        logging.info("[DB-Writer] 数据库写入端已关闭")
 
-async def check_all_members_async(members, ip_clients, previous_status, last_db_write_time):
+class RecorderAssignmentSink:
     """
-    动态平滑并发：确保请求在均匀分布，且每个 IP 瞬时只负责一个成员
+    录制器分配管道的写入端：批量分配/清除录制器
+    使用独立的数据库连接和执行器线程，大量成员同时开播时也不会拖慢直播状态提交
     """
-    total_members = len(members)
-    if total_members == 0:
-        return
 
-    # 1. 计算步进间隔
-    target_fill_time = (REQUEST_INTERVAL - 0.1)
-    interval = target_fill_time / total_members
-
-    # 2. 限制总并发数为 IP 数量，确保资源不超载
-    sem = asyncio.Semaphore(len(ip_clients))
-
-    # 3. 【关键】每一轮都生成一个随机顺序的 IP 客户端列表
-    # 这样可以打破“成员A 永远用 IP_1”的固定关系
-    shuffled_clients = ip_clients.copy()
-    random.shuffle(shuffled_clients)
+    def __init__(self):
+        self.conn = None
+        self.load_balancer = None
+        # 放置策略与连接无关，重连后沿用（保留粘性放置的记忆）
+        self.policy = PlacementPolicy(
+            mode=PLACEMENT_MODE,
+            heartbeat_timeout=RECORDER_HEARTBEAT_TIMEOUT,
+            min_free_disk_bytes=RECORDER_MIN_FREE_DISK_GB * 1024 ** 3,
+            bandwidth_budget=RECORDER_BANDWIDTH_BUDGET_MB * 1024 ** 2,
+            sticky=PLACEMENT_STICKY,
+            sticky_seconds=PLACEMENT_STICKY_SECONDS,
+        )
 
-    async def throttled_check(member, client, index):
-        # 按计算好的时间点出发，实现平滑请求
-        await asyncio.sleep(index * interval)
-        
-        async with sem:
-            # 在信号量保护下，由于 client 是按 index % len 分配的，
-            # 配合信号量大小等于 IP 总数，可以保证此时该 IP 没有被其他任务占用
-            return await check_single_member(member, client, previous_status, last_db_write_time)
+    def open(self):
+        self.conn = get_db_connection()
+        # ✅ 初始化负载均衡器（用于给录制器分配）
+        self.load_balancer = LoadBalancer(self.conn, policy=self.policy)
+        logging.info("[Assigner] 🚀 录制器分配端启动")
+
+    def write_batch(self, records):
+        if self.conn is None:
+            self.conn, _ = reconnect_db()
+            if not self.conn:
+                raise ConnectionError("数据库不可用")
+            self.load_balancer = LoadBalancer(self.conn, policy=self.policy)
+            logging.info("[Assigner] LoadBalancer 已重新初始化")
+
+        # 管道已按 member_id 合并，同一成员只保留最后一个动作
+        to_assign = [r['member_id'] for r in records if r['action'] == 'assign']
+        to_clear = [r['member_id'] for r in records if r['action'] == 'clear']
+        try:
+            if to_clear:
+                self.load_balancer.clear_assignments(to_clear)
+                logging.debug(f"[清除分配] {', '.join(to_clear)}")
+            if to_assign:
+                assigned = self.load_balancer.assign_recorders(to_assign)
+                for member_id, recorder_id in assigned.items():
+                    logging.info(f"[分配] {member_id} → {recorder_id}")
+                missing = [m for m in to_assign if m not in assigned]
+                if missing:
+                    logging.error(f"[分配失败] {', '.join(missing)}")
+        except cx_Oracle.DatabaseError as e:
+            error_obj, = e.args
+            if error_obj.code in OracleLiveStatusSink.CONNECTION_ERROR_CODES:
+                logging.warning(f"[Assigner] 检测到连接错误 (ORA-{error_obj.code})，下次写入时重连")
+                self.close()
+            raise
+
+    def close(self):
+        if self.conn:
+            try:
+                self.conn.close()
+            except:
+                pass
+        self.conn = None
 
-    tasks = []
-    num_ips = len(shuffled_clients)
-    
-    for i, member in enumerate(members):
-        # 4. 【核心】使用打乱后的 IP 列表进行轮询
-        # 假设有 30 个 IP，那么 i=0..29 时，每个成员分配到的 IP 绝对不重复
-        client = shuffled_clients[i % num_ips]
-        tasks.append(throttled_check(member, client, i))
-
-    # 并发执行
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    # 错误统计
-    errors = [r for r in results if isinstance(r, Exception)]
-    if errors:
-        logging.warning(f"本轮完成，其中 {len(errors)} 个请求发生代码级异常")
+def load_live_history_rows(days):
+    """读取最近 days 天的开播记录，供自适应调度器建立开播时段分布"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT MEMBER_ID, STARTED_AT
+            FROM {DB_HISTORY_TABLE}
+            WHERE STARTED_AT >= SYSTIMESTAMP - NUMTODSINTERVAL(:days, 'DAY')
+        """, {'days': days})
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    except Exception as e:
+        logging.error(f"读取开播历史失败: {e}")
+        return None
+    finally:
+        try:
+            conn.close()
+        except:
+            pass
 
 async def monitor_loop_async():
     """异步主循环"""
-    global MEMBERS
+    global MEMBERS, db_pipeline, assign_pipeline
     logging.info(f"🚀 开始监视 {len(MEMBERS)} 个主播 (异步模式)")
     
-    previous_status = {}
-    last_db_write_time = {}
     stop_flag = [False]
 
-    # ✅ 预处理所有成员的team信息
-    for member in MEMBERS:
-        team_full = member.get("team", "")
-        team_parts = team_full.split(" ", 1)
-        member['group_name'] = team_parts[0] if len(team_parts) > 0 else ""
-        member['team_name'] = team_parts[1] if len(team_parts) > 1 else ""
+    # ✅ 成员注册表：group_name / team_name 已在加载时预先计算，只有成员真正变化时才重建列表与调度
+    member_registry = get_member_registry()
+    members_dirty = [True]
+    def on_members_changed(added, updated, removed):
+        members_dirty[0] = True
+    member_registry.subscribe(on_members_changed)
     
     # ✅ 直接创建客户端列表
     ip_clients = []
@@ -561,48 +500,128 @@ async def monitor_loop_async():
     logging.info(f"   总成员: {len(MEMBERS)}")
     logging.info(f"   IP池大小: {len(OUTBOUND_IPS)}")
     logging.info(f"   并发请求数: {len(MEMBERS)}")
+
+    # ✅ 自适应调度：按开播规律给每个成员分配检查频率
+    scheduler = None
+    last_history_load = 0
+    if ADAPTIVE_POLLING:
+        scheduler = AdaptivePollScheduler(
+            live_interval=POLL_INTERVAL_LIVE,
+            hot_interval=POLL_INTERVAL_HOT,
+            warm_interval=POLL_INTERVAL_WARM,
+            dormant_min_interval=POLL_INTERVAL_DORMANT_MIN,
+            dormant_max_interval=POLL_INTERVAL_DORMANT_MAX,
+            max_latency=POLL_MAX_LATENCY,
+            hot_probability=POLL_HOT_PROBABILITY,
+            warm_probability=POLL_WARM_PROBABILITY,
+        )
+        scheduler.sync_members(MEMBERS)
+        logging.info(f"   调度模式: 自适应 (live/hot {POLL_INTERVAL_LIVE}s, 上限 {POLL_MAX_LATENCY}s)")
+
+    # ✅ 批量发现：每轮一次 onlives 请求，只对状态可能变化的成员发单房间请求
+    discovery = None
+    if ONLIVES_DISCOVERY:
+        discovery = OnlivesDiscovery(request_interval=REQUEST_INTERVAL, verify_interval=ONLIVES_VERIFY_INTERVAL)
+        logging.info(f"   发现模式: onlives 批量发现 (全员校验周期 {ONLIVES_VERIFY_INTERVAL}s)")
+
+    # ✅ IP 池：被限流的 IP 自动隔离，请求优先分配给又快又健康的 IP
+    ip_pool = None
+    if IP_POOL_ENABLED:
+        ip_pool = IPPoolManager(
+            ip_clients,
+            rate_per_second=IP_RATE_PER_SECOND,
+            burst=IP_RATE_BURST,
+            window_seconds=IP_HEALTH_WINDOW,
+            min_success_rate=IP_MIN_SUCCESS_RATE,
+            quarantine_seconds=IP_QUARANTINE_SECONDS,
+            max_quarantine_seconds=IP_QUARANTINE_MAX,
+        )
+        logging.info(f"   IP选择: 健康度加权 (单IP {IP_RATE_PER_SECOND} 次/秒)")
+
+    poller = StatusPoller(
+        ip_clients,
+        on_status=lambda m, is_live_flag, started_at: save_to_db(
+            m['id'], m['room_id'], is_live_flag, started_at, poller.previous_status, m
+        ),
+        request_interval=REQUEST_INTERVAL,
+        fetcher=HttpxFetcher(SHOWROOM_API_BASE),
+        scheduler=scheduler,
+        discovery=discovery,
+        ip_pool=ip_pool,
+    )
     
-    # 启动DB线程
-    db_thread = Thread(
-        target=db_writer_thread,
-        args=(stop_flag,),
-        name="DB-Writer",
-        daemon=True
+    # 启动DB写入管道（阻塞的数据库调用都在它的单线程执行器里完成）
+    db_pipeline = DBWritePipeline(
+        OracleLiveStatusSink(),
+        max_batch=DB_BATCH_MAX_ROWS,
+        max_delay=DB_BATCH_MAX_DELAY,
+        maxsize=DB_QUEUE_MAXSIZE,
+    )
+    await db_pipeline.start()
+    # 录制器分配走独立管道：开播高峰时批量分配，不占用状态写入的连接和线程
+    assign_pipeline = DBWritePipeline(
+        RecorderAssignmentSink(), max_batch=100, max_delay=DB_BATCH_MAX_DELAY, name="Assigner"
     )
-    db_thread.start()
+    await assign_pipeline.start()
     
     # 主循环监控
+    last_shard_refresh = time.time()
+    last_member_check = time.time()
     try:
         loop_count = 0
         while not stop_flag[0]:
             round_start = time.time()
             
-            # 重新加载成员配置
+            # 增量刷新成员配置（没有变化时只有一次版本探测）
             try:
-                from config import get_enabled_members
-                all_members = get_enabled_members()
-                if all_members:
-                    MEMBERS = all_members
-                    # ✅ 重新加载后也预处理team信息
-                    for member in MEMBERS:
-                        team_full = member.get("team", "")
-                        team_parts = team_full.split(" ", 1)
-                        member['group_name'] = team_parts[0] if len(team_parts) > 0 else ""
-                        member['team_name'] = team_parts[1] if len(team_parts) > 1 else ""
+                if round_start - last_member_check >= MEMBER_RELOAD_INTERVAL:
+                    last_member_check = round_start
+                    await asyncio.to_thread(member_registry.refresh)
+                
+                all_members = member_registry.members()
+                members_changed = members_dirty[0]
+                if all_members and shard:
+                    # 分片模式：续约心跳并按存活实例重算一致性哈希
+                    if round_start - last_shard_refresh >= SHARD_REFRESH_INTERVAL or members_changed:
+                        last_shard_refresh = round_start
+                        active_monitors = await asyncio.to_thread(refresh_monitor_heartbeat, INSTANCE_ID)
+                        if active_monitors is None:
+                            # 数据库不可用时沿用上一次的实例集合（仍然推进交接租约）
+                            active_monitors = shard.ring.nodes
+                        if shard.update(active_monitors, [m['id'] for m in all_members], round_start):
+                            members_changed = True
+                
+                if members_changed and all_members:
+                    members_dirty[0] = False
+                    if shard:
+                        polled_ids = shard.polled_ids()
+                        MEMBERS = [m for m in all_members if m['id'] in polled_ids]
+                    elif MEMBER_ID and MEMBER_ID.upper() != "ALL":
+                        MEMBERS = [m for m in all_members if m['id'] == MEMBER_ID] or MEMBERS
+                    else:
+                        MEMBERS = all_members
+                    if scheduler:
+                        scheduler.sync_members(MEMBERS)
+                    logging.info(f"👥 成员列表已更新: 本实例检测 {len(MEMBERS)} 个成员")
             except Exception as e:
                 logging.error(f"重新加载成员配置失败: {e}")
             
             # ✅ 定期清理过期状态 (每100轮)
             if loop_count % 100 == 0 and loop_count > 0:
-                current_ids = {m['id'] for m in MEMBERS}
-                old_count = len(previous_status)
-                previous_status = {k: v for k, v in previous_status.items() if k in current_ids}
-                last_db_write_time = {k: v for k, v in last_db_write_time.items() if k in current_ids}
-                if old_count > len(previous_status):
-                    logging.info(f"🧹 清理了 {old_count - len(previous_status)} 个过期状态")
+                removed = poller.forget({m['id'] for m in MEMBERS})
+                if removed:
+                    logging.info(f"🧹 清理了 {removed} 个过期状态")
             
-            # 并发检测所有成员
-            await check_all_members_async(MEMBERS, ip_clients, previous_status, last_db_write_time)
+            # 自适应调度：定期刷新开播历史（成员列表只在变化时同步）
+            if scheduler:
+                if round_start - last_history_load >= POLL_HISTORY_REFRESH:
+                    last_history_load = round_start
+                    rows = await asyncio.to_thread(load_live_history_rows, POLL_HISTORY_DAYS)
+                    if rows is not None:
+                        scheduler.load_history(rows, POLL_HISTORY_DAYS)
+
+            # 并发检测所有成员（自适应模式下只检测到期成员，发现模式下只确认可能变化的成员）
+            checked_count = await poller.run_round(MEMBERS, round_start)
             
             round_time = time.time() - round_start
             loop_count += 1
@@ -610,11 +629,20 @@ async def monitor_loop_async():
             if round_time < REQUEST_INTERVAL:
                 await asyncio.sleep(REQUEST_INTERVAL - round_time)
 
-            queue_size = db_queue.qsize()
-            logging.info(f"⏱️ 轮询完成:耗时 {round_time:.2f} 秒 | 队列: {queue_size}")
+            queue_size = db_pipeline.qsize()
+            requests_count = poller.last_round['status_requests'] + poller.last_round['onlives_requests']
+            logging.info(f"⏱️ 轮询完成:耗时 {round_time:.2f} 秒 | 检查: {checked_count}/{len(MEMBERS)} | 请求: {requests_count} | 队列: {queue_size}")
+
+            # 每 60 轮 (约 5 分钟) 输出一次各分级的实测检测延迟与 IP 健康状况
+            if scheduler and loop_count % 60 == 0:
+                scheduler.log_stats()
+            if ip_pool and loop_count % 60 == 0:
+                ip_pool.log_stats()
+            if loop_count % 60 == 0:
+                db_pipeline.log_stats()
             
-            if queue_size > 800:
-                logging.warning(f"⚠️ 队列堆积: {queue_size}/1000")
+            if queue_size > DB_QUEUE_MAXSIZE * 0.8:
+                logging.warning(f"⚠️ 队列堆积: {queue_size}/{DB_QUEUE_MAXSIZE}")
                 
     except KeyboardInterrupt:
         logging.info("收到停止信号...")
@@ -625,14 +653,16 @@ async def monitor_loop_async():
         
         logging.info("等待数据库队列清空...")
         try:
-            db_queue.join()
+            await db_pipeline.stop()
+            await assign_pipeline.stop()
+            db_pipeline.log_stats()
             logging.info("✅ 队列已清空")
         except Exception as e:
             logging.warning(f"⚠️ 队列清空失败: {e}")
         
-        db_thread.join(timeout=10)
-        if db_thread.is_alive():
-            logging.warning("⚠️ DB线程未能正常退出")
+        # 分片模式：让心跳立即过期，其它检测器尽快接管本实例的成员
+        if shard:
+            await asyncio.to_thread(release_monitor_heartbeat, INSTANCE_ID)
         
         # ✅ 关闭所有异步客户端
         logging.info("关闭HTTP客户端...")
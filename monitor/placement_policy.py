@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+录制器放置策略
+供 load_balancer_module.py 与 placement_simulator.py 调用：给一个新开播成员选择录制器
+
+策略 (mode):
+    least_loaded - 只看分配数，选最少的（旧行为，不考虑容量，用于模拟器对比）
+    capacity     - 遵守 MAX_CAPACITY，排除心跳过期的实例，按负载率选择
+    resource     - 在 capacity 基础上，按录制器上报的写入速率 / 剩余磁盘 / 系统负载加权
+
+粘性放置 (sticky): 成员在 sticky_seconds 内重新开播（断线重连）时优先回到上次的录制器，
+这样同一场直播的分片落在同一个目录树下
+
+录制器指标由 recorder/showroom-smart-start.py 定期写入 ADMIN.INSTANCE_METRICS:
+
+    CREATE TABLE ADMIN.INSTANCE_METRICS (
+        INSTANCE_ID          VARCHAR2(50) PRIMARY KEY,
+        WRITE_BYTES_PER_SEC  NUMBER,
+        NET_RECV_BYTES_PER_SEC NUMBER,
+        DISK_FREE_BYTES      NUMBER,
+        LOAD_AVG_1M          NUMBER,
+        CPU_COUNT            NUMBER,
+        ACTIVE_RECORDINGS    NUMBER,
+        REPORTED_AT          TIMESTAMP DEFAULT SYSTIMESTAMP
+    );
+
+本模块不依赖 config.py / 数据库
+"""
+
+import time
+
+MODES = ('least_loaded', 'capacity', 'resource')
+
+
+def make_node(instance_id: str, max_capacity: int = None, load: int = 0,
+              last_heartbeat: float = None, metrics: dict = None) -> dict:
+    """
+    录制器节点描述（字典）
+        last_heartbeat: 时间戳，None 表示从未上报
+        metrics: {'write_bytes_per_sec', 'net_recv_bytes_per_sec', 'disk_free_bytes',
+                  'load_avg', 'cpu_count', 'reported_at'}，None 表示没有指标
+    """
+    return {
+        'instance_id': instance_id,
+        'max_capacity': max_capacity,
+        'load': load,
+        'last_heartbeat': last_heartbeat,
+        'metrics': metrics,
+    }
+
+
+class PlacementPolicy:
+    """按容量、心跳与资源指标给录制器打分，分数越低越优先"""
+
+    def __init__(self, mode: str = 'resource',
+                 heartbeat_timeout: float = 180,
+                 require_heartbeat: bool = False,
+                 metrics_timeout: float = 300,
+                 min_free_disk_bytes: float = 20 * 1024 ** 3,
+                 bandwidth_budget: float = 50 * 1024 ** 2,
+                 sticky: bool = True,
+                 sticky_seconds: float = 1800,
+                 sticky_max_utilization: float = 0.9):
+        """
+        参数:
+            mode: 见模块说明
+            heartbeat_timeout: LAST_HEARTBEAT 超过该秒数视为失联，不再分配
+            require_heartbeat: 为 True 时从未上报心跳的实例也不分配
+            metrics_timeout: 指标超过该秒数视为过期，按无指标处理
+            min_free_disk_bytes: 剩余磁盘低于该值时不再分配
+            bandwidth_budget: 单台录制器的写入带宽预算（字节/秒），用于把写入速率归一化
+            sticky: 是否启用粘性放置
+            sticky_seconds: 下播后多久内重新开播仍回到原录制器
+            sticky_max_utilization: 原录制器负载率超过该值时放弃粘性
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的放置策略: {mode}")
+        self.mode = mode
+        self.heartbeat_timeout = heartbeat_timeout
+        self.require_heartbeat = require_heartbeat
+        self.metrics_timeout = metrics_timeout
+        self.min_free_disk_bytes = min_free_disk_bytes
+        self.bandwidth_budget = bandwidth_budget
+        self.sticky = sticky
+        self.sticky_seconds = sticky_seconds
+        self.sticky_max_utilization = sticky_max_utilization
+        # 粘性放置的记忆放在策略上：负载均衡器重连重建时沿用同一个策略实例即可保留
+        self._last_instance = {}    # {成员键: (instance_id, 下播时间戳)}
+
+    # ========================= 过滤 =========================
+
+    def _fresh_metrics(self, node: dict, now: float):
+        metrics = node.get('metrics')
+        if not metrics:
+            return None
+        reported_at = metrics.get('reported_at')
+        if reported_at is not None and now - reported_at > self.metrics_timeout:
+            return None
+        return metrics
+
+    def rejection_reason(self, node: dict, now: float = None):
+        """节点不可分配的原因；可分配时返回 None"""
+        if self.mode == 'least_loaded':
+            return None
+        now = now if now is not None else time.time()
+
+        capacity = node.get('max_capacity')
+        if capacity is not None and node['load'] >= capacity:
+            return 'full'
+
+        heartbeat = node.get('last_heartbeat')
+        if heartbeat is None:
+            if self.require_heartbeat:
+                return 'no_heartbeat'
+        elif now - heartbeat > self.heartbeat_timeout:
+            return 'stale_heartbeat'
+
+        if self.mode == 'resource':
+            metrics = self._fresh_metrics(node, now)
+            if metrics and metrics.get('disk_free_bytes') is not None \
+                    and metrics['disk_free_bytes'] < self.min_free_disk_bytes:
+                return 'low_disk'
+        return None
+
+    # ========================= 打分 =========================
+
+    def score(self, node: dict, now: float = None) -> float:
+        """分数越低越优先"""
+        if self.mode == 'least_loaded':
+            return float(node['load'])
+
+        capacity = node.get('max_capacity')
+        utilization = node['load'] / capacity if capacity else float(node['load'])
+        if self.mode == 'capacity':
+            return utilization
+
+        now = now if now is not None else time.time()
+        metrics = self._fresh_metrics(node, now)
+        if not metrics:
+            # 没有指标的实例只按负载率排序，稍微靠后（信息不足）
+            return utilization + 0.1
+
+        cpu_count = metrics.get('cpu_count') or 1
+        cpu_pressure = (metrics.get('load_avg') or 0) / cpu_count
+        write_rate = max(metrics.get('write_bytes_per_sec') or 0, metrics.get('net_recv_bytes_per_sec') or 0)
+        bandwidth_pressure = write_rate / self.bandwidth_budget if self.bandwidth_budget else 0
+        disk_free = metrics.get('disk_free_bytes')
+        # 剩余磁盘接近下限（2 倍以内）时逐渐加罚
+        disk_pressure = 0.0
+        if disk_free is not None and self.min_free_disk_bytes:
+            disk_pressure = max(0.0, 2.0 - disk_free / self.min_free_disk_bytes)
+
+        return utilization + 0.5 * min(cpu_pressure, 2.0) + 0.5 * min(bandwidth_pressure, 2.0) + disk_pressure
+
+    # ========================= 粘性记忆 =========================
+
+    def remember(self, member_key, instance_id: str, ended_at: float = None):
+        """记下成员下播时所在的录制器（顺便丢弃已超过粘性时长的旧记录）"""
+        ended_at = ended_at if ended_at is not None else time.time()
+        expired = [k for k, (_, t) in self._last_instance.items()
+                   if t is not None and ended_at - t > self.sticky_seconds]
+        for key in expired:
+            del self._last_instance[key]
+        self._last_instance[member_key] = (instance_id, ended_at)
+
+    def previous(self, member_key):
+        """成员上次的 (instance_id, 下播时间戳)，没有时 None；可直接传给 choose(previous=...)"""
+        return self._last_instance.get(member_key)
+
+    # ========================= 选择 =========================
+
+    def choose(self, nodes: list, previous: tuple = None, now: float = None):
+        """
+        为一个新开播成员选择录制器
+        参数:
+            nodes: make_node() 字典列表（load 为当前分配数）
+            previous: (上次的 instance_id, 上次下播时间戳)，用于粘性放置
+        返回:
+            (instance_id, reason)；没有可用录制器时 instance_id 为 None，reason 为各节点的拒绝原因
+        """
+        now = now if now is not None else time.time()
+        eligible = []
+        rejected = {}
+        for node in nodes:
+            reason = self.rejection_reason(node, now)
+            if reason:
+                rejected[node['instance_id']] = reason
+            else:
+                eligible.append(node)
+
+        if not eligible:
+            return None, rejected
+
+        if self.sticky and previous:
+            previous_id, ended_at = previous
+            if ended_at is None or now - ended_at <= self.sticky_seconds:
+                for node in eligible:
+                    if node['instance_id'] != previous_id:
+                        continue
+                    capacity = node.get('max_capacity')
+                    if not capacity or (node['load'] + 1) / capacity <= self.sticky_max_utilization:
+                        return previous_id, 'sticky'
+
+        best = min(eligible, key=lambda n: (self.score(n, now), n['load'], n['instance_id']))
+        return best['instance_id'], 'best'
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+录制器放置策略模拟器
+把一天的开播/下播事件按时间顺序重放到一组录制器上，比较不同放置策略的
+峰值负载、未能录制的直播（没有可用录制器 / 会超出容量而被拒绝）、因磁盘写满被截断的直播、
+断线重连回到原录制器的比例与最低剩余磁盘
+
+磁盘模型: 直播中按 BYTES_PER_LIVE 写盘，磁盘写满后该录制器上的直播被截断（剩余磁盘不会为负）；
+下播后这场直播的文件进入上传 / 清理，--cleanup-hours 之后释放（默认下播即释放）
+
+事件来源（三选一）:
+    --from-db --date 2025-01-31     读取 SHOWROOM_LIVE_HISTORY（需要数据库）
+    --csv history.csv               CSV: member_id,started_at,ended_at（ISO 时间，ended_at 可空）
+    --synthetic                     生成一天的模拟事件（晚间高峰 + 断线重连）
+
+录制器来源:
+    --nodes recorder-a:10,recorder-b:10:8:150    名称:容量[:CPU数[:剩余磁盘GB]]
+    --from-db 时默认读取 ADMIN.INSTANCES 中 active 的录制器
+
+使用示例:
+    python placement_simulator.py --synthetic --members 277 --nodes recorder-a:12,recorder-b:12,recorder-c:6:2:60
+    python placement_simulator.py --from-db --date 2025-01-31
+    python placement_simulator.py --synthetic --fail recorder-b@20:30-21:30
+"""
+
+import csv
+import sys
+import heapq
+import random
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from placement_policy import PlacementPolicy, make_node
+
+DEFAULT_POLICIES = ('least_loaded', 'capacity', 'capacity+sticky', 'resource', 'resource+sticky')
+
+# 单场直播的资源模型
+BYTES_PER_LIVE = 1.2 * 1024 ** 2    # 写入速率（字节/秒）
+LOAD_PER_LIVE = 0.35                # 对 1 分钟负载的贡献
+METRICS_INTERVAL = 30               # 录制器上报指标的间隔（秒），放置时看到的是上一次上报的值
+
+
+# ========================= 事件来源 =========================
+
+def load_events_from_csv(path: Path) -> list:
+    """CSV: member_id,started_at,ended_at"""
+    sessions = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            started_at = datetime.fromisoformat(row['started_at'])
+            ended_at = datetime.fromisoformat(row['ended_at']) if row.get('ended_at') else None
+            sessions.append((row['member_id'], started_at, ended_at))
+    return sessions
+
+
+def load_events_from_db(day: datetime) -> list:
+    sys.path.insert(0, str(Path(__file__).parent.parent / "shared"))
+    from config import get_db_connection, DB_HISTORY_TABLE
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ 无法连接数据库")
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT MEMBER_ID, STARTED_AT, ENDED_AT
+            FROM {DB_HISTORY_TABLE}
+            WHERE STARTED_AT >= :day_start AND STARTED_AT < :day_end
+            ORDER BY STARTED_AT
+        """, {'day_start': day, 'day_end': day + timedelta(days=1)})
+        sessions = cursor.fetchall()
+        cursor.close()
+        return sessions
+    finally:
+        conn.close()
+
+
+def load_nodes_from_db() -> list:
+    sys.path.insert(0, str(Path(__file__).parent.parent / "shared"))
+    from config import get_db_connection
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("❌ 无法连接数据库")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT INSTANCE_ID, MAX_CAPACITY
+            FROM ADMIN.INSTANCES
+            WHERE INSTANCE_TYPE = 'recorder' AND STATUS = 'active'
+            ORDER BY INSTANCE_ID
+        """)
+        nodes = [{'instance_id': r[0], 'max_capacity': r[1], 'cpu_count': 4, 'disk_free_gb': 200}
+                 for r in cursor.fetchall()]
+        cursor.close()
+        return nodes
+    finally:
+        conn.close()
+
+
+def synthetic_events(members: int, day: datetime, seed: int) -> list:
+    """
+    生成一天的模拟开播：约 1/3 的成员开播，集中在 12 点和 20~23 点，
+    时长对数正态（中位数约 35 分钟），15% 的直播中途断线 1~5 分钟后重连
+    """
+    rng = random.Random(seed)
+    sessions = []
+    for i in range(members):
+        if rng.random() > 0.35:
+            continue
+        member_id = f"member_{i:03d}"
+        for _ in range(rng.choice((1, 1, 1, 2))):
+            peak = rng.choice((12, 20, 21, 21, 22, 22, 23))
+            start = day + timedelta(hours=peak, minutes=rng.gauss(0, 25))
+            duration = timedelta(minutes=min(180, max(5, rng.lognormvariate(3.55, 0.5))))
+            if rng.random() < 0.15:
+                cut = duration * rng.uniform(0.2, 0.8)
+                gap = timedelta(minutes=rng.uniform(1, 5))
+                sessions.append((member_id, start, start + cut))
+                sessions.append((member_id, start + cut + gap, start + duration + gap))
+            else:
+                sessions.append((member_id, start, start + duration))
+    return sessions
+
+
+def parse_nodes(spec: str) -> list:
+    nodes = []
+    for item in filter(None, spec.split(",")):
+        parts = item.split(":")
+        nodes.append({
+            'instance_id': parts[0],
+            'max_capacity': int(parts[1]) if len(parts) > 1 and parts[1] else None,
+            'cpu_count': int(parts[2]) if len(parts) > 2 else 4,
+            'disk_free_gb': float(parts[3]) if len(parts) > 3 else 200,
+        })
+    return nodes
+
+
+def parse_failures(specs: list, day: datetime) -> dict:
+    """--fail recorder-b@20:30-21:30 → {instance_id: [(start, end), ...]}（期间心跳停止）"""
+    failures = {}
+    for spec in specs or []:
+        instance_id, window = spec.split("@")
+        start_s, end_s = window.split("-")
+        start = datetime.combine(day.date(), datetime.strptime(start_s, "%H:%M").time())
+        end = datetime.combine(day.date(), datetime.strptime(end_s, "%H:%M").time())
+        failures.setdefault(instance_id, []).append((start.timestamp(), end.timestamp()))
+    return failures
+
+
+# ========================= 模拟 =========================
+
+def make_policy(name: str, args) -> PlacementPolicy:
+    mode, _, flag = name.partition('+')
+    return PlacementPolicy(
+        mode=mode,
+        heartbeat_timeout=args.heartbeat_timeout,
+        min_free_disk_bytes=args.min_free_disk_gb * 1024 ** 3,
+        bandwidth_budget=args.bandwidth_budget_mb * 1024 ** 2,
+        sticky=(flag == 'sticky'),
+        sticky_seconds=args.sticky_seconds,
+    )
+
+
+def simulate(policy_name: str, sessions: list, node_specs: list, failures: dict, args) -> dict:
+    policy = make_policy(policy_name, args)
+    day_end = max((e or s) for _, s, e in sessions) + timedelta(minutes=1)
+
+    # 展开为事件：同一时刻先处理下播再处理开播
+    events = []
+    for member_id, started_at, ended_at in sessions:
+        events.append((started_at.timestamp(), 1, member_id))
+        events.append(((ended_at or day_end).timestamp(), 0, member_id))
+    events.sort()
+
+    nodes = {}
+    for spec in node_specs:
+        nodes[spec['instance_id']] = {
+            'spec': spec,
+            'load': 0,
+            'disk_free': spec['disk_free_gb'] * 1024 ** 3,
+            'peak': 0,
+            'min_disk_free': spec['disk_free_gb'] * 1024 ** 3,
+            'metrics': None,
+            'metrics_time': None,
+        }
+
+    placed = {}              # {member_id: [instance_id, 已写入字节数]}
+    cleanups = []            # [(释放时间, instance_id, 字节数)] 下播后上传/清理释放磁盘
+    last_recorder = {}       # {member_id: (instance_id, ended_at)}
+    truncated = set()        # 因磁盘写满被截断的 (member_id, instance_id)
+    stats = {
+        'assignments': 0,
+        'rejected': 0,
+        'over_capacity': 0,
+        'truncated': 0,
+        'reconnects': 0,
+        'reconnect_same_node': 0,
+        'stale_skips': 0,
+    }
+    clock = events[0][0] if events else 0
+
+    def heartbeat_ok(instance_id, t):
+        return not any(start <= t < end for start, end in failures.get(instance_id, []))
+
+    def advance(t):
+        nonlocal clock
+        dt = t - clock
+        clock = t
+        if dt > 0:
+            # 每台录制器按负载写盘；写满时只能写到 0，正在录的直播被截断
+            share = {}
+            for instance_id, n in nodes.items():
+                wanted = n['load'] * BYTES_PER_LIVE * dt
+                written = min(wanted, max(0.0, n['disk_free']))
+                n['disk_free'] -= written
+                n['min_disk_free'] = min(n['min_disk_free'], n['disk_free'])
+                share[instance_id] = (written / n['load'] if n['load'] else 0.0, written < wanted)
+            for member_id, entry in placed.items():
+                per_stream, full = share[entry[0]]
+                entry[1] += per_stream
+                if full and (member_id, entry[0]) not in truncated:
+                    truncated.add((member_id, entry[0]))
+                    stats['truncated'] += 1
+        while cleanups and cleanups[0][0] <= t:
+            _, instance_id, freed = heapq.heappop(cleanups)
+            nodes[instance_id]['disk_free'] += freed
+
+    for t, is_start, member_id in events:
+        advance(t)
+
+        if not is_start:
+            instance_id, written = placed.pop(member_id, (None, 0.0))
+            if instance_id:
+                nodes[instance_id]['load'] -= 1
+                truncated.discard((member_id, instance_id))
+                last_recorder[member_id] = (instance_id, t)
+                # 下播后上传 / 清理，释放这场直播实际写入的字节
+                heapq.heappush(cleanups, (t + args.cleanup_hours * 3600, instance_id, written))
+            continue
+
+        # 录制器上报的指标有延迟：每 METRICS_INTERVAL 秒刷新一次
+        view = []
+        for instance_id, n in nodes.items():
+            if n['metrics_time'] is None or t - n['metrics_time'] >= METRICS_INTERVAL:
+                n['metrics'] = {
+                    'write_bytes_per_sec': n['load'] * BYTES_PER_LIVE,
+                    'net_recv_bytes_per_sec': n['load'] * BYTES_PER_LIVE,
+                    'disk_free_bytes': n['disk_free'],
+                    'load_avg': n['load'] * LOAD_PER_LIVE,
+                    'cpu_count': n['spec']['cpu_count'],
+                    'reported_at': t,
+                }
+                n['metrics_time'] = t
+            alive = heartbeat_ok(instance_id, t)
+            if not alive:
+                stats['stale_skips'] += 1
+            view.append(make_node(
+                instance_id,
+                max_capacity=n['spec']['max_capacity'],
+                load=n['load'],
+                last_heartbeat=t if alive else t - policy.heartbeat_timeout - 1,
+                metrics=n['metrics'],
+            ))
+
+        previous = last_recorder.get(member_id)
+        is_reconnect = previous is not None and t - previous[1] <= args.sticky_seconds
+        instance_id, _ = policy.choose(view, previous=previous, now=t)
+        if instance_id is None:
+            stats['rejected'] += 1
+            continue
+
+        n = nodes[instance_id]
+        capacity = n['spec']['max_capacity']
+        if capacity is not None and n['load'] >= capacity:
+            # 录制器不会接超出容量的直播：这场直播没有录到
+            stats['over_capacity'] += 1
+            continue
+        n['load'] += 1
+        n['peak'] = max(n['peak'], n['load'])
+        placed[member_id] = [instance_id, 0.0]
+        stats['assignments'] += 1
+        if is_reconnect:
+            stats['reconnects'] += 1
+            if previous[0] == instance_id:
+                stats['reconnect_same_node'] += 1
+
+    stats['policy'] = policy_name
+    stats['nodes'] = {
+        instance_id: {
+            'capacity': n['spec']['max_capacity'],
+            'peak': n['peak'],
+            'min_disk_free_gb': round(n['min_disk_free'] / 1024 ** 3, 1),
+        }
+        for instance_id, n in nodes.items()
+    }
+    return stats
+
+
+def print_report(results: list, session_count: int):
+    print(f"\n重放 {session_count} 场直播\n")
+    print(f"{'策略':<18} {'分配':>6} {'无可用':>6} {'超容量':>6} {'未录制':>6} {'磁盘满截断':>10} {'重连同节点':>12}"
+          f"  峰值负载/容量 (最低剩余磁盘GB)")
+    print("-" * 120)
+    for r in results:
+        reconnect = f"{r['reconnect_same_node']}/{r['reconnects']}"
+        unrecorded = r['rejected'] + r['over_capacity']
+        peaks = "  ".join(
+            f"{name}={n['peak']}/{n['capacity'] or '-'}({n['min_disk_free_gb']})"
+            for name, n in r['nodes'].items()
+        )
+        print(f"{r['policy']:<18} {r['assignments']:>6} {r['rejected']:>6} {r['over_capacity']:>6} "
+              f"{unrecorded:>6} {r['truncated']:>10} {reconnect:>12}  {peaks}")
+    print("\n未录制 = 没有可用录制器 + 会超出容量而被拒绝；磁盘满截断 = 录制中途磁盘写满的直播")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='录制器放置策略模拟器')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--from-db', action='store_true', help='从 SHOWROOM_LIVE_HISTORY 读取')
+    source.add_argument('--csv', type=Path, help='CSV 文件: member_id,started_at,ended_at')
+    source.add_argument('--synthetic', action='store_true', help='生成模拟的一天')
+    parser.add_argument('--date', help='重放的日期 YYYY-MM-DD（默认昨天）')
+    parser.add_argument('--members', type=int, default=277, help='--synthetic 的成员数')
+    parser.add_argument('--seed', type=int, default=48)
+    parser.add_argument('--nodes', help='录制器列表 名称:容量[:CPU数[:剩余磁盘GB]]，逗号分隔')
+    parser.add_argument('--fail', action='append', help='模拟心跳中断 实例@HH:MM-HH:MM，可重复')
+    parser.add_argument('--policies', default=",".join(DEFAULT_POLICIES), help='逗号分隔的策略列表')
+    parser.add_argument('--heartbeat-timeout', type=float, default=180)
+    parser.add_argument('--min-free-disk-gb', type=float, default=20)
+    parser.add_argument('--bandwidth-budget-mb', type=float, default=50)
+    parser.add_argument('--sticky-seconds', type=float, default=1800)
+    parser.add_argument('--cleanup-hours', type=float, default=0,
+                        help='下播后多久上传完成并释放磁盘（默认 0: 下播即释放）')
+    args = parser.parse_args()
+
+    day = datetime.strptime(args.date, "%Y-%m-%d") if args.date else \
+        datetime.combine(datetime.now().date() - timedelta(days=1), datetime.min.time())
+
+    if args.from_db:
+        sessions = load_events_from_db(day)
+    elif args.csv:
+        sessions = load_events_from_csv(args.csv)
+    else:
+        sessions = synthetic_events(args.members, day, args.seed)
+
+    if not sessions:
+        sys.exit("❌ 没有可重放的开播记录")
+
+    if args.nodes:
+        node_specs = parse_nodes(args.nodes)
+    elif args.from_db:
+        node_specs = load_nodes_from_db()
+    else:
+        node_specs = parse_nodes("recorder-a:12,recorder-b:12,recorder-c:8:2:80")
+
+    failures = parse_failures(args.fail, day)
+    results = [simulate(name, sessions, node_specs, failures, args)
+               for name in args.policies.split(",") if name]
+    print_report(results, len(sessions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+自适应轮询调度器
+供 monitor_showroom.py 调用：根据 SHOWROOM_LIVE_HISTORY 的开播规律，
+给每个成员计算下一次检查时间，用最小堆按到期时间取出
+
+分级策略:
+    live    - 正在直播（或刚下播的冷却期内）: 高频检查，及时发现下播/重连
+    hot     - 历史上常在当前时段开播:       高频检查
+    warm    - 偶尔在当前时段开播/近期活跃:   中频检查
+    dormant - 长期未开播:                  低频检查（30~60 秒）
+所有分级都受 max_latency 上限约束，保证任何成员的检测延迟都有硬上限
+"""
+
+import heapq
+import time
+import logging
+from collections import defaultdict, deque
+from datetime import datetime
+
+TIERS = ('live', 'hot', 'warm', 'dormant')
+
+# 一周 168 个小时槽
+HOURS_PER_WEEK = 168
+
+
+class AdaptivePollScheduler:
+    """按成员开播概率分级的轮询调度器（最小堆，键为下次到期时间）"""
+
+    def __init__(self,
+                 live_interval: float = 5,
+                 hot_interval: float = 5,
+                 warm_interval: float = 15,
+                 dormant_min_interval: float = 30,
+                 dormant_max_interval: float = 60,
+                 max_latency: float = 60,
+                 hot_probability: float = 0.2,
+                 warm_probability: float = 0.05,
+                 recent_days: float = 7,
+                 cooldown_seconds: float = 600):
+        """
+        参数:
+            *_interval: 各分级的检查间隔（秒）
+            dormant_min_interval / dormant_max_interval: 休眠成员的间隔区间，
+                越久没开播越接近上限
+            max_latency: 任何成员两次检查之间的硬上限（秒）
+            hot_probability / warm_probability: 当前时段开播概率的分级阈值
+            recent_days: 多少天内开过播视为近期活跃（至少 warm）
+            cooldown_seconds: 下播后继续按 live 频率检查的时长（应对断线重连）
+        """
+        self.intervals = {
+            'live': live_interval,
+            'hot': hot_interval,
+            'warm': warm_interval,
+        }
+        self.dormant_min_interval = dormant_min_interval
+        self.dormant_max_interval = dormant_max_interval
+        self.max_latency = max_latency
+        self.hot_probability = hot_probability
+        self.warm_probability = warm_probability
+        self.recent_days = recent_days
+        self.cooldown_seconds = cooldown_seconds
+
+        self._heap = []             # [(due, seq, member_id)]
+        self._seq = 0
+        self._entry_seq = {}        # {member_id: seq} 惰性删除：只有最新的堆条目有效
+        self._members = {}          # {member_id: member}
+        self._tier = {}             # {member_id: tier}
+        self._live = set()
+        self._ended_at = {}         # {member_id: 下播时间戳}
+
+        # 开播先验: {member_id: {'week': [168], 'day': [24], 'weeks': float, 'last_start': ts}}
+        self._priors = {}
+
+        # 指标
+        self._latency = {tier: deque(maxlen=500) for tier in TIERS}
+        self._detections = defaultdict(int)
+        self._polls = defaultdict(int)
+        self._max_gap = defaultdict(float)
+        self._last_polled = {}
+
+    # ========================= 成员与先验 =========================
+
+    def sync_members(self, members: list, now: float = None):
+        """同步成员列表：新成员立即到期，已删除成员惰性移出堆"""
+        now = now if now is not None else time.time()
+        current = {m['id']: m for m in members}
+
+        for member_id in list(self._members):
+            if member_id not in current:
+                self._members.pop(member_id, None)
+                self._entry_seq.pop(member_id, None)
+                self._tier.pop(member_id, None)
+                self._live.discard(member_id)
+                self._ended_at.pop(member_id, None)
+                self._last_polled.pop(member_id, None)
+
+        for member_id, member in current.items():
+            if member_id not in self._members:
+                self._push(member_id, now)
+            self._members[member_id] = member
+
+    def load_history(self, rows, history_days: float, now: float = None):
+        """
+        根据开播历史建立每个成员的开播时段分布
+        参数:
+            rows: [(member_id, started_at: datetime), ...]
+            history_days: 历史统计窗口（天），用于把次数换算成概率
+        """
+        now = now if now is not None else time.time()
+        weeks = max(history_days / 7.0, 1.0)
+        priors = {}
+        for member_id, started_at in rows:
+            if not started_at:
+                continue
+            prior = priors.get(member_id)
+            if prior is None:
+                prior = priors[member_id] = {
+                    'week': [0] * HOURS_PER_WEEK,
+                    'day': [0] * 24,
+                    'weeks': weeks,
+                    'days': max(history_days, 1.0),
+                    'last_start': 0.0,
+                }
+            prior['week'][started_at.weekday() * 24 + started_at.hour] += 1
+            prior['day'][started_at.hour] += 1
+            prior['last_start'] = max(prior['last_start'], started_at.timestamp())
+
+        self._priors = priors
+        # 先验更新后重新分级（不改变已排好的到期时间）
+        for member_id in self._members:
+            self._tier[member_id] = self.tier_for(member_id, now)
+        logging.info(f"📈 [调度器] 已加载 {len(rows)} 条开播记录，覆盖 {len(priors)} 个成员")
+
+    def start_probability(self, member_id: str, now: float = None) -> float:
+        """估计成员在当前时段（前后各 1 小时）开播的概率"""
+        prior = self._priors.get(member_id)
+        if not prior:
+            return 0.0
+        now = now if now is not None else time.time()
+        dt = datetime.fromtimestamp(now)
+        slot = dt.weekday() * 24 + dt.hour
+
+        week_hits = sum(prior['week'][(slot + d) % HOURS_PER_WEEK] for d in (-1, 0, 1))
+        day_hits = sum(prior['day'][(dt.hour + d) % 24] for d in (-1, 0, 1))
+        # 周规律与日规律取较大者：每周固定开播的成员和每天开播的成员都能识别
+        return min(1.0, max(week_hits / prior['weeks'], day_hits / prior['days']))
+
+    def tier_for(self, member_id: str, now: float = None) -> str:
+        now = now if now is not None else time.time()
+        if member_id in self._live:
+            return 'live'
+        ended_at = self._ended_at.get(member_id)
+        if ended_at and now - ended_at < self.cooldown_seconds:
+            return 'live'
+
+        probability = self.start_probability(member_id, now)
+        if probability >= self.hot_probability:
+            return 'hot'
+        if probability >= self.warm_probability:
+            return 'warm'
+        prior = self._priors.get(member_id)
+        if prior and now - prior['last_start'] < self.recent_days * 86400:
+            return 'warm'
+        return 'dormant'
+
+    def interval_for(self, member_id: str, tier: str, now: float) -> float:
+        if tier != 'dormant':
+            interval = self.intervals[tier]
+        else:
+            # 越久没开播间隔越长，90 天以上（或无记录）取上限
+            prior = self._priors.get(member_id)
+            idle_days = (now - prior['last_start']) / 86400 if prior else 90
+            ratio = min(max(idle_days / 90.0, 0.0), 1.0)
+            interval = self.dormant_min_interval + ratio * (self.dormant_max_interval - self.dormant_min_interval)
+        return min(interval, self.max_latency)
+
+    # ========================= 调度 =========================
+
+    def _push(self, member_id: str, due: float):
+        self._seq += 1
+        self._entry_seq[member_id] = self._seq
+        heapq.heappush(self._heap, (due, self._seq, member_id))
+
+    def pop_due(self, horizon: float) -> list:
+        """取出所有到期时间 <= horizon 的成员（按到期先后）"""
+        due_members = []
+        while self._heap and self._heap[0][0] <= horizon:
+            due, seq, member_id = heapq.heappop(self._heap)
+            if self._entry_seq.get(member_id) != seq:
+                continue  # 已失效的旧条目
+            member = self._members.get(member_id)
+            if member is not None:
+                self._entry_seq.pop(member_id, None)
+                due_members.append(member)
+        return due_members
+
+    def reschedule(self, member_id: str, is_live, base_time: float):
+        """
+        检查完成后安排下一次检查
+        参数:
+            is_live: 本次检查结果；None 表示请求失败，按 live 频率尽快重试
+            base_time: 本轮的计划开始时间（以它为基准可避免调度漂移）
+        """
+        if member_id not in self._members:
+            return
+
+        if is_live is True:
+            self._live.add(member_id)
+            self._ended_at.pop(member_id, None)
+        elif is_live is False and member_id in self._live:
+            self._live.discard(member_id)
+            self._ended_at[member_id] = base_time
+
+        tier = self.tier_for(member_id, base_time)
+        self._tier[member_id] = tier
+        interval = self.intervals['live'] if is_live is None else self.interval_for(member_id, tier, base_time)
+
+        last = self._last_polled.get(member_id)
+        if last is not None:
+            self._max_gap[tier] = max(self._max_gap[tier], base_time - last)
+        self._last_polled[member_id] = base_time
+        self._polls[tier] += 1
+
+        self._push(member_id, base_time + interval)
+
+    def next_due_time(self):
+        """堆中最早的到期时间（无成员时返回 None）"""
+        while self._heap and self._entry_seq.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    # ========================= 指标 =========================
+
+    def record_detection(self, member_id: str, started_at: datetime, detected_at: float = None):
+        """记录一次开播检测：延迟 = 检测时间 - Showroom 返回的开播时间"""
+        if not started_at:
+            return
+        detected_at = detected_at if detected_at is not None else time.time()
+        # 用检测前的分级归类（检测后它已经变成 live）
+        tier = self._tier.get(member_id, 'dormant')
+        latency = max(0.0, detected_at - started_at.timestamp())
+        self._latency[tier].append(latency)
+        self._detections[tier] += 1
+
+    def stats_snapshot(self) -> dict:
+        """各分级的成员数、间隔、检查次数与实测检测延迟"""
+        counts = defaultdict(int)
+        for tier in self._tier.values():
+            counts[tier] += 1
+
+        snapshot = {}
+        for tier in TIERS:
+            samples = sorted(self._latency[tier])
+            snapshot[tier] = {
+                'members': counts[tier],
+                'interval': self.intervals.get(tier, f"{self.dormant_min_interval:.0f}-{self.dormant_max_interval:.0f}"),
+                'polls': self._polls[tier],
+                'max_gap': round(self._max_gap[tier], 1),
+                'detections': self._detections[tier],
+                'latency_p50': _percentile(samples, 0.5),
+                'latency_p90': _percentile(samples, 0.9),
+                'latency_max': round(samples[-1], 1) if samples else None,
+            }
+        return snapshot
+
+    def log_stats(self):
+        for tier, s in self.stats_snapshot().items():
+            logging.info(
+                f"📊 [调度器] {tier:<7} 成员 {s['members']:>3} | 间隔 {s['interval']}s | "
+                f"检查 {s['polls']} 次 (最大间隔 {s['max_gap']}s) | "
+                f"开播检测 {s['detections']} 次, 延迟 p50={s['latency_p50']}s p90={s['latency_p90']}s max={s['latency_max']}s"
+            )
+
+
+def _percentile(sorted_samples: list, q: float):
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, int(q * len(sorted_samples)))
+    return round(sorted_samples[index], 1)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Showroom API 访问层
+供 monitor_showroom.py / bench_poller.py 调用，所有 HTTP 请求都经过可替换的 fetcher，
+离线测试时只需把 base_url 指向本地假服务器 (fake_showroom_server.py)
+
+本模块不依赖 config.py / 数据库，可以单独导入
+"""
+
+import logging
+from datetime import datetime
+
+SHOWROOM_API_BASE = "https://www.showroom-live.com"
+
+ROOM_STATUS_PATH = "/api/room/status"
+ONLIVES_PATH = "/api/live/onlives"
+
+
+class HttpxFetcher:
+    """
+    默认的 fetcher：用调用方传入的 httpx.AsyncClient（已绑定出口 IP）发起 GET 请求
+
+    fetcher 接口只有一个方法:
+        async get_json(client, path, params) -> (status_code, data)
+        data 为解析后的 JSON；非 JSON 响应时为 None；网络异常直接抛出
+    """
+
+    def __init__(self, base_url: str = SHOWROOM_API_BASE):
+        self.base_url = base_url.rstrip("/")
+
+    async def get_json(self, client, path: str, params: dict = None):
+        res = await client.get(f"{self.base_url}{path}", params=params)
+        if res.status_code != 200:
+            return res.status_code, None
+        try:
+            return res.status_code, res.json()
+        except ValueError:
+            return res.status_code, None
+
+
+def generate_key(member):
+    """生成room_url_key"""
+    name_en = member.get("name_en", "")
+    parts = name_en.split(" ")
+    if len(parts) == 2:
+        key_suffix = f"{parts[1]}_{parts[0]}"
+    else:
+        key_suffix = name_en.replace(" ", "_")
+    return f"48_{key_suffix}"
+
+
+async def is_live_async(member_id, room_url_key, client, fetcher):
+    """
+    异步检查直播状态
+    返回: (is_live, started_at, status_code)
+        请求异常/被限流时 is_live 为 None，调用方应跳过本次结果
+    """
+    try:
+        status_code, data = await fetcher.get_json(client, ROOM_STATUS_PATH, {"room_url_key": room_url_key})
+        if status_code != 200:
+            logging.warning(f"[{member_id}] 请求异常: {status_code}")
+            return None, None, status_code
+
+        if data is None:
+            logging.warning(f"[{member_id}] 返回非JSON内容,可能被限流")
+            return None, None, status_code
+
+        is_live_flag = data.get("is_live", False)
+        started_at_raw = data.get("started_at") if is_live_flag else None
+
+        if started_at_raw:
+            started_at = datetime.fromtimestamp(started_at_raw)
+        else:
+            started_at = None
+
+        return is_live_flag, started_at, status_code
+    except Exception:
+        # 超时 / 网络错误不等于下播：返回 None，调用方保留上一次的状态
+        logging.exception(f"[{member_id}] 获取直播状态失败")
+        return None, None, None
+
+
+async def fetch_onlives(client, fetcher):
+    """
+    一次请求获取当前所有正在直播的房间
+    返回: (live_rooms, status_code)
+        live_rooms: {room_id(str): started_at(datetime 或 None)}，失败时为 None
+        status_code: 请求异常时为 None
+    """
+    try:
+        status_code, data = await fetcher.get_json(client, ONLIVES_PATH)
+    except Exception as e:
+        logging.warning(f"[发现] onlives 请求失败: {e}")
+        return None, None
+
+    if status_code != 200 or not isinstance(data, dict):
+        logging.warning(f"[发现] onlives 响应异常: {status_code}")
+        return None, status_code
+
+    live_rooms = {}
+    for genre in data.get("onlives", []):
+        for live in genre.get("lives", []):
+            room_id = live.get("room_id")
+            if room_id is None:
+                continue
+            started_at_raw = live.get("started_at")
+            live_rooms[str(room_id)] = datetime.fromtimestamp(started_at_raw) if started_at_raw else None
+    return live_rooms, status_code
+
+
+class OnlivesDiscovery:
+    """
+    批量发现模式：每轮先拉一次 onlives 列表，与成员 room_id 索引求交集，
+    只对「状态可能变化」的成员发单房间请求确认（同时拿到 started_at）
+
+    为防止 onlives 列表漏项，每个成员仍会按 verify_interval 轮流做一次单房间校验
+    """
+
+    def __init__(self, request_interval: float = 5, verify_interval: float = 60):
+        self.request_interval = request_interval
+        self.verify_interval = verify_interval
+        self._room_index = {}      # {room_id(str): member_id}
+        self._index_source = None  # 建索引时的成员列表对象，列表变化时重建
+        self._verify_cursor = 0
+
+    def _ensure_index(self, members: list):
+        if self._index_source is members and len(self._room_index) == len(members):
+            return
+        self._room_index = {str(m['room_id']): m['id'] for m in members if m.get('room_id') is not None}
+        self._index_source = members
+
+    def plan_round(self, members: list, previous_status: dict, live_rooms: dict):
+        """
+        根据 onlives 结果规划本轮
+        返回: (to_confirm, inferred)
+            to_confirm: 需要发单房间请求的成员列表
+            inferred:   [(member, is_live, started_at)] 无需请求、可直接写入的状态
+        """
+        self._ensure_index(members)
+        live_member_ids = {self._room_index[r] for r in live_rooms if r in self._room_index}
+
+        # 轮流抽取一部分成员做单房间校验，verify_interval 内覆盖全部成员
+        verify_count = 0
+        if members and self.verify_interval > 0:
+            verify_count = max(1, -(-len(members) * self.request_interval // self.verify_interval))
+            verify_count = int(min(verify_count, len(members)))
+        verify_ids = set()
+        for i in range(verify_count):
+            verify_ids.add(members[(self._verify_cursor + i) % len(members)]['id'])
+        if members:
+            self._verify_cursor = (self._verify_cursor + verify_count) % len(members)
+
+        changed, verify, inferred = [], [], []
+        for member in members:
+            member_id = member['id']
+            prev = previous_status.get(member_id)
+            now_live = member_id in live_member_ids
+
+            if prev is None or prev.get('is_live') != now_live:
+                # 新开播 / 疑似下播 / 首次观察 → 单房间请求确认
+                changed.append(member)
+            elif member_id in verify_ids:
+                verify.append(member)
+            elif now_live:
+                started_at = prev.get('started_at') or live_rooms.get(str(member.get('room_id')))
+                inferred.append((member, True, started_at))
+            else:
+                inferred.append((member, False, None))
+        # 状态变化的成员排在前面，本轮最先发出请求，校验请求随后平滑铺开
+        return changed + verify, inferred
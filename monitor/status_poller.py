@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+直播状态轮询引擎
+供 monitor_showroom.py 调用：负责一轮内的请求调度（IP 选择、时间平滑、
+自适应调度、onlives 批量发现），结果通过 on_status 回调交给调用方写库
+
+本模块不依赖 config.py / 数据库，bench_poller.py 可以直接驱动它做离线压测
+"""
+
+import time
+import random
+import asyncio
+import inspect
+import logging
+from collections import deque
+
+from showroom_api import HttpxFetcher, is_live_async, fetch_onlives, generate_key
+
+
+class StatusPoller:
+    """一轮一轮地检查成员直播状态"""
+
+    def __init__(self, ip_clients: list, on_status, request_interval: float = 5,
+                 fetcher=None, scheduler=None, discovery=None, ip_pool=None):
+        """
+        参数:
+            ip_clients: 绑定了不同出口 IP 的 httpx.AsyncClient 列表
+            on_status: 回调 on_status(member, is_live, started_at)，可以是协程函数；
+                调用时 previous_status 仍是上一次的状态
+            request_interval: 每轮的目标时长（秒）
+            fetcher: HTTP 访问层，默认 HttpxFetcher()
+            scheduler: AdaptivePollScheduler，None 表示每轮检查所有成员
+            discovery: OnlivesDiscovery，None 表示不使用批量发现
+            ip_pool: IPPoolManager，按健康度与限速选择 IP；None 表示每轮随机打乱 IP 列表
+        """
+        self.ip_clients = ip_clients
+        self.on_status = on_status
+        self.request_interval = request_interval
+        self.fetcher = fetcher or HttpxFetcher()
+        self.scheduler = scheduler
+        self.discovery = discovery
+        self.ip_pool = ip_pool
+
+        self.previous_status = {}   # {member_id: {'is_live': bool, 'started_at': datetime}}
+        self.detection_latencies = deque(maxlen=1000)
+        self.stats = {
+            'rounds': 0,
+            'status_requests': 0,
+            'onlives_requests': 0,
+            'inferred': 0,
+            'errors': 0,
+        }
+        self.last_round = {'status_requests': 0, 'onlives_requests': 0, 'inferred': 0}
+
+    async def run_round(self, members: list, round_start: float = None) -> int:
+        """
+        执行一轮检查
+        返回: 本轮发出单房间请求的成员数
+        """
+        round_start = round_start or time.time()
+        self.stats['rounds'] += 1
+        self.last_round = {'status_requests': 0, 'onlives_requests': 0, 'inferred': 0}
+
+        # 1. 批量发现：一次 onlives 请求覆盖所有成员，只确认可能变化的成员
+        if self.discovery and self.ip_clients:
+            if self.ip_pool:
+                client = await self.ip_pool.acquire()
+                t0 = time.monotonic()
+                live_rooms, status_code = await fetch_onlives(client, self.fetcher)
+                self.ip_pool.release(client, time.monotonic() - t0, status_code, live_rooms is not None)
+            else:
+                live_rooms, _ = await fetch_onlives(random.choice(self.ip_clients), self.fetcher)
+            self._count('onlives_requests', 1)
+            if live_rooms is not None:
+                to_confirm, inferred = self.discovery.plan_round(members, self.previous_status, live_rooms)
+                for member, is_live_flag, started_at in inferred:
+                    await self._emit(member, is_live_flag, started_at)
+                self._count('inferred', len(inferred))
+                await self._check_members(to_confirm, round_start, reschedule=False)
+                return len(to_confirm)
+            logging.warning("[发现] onlives 获取失败，本轮退回单房间轮询")
+
+        # 2. 自适应调度：只检查本轮到期的成员
+        if self.scheduler:
+            # 到期时间落在本轮前半段的成员都在本轮检查，避免 5.01 秒的成员被拖到下一轮
+            members = self.scheduler.pop_due(round_start + self.request_interval / 2)
+
+        await self._check_members(members, round_start, reschedule=bool(self.scheduler))
+        return len(members)
+
+    def _count(self, key: str, n: int):
+        self.stats[key] += n
+        self.last_round[key] += n
+
+    async def _emit(self, member: dict, is_live_flag, started_at):
+        member_id = member["id"]
+        prev_record = self.previous_status.get(member_id, {})
+
+        # ✅ 记录开播检测延迟（启动后第一次看到的直播不算，延迟没有意义）
+        if is_live_flag and prev_record and not prev_record.get('is_live') and started_at:
+            self.detection_latencies.append(max(0.0, time.time() - started_at.timestamp()))
+            if self.scheduler:
+                self.scheduler.record_detection(member_id, started_at)
+
+        result = self.on_status(member, is_live_flag, started_at)
+        if inspect.isawaitable(result):
+            await result
+
+        # 更新内存状态
+        self.previous_status[member_id] = {'is_live': is_live_flag, 'started_at': started_at}
+
+    async def check_single_member(self, member: dict, client=None):
+        """检查单个成员；client 为 None 时从 IP 池租用一个客户端"""
+        member_id = member["id"]
+        room_url_key = member.get("room_url_key") or generate_key(member)
+
+        leased = client is None
+        if leased:
+            client = await self.ip_pool.acquire()
+
+        # 1. 异步获取当前直播状态
+        is_live_flag, status_code = None, None
+        t0 = time.monotonic()
+        try:
+            is_live_flag, started_at, status_code = await is_live_async(member_id, room_url_key, client, self.fetcher)
+        finally:
+            if leased:
+                # 200 但 is_live 为 None 说明返回了非 JSON 内容
+                self.ip_pool.release(client, time.monotonic() - t0, status_code, is_live_flag is not None)
+        self._count('status_requests', 1)
+
+        if is_live_flag is not None:
+            await self._emit(member, is_live_flag, started_at)
+        return is_live_flag
+
+    async def _check_members(self, members: list, round_start: float, reschedule: bool):
+        """
+        动态平滑并发：确保请求在均匀分布，且每个 IP 瞬时只负责一个成员
+        """
+        total_members = len(members)
+        if total_members == 0 or not self.ip_clients:
+            return
+
+        # 1. 计算步进间隔
+        target_fill_time = (self.request_interval - 0.1)
+        interval = target_fill_time / total_members
+
+        # 2. 限制总并发数为 IP 数量，确保资源不超载
+        sem = asyncio.Semaphore(len(self.ip_clients))
+
+        # 3. 【关键】每一轮都生成一个随机顺序的 IP 客户端列表
+        # 这样可以打破“成员A 永远用 IP_1”的固定关系
+        shuffled_clients = self.ip_clients.copy()
+        random.shuffle(shuffled_clients)
+
+        async def throttled_check(member, client, index):
+            # 按计算好的时间点出发，实现平滑请求
+            await asyncio.sleep(index * interval)
+
+            async with sem:
+                is_live_flag = None
+                try:
+                    is_live_flag = await self.check_single_member(member, client)
+                    return is_live_flag
+                finally:
+                    # 无论成功与否都要重新入堆，否则该成员会永远不再被检查
+                    if reschedule:
+                        self.scheduler.reschedule(member["id"], is_live_flag, round_start)
+
+        tasks = []
+        num_ips = len(shuffled_clients)
+
+        for i, member in enumerate(members):
+            # 4. 【核心】使用打乱后的 IP 列表进行轮询；有 IP 池时在出发时刻再按健康度选择
+            client = None if self.ip_pool else shuffled_clients[i % num_ips]
+            tasks.append(throttled_check(member, client, i))
+
+        # 并发执行
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        # 错误统计
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            self.stats['errors'] += len(errors)
+            logging.warning(f"本轮完成，其中 {len(errors)} 个请求发生代码级异常")
+
+    def forget(self, keep_ids: set) -> int:
+        """清理已不在成员列表中的状态，返回清理数量"""
+        old_count = len(self.previous_status)
+        self.previous_status = {k: v for k, v in self.previous_status.items() if k in keep_ids}
+        return old_count - len(self.previous_status)
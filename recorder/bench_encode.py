@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+拉伸编码参数基准（在本机上跑，不依赖真实直播片段）
+    1. 用 lavfi testsrc2 生成 1080p 原始画面，缩到 Showroom 的 360p 规格（H.264 ~700kbps, 30fps, AAC 48kHz）
+       编成 MPEG-TS 作为拉伸的输入
+    2. 对 preset × CRF × 缩放算法 × 线程数 的组合，用 upscaler 实际使用的编码命令拉伸到 1080p
+    3. 统计编码速度（fps、倍速）、CPU 秒数、输出码率，并与 1080p 原始画面比较 SSIM / PSNR
+    4. 结果写成 JSON；encode_profile.py 读取它，为每个编码分到的线程数选
+       "SSIM 不低于最佳结果 max_ssim_drop 的前提下最快" 的参数
+
+需要 ffmpeg（带 libx264）
+
+使用示例:
+    python bench_encode.py
+    python bench_encode.py --quick
+    python bench_encode.py --presets ultrafast superfast --crfs 18 20 --scalers bicubic lanczos --threads 2 4
+    python bench_encode.py --output /tmp/encode_bench_test.json --duration 30
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import itertools
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "shared"))
+from upscaler import _encode_cmd
+try:
+    from config import ENCODE_BENCH_FILE
+except ImportError:
+    # 4C 编码机上可能没有 cx_Oracle（config.py 会导入它），用与 config 相同的默认路径
+    ENCODE_BENCH_FILE = Path("~/encode_bench.json").expanduser()
+
+SOURCE = {'width': 640, 'height': 360, 'fps': 30, 'video_bitrate': "700k", 'audio_rate': 48000}
+TARGET = (1920, 1080)
+
+
+def cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def reference_input(duration: float) -> list:
+    """1080p 原始画面（lavfi 生成，每次完全一致）"""
+    return ["-f", "lavfi", "-i", f"testsrc2=size={TARGET[0]}x{TARGET[1]}:rate={SOURCE['fps']}:duration={duration}"]
+
+
+def make_source(path: Path, duration: float):
+    subprocess.run([
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        *reference_input(duration),
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate={SOURCE['audio_rate']}:duration={duration}",
+        "-vf", f"scale={SOURCE['width']}:{SOURCE['height']}",
+        "-c:v", "libx264", "-preset", "veryfast", "-b:v", SOURCE['video_bitrate'], "-g", str(SOURCE['fps'] * 2),
+        "-c:a", "aac", "-b:a", "128k",
+        "-f", "mpegts", str(path)
+    ], check=True)
+
+
+def measure_quality(output: Path, duration: float):
+    """与 1080p 原始画面逐帧比较: (SSIM All, PSNR average)"""
+    graph = ("[0:v]setpts=PTS-STARTPTS,format=yuv420p[d];"
+             "[1:v]setpts=PTS-STARTPTS,format=yuv420p,split[r1][r2];"
+             "[d][r1]ssim[s];[s][r2]psnr")
+    proc = subprocess.run([
+        "ffmpeg", "-hide_banner", "-loglevel", "info",
+        "-i", str(output), *reference_input(duration),
+        "-lavfi", graph, "-f", "null", "-"
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    ssim = re.search(r'SSIM .*All:([\d.]+)', proc.stderr)
+    psnr = re.search(r'PSNR .*average:([\d.]+|inf)', proc.stderr)
+    return (float(ssim.group(1)) if ssim else None,
+            float(psnr.group(1)) if psnr and psnr.group(1) != "inf" else None)
+
+
+def run_one(source: Path, work: Path, duration: float, preset: str, crf: int, scaler: str, threads: int) -> dict:
+    output = work / f"{preset}_crf{crf}_{scaler}_t{threads}.mp4"
+    profile = {'fps': str(SOURCE['fps']), 'target': list(TARGET), 'scaler': scaler, 'preset': preset, 'crf': crf}
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    subprocess.run(_encode_cmd(str(source), output, profile, threads), check=True)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    ssim, psnr = measure_quality(output, duration)
+    result = {
+        'preset': preset, 'crf': crf, 'scaler': scaler, 'threads': threads,
+        'wall': round(wall, 3),
+        'fps': round(duration * SOURCE['fps'] / wall, 2),
+        'realtime': round(duration / wall, 3),
+        'cpu_seconds': round(cpu, 3),
+        'bitrate_kbps': round(output.stat().st_size * 8 / duration / 1000, 1),
+        'ssim': ssim,
+        'psnr': psnr,
+    }
+    output.unlink(missing_ok=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='拉伸编码参数基准')
+    parser.add_argument('--presets', nargs='+', default=["ultrafast", "superfast", "veryfast"])
+    parser.add_argument('--crfs', nargs='+', type=int, default=[18, 20, 23])
+    parser.add_argument('--scalers', nargs='+', default=["bilinear", "bicubic", "lanczos"])
+    parser.add_argument('--threads', nargs='+', type=int, default=None, help='默认 1、2、4… 直到 CPU 核数')
+    parser.add_argument('--duration', type=float, default=20, help='测试片段秒数')
+    parser.add_argument('--quick', action='store_true', help='只跑 ultrafast/superfast × CRF 18 × bicubic/lanczos')
+    parser.add_argument('--output', default=str(ENCODE_BENCH_FILE),
+                        help='结果 JSON（默认 config.ENCODE_BENCH_FILE，checker_4c 经 encode_profile 读取）')
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        raise SystemExit("需要 ffmpeg")
+
+    cores = os.cpu_count() or 1
+    threads = args.threads or sorted({t for t in (1, 2, 4, 8, 16) if t <= cores} | {cores})
+    presets, crfs, scalers = args.presets, args.crfs, args.scalers
+    if args.quick:
+        presets, crfs, scalers = ["ultrafast", "superfast"], [18], ["bicubic", "lanczos"]
+    matrix = list(itertools.product(presets, crfs, scalers, threads))
+
+    work = Path(tempfile.mkdtemp(prefix="bench_encode_"))
+    try:
+        source = work / "source_360p.ts"
+        make_source(source, args.duration)
+        print(f"{cpu_model()} | {cores} 核 | 源 {SOURCE['width']}x{SOURCE['height']}@{SOURCE['fps']} "
+              f"{args.duration:.0f}s | {len(matrix)} 组参数")
+        print(f"{'preset':<10} {'crf':>3} {'scaler':<9} {'线程':>4} {'fps':>7} {'倍速':>6} {'CPU s':>7} "
+              f"{'kbps':>7} {'SSIM':>7} {'PSNR':>6}")
+        results = []
+        for preset, crf, scaler, thread_count in matrix:
+            r = run_one(source, work, args.duration, preset, crf, scaler, thread_count)
+            results.append(r)
+            print(f"{preset:<10} {crf:>3} {scaler:<9} {thread_count:>4} {r['fps']:>7.1f} {r['realtime']:>6.2f} "
+                  f"{r['cpu_seconds']:>7.1f} {r['bitrate_kbps']:>7.0f} {r['ssim'] or 0:>7.4f} {r['psnr'] or 0:>6.2f}")
+
+        report = {
+            'created_at': time.time(),
+            'host': {'cpu': cpu_model(), 'cores': cores, 'machine': platform.machine()},
+            'source': {k: SOURCE[k] for k in ('width', 'height', 'fps')},
+            'target': list(TARGET),
+            'duration': args.duration,
+            'results': results,
+        }
+        output = Path(args.output).expanduser()
+        tmp = output.with_name(output.name + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, output)
+        print(f"结果已写入 {output}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
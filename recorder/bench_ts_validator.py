@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+ts_validator.py 压测与一致性检查
+生成一批合成片段（正常 / 只有音频 / 只有视频 / 声明了音频但无数据 / 私有流 / 损坏 / 截断 / 垃圾数据），
+可再加上真实录制片段 (--corpus)，对比进程内校验与 ffprobe（两次子进程，与 checker.check_ts_file 相同）的
+吞吐量与结论一致率；ffprobe 不可用时只输出进程内校验的结果
+
+使用示例:
+    python bench_ts_validator.py --per-kind 20
+    python bench_ts_validator.py --corpus ~/Downloads/Showroom/active --limit 300
+"""
+
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from collections import defaultdict
+
+from ts_validator import validate_ts, VALID, INVALID, AMBIGUOUS, TS_PACKET_SIZE
+
+# ========================= 合成片段 =========================
+
+_CRC_TABLE = []
+for _i in range(256):
+    _c = _i << 24
+    for _ in range(8):
+        _c = ((_c << 1) ^ 0x04C11DB7) if _c & 0x80000000 else (_c << 1)
+    _CRC_TABLE.append(_c & 0xFFFFFFFF)
+
+
+def crc32_mpeg2(data: bytes) -> int:
+    crc = 0xFFFFFFFF
+    for b in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC_TABLE[((crc >> 24) ^ b) & 0xFF]
+    return crc
+
+
+def _psi(table_id: int, table_id_ext: int, body: bytes) -> bytes:
+    length = 5 + len(body) + 4
+    section = bytes([table_id, 0xB0 | (length >> 8), length & 0xFF,
+                     table_id_ext >> 8, table_id_ext & 0xFF, 0xC1, 0x00, 0x00]) + body
+    return section + crc32_mpeg2(section).to_bytes(4, 'big')
+
+
+def make_pat(pmt_pid: int) -> bytes:
+    return _psi(0x00, 1, bytes([0x00, 0x01, 0xE0 | (pmt_pid >> 8), pmt_pid & 0xFF]))
+
+
+def make_pmt(pcr_pid: int, streams: list) -> bytes:
+    body = bytes([0xE0 | (pcr_pid >> 8), pcr_pid & 0xFF, 0xF0, 0x00])
+    for stream_type, pid in streams:
+        body += bytes([stream_type, 0xE0 | (pid >> 8), pid & 0xFF, 0xF0, 0x00])
+    return _psi(0x02, 1, body)
+
+
+class _BitWriter:
+    def __init__(self):
+        self.bits = []
+
+    def put(self, value: int, n: int):
+        self.bits.extend((value >> (n - 1 - i)) & 1 for i in range(n))
+
+    def ue(self, value: int):
+        code = value + 1
+        n = code.bit_length()
+        self.put(0, n - 1)
+        self.put(code, n)
+
+    def rbsp(self) -> bytes:
+        self.bits.append(1)
+        while len(self.bits) % 8:
+            self.bits.append(0)
+        raw = bytes(int("".join(map(str, self.bits[i:i + 8])), 2) for i in range(0, len(self.bits), 8))
+        # 插入防竞争字节
+        out = bytearray()
+        zeros = 0
+        for b in raw:
+            if zeros >= 2 and b <= 3:
+                out.append(3)
+                zeros = 0
+            out.append(b)
+            zeros = zeros + 1 if b == 0 else 0
+        return bytes(out)
+
+
+def make_sps(width: int, height: int) -> bytes:
+    """Baseline profile 的 SPS NAL（含 NAL 头）"""
+    w = _BitWriter()
+    w.put(66, 8)
+    w.put(0, 8)
+    w.put(31, 8)
+    w.ue(0)                  # sps id
+    w.ue(0)                  # log2_max_frame_num_minus4
+    w.ue(2)                  # poc type
+    w.ue(1)                  # max_num_ref_frames
+    w.put(0, 1)
+    mbs_w, mbs_h = (width + 15) // 16, (height + 15) // 16
+    w.ue(mbs_w - 1)
+    w.ue(mbs_h - 1)
+    w.put(1, 1)              # frame_mbs_only
+    w.put(1, 1)              # direct_8x8
+    crop_right, crop_bottom = (mbs_w * 16 - width) // 2, (mbs_h * 16 - height) // 2
+    if crop_right or crop_bottom:
+        w.put(1, 1)
+        w.ue(0)
+        w.ue(crop_right)
+        w.ue(0)
+        w.ue(crop_bottom)
+    else:
+        w.put(0, 1)
+    w.put(0, 1)              # vui
+    return b"\x67" + w.rbsp()
+
+
+def make_pes(stream_id: int, pts: int, payload: bytes) -> bytes:
+    pts_bytes = bytes([
+        0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, 0x01 | ((pts >> 14) & 0xFE),
+        (pts >> 7) & 0xFF, 0x01 | ((pts << 1) & 0xFE),
+    ])
+    length = 3 + len(pts_bytes) + len(payload)
+    length = length if stream_id != 0xE0 and length < 0x10000 else 0
+    return bytes([0, 0, 1, stream_id, length >> 8, length & 0xFF, 0x80, 0x80, 5]) + pts_bytes + payload
+
+
+def packetize(pid: int, data: bytes, counters: dict, psi: bool = False) -> bytes:
+    """把 PES / PSI 切成 TS 包，最后一个包用适配域填充"""
+    out = bytearray()
+    if psi:
+        data = b"\x00" + data
+    first = True
+    while data:
+        cc = counters.get(pid, 0)
+        counters[pid] = (cc + 1) & 0x0F
+        header = bytes([0x47, (0x40 if first else 0) | (pid >> 8), pid & 0xFF])
+        chunk = data[:184]
+        data = data[184:]
+        if len(chunk) == 184:
+            out += header + bytes([0x10 | cc]) + chunk
+        else:
+            stuffing = 184 - len(chunk) - 1
+            af = bytes([stuffing]) + (bytes([0x00]) + b"\xff" * (stuffing - 1) if stuffing > 0 else b"")
+            out += header + bytes([0x30 | cc]) + af + chunk
+        first = False
+    return bytes(out)
+
+
+def make_fragment(rng: random.Random, seconds: float = 2.0, video: bool = True, audio: bool = True,
+                  audio_payload: bool = True, audio_type: int = 0x0F, kbps: int = 1500,
+                  width: int = 1280, height: int = 720) -> bytes:
+    counters = {}
+    streams = []
+    if video:
+        streams.append((0x1B, 0x100))
+    if audio:
+        streams.append((audio_type, 0x101))
+    out = bytearray(packetize(0, make_pat(0x1000), counters, psi=True))
+    out += packetize(0x1000, make_pmt(0x100 if video else 0x101, streams), counters, psi=True)
+
+    fps, audio_rate = 30, 44100 / 1024
+    frame_bytes = int(kbps * 1000 / 8 / fps)
+    events = []
+    if video:
+        events += [(i / fps, 'v', i) for i in range(int(seconds * fps))]
+    if audio and audio_payload:
+        events += [(i / audio_rate, 'a', i) for i in range(int(seconds * audio_rate))]
+    events.sort()
+    sps = make_sps(width, height)
+    for t, kind, i in events:
+        pts = int(t * 90000) + 126000
+        if kind == 'v':
+            nal = b"\x00\x00\x00\x01\x09\xf0"
+            if i % fps == 0:
+                nal += b"\x00\x00\x00\x01" + sps + b"\x00\x00\x00\x01\x68\xce\x38\x80"
+            nal += b"\x00\x00\x01\x65" + rng.randbytes(frame_bytes)
+            out += packetize(0x100, make_pes(0xE0, pts, nal), counters)
+        else:
+            adts = b"\xff\xf1\x50\x80\x2e\x7f\xfc" + rng.randbytes(360)
+            out += packetize(0x101, make_pes(0xC0, pts, adts), counters)
+    return bytes(out)
+
+
+def corrupt(rng: random.Random, data: bytes, ratio: float = 0.02) -> bytes:
+    buf = bytearray(data)
+    for _ in range(int(len(buf) * ratio)):
+        buf[rng.randrange(len(buf))] = rng.randrange(256)
+    return bytes(buf)
+
+
+KINDS = {
+    'valid':          lambda rng: make_fragment(rng),
+    'valid_1080p':    lambda rng: make_fragment(rng, width=1920, height=1080, kbps=4000),
+    'audio_only':     lambda rng: make_fragment(rng, video=False),
+    'video_only':     lambda rng: make_fragment(rng, audio=False),
+    'audio_declared': lambda rng: make_fragment(rng, audio_payload=False),
+    'private_audio':  lambda rng: make_fragment(rng, audio_type=0x06),
+    'corrupted':      lambda rng: corrupt(rng, make_fragment(rng)),
+    'truncated':      lambda rng: make_fragment(rng)[:rng.randrange(TS_PACKET_SIZE * 2, TS_PACKET_SIZE * 12)],
+    'garbage':        lambda rng: rng.randbytes(200_000),
+    'empty':          lambda rng: b"",
+}
+
+
+# ========================= ffprobe 对照 =========================
+
+def ffprobe_verdict(path: Path, timeout: float = 10) -> str:
+    """与 checker.check_ts_file 相同的判定：视频流和音频流各查一次"""
+    outputs = []
+    for selector in ("v", "a"):
+        cmd = ["ffprobe", "-hide_banner", "-v", "error", "-select_streams", selector,
+               "-show_entries", "stream=index", "-of", "csv=p=0", str(path)]
+        try:
+            outputs.append(subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                          text=True, timeout=timeout).stdout.strip())
+        except subprocess.TimeoutExpired:
+            outputs.append("")
+    return VALID if all(outputs) else INVALID
+
+
+def main():
+    parser = argparse.ArgumentParser(description='进程内 TS 校验压测')
+    parser.add_argument('--per-kind', type=int, default=10, help='每类合成片段数量')
+    parser.add_argument('--corpus', default=None, help='真实片段目录（递归查找 *.ts）')
+    parser.add_argument('--limit', type=int, default=200, help='最多取多少个真实片段')
+    parser.add_argument('--details', action='store_true', help='同时解析 PTS 范围与分辨率')
+    parser.add_argument('--no-ffprobe', action='store_true', help='不跑 ffprobe 对照')
+    parser.add_argument('--seed', type=int, default=48)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    has_ffprobe = shutil.which("ffprobe") is not None and not args.no_ffprobe
+    tmp = Path(tempfile.mkdtemp(prefix="ts_bench_"))
+    samples = []
+    try:
+        for kind, factory in KINDS.items():
+            for i in range(args.per_kind):
+                path = tmp / f"{kind}_{i}.ts"
+                path.write_bytes(factory(rng))
+                samples.append((kind, path))
+        if args.corpus:
+            for path in sorted(Path(args.corpus).expanduser().rglob("*.ts"))[:args.limit]:
+                samples.append(('real', path))
+
+        rows = defaultdict(lambda: {'n': 0, 'bytes': 0, 'py': 0.0, 'ff': 0.0, VALID: 0, INVALID: 0,
+                                    AMBIGUOUS: 0, 'agree': 0, 'compared': 0, 'reasons': defaultdict(int),
+                                    'sizes': set()})
+        for kind, path in samples:
+            row = rows[kind]
+            row['n'] += 1
+            row['bytes'] += path.stat().st_size
+            start = time.perf_counter()
+            result = validate_ts(path, details=args.details)
+            row['py'] += time.perf_counter() - start
+            row[result['verdict']] += 1
+            if result['reason']:
+                row['reasons'][result['reason']] += 1
+            if result['height']:
+                row['sizes'].add(f"{result['width']}x{result['height']}")
+            if has_ffprobe:
+                start = time.perf_counter()
+                expected = ffprobe_verdict(path)
+                row['ff'] += time.perf_counter() - start
+                if result['verdict'] != AMBIGUOUS:
+                    row['compared'] += 1
+                    row['agree'] += result['verdict'] == expected
+
+        print("\n" + "=" * 100)
+        print(f"{'类型':<15} {'数量':>4} {'valid':>5} {'invalid':>7} {'回退':>4} {'进程内ms/个':>11} {'MB/s':>7} "
+              f"{'ffprobe ms/个':>13} {'一致':>9}  原因 / 分辨率")
+        print("-" * 100)
+        total = {'n': 0, 'py': 0.0, 'ff': 0.0, 'bytes': 0, 'agree': 0, 'compared': 0}
+        for kind, row in rows.items():
+            for key in total:
+                total[key] += row[key]
+            mbps = row['bytes'] / row['py'] / 1e6 if row['py'] else 0
+            ff = f"{row['ff'] / row['n'] * 1000:.1f}" if has_ffprobe else "-"
+            agree = f"{row['agree']}/{row['compared']}" if has_ffprobe else "-"
+            extra = ", ".join(f"{k}×{v}" for k, v in row['reasons'].items())
+            if row['sizes']:
+                extra += (" " if extra else "") + "/".join(sorted(row['sizes']))
+            print(f"{kind:<15} {row['n']:>4} {row[VALID]:>5} {row[INVALID]:>7} {row[AMBIGUOUS]:>4} "
+                  f"{row['py'] / row['n'] * 1000:>11.2f} {mbps:>7.0f} {ff:>13} {agree:>9}  {extra}")
+        print("=" * 100)
+        print(f"合计 {total['n']} 个片段: 进程内 {total['n'] / total['py']:.0f} 个/秒 "
+              f"({total['bytes'] / total['py'] / 1e6:.0f} MB/s)", end="")
+        if has_ffprobe and total['ff']:
+            print(f", ffprobe {total['n'] / total['ff']:.1f} 个/秒, 加速 {total['ff'] / total['py']:.0f}×, "
+                  f"一致 {total['agree']}/{total['compared']}")
+        else:
+            print("，未找到 ffprobe，跳过对照")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
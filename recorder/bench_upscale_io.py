@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+upscale_file 磁盘 I/O 基准：管道模式 vs 旧的两步流程（pre_merge mp4）
+    每种模式对同一批片段拉伸一个 chunk，统计:
+        - 中间文件字节数（两步流程的 pre_merge mp4 峰值大小；管道模式应为 0）
+        - 每个 chunk 写盘字节数 = 中间文件 + 输出；读盘字节数 = 片段 + 中间文件
+        - 墙钟时间，产出视频时长（两种模式应一致）
+
+需要 ffmpeg / ffprobe。没有 --corpus 时用 lavfi 生成 360p 测试片段（每个 2 秒）
+
+使用示例:
+    python bench_upscale_io.py
+    python bench_upscale_io.py --fragments 150
+    python bench_upscale_io.py --corpus /mnt/video/data/incoming_ts/某个文件夹 --limit 500
+"""
+
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "shared"))
+from upscaler import upscale_file, get_frame_rate, PIPELINE_PIPE, PIPELINE_TWO_PASS
+from probe_service import probe
+
+
+def make_fragments(target: Path, count: int) -> list:
+    target.mkdir(parents=True, exist_ok=True)
+    subprocess.run([
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", "testsrc2=size=640x360:rate=30",
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+        "-t", str(count * 2),
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "60",
+        "-c:a", "aac",
+        "-f", "segment", "-segment_time", "2", "-segment_format", "mpegts",
+        str(target / "ss-%06d.ts")
+    ], check=True)
+    return sorted(target.glob("*.ts"))
+
+
+def watch_peak(directory: Path, pattern: str, stop: threading.Event, peak: list):
+    """轮询中间文件大小，记录峰值（两步流程结束时中间文件已被删除）"""
+    while not stop.is_set():
+        for path in directory.glob(pattern):
+            try:
+                peak[0] = max(peak[0], path.stat().st_size)
+            except FileNotFoundError:
+                pass
+        stop.wait(0.05)
+
+
+def run(mode: str, fragments: list, work: Path, fps: str, threads: int):
+    out_dir = work / mode
+    out_dir.mkdir(parents=True, exist_ok=True)
+    filelist = out_dir / "list.txt"
+    filelist.write_text("".join(f"file '{f.resolve()}'\n" for f in fragments), encoding="utf-8")
+    output = out_dir / "chunk.mp4"
+
+    stop, peak = threading.Event(), [0]
+    watcher = threading.Thread(target=watch_peak, args=(out_dir, "pre_merge_*", stop, peak), daemon=True)
+    watcher.start()
+    start = time.perf_counter()
+    ok = upscale_file(filelist, output, fps=fps, is_filelist=True, threads=threads, pipeline=mode)
+    wall = time.perf_counter() - start
+    stop.set()
+    watcher.join()
+    if not ok:
+        raise SystemExit(f"{mode} 拉伸失败")
+
+    source = sum(f.stat().st_size for f in fragments)
+    out_size = output.stat().st_size
+    return {
+        'wall': wall,
+        'intermediate': peak[0],
+        'written': peak[0] + out_size,
+        'read': source + peak[0],
+        'duration': probe(output, timeout=30).duration,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='upscale_file 磁盘 I/O 基准')
+    parser.add_argument('--fragments', type=int, default=60, help='合成片段数量（每个 2 秒）')
+    parser.add_argument('--corpus', default=None, help='真实片段目录（*.ts）')
+    parser.add_argument('--limit', type=int, default=500, help='从真实片段目录最多取多少个')
+    parser.add_argument('--threads', type=int, default=None, help='x264 线程数')
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        raise SystemExit("需要 ffmpeg / ffprobe")
+
+    work = Path(tempfile.mkdtemp(prefix="bench_upscale_io_"))
+    try:
+        if args.corpus:
+            fragments = sorted(Path(args.corpus).expanduser().glob("*.ts"))[:args.limit]
+        else:
+            fragments = make_fragments(work / "src", args.fragments)
+        if not fragments:
+            raise SystemExit("没有片段")
+        fps = get_frame_rate(fragments)
+        source_mb = sum(f.stat().st_size for f in fragments) / 1024 / 1024
+        print(f"{len(fragments)} 个片段, 共 {source_mb:.1f} MB, fps={fps}")
+
+        results = {mode: run(mode, fragments, work, fps, args.threads)
+                   for mode in (PIPELINE_TWO_PASS, PIPELINE_PIPE)}
+        print(f"{'模式':<10} {'墙钟 s':>8} {'中间文件 MB':>12} {'写盘 MB':>9} {'读盘 MB':>9} {'视频 s':>8}")
+        for mode, r in results.items():
+            print(f"{mode:<10} {r['wall']:>8.1f} {r['intermediate'] / 1024 / 1024:>12.1f} "
+                  f"{r['written'] / 1024 / 1024:>9.1f} {r['read'] / 1024 / 1024:>9.1f} {r['duration'] or 0:>8.1f}")
+        old, new = results[PIPELINE_TWO_PASS], results[PIPELINE_PIPE]
+        print(f"管道模式每个 chunk 少写 {(old['written'] - new['written']) / 1024 / 1024:.1f} MB、"
+              f"少读 {(old['read'] - new['read']) / 1024 / 1024:.1f} MB，墙钟 {new['wall'] / old['wall'] * 100:.0f}%")
+        if old['duration'] and new['duration'] and abs(old['duration'] - new['duration']) > 1:
+            print(f"⚠️ 两种模式产出时长不一致: {old['duration']:.1f}s vs {new['duration']:.1f}s")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
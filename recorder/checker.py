@@ -1,5 +1,4 @@
 import time
-import subprocess
 import cx_Oracle
 import os
 import threading
@@ -7,12 +6,11 @@ import traceback
 import logging
 import re
 import sys
-import hashlib
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 sys.path.insert(0, str(Path(__file__).parent.parent / "shared"))
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 from logger_config import setup_logger
 setup_logger()
 from config import *
@@ -22,6 +20,16 @@ from typing import Optional
 from queue import Queue
 from threading import Thread
 from sync_module import syncer
+from fragment_watcher import FragmentWatcher
+from validation_cache import ValidationCache
+from ts_validator import validate_ts, VALID, AMBIGUOUS
+from probe_service import get_probe_service
+from probe_scheduler import ProbeScheduler
+from ts_dedup import TSDeduplicator, Fingerprinter
+from stream_index import StreamSessionIndex
+from subtitle_index import get_subtitle_index
+from stream_lifecycle import StreamLifecycle
+from rolling_merger import get_rolling_merger, fragment_sort_key
 
 os.environ["TNS_ADMIN"] = WALLET_DIR # 新增
 
@@ -29,14 +37,29 @@ os.environ["TNS_ADMIN"] = WALLET_DIR # 新增
 merge_queue = Queue()  # 合并任务队列
 merge_lock = threading.Lock()  # 合并锁（可选，Queue本身是线程安全的）
 
+# 片段索引（main_loop 中启动；为 None 时退回 glob 扫描）
+fragment_watcher = None
+
+# 片段检查结果的持久化缓存（每个文件夹一个 .fragment_checks.jsonl，重启后不再重复 ffprobe）
+validation_cache = ValidationCache()
+
+# 共享的 ffprobe 探测服务（与 sync_module 的分辨率检测共用同一个有界缓存）
+probe_service = get_probe_service(PROBE_CACHE_SIZE, FFPROBE_TIMEOUT, FFMPEG_LOGLEVEL, FFMPEG_HIDE_BANNER)
+
+# 常驻的片段检查调度器（所有文件夹共用，按直播轮转；main_loop 中启动）
+probe_scheduler = ProbeScheduler(PROBE_WORKERS, name="FragmentCheck")
+
 # ========================= 文件夹操作 =========================
 
 def find_all_live_folders(parent_dir: Path):
     """获取所有直播文件夹路径"""
-    folders = []
-    for f in parent_dir.iterdir():
-        if f.is_dir() and not f.name.startswith("temp_"):  # 排除临时目录
-            folders.append(f)
+    if fragment_watcher:
+        folders = fragment_watcher.folders()
+    else:
+        folders = []
+        for f in parent_dir.iterdir():
+            if f.is_dir() and not f.name.startswith("temp_"):  # 排除临时目录
+                folders.append(f)
     return sorted(folders, key=lambda x: x.stat().st_mtime)
 
 
@@ -53,8 +76,30 @@ def has_been_merged(ts_dir: Path):
 
 def has_files_to_check(ts_dir: Path):
     """检查文件夹是否有足够的文件可以开始检查"""
-    ts_files = list(ts_dir.glob("*.ts"))
-    return len(ts_files) >= MIN_FILES_FOR_CHECK
+    return count_ts_files(ts_dir) >= MIN_FILES_FOR_CHECK
+
+
+def count_ts_files(ts_dir: Path):
+    if fragment_watcher:
+        return fragment_watcher.index(ts_dir).count
+    return len(list(ts_dir.glob("*.ts")))
+
+
+def ts_time_range(ts_dir: Path):
+    """
+    文件夹内 ts 文件的 (最早 ctime, 最晚 ctime, 最晚 mtime)，没有文件时返回 None
+    有片段索引时直接读索引，不再逐个 stat
+    """
+    if fragment_watcher:
+        idx = fragment_watcher.index(ts_dir)
+        if not idx.count:
+            return None
+        return idx.first_ctime, idx.last_ctime, idx.last_mtime
+    stats = [f.stat() for f in ts_dir.glob("*.ts")]
+    if not stats:
+        return None
+    return (min(st.st_ctime for st in stats), max(st.st_ctime for st in stats),
+            max(st.st_mtime for st in stats))
 
 
 def all_folders_completed(folders):
@@ -67,107 +112,15 @@ def all_folders_completed(folders):
 # ========================= 文件状态检查 =========================
 def group_folders_by_member(folders):
     """将文件夹按成员分组,根据ts文件时间戳判断是否为同一场直播(支持跨日)"""
-    from collections import defaultdict
-    groups = defaultdict(list)
-    
-    # 先按成员ID分组
-    member_folders = defaultdict(list)
+    # 先更新各文件夹的场次记录：有片段索引时直接读索引，否则只扫描有新文件的文件夹
     for folder in folders:
-        member_id = extract_member_name_from_folder(folder.name)
-        if member_id:
-            member_folders[member_id].append(folder)
+        if fragment_watcher:
+            idx = fragment_watcher.index(folder)
+            stream_index.update(folder, idx.first_ctime, idx.last_ctime, idx.last_mtime, idx.count)
         else:
-            # 解析失败的单独分组
-            groups[f"unknown_{folder.name}"].append(folder)
-    
-    # 对每个成员的文件夹按创建时间排序,然后根据ts文件时间判断是否连续
-    for member_id, member_folder_list in member_folders.items():
-        # 按文件夹创建时间排序
-        member_folder_list.sort(key=lambda x: x.stat().st_ctime)
-        
-        if not member_folder_list:
-            continue
-            
-        # 用于标记当前直播组
-        current_group = []
-        group_index = 0
-        
-        for i, folder in enumerate(member_folder_list):
-            if i == 0:
-                # 第一个文件夹,直接加入当前组
-                current_group.append(folder)
-            else:
-                # 获取当前文件夹最早的ts文件时间
-                current_ts_files = list(folder.glob("*.ts"))
-                if not current_ts_files:
-                    # 没有ts文件,按文件夹时间判断(降级处理)
-                    prev_folder = member_folder_list[i-1]
-                    time_diff = folder.stat().st_ctime - prev_folder.stat().st_ctime
-                    if time_diff < 14400:  # 4小时
-                        current_group.append(folder)
-                    else:
-                        # 保存当前组并开始新组
-                        first_folder = current_group[0]
-                        date_part = first_folder.name[:6]
-                        key = f"{date_part}_{member_id}_{group_index}"
-                        groups[key] = current_group
-                        group_index += 1
-                        current_group = [folder]
-                    continue
-                
-                current_earliest_ts = min(current_ts_files, key=lambda x: x.stat().st_ctime)
-                current_ts_time = current_earliest_ts.stat().st_ctime
-                
-                # 获取前一个文件夹最晚的ts文件时间
-                prev_folder = current_group[-1]  # 用当前组的最后一个文件夹
-                prev_ts_files = list(prev_folder.glob("*.ts"))
-                
-                if prev_ts_files:
-                    prev_latest_ts = max(prev_ts_files, key=lambda x: x.stat().st_ctime)
-                    prev_ts_time = prev_latest_ts.stat().st_ctime
-                    
-                    # 计算两个文件夹ts文件的时间差
-                    time_gap = current_ts_time - prev_ts_time
-                    
-                    # 如果时间差小于5分钟(300秒),认为是同一场直播
-                    # 正常情况下ts文件每2秒一个,5分钟已经很宽松了
-                    if time_gap < 300:
-                        current_group.append(folder)
-                        logging.debug(f"文件夹 {folder.name} 与前一个文件夹ts时间差 {time_gap:.0f}秒,判定为同一场直播")
-                    else:
-                        # 时间差太大,说明是新的直播
-                        logging.info(f"文件夹 {folder.name} 与前一个文件夹ts时间差 {time_gap:.0f}秒,判定为新直播")
-                        
-                        # 保存当前组
-                        first_folder = current_group[0]
-                        date_part = first_folder.name[:6]
-                        key = f"{date_part}_{member_id}_{group_index}"
-                        groups[key] = current_group
-                        
-                        # 开始新组
-                        group_index += 1
-                        current_group = [folder]
-                else:
-                    # 前一个文件夹没有ts文件,降级到文件夹时间判断
-                    time_diff = folder.stat().st_ctime - prev_folder.stat().st_ctime
-                    if time_diff < 14400:
-                        current_group.append(folder)
-                    else:
-                        first_folder = current_group[0]
-                        date_part = first_folder.name[:6]
-                        key = f"{date_part}_{member_id}_{group_index}"
-                        groups[key] = current_group
-                        group_index += 1
-                        current_group = [folder]
-        
-        # 保存最后一组
-        if current_group:
-            first_folder = current_group[0]
-            date_part = first_folder.name[:6]
-            key = f"{date_part}_{member_id}_{group_index}"
-            groups[key] = current_group
-    
-    return groups
+            stream_index.refresh(folder)
+    # 分组只看记录，O(文件夹数)
+    return stream_index.groups(folders)
 
 def has_matching_subtitle_for_group(group_folders):
     """检查一组文件夹(同一个直播)是否有对应的字幕文件
@@ -191,11 +144,11 @@ def is_file_stable(file_path: Path, stable_time: int = FILE_STABLE_TIME):
 
 def is_live_active(ts_dir: Path):
     """检查直播是否还在进行中"""
-    ts_files = list(ts_dir.glob("*.ts"))
-    if not ts_files:
+    ts_range = ts_time_range(ts_dir)
+    if not ts_range:
         return False
     
-    latest_mtime = max(f.stat().st_mtime for f in ts_files)
+    latest_mtime = ts_range[2]
     seconds_since_last_update = time.time() - latest_mtime
     return seconds_since_last_update <= LIVE_INACTIVE_THRESHOLD
 
@@ -205,12 +158,12 @@ def is_really_stream_ended(all_folders, grace_period=FINAL_INACTIVE_THRESHOLD):
     current_time = time.time()
     
     for ts_dir in all_folders:
-        ts_files = list(ts_dir.glob("*.ts"))
-        if not ts_files:
+        ts_range = ts_time_range(ts_dir)
+        if not ts_range:
             continue
             
         # 获取该文件夹最新文件的修改时间
-        latest_mtime = max(f.stat().st_mtime for f in ts_files)
+        latest_mtime = ts_range[2]
         seconds_since_last_update = current_time - latest_mtime
         
         # 如果任何文件夹的文件在宽限期内还有更新，说明可能还在录制
@@ -249,26 +202,9 @@ def has_matching_subtitle_file(ts_dir: Path):
     if not SUBTITLES_SOURCE_ROOT.exists():
         return False
 
-    best_match_sub = None
-    min_diff = 999999 # 初始设为一个很大的秒数
-
-    # 扫描所有comments.json
-    for sub_file in SUBTITLES_SOURCE_ROOT.rglob("*comments.json"):
-        sub_name = sub_file.stem
-        
-        # 匹配规则：字幕文件名里必须包含日期和成员名
-        if v_date in sub_name and v_name in sub_name:
-            # 尝试从字幕文件名提取时间戳数字
-            sub_time_match = re.search(r'(\d{6})', sub_name.replace(v_date, "", 1)) # 排除掉日期后的第一个6位数字
-            
-            if sub_time_match:
-                s_time = int(sub_time_match.group(1))
-                diff = abs(v_time - s_time) # 计算时间差
-                
-                # 如果时间差在 60 秒（1分钟）以内，且是目前最接近的
-                if diff < 60 and diff < min_diff:
-                    min_diff = diff
-                    best_match_sub = sub_file
+    # 匹配规则：字幕文件名里必须包含日期和成员名，时间差在 60 秒（1分钟）以内，取最接近的
+    # （查字幕索引，不再每次 rglob 整个字幕目录）
+    best_match_sub, min_diff = get_subtitle_index(SUBTITLES_SOURCE_ROOT).find_nearest(v_date, v_name, v_time, 60)
 
     if best_match_sub:
         logging.info(f"✅ 成功匹配字幕: {best_match_sub.name} (时间误差: {min_diff}秒)")
@@ -280,9 +216,8 @@ def get_earliest_active_folder(all_folders):
     """获取最早的活跃文件夹（当前录制中且有文件的文件夹中最早创建的）"""
     active_folders = []
     for folder in all_folders:
-        ts_files = list(folder.glob("*.ts"))
         # 必须同时满足：有文件 + 还在录制中（文件还在活跃）
-        if ts_files and is_live_active(folder):
+        if is_live_active(folder):
             active_folders.append(folder)
     
     if not active_folders:
@@ -315,29 +250,26 @@ def get_db_pool():
     return db_pool
 
 
-def read_is_live(member_id: str):
-    """从连接池中获取连接执行查询，执行完自动归还"""
+def read_live_statuses(member_ids):
+    """一次查询读取多个成员的 IS_LIVE: {member_id: bool}；连接池不可用或查询失败时抛异常"""
     pool = get_db_pool()
     if not pool:
-        return False
-    
-    try:
-        # 使用 with pool.acquire() 会在执行完毕后自动将连接放回池中，而不是关闭它
-        with pool.acquire() as conn:
-            with conn.cursor() as cursor:
-                query = f"SELECT IS_LIVE FROM {DB_TABLE} WHERE MEMBER_ID = :member_id"
-                cursor.execute(query, {'member_id': member_id})
-                result = cursor.fetchone()
-                
-                if result:
-                    is_live = bool(result[0])
-                    
-                    logging.info(f"数据库状态: {member_id} is_live={is_live}")
-                    return is_live
-                return False
-    except Exception as e:
-        logging.error(f"查询成员 {member_id} 状态失败 (数据库可能未开启): {e}")
-        return False
+        raise RuntimeError("数据库连接池不可用")
+    
+    result = {}
+    member_ids = list(member_ids)
+    # 使用 with pool.acquire() 会在执行完毕后自动将连接放回池中，而不是关闭它
+    with pool.acquire() as conn:
+        with conn.cursor() as cursor:
+            # Oracle 的 IN 列表最多 1000 项，分批绑定（通常一批就够）
+            for start in range(0, len(member_ids), 500):
+                chunk = member_ids[start:start + 500]
+                binds = {f"m{i}": member_id for i, member_id in enumerate(chunk)}
+                placeholders = ", ".join(f":{name}" for name in binds)
+                cursor.execute(f"SELECT MEMBER_ID, IS_LIVE FROM {DB_TABLE} WHERE MEMBER_ID IN ({placeholders})", binds)
+                for member_id, is_live in cursor:
+                    result[member_id] = bool(is_live)
+    return result
 
 def extract_member_name_from_folder(folder_name: str) -> Optional[str]:
     """从文件夹名称中提取人名部分，用于模糊匹配数据库中的 member_id"""
@@ -370,106 +302,121 @@ def extract_member_name_from_folder(folder_name: str) -> Optional[str]:
     return None
 
 # ========================= 全局跨文件夹去重器 =========================
-class TSDeduplicator:
-    def __init__(self):
-        # 格式: { member_id: { "md5_size": timestamp } }
-        self.fingerprints = {}  
-        self.ttl = 43200  # 改为 12 小时（完全足够覆盖同一场长直播的任何断线重连）
-        self._insert_count = 0  # 新增：独立的全局插入计数器
-
-    def check_and_add(self, ts_file: Path) -> bool:
-        """检查文件是否重复。返回 True 表示重复，False 表示是新文件"""
-        folder_name = ts_file.parent.name
-        member_id = extract_member_name_from_folder(folder_name) or "unknown"
-        
-        if member_id not in self.fingerprints:
-            self.fingerprints[member_id] = {}
-
-        # 优化：使用独立计数器，严格每检查 1000 个文件（约 16 分钟）执行一次全局过期清理
-        self._insert_count += 1
-        if self._insert_count % 1000 == 0:
-            current_time = time.time()
-            for m_id in list(self.fingerprints.keys()):
-                self.fingerprints[m_id] = {
-                    k: v for k, v in self.fingerprints[m_id].items() 
-                    if current_time - v < self.ttl
-                }
-
-        # 计算哈希指纹（读取前 512KB 足以精确区分）
-        fsize = ts_file.stat().st_size
-        hasher = hashlib.md5()
+# 实例化全局去重器（线程安全，每个成员的指纹有 TTL 与条数上限）
+global_deduplicator = TSDeduplicator(
+    ttl=DEDUP_TTL,
+    max_per_member=DEDUP_MAX_PER_MEMBER,
+    fingerprinter=Fingerprinter(DEDUP_FINGERPRINT_MODE, sample_bytes=DEDUP_SAMPLE_BYTES),
+    member_of=extract_member_name_from_folder,
+)
+
+# 直播场次索引（持久化到 STREAM_INDEX_FILE，重启后直接复用）
+stream_index = StreamSessionIndex(
+    STREAM_INDEX_FILE,
+    member_of=extract_member_name_from_folder,
+    time_field="ctime",
+    gap=STREAM_GROUP_GAP,
+    fallback_gap=STREAM_GROUP_FALLBACK_GAP,
+)
+
+# 滚动合并：直播中把有效片段按顺序追加到中间文件，结束后 merger 只需封装一次
+rolling_merger = get_rolling_merger(ROLLING_MERGE_DIR) if ROLLING_MERGE else None
+
+def record_stream_end(group_key, ended_at: float):
+    """直播判定结束时把结束时间记进滚动合并清单，merger 从这个时间统计「直播结束 → 可上传」"""
+    if not rolling_merger:
+        return
+    _, folders = stream_lifecycle.groups.get(group_key, (None, []))
+    for ts_dir in folders:
         try:
-            with open(ts_file, 'rb') as f:
-                hasher.update(f.read(524288))
-            fingerprint = f"{hasher.hexdigest()}_{fsize}"
-        except Exception:
-            fingerprint = f"{ts_file.name}_{fsize}" # 降级
-
-        # 判断并记录
-        if fingerprint in self.fingerprints[member_id]:
-            return True  # 拦截！是重复回放
-        else:
-            self.fingerprints[member_id][fingerprint] = time.time()
-            return False # 放行！是新文件
-
-# 实例化全局去重器
-global_deduplicator = TSDeduplicator()
+            rolling_merger.mark_ended(ts_dir, ended_at)
+        except OSError as e:
+            logging.warning(f"记录直播结束时间失败 {ts_dir.name}: {e}")
+
+# 直播生命周期：每轮一次批量 IS_LIVE 查询 + 片段活跃度，两轮之间直播结束时立即进入下一轮
+stream_lifecycle = StreamLifecycle(
+    fetch_live=read_live_statuses,
+    last_activity=lambda ts_dir: (ts_time_range(ts_dir) or (None, None, None))[2],
+    grace=FINAL_INACTIVE_THRESHOLD,
+    recheck_interval=LIFECYCLE_DB_RECHECK_INTERVAL,
+    on_ended=record_stream_end,
+)
 
 # ========================= 文件检查和处理 =========================
 
 def check_ts_file(ts_file: Path):
-    """检测ts文件是否含视频和音频流"""
-    # 构建FFprobe命令，使用配置的参数
-    base_cmd = ["ffprobe"]
-    
-    # 添加隐藏banner选项
-    if FFMPEG_HIDE_BANNER:
-        base_cmd.append("-hide_banner")
-    
-    # 添加日志级别
-    base_cmd.extend(["-v", FFMPEG_LOGLEVEL])
-    
-    v_cmd = base_cmd + [
-        "-select_streams", "v",
-        "-show_entries", "stream=index",
-        "-of", "csv=p=0",
-        str(ts_file)
-    ]
-    a_cmd = base_cmd + [
-        "-select_streams", "a",
-        "-show_entries", "stream=index",
-        "-of", "csv=p=0",
-        str(ts_file)
-    ]
+    """检测ts文件是否含视频和音频流（结果写入持久化缓存，重启后直接复用）"""
+    try:
+        st = ts_file.stat()
+    except FileNotFoundError:
+        return None, f"[错误] {ts_file.name} 检测失败: 文件不存在"
+    cached = validation_cache.lookup(ts_file, st)
+    if cached is not None:
+        if cached['valid']:
+            return ts_file, None
+        return None, cached.get('error') or f"[不同步或缺流] {ts_file.name}"
+
+    if TS_VALIDATOR == "python":
+        # 进程内解析 PAT/PMT/PES，不启动子进程；只有判断不了的片段才走下面的 ffprobe
+        try:
+            result = validate_ts(ts_file)
+        except Exception as e:
+            logging.debug(f"进程内检查异常，改用 ffprobe {ts_file.name}: {e}")
+            result = {'verdict': AMBIGUOUS}
+        if result['verdict'] != AMBIGUOUS:
+            streams = {'video': ",".join(str(s['pid']) for s in result['video']),
+                       'audio': ",".join(str(s['pid']) for s in result['audio'])}
+            if result['verdict'] == VALID:
+                validation_cache.record(ts_file, True, streams,
+                                        fingerprint=global_deduplicator.compute_fingerprint(ts_file), st=st)
+                return ts_file, None
+            msg = f"[不同步或缺流] {ts_file.name} ({result['reason']})"
+            validation_cache.record(ts_file, False, streams, error=msg, st=st)
+            return None, msg
     
     try:
-        video_stream = subprocess.run(
-            v_cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, 
-            text=True, 
-            timeout=FFPROBE_TIMEOUT
-        ).stdout.strip()
-        
-        audio_stream = subprocess.run(
-            a_cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, 
-            text=True, 
-            timeout=FFPROBE_TIMEOUT
-        ).stdout.strip()
+        # 一次 ffprobe 同时拿到视频流和音频流
+        result = probe_service.probe(ts_file, timeout=FFPROBE_TIMEOUT)
+        video_stream = ",".join(str(i) for i in result.indexes('video'))
+        audio_stream = ",".join(str(i) for i in result.indexes('audio'))
         
+        streams = {'video': video_stream, 'audio': audio_stream}
         if video_stream and audio_stream:
+            # 顺便在检查线程里算好去重指纹，一起缓存
+            validation_cache.record(ts_file, True, streams,
+                                    fingerprint=global_deduplicator.compute_fingerprint(ts_file), st=st)
             return ts_file, None
         else:
             msg = f"[不同步或缺流] {ts_file.name}"
+            validation_cache.record(ts_file, False, streams, error=msg, st=st)
             return None, msg
     except Exception as e:
+        # 超时等临时错误不缓存，下次重新检查
         return None, f"[错误] {ts_file.name} 检测失败: {e}"
 
 
+def cached_fingerprint(ts_file: Path):
+    """检查缓存里的去重指纹（没有时返回 None，由去重器自己计算）"""
+    record = validation_cache.lookup(ts_file)
+    return record.get('fingerprint') if record else None
+
+
+def sync_fragment(ts_file: Path, member_id):
+    """同步片段到 4C；已同步的片段记在检查缓存里，重启后不再重复 rsync"""
+    if validation_cache.is_synced(ts_file):
+        # 重启后 synced_set 是空的：补记一下，结束时的审计才不会逐个重新 rsync
+        syncer.mark_synced(ts_file)
+        return
+    syncer.sync_to_4c(ts_file, member_id=member_id)
+    if str(ts_file) in syncer.synced_set:
+        validation_cache.mark_synced(ts_file)
+
+
 def get_unchecked_stable_files(ts_dir: Path, checked_files: set):
     """获取未检查且稳定的ts文件"""
+    if fragment_watcher:
+        # 只看索引里新出现的片段（写完即稳定），不再 glob + stat 整个文件夹
+        return fragment_watcher.index(ts_dir).unchecked_stable(checked_files, FILE_STABLE_TIME)
     ts_files = list(ts_dir.glob("*.ts"))
     unchecked_files = []
     
@@ -481,79 +428,102 @@ def get_unchecked_stable_files(ts_dir: Path, checked_files: set):
     return unchecked_files
 
 
-def check_live_folder_incremental(ts_dir: Path, checked_files: set, valid_files: list, error_logs: list):
-    """增量检查直播文件夹中的新文件"""
-    base_name = ts_dir.name
+def submit_fragment_checks(ts_dir: Path, state: dict, files, priority: bool = False):
+    """把片段交给检查调度器（不等待结果），结果由 collect_fragment_checks 处理"""
+    pending = state.setdefault('pending', {})
+    for ts_file in files:
+        # 提交即标记为已检查，下一轮不会重复提交
+        state['checked_files'].add(ts_file)
+        pending[probe_scheduler.submit(ts_dir, check_ts_file, ts_file, priority=priority)] = ts_file
 
-    # <---【修改点2A】新增：提前解析 Member ID，用于传给同步模块做判断
-    current_member_id = extract_member_name_from_folder(base_name)
-    
-    # 获取未检查且稳定的文件
-    unchecked_files = get_unchecked_stable_files(ts_dir, checked_files)
-    
-    if not unchecked_files:
+
+def collect_fragment_checks(ts_dir: Path, state: dict, wait: bool = False, final: bool = False):
+    """处理已完成的检查结果（wait=True 时等到该文件夹的任务全部完成）"""
+    pending = state.get('pending')
+    if not pending:
         return
-    logging.debug(f"[{base_name}] 发现 {len(unchecked_files)} 个新的稳定文件需要检查")
+    base_name = ts_dir.name
+    current_member_id = extract_member_name_from_folder(base_name)
+    futures = as_completed(list(pending)) if wait else [f for f in list(pending) if f.done()]
     
-    # 检查新文件
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(check_ts_file, f): f for f in unchecked_files}
-        for future in as_completed(futures):
-            ts_file = futures[future]
+    for future in futures:
+        ts_file = pending.pop(future)
+        try:
             valid_file, err_msg = future.result()
-            
-            # 标记为已检查
-            checked_files.add(ts_file)
-            
-            if valid_file:
-                # === 新增：调用全局去重器 ===
-                if global_deduplicator.check_and_add(ts_file):
-                    logging.warning(f"[{base_name}] 拦截跨文件夹重复片段: {ts_file.name}")
+        except Exception as e:
+            valid_file, err_msg = None, f"[错误] {ts_file.name} 检测失败: {e}"
+        
+        if valid_file:
+            # === 新增：调用全局去重器 ===
+            if global_deduplicator.check_and_add(ts_file, cached_fingerprint(ts_file)):
+                if final:
+                    logging.warning(f"[{base_name}] 最终检查拦截重复: {ts_file.name}")
                 else:
-                    valid_files.append(valid_file)
-                    syncer.sync_to_4c(valid_file, member_id=current_member_id)
-                    logging.debug(f"[{base_name}] ✓ {ts_file.name}")
-                # ===========================
-            if err_msg:
-                logging.error(f"[{base_name}] {err_msg}")
-                error_logs.append(err_msg)
+                    logging.warning(f"[{base_name}] 拦截跨文件夹重复片段: {ts_file.name}")
+            else:
+                state['valid_files'].append(valid_file)
+                sync_fragment(valid_file, current_member_id)
+                logging.debug(f"[{base_name}] ✓ {ts_file.name}")
+            # ===========================
+        if err_msg:
+            logging.error(f"[{base_name}] {err_msg}")
+            state['error_logs'].append(err_msg)
+
+
+def feed_rolling_merge(ts_dir: Path, state: dict):
+    """把已经按顺序就绪的有效片段追加到滚动合并的中间文件"""
+    if rolling_merger and state.get('valid_files'):
+        rolling_merger.feed(ts_dir, state['valid_files'], list(state.get('pending', {}).values()))
+
+
+def collect_all_fragment_checks(folder_states: dict):
+    """本轮所有文件夹都提交完之后统一等结果，各文件夹的检查在调度器里并行进行"""
+    for ts_dir, state in list(folder_states.items()):
+        if state.get('pending'):
+            collect_fragment_checks(ts_dir, state, wait=True)
+            feed_rolling_merge(ts_dir, state)
+
+
+def check_live_folder_incremental(ts_dir: Path, state: dict):
+    """增量检查直播文件夹中的新文件（只提交，不等待；顺便处理已经完成的结果）"""
+    base_name = ts_dir.name
+    
+    # 获取未检查且稳定的文件
+    unchecked_files = get_unchecked_stable_files(ts_dir, state['checked_files'])
+    
+    if unchecked_files:
+        logging.debug(f"[{base_name}] 发现 {len(unchecked_files)} 个新的稳定文件需要检查")
+        submit_fragment_checks(ts_dir, state, unchecked_files)
+    collect_fragment_checks(ts_dir, state)
+    feed_rolling_merge(ts_dir, state)
 
 
-def finalize_live_check(ts_dir: Path, checked_files: set, valid_files: list, error_logs: list):
+def finalize_live_check(ts_dir: Path, state: dict):
     """直播结束后的最终检查和文件列表生成"""
     base_name = ts_dir.name
     filelist_txt = ts_dir / FILELIST_NAME
     log_file = OUTPUT_DIR / f"{base_name}{LOG_SUFFIX}"
+    valid_files = state['valid_files']
+    error_logs = state['error_logs']
+    
+    # 该文件夹还在排队的增量检查整体提前
+    probe_scheduler.promote(ts_dir)
     
-    # 检查剩余未检查的文件（包括不稳定的）
+    # 检查剩余未检查的文件（包括不稳定的）；最终检查仍以磁盘上的实际文件为准
     ts_files = list(ts_dir.glob("*.ts"))
-    unchecked_files = [f for f in ts_files if f not in checked_files]
+    unchecked_files = [f for f in ts_files if f not in state['checked_files']]
     
-    #【获取 Member ID 用于同步】
-    current_member_id = extract_member_name_from_folder(base_name)
     if unchecked_files:
         logging.debug(f"[{base_name}] 最终检查剩余 {len(unchecked_files)} 个文件")
-        
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {executor.submit(check_ts_file, f): f for f in unchecked_files}
-            for future in as_completed(futures):
-                ts_file = futures[future]
-                valid_file, err_msg = future.result()
-                
-                if valid_file:
-                    # === 新增：调用全局去重器 ===
-                    if global_deduplicator.check_and_add(ts_file):
-                        logging.warning(f"[{base_name}] 最终检查拦截重复: {ts_file.name}")
-                    else:
-                        valid_files.append(valid_file)
-                        syncer.sync_to_4c(valid_file, member_id=current_member_id)
-                    # ===========================
-                if err_msg:
-                    logging.error(f"[{base_name}] {err_msg}")
-                    error_logs.append(err_msg)
+        submit_fragment_checks(ts_dir, state, unchecked_files, priority=True)
+    collect_fragment_checks(ts_dir, state, wait=True, final=True)
     
     # 按文件名排序
-    valid_files.sort(key=lambda f: [int(c) if c.isdigit() else c.lower() for c in re.split(r'(\d+)', f.name)])
+    valid_files.sort(key=fragment_sort_key)
+    
+    # 滚动合并：追加剩下的尾巴并封存（在写 filelist.txt 之前，merger 看到 filelist 时中间文件已就绪）
+    if rolling_merger:
+        rolling_merger.seal(ts_dir, valid_files)
     
     # 写 filelist.txt：无论是否有有效文件，都需要创建这个文件作为检查完成的标记
     with open(filelist_txt, "w", encoding="utf-8") as f:
@@ -574,7 +544,12 @@ def finalize_live_check(ts_dir: Path, checked_files: set, valid_files: list, err
         # 1. 解析成员ID
         member_id = extract_member_name_from_folder(ts_dir.name)
         
-        # 2. 发送信号
+        # 2. 先把场次记录同步过去，4C 直接按 3C 的片段时间分组
+        session_file = stream_index.export(ts_dir)
+        if session_file:
+            syncer.sync_to_4c(session_file, member_id=member_id)
+        
+        # 3. 发送信号
         # 新代码：直接调用审计方法，因为它就是 txt 文件
         syncer.sync_filelist_and_audit(filelist_txt, member_id=member_id)
         
@@ -629,7 +604,7 @@ def process_single_folder(ts_dir: Path, folder_states: dict, all_folders: list,
     
     # 检查文件数量是否足够开始检查
     if not has_files_to_check(ts_dir):
-        ts_count = len(list(ts_dir.glob("*.ts")))
+        ts_count = count_ts_files(ts_dir)
         logging.debug(f"直播 {base_name} 文件数量不足({ts_count}/{MIN_FILES_FOR_CHECK})，等待中...")
         return False  # 返回False表示该文件夹还不能处理
     
@@ -637,12 +612,7 @@ def process_single_folder(ts_dir: Path, folder_states: dict, all_folders: list,
     if current_time - state['last_check'] >= LIVE_CHECK_INTERVAL:
         
         logging.debug(f"处理中：{base_name}，进行增量检查...")
-        check_live_folder_incremental(
-            ts_dir, 
-            state['checked_files'], 
-            state['valid_files'], 
-            state['error_logs']
-        )
+        check_live_folder_incremental(ts_dir, state)
         state['last_check'] = current_time
     else:
         remaining = LIVE_CHECK_INTERVAL - (current_time - state['last_check'])
@@ -666,6 +636,8 @@ def cleanup_old_folder_states(folder_states: dict, active_folders: list, current
     
     for folder_path in folders_to_remove:
         logging.debug(f"清理过期文件夹状态: {folder_path.name}")
+        probe_scheduler.cancel(folder_path)
+        probe_scheduler.forget(folder_path)
         del folder_states[folder_path]
 
 def merge_worker():
@@ -704,11 +676,60 @@ def merge_worker():
             logging.error(f"合并工作线程异常: {e}")
             time.sleep(1)
 
+def wait_for_next_cycle(folder_states: dict, interval: float):
+    """
+    等待下一轮主循环
+    有片段索引时，期间每 FRAGMENT_FAST_CHECK_INTERVAL 秒处理一次文件事件，
+    对正在增量检查的文件夹立即检查新写完的片段（不等 LIVE_CHECK_INTERVAL）；
+    片段静默的直播按需补查数据库，确认结束后提前返回
+    （FRAGMENT_WATCH_BACKEND='off' 时按同样的间隔分段 sleep，结束检测照常进行）
+    """
+    deadline = time.time() + interval
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        if fragment_watcher:
+            try:
+                changed = fragment_watcher.poll(min(FRAGMENT_FAST_CHECK_INTERVAL, remaining))
+            except Exception as e:
+                logging.error(f"处理片段事件失败: {e}")
+                time.sleep(min(FRAGMENT_FAST_CHECK_INTERVAL, max(0, remaining)))
+                continue
+        else:
+            time.sleep(min(FRAGMENT_FAST_CHECK_INTERVAL, remaining))
+            changed = ()
+        for ts_dir in changed:
+            state = folder_states.get(ts_dir)
+            # 只处理已经进入增量检查的文件夹（是否开始检查仍由主循环按直播状态决定）
+            if not state or 'last_check' not in state or has_been_merged(ts_dir):
+                continue
+            check_live_folder_incremental(ts_dir, state)
+            state['last_check'] = time.time()
+        # 有直播结束时不再等满 CHECK_INTERVAL，立即进入下一轮做最终检查
+        ended = stream_lifecycle.poll()
+        if ended:
+            logging.info(f"⏩ {len(ended)} 个直播已结束，提前开始下一轮: {', '.join(ended)}")
+            break
+
 # ========================= 主循环 =========================
 
 def main_loop():
+    global fragment_watcher
     logging.info("开始监控直播文件夹...")
     
+    if FRAGMENT_WATCH_BACKEND != 'off':
+        try:
+            fragment_watcher = FragmentWatcher(
+                PARENT_DIR, suffix=".ts", backend=FRAGMENT_WATCH_BACKEND,
+                rescan_interval=FRAGMENT_RESCAN_INTERVAL, stable_time=FILE_STABLE_TIME
+            ).start()
+        except Exception as e:
+            logging.error(f"❌ 片段索引启动失败，使用 glob 扫描: {e}")
+            fragment_watcher = None
+    
+    probe_scheduler.start()
+    
     # 启动合并工作线程
     merge_thread = Thread(target=merge_worker, daemon=True, name="MergeWorker")
     merge_thread.start()
@@ -716,11 +737,16 @@ def main_loop():
     folder_states = {}
     subtitle_check_count = {}
     submitted_merges = set()  # 添加这行：追踪已提交到队列的组
+    last_metrics = time.time()
     
     try:
         while True:
             current_time = time.time()
             
+            # 先处理积压的文件事件，保证本轮看到的索引是最新的
+            if fragment_watcher:
+                fragment_watcher.poll(0)
+            
             # 获取直播文件夹
             if PROCESS_ALL_FOLDERS:
                 all_folders = find_all_live_folders(PARENT_DIR)
@@ -757,15 +783,21 @@ def main_loop():
 
             if not all_folders:
                 logging.debug("未找到直播文件夹,等待中...")
-                time.sleep(CHECK_INTERVAL)
+                wait_for_next_cycle(folder_states, CHECK_INTERVAL)
                 continue
             
+            # 所有组的直播状态一次批量查询
+            group_members = {key: extract_member_name_from_folder(folders[0].name) for key, folders in grouped.items()}
+            stream_lifecycle.track({key: (group_members[key], folders) for key, folders in grouped.items()})
+            stream_lifecycle.refresh(group_members.values(), current_time)
+            stream_lifecycle.evaluate(current_time)
+            
             # ==== 直接进入按组处理,不需要全局判断 ====
             for group_key, group_folders in grouped.items():
-                member_id = extract_member_name_from_folder(group_folders[0].name)
+                member_id = group_members[group_key]
                 
-                # 该组的网络状态
-                group_is_streaming = read_is_live(member_id) if member_id else False
+                # 该组的网络状态（本轮批量查询的结果）
+                group_is_streaming = stream_lifecycle.is_live(member_id) if member_id else False
                 
                 # 该组的文件活跃度
                 group_files_active = not is_really_stream_ended(group_folders, FINAL_INACTIVE_THRESHOLD)
@@ -812,12 +844,7 @@ def main_loop():
                             if ts_dir not in folder_states:
                                 folder_states[ts_dir] = {'checked_files': set(), 'valid_files': [], 'error_logs': []}
                             
-                            finalize_live_check(
-                                ts_dir,
-                                folder_states[ts_dir]['checked_files'],
-                                folder_states[ts_dir]['valid_files'],
-                                folder_states[ts_dir]['error_logs']
-                            )
+                            finalize_live_check(ts_dir, folder_states[ts_dir])
                     # (B) 合并该组 - 提交到合并队列
                     if all(has_been_merged(f) for f in group_folders):
                         earliest_folder = min(group_folders, key=lambda x: x.stat().st_ctime)
@@ -837,8 +864,23 @@ def main_loop():
                             # 直接调用 process_single_folder，让它自己管理 folder_states 字典中的状态
                             process_single_folder(ts_dir, folder_states, all_folders, current_time)
             
+            # 各文件夹提交的增量检查在这里统一收结果
+            collect_all_fragment_checks(folder_states)
+            if current_time - last_metrics >= PROBE_METRICS_INTERVAL:
+                probe_scheduler.log_metrics(label=lambda ts_dir: ts_dir.name)
+                last_metrics = current_time
+            
             # 清理过期状态
             cleanup_old_folder_states(folder_states, all_folders, current_time)
+            # 已合并文件夹的检查缓存不再需要
+            validation_cache.prune_merged()
+            # 场次索引：删掉已被清理的文件夹，有变化时定期写盘
+            live_folder_names = [f.name for f in find_all_live_folders(PARENT_DIR)]
+            stream_index.prune(live_folder_names)
+            stream_index.save()
+            # 源文件夹已被清理的滚动合并中间文件
+            if rolling_merger:
+                rolling_merger.prune(live_folder_names)
             
             # 清理字幕检查计数器
             active_group_keys = set(grouped.keys())
@@ -854,7 +896,7 @@ def main_loop():
                 if key in submitted_merges:
                     submitted_merges.discard(key)
             
-            time.sleep(CHECK_INTERVAL)
+            wait_for_next_cycle(folder_states, CHECK_INTERVAL)
             
     except KeyboardInterrupt:
         logging.warning("收到停止信号，正在清理资源...")
@@ -876,6 +918,10 @@ def main_loop():
                 logging.info("数据库连接池已关闭")
             except:
                 pass
+        if fragment_watcher:
+            fragment_watcher.close()
+        probe_scheduler.close()
+        stream_index.save(force=True)
 
 if __name__ == "__main__":
     main_loop()
\ No newline at end of file
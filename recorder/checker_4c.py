@@ -19,62 +19,35 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "shared"))
 from logger_config import setup_logger
 setup_logger()
 from config import * # 复用 OUTPUT_DIR, SUBTITLES_SOURCE_ROOT 等配置
-from upscaler import get_frame_rate, upscale_file  # 需确保 recorder/upscaler.py 存在
+from upscaler import upscale_file  # 需确保 recorder/upscaler.py 存在
+from encode_profile import resolve_profile, load_bench
+from upscale_scheduler import UpscaleScheduler, plan_chunks
+from probe_service import probe
 from merger import merge_once      # 复用现有的合并模块
+from stream_index import StreamSessionIndex
+from subtitle_index import get_subtitle_index
 
 
 # 全局任务队列
 merge_queue = Queue()
 
+# 直播场次索引（持久化在 INCOMING_DIR 下，重启后不再重新扫描）
+stream_index = None
+
+# 拉伸任务调度器（多个编码并行，按核数分配线程）
+upscale_scheduler = None
+
 # ========================= 逻辑复用区 =========================
 
 def group_folders_by_member(folders):
     """
-    【逻辑复用】将文件夹按成员分组
-    因为 rsync 保留了时间戳，4C 的分组结果将与 3C 完全一致
+    【逻辑复用】将文件夹按成员分组（与 3C 共用 stream_index 的分组规则）
+    3C 最终检查时会同步 .stream_session.json 过来，有它时直接用 3C 的片段时间；
+    还没有时用本地片段 mtime（rsync 保留 mtime，不保留 ctime）
     """
-    from collections import defaultdict
-    groups = defaultdict(list)
-    member_folders = defaultdict(list)
-    
     for folder in folders:
-        member_id = extract_member_name_from_folder(folder.name)
-        if member_id:
-            member_folders[member_id].append(folder)
-        else:
-            groups[f"unknown_{folder.name}"].append(folder)
-    
-    for member_id, member_folder_list in member_folders.items():
-        member_folder_list.sort(key=lambda x: x.stat().st_ctime)
-        if not member_folder_list: continue
-            
-        current_group = []
-        group_index = 0
-        
-        for i, folder in enumerate(member_folder_list):
-            if i == 0:
-                current_group.append(folder)
-            else:
-                prev_folder = member_folder_list[i-1]
-                # 简单的时间差判定 (4小时)，与 3C 逻辑保持兼容
-                time_diff = folder.stat().st_ctime - prev_folder.stat().st_ctime
-                if time_diff < 14400: 
-                    current_group.append(folder)
-                else:
-                    first_folder = current_group[0]
-                    date_part = first_folder.name[:6]
-                    key = f"{date_part}_{member_id}_{group_index}_{int(first_folder.stat().st_ctime)}"
-                    groups[key] = current_group
-                    group_index += 1
-                    current_group = [folder]
-        
-        if current_group:
-            first_folder = current_group[0]
-            date_part = first_folder.name[:6]
-            key = f"{date_part}_{member_id}_{group_index}_{int(first_folder.stat().st_ctime)}"
-            groups[key] = current_group
-    
-    return groups
+        stream_index.refresh(folder)
+    return stream_index.groups(folders, with_ctime=True)
 
 def extract_member_name_from_folder(folder_name: str):
     """【逻辑复用】提取 Member ID"""
@@ -107,86 +80,119 @@ def has_matching_subtitle_for_group(group_folders):
     v_name = match.group(2).strip()
     v_time = int(match.group(3))
 
-    # 扫描 config 中配置的字幕目录
-    for sub_file in SUBTITLES_SOURCE_ROOT.rglob("*comments.json"):
-        sub_name = sub_file.stem
-        if v_date in sub_name and v_name in sub_name:
-            sub_time_match = re.search(r'(\d{6})', sub_name.replace(v_date, "", 1))
-            if sub_time_match:
-                s_time = int(sub_time_match.group(1))
-                diff = abs(v_time - s_time)
-                if diff < 120: # 允许2分钟误差
-                    return True
-    return False
+    # 查 config 中配置的字幕目录的索引（允许2分钟误差）
+    sub_file, _ = get_subtitle_index(SUBTITLES_SOURCE_ROOT).find_nearest(v_date, v_name, v_time, 120)
+    return sub_file is not None
 
 # ========================= 4C 核心处理 =========================
 
-def process_live_folder_upscale(incoming_folder: Path, processed_folder: Path, is_last: bool = False):
+def run_upscale_job(key: str, inputs, options, threads: int):
+    """拉伸调度器的工作函数：拉伸一个 chunk，返回 (成功与否, 产出的视频秒数)"""
+    # options 为 encode profile；旧状态文件里恢复的任务只有帧率字符串
+    profile = options if isinstance(options, dict) else {'fps': options or "40"}
+    dst = Path(key)
+    tmp_list = dst.parent / f".tmp_{dst.stem}.txt"
+    with open(tmp_list, "w", encoding="utf-8") as f:
+        for ts in inputs:
+            f.write(f"file '{ts.resolve()}'\n")
+    try:
+        ok = upscale_file(tmp_list, dst, is_filelist=True, threads=threads, pipeline=UPSCALE_PIPELINE, profile=profile)
+    finally:
+        tmp_list.unlink(missing_ok=True)
+    if not ok:
+        return False, None
+    # 时长只用于统计：编码已成功，探测失败不能让任务被记为失败
+    try:
+        return True, probe(dst, timeout=30).duration
+    except Exception as e:
+        logging.warning(f"⚠️ 读取拉伸产出时长失败 {dst.name}: {e}")
+        return True, None
+
+def get_ss_num_from_path(f):
+    m = re.search(r'ss-(\d+)', f.name)
+    return int(m.group(1)) if m else -1
+
+_unnumbered_warned = set()   # 已告警过的 (文件夹, 文件名)，每个文件只告警一次
+
+def numbered_fragments(incoming_folder: Path) -> dict:
+    """{序号: 片段}；没有 ss-序号 的文件无法排进网格，不会被拉伸（告警，需人工处理）"""
+    fragments = {}
+    for f in incoming_folder.glob("*.ts"):
+        num = get_ss_num_from_path(f)
+        if num >= 0:
+            fragments[num] = f
+        elif (incoming_folder.name, f.name) not in _unnumbered_warned:
+            _unnumbered_warned.add((incoming_folder.name, f.name))
+            logging.warning(f"⚠️ [{incoming_folder.name}] 片段没有 ss-序号，不会被拉伸: {f.name}")
+    return fragments
+
+def fragment_arrival(f: Path) -> float:
+    """
+    片段到达 4C 的时间（只在格内有缺号时才 stat）
+    rsync -a 保留的是 3C 上的 mtime，落地时间看 ctime；文件已不在时按刚到达处理
+    """
+    try:
+        return f.stat().st_ctime
+    except OSError:
+        return time.time()
+
+def chunk_ranges(processed_folder: Path, include_active: bool = True) -> list:
+    """已拉伸完成（以及排队 / 运行中）的 chunk 覆盖的 [(first, last)]"""
+    names = [mp4.name for mp4 in processed_folder.glob("chunk_*.mp4") if mp4.stat().st_size > 0]
+    if include_active and upscale_scheduler:
+        names += [Path(key).name for key in upscale_scheduler.active_keys() if Path(key).parent == processed_folder]
+    ranges = []
+    for name in names:
+        m = re.match(r'chunk_(\d+)_(\d+)\.mp4$', name)
+        if m:
+            ranges.append((int(m.group(1)), int(m.group(2))))
+    return ranges
+
+def process_live_folder_upscale(incoming_folder: Path, processed_folder: Path, is_last: bool = False,
+                                stream_start: float = 0):
     """
     核心任务：将 Incoming (360p) 的文件拉伸到 Processed (1080p)
+    只负责切分 chunk 并提交给拉伸调度器，编码在调度器的工作线程里并行进行
+    直播中按 UPSCALE_CHUNK_FRAGMENTS 个序号一格的网格切小 chunk，写满一格就拉伸，
+    结束时只剩最后一格的尾巴（合并时 -c copy 拼接这些 chunk）
     """
     if not incoming_folder.exists():
         return
 
     processed_folder.mkdir(parents=True, exist_ok=True)
-    src_files = sorted(list(incoming_folder.glob("*.ts")),
-                       key=lambda f: [int(c) if c.isdigit() else c.lower()
-                                      for c in re.split(r'(\d+)', f.name)])
-
-    if not src_files:
+    fragments = numbered_fragments(incoming_folder)
+    if not fragments:
         return
 
-    fps = get_frame_rate(src_files)
-
-    # 按序号断层切分成连续段
-    def get_ss_num(f):
-        m = re.search(r'ss-(\d+)', f.name)
-        return int(m.group(1)) if m else -1
-
-    # 切分连续段
-    segments = []
-    current_seg = [src_files[0]]
-    for i in range(1, len(src_files)):
-        prev_num = get_ss_num(src_files[i-1])
-        curr_num = get_ss_num(src_files[i])
-        if curr_num - prev_num == 1:
-            current_seg.append(src_files[i])
-        else:
-            segments.append(current_seg)
-            current_seg = [src_files[i]]
-    segments.append(current_seg)
-
-    # 每段最多500个，超过500再细分
-    chunks = []
-    for seg in segments:
-        for i in range(0, len(seg), 500):
-            chunks.append(seg[i:i+500])
-
-    for chunk in chunks:
-        # 不足500个且不是最后阶段，跳过
-        if len(chunk) < 500 and not is_last:
-            continue
+    numbers = sorted(fragments)
+    pieces = plan_chunks(numbers, chunk_ranges(processed_folder), UPSCALE_CHUNK_FRAGMENTS,
+                         UPSCALE_CHUNK_SETTLE, final=is_last,
+                         arrival_of=lambda n: fragment_arrival(fragments[n]), gap_stable=UPSCALE_CHUNK_GAP_STABLE)
+    if not pieces:
+        return
 
-        first_num = get_ss_num(chunk[0])
-        last_num = get_ss_num(chunk[-1])
+    # 每个文件夹只探测一次源分辨率 / 帧率，缓存在拉伸目录下
+    profile = resolve_profile(
+        [fragments[n] for n in numbers], processed_folder,
+        table=UPSCALE_PROFILE_TABLE,
+        threads_per_job=upscale_scheduler.threads_per_job,
+        native_height=UPSCALE_NATIVE_HEIGHT,
+        target=UPSCALE_TARGET,
+        scaler=UPSCALE_SCALER,
+        high_threads=UPSCALE_HIGH_CPU_THREADS,
+        bench=load_bench(ENCODE_BENCH_FILE),
+        max_ssim_drop=ENCODE_MAX_SSIM_DROP,
+    )
+
+    for first_num, last_num in pieces:
+        chunk = [fragments[n] for n in range(first_num, last_num + 1)]
         out_name = f"chunk_{first_num:06d}_{last_num:06d}.mp4"
         dst = processed_folder / out_name
 
-        if dst.exists() and dst.stat().st_size > 0:
-            continue
-
-        tmp_list = processed_folder / f".tmp_{first_num}.txt"
-        with open(tmp_list, "w", encoding="utf-8") as f:
-            for ts in chunk:
-                f.write(f"file '{ts.resolve()}'\n")
-
-        logging.info(f"⚡ [{incoming_folder.name}] 拉伸分组 {out_name} ({len(chunk)}个分片)")
-        upscale_file(tmp_list, dst, fps=fps, is_filelist=True)
-        tmp_list.unlink(missing_ok=True)
-
-def get_ss_num_from_path(f):
-    m = re.search(r'ss-(\d+)', f.name)
-    return int(m.group(1)) if m else -1
+        # 已结束直播的 chunk 优先，其次开始得早的直播
+        if upscale_scheduler.submit(str(dst), chunk, profile, final=is_last, stream_start=stream_start, order=first_num):
+            logging.info(f"⚡ [{incoming_folder.name}] 拉伸分组 {out_name} ({len(chunk)}个分片) 加入队列 "
+                         f"(排队 {upscale_scheduler.depth()} 个)")
 
 def check_group_ready_to_merge(group_folders):
     for folder in group_folders:
@@ -198,22 +204,17 @@ def check_group_ready_to_merge(group_folders):
         if not proc_folder.exists():
             return False, f"等待创建拉伸目录: {proc_folder.name}"
 
-        src_files = sorted(list(folder.glob("*.ts")),
-                           key=lambda f: [int(c) if c.isdigit() else c.lower()
-                                          for c in re.split(r'(\d+)', f.name)])
-        if not src_files:
+        numbers = sorted(numbered_fragments(folder))
+        if not numbers:
             continue
 
-        last_ts = src_files[-1]
-        processed_mp4s = list(proc_folder.glob("chunk_*.mp4"))
-        if not processed_mp4s:
+        # 每个片段都要被某个已完成的 chunk 覆盖
+        done = chunk_ranges(proc_folder, include_active=False)
+        if not done:
             return False, f"拉伸进行中: 0个chunk完成"
-
-        last_ts_num = get_ss_num_from_path(last_ts)
-        last_chunk_done = any(f"{last_ts_num:06d}" in mp4.name for mp4 in processed_mp4s)
-
-        if not last_chunk_done:
-            return False, f"拉伸进行中: 最后chunk未完成"
+        remaining = sum(1 for n in numbers if not any(first <= n <= last for first, last in done))
+        if remaining:
+            return False, f"拉伸进行中: {remaining} 个片段未完成"
 
     return True, "Ready"
 
@@ -270,6 +271,7 @@ def merge_worker():
 # ========================= 主循环 =========================
 
 def main_loop():
+    global stream_index, upscale_scheduler
     logging.info("🚀 4C 拉伸检查服务启动...")
     
     # 目录初始化
@@ -284,6 +286,20 @@ def main_loop():
     
     submitted_merges = set()
     subtitle_check_count = {}
+    stream_index = StreamSessionIndex(
+        INCOMING_DIR / STREAM_INDEX_FILE.name,
+        member_of=extract_member_name_from_folder,
+        time_field="mtime",
+        gap=STREAM_GROUP_GAP,
+        fallback_gap=STREAM_GROUP_FALLBACK_GAP,
+    )
+    upscale_scheduler = UpscaleScheduler(
+        run_upscale_job,
+        workers=UPSCALE_WORKERS,
+        threads_per_job=UPSCALE_THREADS_PER_JOB,
+        state_path=UPSCALE_STATE_FILE,
+    ).start()
+    last_metrics = time.time()
 
     while True:
         try:
@@ -302,6 +318,8 @@ def main_loop():
 
             # 2. 分组 (与 3C 逻辑一致)
             grouped = group_folders_by_member(all_folders)
+            stream_index.prune(f.name for f in all_folders)
+            stream_index.save()
             
             # 3. 逐组处理
             for group_key, group_folders in grouped.items():
@@ -310,11 +328,12 @@ def main_loop():
                 if group_key in submitted_merges:
                     continue
 
-                # === 步骤 A: 拉伸 (Incoming -> Processed) ===
+                # === 步骤 A: 拉伸 (Incoming -> Processed)，提交给调度器并行编码 ===
+                group_start = min((stream_index.time_range(f) or (f.stat().st_mtime,))[0] for f in group_folders)
                 for folder in group_folders:
                     proc_folder = PROCESSED_DIR / folder.name
                     is_last = (folder / FILELIST_NAME).exists()
-                    process_live_folder_upscale(folder, proc_folder, is_last=is_last)
+                    process_live_folder_upscale(folder, proc_folder, is_last=is_last, stream_start=group_start)
 
                 # === 步骤 B: 检查合并条件 ===
                 is_ready, status_msg = check_group_ready_to_merge(group_folders)
@@ -348,9 +367,16 @@ def main_loop():
                         if subtitle_check_count[group_key] % 2 == 0:
                             logging.info(f"[{group_key}] 等待字幕... ({subtitle_check_count[group_key]})")
             
+            if time.time() - last_metrics >= UPSCALE_METRICS_INTERVAL:
+                upscale_scheduler.log_metrics()
+                upscale_scheduler.prune()
+                last_metrics = time.time()
+            
             time.sleep(CHECK_INTERVAL)
 
         except KeyboardInterrupt:
+            # 排队中的拉伸任务保留在状态文件里，下次启动时恢复
+            upscale_scheduler.close()
             logging.info("程序退出")
             break
         except Exception as e:
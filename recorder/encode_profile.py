@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+每场直播的编码参数（encode profile）
+供 checker_4c.py 调用：代替每个 chunk 探测一次中间片段的帧率、固定拉伸到 1080p / ultrafast / CRF 18
+
+    - 每个文件夹只探测一次：按 1/4、1/2、3/4 位置取几个片段，经共享探测服务读取分辨率与帧率，
+      结果（源信息）缓存为拉伸目录下的 .encode_profile.json，重启后不再探测
+    - 帧率: 优先 avg_frame_rate（r_frame_rate 在 HLS 片段上常被报成两倍），取各样本中位数，
+      贴近常见帧率时取标准值；探测不到时不加 fps 滤镜（保持源时间轴，不再强制 40）
+    - 源高度 ≥ native_height（默认 720）时不拉伸，chunk 只做 -c copy 封装
+    - preset / CRF 查配置表：按源高度选行，按每个编码分到的线程数选 CPU 档位（low / high）
+      编码参数每次按当前配置现算，改了配置表不需要删缓存
+    - 有 bench_encode.py 在本机跑出的结果时优先用它：在线程数与调度器分配最接近的结果里，
+      选 SSIM 不低于最佳结果 max_ssim_drop 的最快一组 preset / CRF / 缩放算法
+      （合成画面的 SSIM 绝对值取决于内容，所以质量下限用相对最佳结果的差值）
+
+本模块不依赖 config.py
+"""
+
+import sys
+import json
+import time
+import logging
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "shared"))
+from probe_service import probe
+
+PROFILE_FILE = ".encode_profile.json"
+COMMON_RATES = {24: "24", 25: "25", 30000 / 1001: "30000/1001", 30: "30", 50: "50", 60000 / 1001: "60000/1001", 60: "60"}
+DEFAULT_TABLE = [
+    {'max_height': 480, 'low': ('ultrafast', 18), 'high': ('superfast', 18)},
+    {'max_height': 719, 'low': ('ultrafast', 20), 'high': ('superfast', 20)},
+]
+
+
+def _fps_string(rate):
+    """29.97 → '30000/1001'，30.0 → '30'；不在常见帧率 1% 以内时保留 3 位小数"""
+    for value, text in COMMON_RATES.items():
+        if abs(rate - value) / value < 0.01:
+            return text
+    return f"{rate:.3f}".rstrip('0').rstrip('.')
+
+
+def _sample(fragments: list, samples: int) -> list:
+    """均匀取样（避开第一个和最后一个片段：开播 / 断流时的片段常常不完整）"""
+    n = len(fragments)
+    if n <= 2:
+        return list(fragments)
+    picks = sorted({max(1, min(n - 2, n * (i + 1) // (samples + 1))) for i in range(samples)})
+    return [fragments[i] for i in picks]
+
+
+def detect_source(fragments: list, samples: int = 3, timeout: float = 10, probe_fn=None) -> dict:
+    """探测源分辨率与帧率: {'width', 'height', 'fps', 'samples'}，一个都探测不到时返回 None"""
+    probe_fn = probe_fn or probe
+    heights, widths, rates = [], [], []
+    for fragment in _sample(fragments, samples):
+        try:
+            result = probe_fn(fragment, timeout=timeout)
+        except Exception as e:
+            logging.debug(f"探测失败 {fragment.name}: {e}")
+            continue
+        video = result.video if result else None
+        if not video:
+            continue
+        if video.height:
+            heights.append(video.height)
+            widths.append(video.width or 0)
+        rate = next((r for r in (video.avg_fps, video.fps) if r and 1 <= r <= 120), None)
+        if rate:
+            rates.append(rate)
+    if not heights:
+        return None
+    return {
+        'width': int(statistics.median(widths)),
+        'height': int(statistics.median(heights)),
+        'fps': _fps_string(statistics.median(rates)) if rates else None,
+        'samples': len(heights),
+    }
+
+
+_bench_cache = {}   # {path: (mtime_ns, data)}
+
+
+def load_bench(path: Path) -> dict:
+    """读取 bench_encode.py 的结果（文件没变时用缓存）；没有或读不了时返回 None"""
+    if not path:
+        return None
+    path = Path(path)
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except OSError:
+        return None
+    cached = _bench_cache.get(path)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"读取编码基准结果失败 {path}: {e}")
+        data = None
+    _bench_cache[path] = (mtime_ns, data)
+    return data
+
+
+def pick_from_bench(bench: dict, source_height: int, threads_per_job: int = None, max_ssim_drop: float = 0.01):
+    """
+    在线程数最接近 threads_per_job 的基准结果里，选 SSIM ≥ 最佳 - max_ssim_drop 的最快一组
+    只对与基准源分辨率相近或更低的源适用；没有可用结果时返回 None
+    """
+    if not bench or not source_height:
+        return None
+    bench_height = (bench.get('source') or {}).get('height')
+    if not bench_height or source_height > bench_height * 4 / 3:
+        return None
+    rows = [r for r in bench.get('results') or [] if r.get('ssim') and r.get('fps')]
+    if not rows:
+        return None
+    if threads_per_job:
+        closest = min({r['threads'] for r in rows}, key=lambda t: (abs(t - threads_per_job), t))
+        rows = [r for r in rows if r['threads'] == closest]
+    floor = max(r['ssim'] for r in rows) - max_ssim_drop
+    return max((r for r in rows if r['ssim'] >= floor), key=lambda r: r['fps'])
+
+
+def cpu_budget(threads_per_job: int, high_threads: int = 4) -> str:
+    """每个编码分到的线程数 ≥ high_threads 时为 'high'，否则 'low'"""
+    return 'high' if threads_per_job and threads_per_job >= high_threads else 'low'
+
+
+def choose(source: dict, table: list = None, budget: str = 'low', native_height: int = 720,
+           target=(1920, 1080), scaler: str = "lanczos", bench: dict = None, threads_per_job: int = None,
+           max_ssim_drop: float = 0.01) -> dict:
+    """按源信息和配置表（有本机基准结果时优先用基准结果）算出编码参数"""
+    source = source or {}
+    height = source.get('height')
+    profile = {
+        'source': [source.get('width'), height],
+        'fps': source.get('fps'),
+        'upscale': not (height and height >= native_height),
+        'target': list(target),
+        'scaler': scaler,
+        'budget': budget,
+        'preset': 'ultrafast',
+        'crf': 18,
+        'chosen_by': 'default',
+    }
+    if profile['upscale'] and height:
+        picked = pick_from_bench(bench, height, threads_per_job, max_ssim_drop)
+        if picked:
+            profile.update(preset=picked['preset'], crf=picked['crf'], scaler=picked['scaler'], chosen_by='bench')
+            return profile
+        for row in table or DEFAULT_TABLE:
+            if height <= row['max_height']:
+                profile['preset'], profile['crf'] = row.get(budget) or row['low']
+                profile['chosen_by'] = 'table'
+                break
+    return profile
+
+
+def resolve_profile(fragments: list, cache_dir: Path, table: list = None, threads_per_job: int = None,
+                    native_height: int = 720, target=(1920, 1080), scaler: str = "lanczos",
+                    high_threads: int = 4, samples: int = 3, bench: dict = None, max_ssim_drop: float = 0.01,
+                    probe_fn=None) -> dict:
+    """
+    读取 / 建立 cache_dir 下的源信息缓存，返回编码参数
+    探测失败时不写缓存（下一轮再试），返回沿用旧默认值、但不强制帧率的参数
+    """
+    cache_file = Path(cache_dir) / PROFILE_FILE
+    source = None
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            source = json.load(f)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logging.warning(f"读取编码参数缓存失败，重新探测: {e}")
+
+    fresh = False
+    if not source and fragments:
+        source = detect_source(fragments, samples=samples, probe_fn=probe_fn)
+        if source:
+            fresh = True
+            source['detected_at'] = time.time()
+            try:
+                Path(cache_dir).mkdir(parents=True, exist_ok=True)
+                with open(cache_file, 'w', encoding='utf-8') as f:
+                    json.dump(source, f, ensure_ascii=False)
+            except OSError as e:
+                logging.warning(f"保存编码参数缓存失败: {e}")
+
+    profile = choose(source, table, cpu_budget(threads_per_job, high_threads), native_height, target, scaler,
+                     bench=bench, threads_per_job=threads_per_job, max_ssim_drop=max_ssim_drop)
+    if fresh:
+        width, height = profile['source']
+        action = (f"拉伸到 {target[0]}x{target[1]} {profile['preset']} crf{profile['crf']} {profile['scaler']}"
+                  f"（{profile['chosen_by']}）" if profile['upscale']
+                  else "已达原生分辨率，只封装不拉伸")
+        logging.info(f"🎛️ [{Path(cache_dir).name}] 源 {width}x{height}@{profile['fps'] or '?'}fps → {action}")
+    return profile
+
+
+if __name__ == "__main__":
+    # 自检：用假的探测结果验证帧率 / 分辨率判定、查表与缓存
+    import shutil
+    import tempfile
+
+    class _Video:
+        def __init__(self, width, height, fps, avg_fps):
+            self.width, self.height, self.fps, self.avg_fps = width, height, fps, avg_fps
+
+    class _Result:
+        def __init__(self, video):
+            self.video = video
+
+    calls = []
+
+    def fake_probe(streams):
+        def probe_fn(path, timeout=None):
+            calls.append(path)
+            return _Result(streams.get(path.name))
+        return probe_fn
+
+    tmp = Path(tempfile.mkdtemp(prefix="encode_profile_"))
+    try:
+        fragments = [tmp / f"ss-{i:06d}.ts" for i in range(100)]
+        # HLS 常见: r_frame_rate 报成 60，avg 为 29.97；有一个样本探测失败
+        streams = {f.name: _Video(640, 360, 60.0, 29.97) for f in fragments}
+        streams[fragments[50].name] = None
+        profile = resolve_profile(fragments, tmp / "proc", threads_per_job=2, probe_fn=fake_probe(streams))
+        assert profile['fps'] == "30000/1001" and profile['upscale'] and profile['preset'] == 'ultrafast', profile
+        assert len(calls) == 3 and fragments[0] not in calls, "只取 3 个中间样本"
+
+        # 第二次直接读缓存，不再探测；CPU 档位按当前线程数现算
+        calls.clear()
+        profile = resolve_profile(fragments, tmp / "proc", threads_per_job=4, probe_fn=fake_probe(streams))
+        assert not calls and profile['preset'] == 'superfast', profile
+
+        # 720p 源不拉伸
+        hd = {f.name: _Video(1280, 720, 30.0, 30.0) for f in fragments}
+        assert not resolve_profile(fragments, tmp / "hd", probe_fn=fake_probe(hd))['upscale']
+
+        # 有本机基准结果：线程数最接近的结果里，SSIM 在最佳 0.01 以内的最快一组
+        bench = {'source': {'height': 360}, 'results': [
+            {'preset': 'ultrafast', 'crf': 18, 'scaler': 'lanczos', 'threads': 2, 'fps': 90, 'ssim': 0.900},
+            {'preset': 'ultrafast', 'crf': 18, 'scaler': 'bicubic', 'threads': 2, 'fps': 110, 'ssim': 0.895},
+            {'preset': 'superfast', 'crf': 18, 'scaler': 'lanczos', 'threads': 2, 'fps': 70, 'ssim': 0.905},
+            {'preset': 'ultrafast', 'crf': 23, 'scaler': 'bilinear', 'threads': 2, 'fps': 150, 'ssim': 0.880},
+            {'preset': 'ultrafast', 'crf': 23, 'scaler': 'bilinear', 'threads': 4, 'fps': 300, 'ssim': 0.880},
+        ]}
+        picked = resolve_profile(fragments, tmp / "proc", threads_per_job=2, bench=bench)
+        assert picked['chosen_by'] == 'bench' and (picked['preset'], picked['scaler']) == ('ultrafast', 'bicubic')
+        assert resolve_profile(fragments, tmp / "hd", bench=bench)['upscale'] is False
+
+        # 全部探测失败：不写缓存，不强制帧率
+        failed = resolve_profile(fragments, tmp / "bad", probe_fn=fake_probe({}))
+        assert failed['fps'] is None and failed['upscale'] and not (tmp / "bad" / PROFILE_FILE).exists()
+        print(f"✅ 自检通过: {profile}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+录制目录的事件驱动片段索引
+供 checker.py 调用：替代每轮 iterdir() + 每个文件夹多次 glob("*.ts") + 逐个 stat
+
+    inotify (Linux, ctypes 直接调用 libc，不需要第三方库)
+        父目录:   新建 / 删除 / 移入移出的直播文件夹
+        直播文件夹: IN_CREATE 记录新片段，IN_CLOSE_WRITE 时 stat 一次得到最终大小与时间
+    polling 回退 (非 Linux 或 inotify 不可用)
+        每次 poll 对每个文件夹 scandir 一次，只 stat 新出现或还没写完的片段
+
+每个文件夹一个 FragmentIndex：片段名 → (大小, mtime, ctime, 是否已写完)，并维护最早/最晚片段时间，
+以及「还没交给调用方检查过的片段」集合，所以每轮的工作量只与新片段数量成正比
+队列溢出 (IN_Q_OVERFLOW) 或每隔 rescan_interval 秒做一次全量重扫兜底
+
+本模块不依赖 config.py
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import ctypes
+import ctypes.util
+from pathlib import Path
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+PARENT_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+FOLDER_MASK = IN_CREATE | IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+
+class Inotify:
+    """libc inotify 的最小封装"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 失败: {os.strerror(err)}")
+        self.fd = fd
+
+    def add_watch(self, path: Path, mask: int) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(str(path)), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch 失败 {path}: {os.strerror(err)}")
+        return wd
+
+    def rm_watch(self, wd: int):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float = 0) -> list:
+        """等待最多 timeout 秒，返回 [(wd, mask, name)]"""
+        ready, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not ready:
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+                offset += length
+                events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class FragmentIndex:
+    """
+    单个直播文件夹的片段索引
+        files: {name: [size, mtime, ctime, closed]}
+            closed: True 已写完 (CLOSE_WRITE / 轮询确认)，False 正在写 (IN_CREATE)，None 扫描发现、未知
+        first_ctime / last_ctime / last_mtime: 最早、最晚片段时间（与原来 glob + stat 的取值一致）
+    """
+
+    def __init__(self, folder: Path, suffix: str = ".ts"):
+        self.folder = folder
+        self.suffix = suffix
+        self.files = {}
+        self.first_ctime = None
+        self.last_ctime = None
+        self.last_mtime = None
+        self._fresh = {}            # 还没交给调用方的片段 {name: 发现时间}，保持插入顺序
+
+    @property
+    def count(self) -> int:
+        return len(self.files)
+
+    def update(self, name: str, size: int, mtime: float, ctime: float, closed):
+        if not name.endswith(self.suffix):
+            return
+        old = self.files.get(name)
+        if old is None:
+            self._fresh[name] = time.time()
+        self.files[name] = [size, mtime, ctime, closed]
+        # IN_CREATE 时记的是出现时间，写完 stat 后被真实时间替换：
+        # 这个片段正好是边界、且新值往里收时，边界要重算（否则开播时间会停在出现时间上）
+        if old is not None and ((old[2] == self.first_ctime and ctime > old[2])
+                                or (old[2] == self.last_ctime and ctime < old[2])
+                                or (old[1] == self.last_mtime and mtime < old[1])):
+            self._recompute_bounds()
+            return
+        if self.first_ctime is None or ctime < self.first_ctime:
+            self.first_ctime = ctime
+        if self.last_ctime is None or ctime > self.last_ctime:
+            self.last_ctime = ctime
+        if self.last_mtime is None or mtime > self.last_mtime:
+            self.last_mtime = mtime
+
+    def stat_update(self, name: str, closed: bool) -> bool:
+        """stat 一次并更新；文件已经不存在时移除"""
+        try:
+            st = os.stat(self.folder / name)
+        except FileNotFoundError:
+            self.remove(name)
+            return False
+        self.update(name, st.st_size, st.st_mtime, st.st_ctime, closed)
+        return True
+
+    def remove(self, name: str):
+        if self.files.pop(name, None) is not None:
+            self._fresh.pop(name, None)
+            # 删除片段很少见（去重 / 清理），此时重算边界
+            self._recompute_bounds()
+
+    def _recompute_bounds(self):
+        ctimes = [f[2] for f in self.files.values()]
+        mtimes = [f[1] for f in self.files.values()]
+        self.first_ctime = min(ctimes, default=None)
+        self.last_ctime = max(ctimes, default=None)
+        self.last_mtime = max(mtimes, default=None)
+
+    def paths(self) -> list:
+        return [self.folder / name for name in self.files]
+
+    def unchecked_stable(self, checked: set, stable_time: float, now: float = None) -> list:
+        """
+        取出已经稳定、调用方还没检查过的片段（只遍历新片段）
+        稳定: 已写完，或扫描发现的片段 mtime 超过 stable_time 秒没有变化（正在写的片段要等 CLOSE_WRITE）
+        """
+        now = now if now is not None else time.time()
+        result = []
+        for name in list(self._fresh):
+            entry = self.files.get(name)
+            if entry is None:
+                self._fresh.pop(name, None)
+                continue
+            path = self.folder / name
+            if path in checked:
+                self._fresh.pop(name, None)
+                continue
+            size, mtime, ctime, closed = entry
+            if closed or (closed is None and now - mtime > stable_time):
+                self._fresh.pop(name, None)
+                result.append(path)
+        return result
+
+
+class FragmentWatcher:
+    """
+    父目录下所有直播文件夹的片段索引
+        poll(timeout):  处理事件（或回退模式下增量扫描），返回有新片段写完的文件夹集合
+        folders():      当前所有直播文件夹（排除 temp_ 开头的临时目录）
+        index(folder):  文件夹的 FragmentIndex（不在索引里时立即扫描一次）
+    """
+
+    def __init__(self, parent_dir: Path, suffix: str = ".ts", backend: str = "auto",
+                 rescan_interval: float = 300, stable_time: float = 5):
+        """
+        参数:
+            parent_dir: 直播文件夹所在的父目录
+            suffix: 片段扩展名
+            backend: 'auto' | 'inotify' | 'poll'
+            rescan_interval: 全量重扫兜底间隔（秒）
+            stable_time: 回退模式下判定片段写完的静止时间（秒）
+        """
+        self.parent_dir = Path(parent_dir)
+        self.suffix = suffix
+        self.rescan_interval = rescan_interval
+        self.stable_time = stable_time
+        self._indexes = {}          # {folder: FragmentIndex}
+        self._wd_folder = {}        # {wd: folder}，父目录对应 None
+        self._folder_wd = {}
+        self._last_rescan = 0
+        self._settling = {}         # {folder: 时间}，扫描发现未确认写完的片段，到时间后通知调用方
+        self._inotify = None
+        self.stats = {'events': 0, 'rescans': 0, 'overflows': 0, 'stats': 0}
+
+        if backend in ("auto", "inotify") and sys.platform.startswith("linux"):
+            try:
+                self._inotify = Inotify()
+            except (OSError, AttributeError) as e:
+                if backend == "inotify":
+                    raise
+                logging.warning(f"⚠️ inotify 不可用，回退到轮询扫描: {e}")
+        self.backend = "inotify" if self._inotify else "poll"
+
+    # ========================= 生命周期 =========================
+
+    def start(self):
+        self.parent_dir.mkdir(parents=True, exist_ok=True)
+        if self._inotify:
+            self._wd_folder[self._inotify.add_watch(self.parent_dir, PARENT_MASK)] = None
+        self.rescan()
+        logging.info(f"👀 片段索引已启动 ({self.backend}): {self.parent_dir}, {len(self._indexes)} 个文件夹")
+        return self
+
+    def close(self):
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+
+    # ========================= 查询 =========================
+
+    def folders(self) -> list:
+        return [f for f in self._indexes if not f.name.startswith("temp_")]
+
+    def index(self, folder: Path) -> FragmentIndex:
+        folder = Path(folder)
+        idx = self._indexes.get(folder)
+        if idx is None:
+            idx = self._track(folder)
+        return idx
+
+    # ========================= 扫描 =========================
+
+    def rescan(self):
+        """全量重扫：同步文件夹列表，并补齐每个文件夹里漏掉的片段"""
+        self.stats['rescans'] += 1
+        self._last_rescan = time.time()
+        for folder in self._sync_folders():
+            self._scan_folder(self._indexes[folder], full=True)
+
+    def _sync_folders(self) -> list:
+        """同步父目录下的文件夹列表，返回原本就在索引里的文件夹"""
+        try:
+            current = {Path(e.path) for e in os.scandir(self.parent_dir) if e.is_dir(follow_symlinks=False)}
+        except FileNotFoundError:
+            current = set()
+        for folder in list(self._indexes):
+            if folder not in current:
+                self._untrack(folder)
+        existing = []
+        for folder in current:
+            if folder in self._indexes:
+                existing.append(folder)
+            else:
+                self._track(folder)
+        return existing
+
+    def _track(self, folder: Path) -> FragmentIndex:
+        idx = FragmentIndex(folder, self.suffix)
+        self._indexes[folder] = idx
+        if self._inotify:
+            try:
+                wd = self._inotify.add_watch(folder, FOLDER_MASK)
+                self._wd_folder[wd] = folder
+                self._folder_wd[folder] = wd
+            except OSError as e:
+                logging.warning(f"监听文件夹失败 {folder.name}: {e}")
+        # 先加监听再扫描，扫描期间写完的片段由事件补上
+        self._scan_folder(idx, full=True)
+        return idx
+
+    def _untrack(self, folder: Path):
+        self._indexes.pop(folder, None)
+        self._settling.pop(folder, None)
+        wd = self._folder_wd.pop(folder, None)
+        if wd is not None:
+            self._wd_folder.pop(wd, None)
+            if self._inotify:
+                self._inotify.rm_watch(wd)
+
+    def _scan_folder(self, idx: FragmentIndex, full: bool = False) -> bool:
+        """
+        scandir 一次；只 stat 新出现的片段和还没写完的片段（full=True 时也只补齐缺失项）
+        返回: 是否有片段变为已写完
+        """
+        try:
+            names = {e.name for e in os.scandir(idx.folder) if e.name.endswith(self.suffix)}
+        except FileNotFoundError:
+            self._untrack(idx.folder)
+            return False
+
+        for name in [n for n in idx.files if n not in names]:
+            idx.remove(name)
+
+        now = time.time()
+        closed_any = False
+        unknown = False
+        for name in names:
+            entry = idx.files.get(name)
+            if entry is not None and entry[3]:
+                continue
+            if entry is not None and self._inotify and (not full or entry[3] is False):
+                # inotify 模式下正在写的片段等 CLOSE_WRITE 事件
+                continue
+            self.stats['stats'] += 1
+            try:
+                st = os.stat(idx.folder / name)
+            except FileNotFoundError:
+                continue
+            # 大小不变且静止超过 stable_time 视为已写完
+            closed = now - st.st_mtime > self.stable_time and (entry is None or entry[0] == st.st_size)
+            idx.update(name, st.st_size, st.st_mtime, st.st_ctime, True if closed else None)
+            closed_any = closed_any or closed
+            unknown = unknown or not closed
+        if unknown and self._inotify:
+            # 监听建立前可能已经写完（不会再有 CLOSE_WRITE），静止 stable_time 后通知调用方
+            self._settling[idx.folder] = now + self.stable_time
+        return closed_any
+
+    # ========================= 事件 =========================
+
+    def poll(self, timeout: float = 0) -> set:
+        """
+        处理文件系统变化，最多等待 timeout 秒
+        返回: 有新片段写完的文件夹集合
+        """
+        if time.time() - self._last_rescan >= self.rescan_interval:
+            self.rescan()
+
+        if not self._inotify:
+            if timeout > 0:
+                time.sleep(timeout)
+            changed = set()
+            self._sync_folders()
+            for idx in list(self._indexes.values()):
+                if not idx.folder.name.startswith("temp_") and self._scan_folder(idx):
+                    changed.add(idx.folder)
+            return changed
+
+        changed = set()
+        events = self._inotify.read_events(timeout)
+        self.stats['events'] += len(events)
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                self.stats['overflows'] += 1
+                logging.warning("⚠️ inotify 事件队列溢出，全量重扫")
+                self.rescan()
+                changed.update(self._indexes)
+                continue
+            if wd not in self._wd_folder:
+                continue
+            folder = self._wd_folder[wd]
+
+            if folder is None:
+                # 父目录：直播文件夹的增删
+                if not mask & IN_ISDIR:
+                    continue
+                path = self.parent_dir / name
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    if path not in self._indexes:
+                        self._track(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._untrack(path)
+                continue
+
+            idx = self._indexes.get(folder)
+            if idx is None:
+                continue
+            if mask & IN_IGNORED or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self._untrack(folder)
+                continue
+            if mask & IN_ISDIR or not name.endswith(self.suffix):
+                continue
+            if mask & IN_CREATE:
+                if name not in idx.files or idx.files[name][3] is None:
+                    # 只记录出现时间，写完后再 stat
+                    now = time.time()
+                    idx.update(name, 0, now, now, False)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self.stats['stats'] += 1
+                if idx.stat_update(name, closed=True):
+                    changed.add(folder)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                idx.remove(name)
+
+        now = time.time()
+        for folder, due in list(self._settling.items()):
+            if now >= due:
+                del self._settling[folder]
+                changed.add(folder)
+        return changed
+
+
+if __name__ == "__main__":
+    # 自检：在临时目录里模拟两个直播文件夹写片段，对比 inotify 与轮询回退
+    import tempfile
+    import argparse
+
+    parser = argparse.ArgumentParser(description='片段索引自检')
+    parser.add_argument('--backend', choices=('inotify', 'poll'), default='inotify')
+    parser.add_argument('--fragments', type=int, default=200, help='每个文件夹写入的片段数')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        parent = Path(tmp)
+        (parent / "old_live").mkdir()
+        (parent / "old_live" / "0.ts").write_bytes(b"x" * 188)
+        watcher = FragmentWatcher(parent, backend=args.backend, stable_time=0.2).start()
+        checked = set()
+
+        folder = parent / "251227 Showroom - AKB48 Team A Bench Member 210000"
+        folder.mkdir()
+        start = time.time()
+        delays = []
+        for i in range(args.fragments):
+            (folder / f"{i}.ts").write_bytes(b"\x47" * 188 * 10)
+            written = time.time()
+            for changed in watcher.poll(0 if args.backend == 'inotify' else 0.3):
+                for path in watcher.index(changed).unchecked_stable(checked, 0.2):
+                    checked.add(path)
+                    delays.append(time.time() - written)
+        while len(checked) < args.fragments + 1 and time.time() - start < 10:
+            for changed in watcher.poll(0.3):
+                checked.update(watcher.index(changed).unchecked_stable(checked, 0.2))
+            checked.update(watcher.index(parent / "old_live").unchecked_stable(checked, 0.2))
+
+        idx = watcher.index(folder)
+        print(f"后端 {watcher.backend}: 索引 {idx.count} 个片段, 交付 {len(checked)} 个, "
+              f"统计 {watcher.stats}, 用时 {time.time() - start:.2f}s")
+        assert idx.count == args.fragments, idx.count
+        # IN_CREATE 记的出现时间不能留在边界上：与 glob + stat 的结果一致
+        ctimes = [p.stat().st_ctime for p in folder.glob("*.ts")]
+        assert idx.first_ctime == min(ctimes) and idx.last_ctime == max(ctimes), (idx.first_ctime, min(ctimes))
+        watcher.close()
@@ -20,6 +20,7 @@ setup_logger()
 from typing import List, Dict, Optional, Tuple
 from config import *
 from sync_module import should_run_local_upload
+from subtitle_index import get_subtitle_index
 
 # ==================== 验证配置 ====================
 
@@ -119,63 +120,14 @@ class GitHubPagesPublisher:
         v_time = int(v_time_str)
 
         # 第一步: 找第一个匹配的 JSON (60秒内,取最接近的)
-        first_json = None
-        min_diff = 999999
-
-        for sub_file in SUBTITLES_SOURCE_ROOT.rglob("*comments.json"):
-            sub_name = sub_file.stem
-
-            if v_date in sub_name and v_name in sub_name:
-                sub_time_match = re.search(r'(\d{6})', sub_name.replace(v_date, "", 1))
-
-                if sub_time_match:
-                    s_time = int(sub_time_match.group(1))
-                    diff = abs(v_time - s_time)
-
-                    if diff < INITIAL_MATCH_THRESHOLD and diff < min_diff:
-                        min_diff = diff
-                        first_json = sub_file
-
-        if not first_json:
+        # 第二步: 链式查找后续 JSON（创建时间紧接上一个 JSON 最后修改时间的）
+        # 都走字幕索引，不再对每个链接的 JSON 重新 rglob 一遍
+        matched_jsons = get_subtitle_index(SUBTITLES_SOURCE_ROOT).find_chain(
+            v_date, v_name, v_time, INITIAL_MATCH_THRESHOLD, CONTINUATION_THRESHOLD
+        )
+        if not matched_jsons:
             return []  # 返回空列表
 
-        # 第二步: 链式查找后续 JSON
-        matched_jsons = [first_json]
-        current_json = first_json
-
-        while True:
-            current_mtime = current_json.stat().st_mtime
-            next_json = None
-            min_time_diff = 999999
-
-            for sub_file in SUBTITLES_SOURCE_ROOT.rglob("*comments.json"):
-                # 跳过已加入的
-                if sub_file in matched_jsons:
-                    continue
-                
-                sub_name = sub_file.stem
-
-                # 必须同日期+同成员
-                if v_date in sub_name and v_name in sub_name:
-                    sub_ctime = sub_file.stat().st_ctime
-                    time_diff = abs(sub_ctime - current_mtime)
-
-                    # 确保时间顺序正确
-                    if sub_ctime >= current_json.stat().st_ctime:
-                        if time_diff < CONTINUATION_THRESHOLD and time_diff < min_time_diff:
-                            min_time_diff = time_diff
-                            next_json = sub_file
-
-            if next_json:
-                matched_jsons.append(next_json)
-                logging.debug(f"找到后续 JSON: {next_json.name} (间隔 {min_time_diff:.0f}秒)")
-                current_json = next_json
-            else:
-                break
-            
-        # 按创建时间排序
-        matched_jsons.sort(key=lambda x: x.stat().st_ctime)
-
         logging.info(f"✅ 找到 {len(matched_jsons)} 个字幕文件")
         for idx, json_file in enumerate(matched_jsons, 1):
             logging.info(f"   {idx}. {json_file.name}")
@@ -10,6 +10,8 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 sys.path.insert(0, str(Path(__file__).parent.parent / "shared"))
 from config import *
+from validation_cache import prune_folder
+from rolling_merger import get_rolling_merger
 
 try:
     from upload_youtube import upload_all_pending_videos
@@ -18,6 +20,9 @@ except ImportError:
     UPLOAD_AVAILABLE = False
     logging.warning("上传模块不可用，跳过自动上传功能")
 
+# 直播中已追加好的中间文件（checker.py 负责追加和封存），合并时优先使用
+rolling_merger = get_rolling_merger(ROLLING_MERGE_DIR) if ROLLING_MERGE else None
+
 class FileLock:
     """文件锁类，防止多个进程同时处理同一个文件"""
     
@@ -160,6 +165,58 @@ def create_combined_filelist(folders_list, merged_name):
     
     return merged_file
 
+def run_concat(list_file: Path, output_file: Path) -> bool:
+    """ffmpeg concat -c copy 封装为 MP4"""
+    # 构建 FFmpeg 命令
+    ffmpeg_cmd = ["ffmpeg"]
+    
+    if FFMPEG_HIDE_BANNER:
+        ffmpeg_cmd.extend(["-hide_banner"])
+    
+    ffmpeg_cmd.extend([
+        "-loglevel", FFMPEG_LOGLEVEL,
+        "-f", "concat", "-safe", "0", "-i", str(list_file),
+        "-c", "copy",
+        "-movflags", "+faststart",
+        str(output_file)
+    ])
+    
+    result = subprocess.run(
+        ffmpeg_cmd,
+        preexec_fn=lambda: os.nice(10)  # 降低优先级 (0-19,越大越低)
+    )
+    return result.returncode == 0
+
+def rolling_filelist(item: dict):
+    """所有文件夹都有已封存且与 filelist.txt 一致的中间文件时，生成指向中间文件的列表: (列表路径, 直播结束时间)"""
+    if not rolling_merger:
+        return None, None
+    inputs, ended_at = rolling_merger.inputs_for(item['folders'], FILELIST_NAME)
+    if not inputs:
+        return None, None
+    temp_dir = Path(OUTPUT_DIR) / ".temp"
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    list_file = temp_dir / f"{item['name']}_rolling.txt"
+    with open(list_file, 'w', encoding='utf-8') as out:
+        for path in inputs:
+            out.write(f"file '{path.resolve()}'\n")
+    return list_file, ended_at
+
+def stream_end_time(item: dict, ended_at=None):
+    """
+    直播结束时间：滚动合并清单里记下的结束时间（直播生命周期判定结束时写入），
+    没有时取各文件夹 filelist.txt 的写入时间（晚于实际结束，包含等待字幕的时间）
+    """
+    if ended_at:
+        return ended_at
+    times = []
+    for folder in item['folders']:
+        try:
+            times.append((folder / FILELIST_NAME).stat().st_mtime)
+        except OSError:
+            continue
+    return max(times) if times else None
+
 def merge_item(item: dict) -> bool:
     """合并单个项目（可能是单个文件夹或合并的文件夹）"""
     name = item['name']
@@ -191,29 +248,28 @@ def merge_item(item: dict) -> bool:
         # 确保输出目录存在
         OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-        logging.info(f"开始合并 {name} -> {output_file}")
-        
-        # 构建 FFmpeg 命令
-        ffmpeg_cmd = ["ffmpeg"]
-        
-        if FFMPEG_HIDE_BANNER:
-            ffmpeg_cmd.extend(["-hide_banner"])
-        
-        ffmpeg_cmd.extend([
-            "-loglevel", FFMPEG_LOGLEVEL,
-            "-f", "concat", "-safe", "0", "-i", str(filelist_txt),
-            "-c", "copy",
-            "-movflags", "+faststart",
-            str(output_file)
-        ])
-        
-        result = subprocess.run(
-            ffmpeg_cmd,
-            preexec_fn=lambda: os.nice(10)  # 降低优先级 (0-19,越大越低)
-        )
+        start = time.time()
+        rolling_list, ended_at = rolling_filelist(item)
+        if rolling_list:
+            logging.info(f"开始合并 {name} -> {output_file}（滚动合并: 只封装中间文件）")
+            success = run_concat(rolling_list, output_file)
+            rolling_list.unlink(missing_ok=True)
+            if not success:
+                logging.warning(f"{name} 中间文件封装失败，改用完整合并")
+                output_file.unlink(missing_ok=True)
+        else:
+            logging.info(f"开始合并 {name} -> {output_file}")
+            success = False
+        mode = "滚动合并" if success else "完整合并"
+        if not success:
+            success = run_concat(filelist_txt, output_file)
 
-        if result.returncode == 0:
+        if success:
             logging.info(f"{name} 合并完成")
+            ended_at = stream_end_time(item, ended_at if mode == "滚动合并" else None)
+            if ended_at:
+                logging.info(f"⏱️ {name} 直播结束 → 可上传: {time.time() - ended_at:.0f} 秒"
+                             f"（{mode}，封装耗时 {time.time() - start:.0f} 秒）")
             # --- 修改部分：统一为所有相关的原始文件夹添加标记 ---
             timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
             for folder in item['folders']:  # 无论 single 还是 merged，folders 列表里都有目标文件夹
@@ -226,8 +282,12 @@ def merge_item(item: dict) -> bool:
                     )
                     marker_file.write_text(marker_content, encoding='utf-8')
                     logging.debug(f"已为文件夹 {folder.name} 添加合并标记")
+                    # 合并完成后片段检查缓存就不再需要了
+                    prune_folder(folder)
                 except Exception as e:
                     logging.error(f"无法为 {folder.name} 创建标记文件: {e}")
+            if rolling_merger:
+                rolling_merger.discard(folder.name for folder in item['folders'])
             return True
         else:
             logging.error(f"{name} 合并失败，请检查 ffmpeg 日志")
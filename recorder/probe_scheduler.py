@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+进程内共享的片段检查调度器
+供 checker.py 调用：代替每个文件夹每轮新建一个 ThreadPoolExecutor
+
+    - 固定数量的常驻工作线程（全局并发上限），不再反复创建/销毁线程池
+    - 每个直播（key）一个队列，工作线程在直播之间轮转取任务：
+      某个直播一次积压几百个片段时，其他直播的新片段不会排在它后面
+    - 两条通道：直播即将结束、要做最终检查的文件夹走优先通道（promote 可把已排队的任务整体提前）
+    - 指标：队列深度、运行中任务数、每个直播最老任务的等待时间与平均排队延迟
+
+submit() 返回 concurrent.futures.Future，调用方可以继续用 as_completed / future.result()
+
+本模块不依赖 config.py
+"""
+
+import time
+import logging
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import Future
+
+NORMAL = 0
+PRIORITY = 1
+
+
+class _StreamStats:
+    __slots__ = ('completed', 'wait_total', 'wait_max', 'last_done')
+
+    def __init__(self):
+        self.completed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.last_done = 0.0
+
+
+class ProbeScheduler:
+    """按直播公平轮转的常驻工作线程池"""
+
+    def __init__(self, workers: int = 4, name: str = "ProbeWorker"):
+        self.workers = max(1, int(workers))
+        self.name = name
+        # 每条通道: {key: deque[(fn, args, future, enqueued_at)]}，OrderedDict 的顺序即轮转顺序
+        self._lanes = (OrderedDict(), OrderedDict())
+        self._cond = threading.Condition()
+        self._running = 0
+        self._closed = False
+        self._threads = []
+        self._stream_stats = {}
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'promoted': 0}
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, daemon=True, name=f"{self.name}-{i}")
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"🧵 片段检查调度器启动: {self.workers} 个工作线程")
+        return self
+
+    # ---------------- 提交 ----------------
+
+    def submit(self, key, fn, *args, priority: bool = False) -> Future:
+        """提交一个任务到 key（直播文件夹）的队列"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("调度器已关闭")
+            lane = self._lanes[PRIORITY if priority else NORMAL]
+            lane.setdefault(key, deque()).append((fn, args, future, time.monotonic()))
+            self.stats['submitted'] += 1
+            self._cond.notify()
+        return future
+
+    def promote(self, key) -> int:
+        """把 key 在普通通道里已排队的任务整体移到优先通道（直播转入最终检查时调用）"""
+        with self._cond:
+            queue = self._lanes[NORMAL].pop(key, None)
+            if not queue:
+                return 0
+            self._lanes[PRIORITY].setdefault(key, deque()).extend(queue)
+            self.stats['promoted'] += len(queue)
+            self._cond.notify(len(queue))
+            return len(queue)
+
+    def cancel(self, key) -> int:
+        """丢弃 key 还没开始执行的任务（文件夹已被清理时调用）"""
+        cancelled = 0
+        with self._cond:
+            for lane in self._lanes:
+                for _, _, future, _ in lane.pop(key, ()):
+                    future.cancel()
+                    cancelled += 1
+        return cancelled
+
+    # ---------------- 执行 ----------------
+
+    def _next(self):
+        """取下一个任务：优先通道优先，同一通道内按 key 轮转（调用方持有锁）"""
+        for lane in (self._lanes[PRIORITY], self._lanes[NORMAL]):
+            while lane:
+                key, queue = next(iter(lane.items()))
+                item = queue.popleft()
+                if queue:
+                    lane.move_to_end(key)
+                else:
+                    del lane[key]
+                if item[2].set_running_or_notify_cancel():
+                    return key, item
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                task = self._next()
+                while task is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    task = self._next()
+                self._running += 1
+            key, (fn, args, future, enqueued_at) = task
+            started = time.monotonic()
+            try:
+                future.set_result(fn(*args))
+                failed = False
+            except BaseException as e:
+                future.set_exception(e)
+                failed = True
+            with self._cond:
+                self._running -= 1
+                self.stats['completed'] += 1
+                if failed:
+                    self.stats['failed'] += 1
+                stats = self._stream_stats.get(key)
+                if stats is None:
+                    stats = self._stream_stats[key] = _StreamStats()
+                wait = started - enqueued_at
+                stats.completed += 1
+                stats.wait_total += wait
+                stats.wait_max = max(stats.wait_max, wait)
+                stats.last_done = time.monotonic()
+
+    def close(self, wait: bool = False):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    # ---------------- 指标 ----------------
+
+    def depth(self) -> int:
+        with self._cond:
+            return sum(len(q) for lane in self._lanes for q in lane.values())
+
+    def snapshot(self) -> dict:
+        """
+        {'depth': 排队任务数, 'running': 运行中, 'priority_depth': 优先通道排队数,
+         'streams': {key: {'queued', 'oldest_wait', 'avg_wait', 'max_wait', 'completed'}}}
+        """
+        now = time.monotonic()
+        with self._cond:
+            streams = {}
+            for lane in self._lanes:
+                for key, queue in lane.items():
+                    entry = streams.setdefault(key, {'queued': 0, 'oldest_wait': 0.0})
+                    entry['queued'] += len(queue)
+                    entry['oldest_wait'] = max(entry['oldest_wait'], now - queue[0][3])
+            for key, stats in self._stream_stats.items():
+                entry = streams.setdefault(key, {'queued': 0, 'oldest_wait': 0.0})
+                entry['completed'] = stats.completed
+                entry['avg_wait'] = stats.wait_total / stats.completed
+                entry['max_wait'] = stats.wait_max
+            return {
+                'depth': sum(e['queued'] for e in streams.values()),
+                'priority_depth': sum(len(q) for q in self._lanes[PRIORITY].values()),
+                'running': self._running,
+                'streams': streams,
+            }
+
+    def forget(self, key):
+        """直播结束后丢弃它的统计"""
+        with self._cond:
+            self._stream_stats.pop(key, None)
+
+    def log_metrics(self, label=str):
+        """打印一行汇总 + 排队最久的几个直播"""
+        snap = self.snapshot()
+        lagging = sorted(((k, e) for k, e in snap['streams'].items() if e['queued']),
+                         key=lambda item: item[1]['oldest_wait'], reverse=True)[:3]
+        detail = ", ".join(f"{label(k)} 排队 {e['queued']} 最久 {e['oldest_wait']:.1f}s" for k, e in lagging)
+        logging.info(
+            f"📊 [检查调度] 排队 {snap['depth']} (优先 {snap['priority_depth']}) | 运行 {snap['running']}/{self.workers} | "
+            f"已完成 {self.stats['completed']}" + (f" | {detail}" if detail else "")
+        )
+
+
+if __name__ == "__main__":
+    # 自检：一个直播积压 200 个任务时，后提交的其他直播仍能很快被轮到；优先通道先于普通通道
+    from concurrent.futures import as_completed
+
+    scheduler = ProbeScheduler(workers=4).start()
+    work = lambda: time.sleep(0.005)
+    backlog = [scheduler.submit("backlog", work) for _ in range(200)]
+    time.sleep(0.02)
+    others = {scheduler.submit(f"live-{i}", work): i for i in range(5) for _ in range(3)}
+    final = [scheduler.submit("ending", work, priority=True) for _ in range(5)]
+
+    start = time.monotonic()
+    for _ in as_completed(final):
+        pass
+    final_done = time.monotonic() - start
+    for _ in as_completed(others):
+        pass
+    others_done = time.monotonic() - start
+    remaining_backlog = sum(not f.done() for f in backlog)
+    snap = scheduler.snapshot()
+    print(f"优先通道完成 {final_done:.3f}s, 其他直播完成 {others_done:.3f}s, 此时积压直播剩余 {remaining_backlog}/200")
+    for key in ("live-0", "ending", "backlog"):
+        print(f"  {key}: {snap['streams'][key]}")
+    assert remaining_backlog > 100, "其他直播应在积压直播做完之前完成"
+    scheduler.log_metrics()
+    for _ in as_completed(backlog):
+        pass
+    scheduler.close(wait=True)
+    print(f"统计: {scheduler.stats}")
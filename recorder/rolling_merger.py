@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+滚动合并：直播进行中就把检查通过的片段按顺序追加到每个文件夹的中间文件（MPEG-TS）
+供 checker.py（追加 / 封存）和 merger.py（用中间文件做最后的封装）调用
+
+    - 直播中：每轮把已检查通过、且排在所有待检查片段之前的片段按文件名顺序追加
+      （TS 片段首尾相接本身就是合法的 TS 流，追加只是字节拷贝，用 copy_file_range）
+    - 直播结束（写 filelist.txt 时）：追加剩下的尾巴并封存，清单与 filelist.txt 完全一致
+    - 合并时：只需对少数几个大文件做一次 -c copy 封装 + faststart，
+      不必再逐个打开几千个小片段；任何不一致（顺序错乱、片段被去重剔除、文件被截断）
+      都会作废中间文件，merger 回退到原来的 filelist 合并
+    - 直播生命周期判定结束时记下直播真正结束的时间（最后一个片段写入的时间），
+      merger 用它统计「直播结束 → 可上传」（封存要等字幕，比结束晚）
+    - 每个文件夹一个清单 {文件夹名}.rolling.json（已追加的片段名、字节数、封存 / 结束时间），
+      重启后接着追加；中间文件比清单记录的长（追加到一半进程退出）时截回去
+
+本模块不依赖 config.py
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import threading
+from pathlib import Path
+
+ROLLING_SUFFIX = ".rolling.ts"
+MANIFEST_SUFFIX = ".rolling.json"
+
+
+def fragment_sort_key(path: Path):
+    """片段按文件名自然排序（与 filelist.txt 的顺序一致）"""
+    return [int(c) if c.isdigit() else c.lower() for c in re.split(r'(\d+)', Path(path).name)]
+
+
+def _append_file(dst, src: Path) -> int:
+    """把 src 整个追加到已打开的 dst，返回字节数"""
+    with open(src, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        copied = 0
+        try:
+            while copied < size:
+                n = os.copy_file_range(f.fileno(), dst.fileno(), size - copied)
+                if n == 0:
+                    break
+                copied += n
+        except (AttributeError, OSError):
+            # 不支持 copy_file_range（跨文件系统 / 老内核）时退回普通拷贝
+            f.seek(copied)
+            dst.seek(0, os.SEEK_END)
+            shutil.copyfileobj(f, dst, 1024 * 1024)
+            copied = size
+    return copied
+
+
+class RollingMerger:
+    """所有文件夹的中间文件放在 root 下（线程安全）"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._manifests = {}      # {folder_name: {'files', 'size', 'sealed_at', 'ended_at', 'broken'}}
+        self._lock = threading.Lock()
+        self.stats = {'appended': 0, 'bytes': 0, 'sealed': 0, 'broken': 0}
+
+    def _paths(self, folder_name: str):
+        return self.root / f"{folder_name}{ROLLING_SUFFIX}", self.root / f"{folder_name}{MANIFEST_SUFFIX}"
+
+    def _manifest(self, folder_name: str) -> dict:
+        manifest = self._manifests.get(folder_name)
+        if manifest is not None:
+            return manifest
+        data_path, manifest_path = self._paths(folder_name)
+        manifest = {'files': [], 'size': 0, 'sealed_at': None, 'ended_at': None, 'broken': False}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest.update(json.load(f))
+            # 追加到一半进程退出：把中间文件截回清单记录的长度
+            if data_path.exists() and data_path.stat().st_size != manifest['size']:
+                if data_path.stat().st_size < manifest['size']:
+                    raise ValueError("中间文件比清单记录的短")
+                os.truncate(data_path, manifest['size'])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"滚动合并清单无效，重新开始 {folder_name}: {e}")
+            manifest = {'files': [], 'size': 0, 'sealed_at': None, 'ended_at': None, 'broken': False}
+            data_path.unlink(missing_ok=True)
+        self._manifests[folder_name] = manifest
+        return manifest
+
+    def _save(self, folder_name: str, manifest: dict):
+        _, manifest_path = self._paths(folder_name)
+        tmp = manifest_path.with_name(manifest_path.name + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, manifest_path)
+
+    def _break(self, folder_name: str, manifest: dict, reason: str):
+        """作废中间文件（之后该文件夹走原来的完整合并）"""
+        data_path, _ = self._paths(folder_name)
+        data_path.unlink(missing_ok=True)
+        manifest.update(files=[], size=0, broken=True)
+        self._save(folder_name, manifest)
+        self.stats['broken'] += 1
+        logging.warning(f"⚠️ [{folder_name}] 滚动合并作废，结束后改用完整合并: {reason}")
+
+    def _extend(self, folder: Path, manifest: dict, ordered: list) -> bool:
+        """ordered 必须以已追加的片段为前缀；追加其余部分"""
+        done = manifest['files']
+        names = [f.name for f in ordered]
+        if names[:len(done)] != done:
+            if len(names) < len(done) and done[:len(names)] == names:
+                return True  # 重启后还没检查到已追加的位置，等着
+            self._break(folder.name, manifest, "片段顺序与已追加的不一致")
+            return False
+        new = ordered[len(done):]
+        if not new:
+            return True
+        data_path, _ = self._paths(folder.name)
+        self.root.mkdir(parents=True, exist_ok=True)
+        added = 0
+        try:
+            # 不能用 'ab'：copy_file_range 不接受 O_APPEND 的目标文件
+            with open(data_path, 'r+b' if data_path.exists() else 'wb', buffering=0) as dst:
+                dst.seek(manifest['size'])
+                for ts_file in new:
+                    added += _append_file(dst, ts_file)
+                    done.append(ts_file.name)
+        except OSError as e:
+            self._break(folder.name, manifest, f"追加失败: {e}")
+            return False
+        manifest['size'] += added
+        self._save(folder.name, manifest)
+        self.stats['appended'] += len(new)
+        self.stats['bytes'] += added
+        return True
+
+    def feed(self, folder: Path, valid_files, pending_files=()):
+        """
+        直播中每轮调用：valid_files 为已通过检查的片段，pending_files 为还在检查的片段
+        只追加排在所有待检查片段之前的部分，保证追加顺序与最终 filelist.txt 一致
+        """
+        with self._lock:
+            manifest = self._manifest(folder.name)
+            if manifest['broken'] or manifest['sealed_at']:
+                return
+            ordered = sorted(valid_files, key=fragment_sort_key)
+            if pending_files:
+                boundary = min(fragment_sort_key(f) for f in pending_files)
+                ordered = [f for f in ordered if fragment_sort_key(f) < boundary]
+            self._extend(folder, manifest, ordered)
+
+    def seal(self, folder: Path, valid_files) -> bool:
+        """直播结束写 filelist.txt 时调用：追加剩余片段并封存；返回中间文件是否可用"""
+        with self._lock:
+            manifest = self._manifest(folder.name)
+            if manifest['broken']:
+                return False
+            if manifest['sealed_at']:
+                return True
+            ordered = sorted(valid_files, key=fragment_sort_key)
+            if not self._extend(folder, manifest, ordered):
+                return False
+            if len(manifest['files']) != len(ordered):
+                self._break(folder.name, manifest, "封存时片段数不一致")
+                return False
+            manifest['sealed_at'] = time.time()
+            self._save(folder.name, manifest)
+            self.stats['sealed'] += 1
+            logging.info(f"📼 [{folder.name}] 滚动合并已封存: {len(ordered)} 个片段, "
+                         f"{manifest['size'] / 1024 / 1024:.0f} MB")
+            return True
+
+    def mark_ended(self, folder: Path, ended_at: float):
+        """直播生命周期判定结束时调用：记下直播结束的时间（之后又恢复直播时以最后一次为准）"""
+        with self._lock:
+            manifest = self._manifest(folder.name)
+            manifest['ended_at'] = ended_at
+            self._save(folder.name, manifest)
+
+    def inputs_for(self, folders, filelist_name: str):
+        """
+        合并时调用：所有文件夹都已封存、且清单与各自的 filelist.txt 一致时，
+        返回 (中间文件列表, 整场直播结束的时间)，否则 (None, None)
+        结束时间取各文件夹记下的结束时间（没有时用封存时间）的最大值
+        """
+        inputs, ended_at = [], None
+        with self._lock:
+            for folder in folders:
+                manifest = self._manifest(folder.name)
+                if manifest['broken'] or not manifest['sealed_at']:
+                    return None, None
+                try:
+                    with open(folder / filelist_name, 'r', encoding='utf-8') as f:
+                        listed = [Path(line.strip()[6:-1]).name for line in f if line.strip().startswith("file '")]
+                except OSError:
+                    return None, None
+                if listed != manifest['files']:
+                    return None, None
+                data_path, _ = self._paths(folder.name)
+                if listed:
+                    try:
+                        if data_path.stat().st_size != manifest['size']:
+                            return None, None
+                    except FileNotFoundError:
+                        return None, None
+                    inputs.append(data_path)
+                folder_end = manifest.get('ended_at') or manifest['sealed_at']
+                ended_at = folder_end if ended_at is None else max(ended_at, folder_end)
+        return (inputs or None), (ended_at if inputs else None)
+
+    def discard(self, folder_names):
+        """合并完成 / 文件夹已删除后删掉中间文件和清单"""
+        with self._lock:
+            for name in folder_names:
+                self._manifests.pop(name, None)
+                for path in self._paths(name):
+                    path.unlink(missing_ok=True)
+
+    def prune(self, existing_names):
+        """删掉源文件夹已不存在的中间文件，返回删除的个数"""
+        if not self.root.exists():
+            return 0
+        existing = set(existing_names)
+        stale = {p.name[:-len(MANIFEST_SUFFIX)] for p in self.root.glob(f"*{MANIFEST_SUFFIX}")}
+        stale = [name for name in stale if name not in existing]
+        self.discard(stale)
+        return len(stale)
+
+
+_mergers = {}
+_mergers_lock = threading.Lock()
+
+
+def get_rolling_merger(root: Path) -> RollingMerger:
+    """每个中间文件目录一个进程内共享的实例（checker 与合并线程共用）"""
+    root = Path(root)
+    with _mergers_lock:
+        merger = _mergers.get(root)
+        if merger is None:
+            merger = _mergers[root] = RollingMerger(root)
+        return merger
+
+
+if __name__ == "__main__":
+    # 自检：乱序完成的检查结果按顺序追加，封存后与逐个拼接的结果逐字节一致；重启后接着追加
+    import random
+    import tempfile
+
+    logging.basicConfig(level=logging.WARNING)
+    tmp = Path(tempfile.mkdtemp(prefix="rolling_merger_"))
+    try:
+        folder = tmp / "250206 Showroom - Team A Haruna Hashimoto 190000"
+        folder.mkdir()
+        rng = random.Random(20)
+        fragments = []
+        for i in range(1, 41):
+            f = folder / f"{i}.ts"
+            f.write_bytes(rng.randbytes(rng.randrange(1000, 5000)))
+            fragments.append(f)
+
+        merger = RollingMerger(tmp / ".rolling")
+        valid, pending = [], list(fragments[:30])
+        rng.shuffle(pending)
+        while pending:
+            # 每轮有几个检查完成（顺序随机），其余仍在检查
+            done, pending = pending[:4], pending[4:]
+            valid += done
+            merger.feed(folder, valid, pending)
+        assert len(merger._manifest(folder.name)['files']) == 30
+
+        # 模拟重启：新实例读清单接着追加
+        merger = RollingMerger(tmp / ".rolling")
+        skipped = fragments[35]                      # 被去重拦截的片段不在 filelist 里
+        final = [f for f in fragments if f != skipped]
+        assert merger.seal(folder, final)
+        (folder / "filelist.txt").write_text("".join(f"file '{f.resolve()}'\n" for f in final))
+        inputs, ended_at = merger.inputs_for([folder], "filelist.txt")
+        assert inputs and ended_at == merger._manifest(folder.name)['sealed_at']
+        # 生命周期记下的结束时间早于封存（封存要等字幕），统计以它为准
+        merger.mark_ended(folder, 1000.0)
+        assert merger.inputs_for([folder], "filelist.txt")[1] == 1000.0
+        expected = b"".join(f.read_bytes() for f in final)
+        assert inputs[0].read_bytes() == expected, "中间文件应与按 filelist 顺序拼接的结果一致"
+
+        # 顺序错乱（较早的片段后来才通过检查）→ 作废，合并回退
+        late = tmp / "250206 Showroom - Team B Yui Oguri 190000"
+        late.mkdir()
+        for i in range(1, 4):
+            (late / f"{i}.ts").write_bytes(b"x" * 188)
+        merger.feed(late, [late / "2.ts", late / "3.ts"])
+        assert not merger.seal(late, [late / f"{i}.ts" for i in range(1, 4)])
+        assert merger.inputs_for([late], "filelist.txt") == (None, None)
+
+        assert merger.prune([folder.name]) == 1
+        merger.discard([folder.name])
+        assert not list((tmp / ".rolling").iterdir())
+        print(f"✅ 自检通过: {merger.stats}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -76,6 +76,7 @@ import cx_Oracle
 import subprocess
 import signal
 import psutil
+import shutil
 from datetime import datetime, timedelta
 from config import *
 
@@ -109,6 +110,15 @@ member_processes = {}  # {member_id: {'process': subprocess, 'last_live': timest
 # 清理状态标志
 is_cleaning_up = False
 
+# 资源指标上报状态（计算速率需要上一次的计数器）
+metrics_state = {
+    'last_report': 0,
+    'last_sample_time': None,
+    'disk_write_bytes': None,
+    'net_recv_bytes': None,
+    'table_available': True,
+}
+
 def read_all_live_status():
     """
     从数据库读取所有直播状态。
@@ -198,6 +208,96 @@ def read_all_live_status():
             
     return {}
 
+def report_instance_metrics(active_recordings: int):
+    """
+    上报本录制器的心跳与资源指标（每 RECORDER_METRICS_INTERVAL 秒一次）
+    检测器的 LoadBalancer 据此避开已满 / 失联 / 磁盘不足 / 带宽吃紧的录制器
+    """
+    global GLOBAL_CONN
+
+    now = time.time()
+    if now - metrics_state['last_report'] < RECORDER_METRICS_INTERVAL:
+        return
+    metrics_state['last_report'] = now
+
+    # 1. 采样：写入速率与下载速率由计数器差值计算
+    write_bps = recv_bps = None
+    try:
+        disk_io = psutil.disk_io_counters()
+        net_io = psutil.net_io_counters()
+        last_time = metrics_state['last_sample_time']
+        if last_time and disk_io and metrics_state['disk_write_bytes'] is not None:
+            elapsed = max(now - last_time, 1e-3)
+            write_bps = max(0, disk_io.write_bytes - metrics_state['disk_write_bytes']) / elapsed
+            recv_bps = max(0, net_io.bytes_recv - metrics_state['net_recv_bytes']) / elapsed
+        metrics_state['last_sample_time'] = now
+        metrics_state['disk_write_bytes'] = disk_io.write_bytes if disk_io else None
+        metrics_state['net_recv_bytes'] = net_io.bytes_recv
+    except Exception as e:
+        logging.debug(f"采集 IO 计数器失败: {e}")
+
+    try:
+        disk_free = shutil.disk_usage(TS_PARENT_DIR).free
+    except OSError:
+        disk_free = None
+    load_avg = os.getloadavg()[0] if hasattr(os, 'getloadavg') else None
+
+    if GLOBAL_CONN is None:
+        return
+
+    # 2. 写入：心跳总是更新；指标表不存在时只更新心跳
+    try:
+        with GLOBAL_CONN.cursor() as cursor:
+            cursor.execute("""
+                UPDATE ADMIN.INSTANCES
+                SET LAST_HEARTBEAT = CURRENT_TIMESTAMP
+                WHERE INSTANCE_ID = :instance_id
+            """, {'instance_id': INSTANCE_ID})
+
+            if metrics_state['table_available']:
+                try:
+                    cursor.execute("""
+                        MERGE INTO ADMIN.INSTANCE_METRICS target
+                        USING (SELECT :instance_id AS INSTANCE_ID FROM DUAL) source
+                        ON (target.INSTANCE_ID = source.INSTANCE_ID)
+                        WHEN MATCHED THEN
+                            UPDATE SET WRITE_BYTES_PER_SEC = :write_bps, NET_RECV_BYTES_PER_SEC = :recv_bps,
+                                       DISK_FREE_BYTES = :disk_free, LOAD_AVG_1M = :load_avg,
+                                       CPU_COUNT = :cpu_count, ACTIVE_RECORDINGS = :active,
+                                       REPORTED_AT = SYSTIMESTAMP
+                        WHEN NOT MATCHED THEN
+                            INSERT (INSTANCE_ID, WRITE_BYTES_PER_SEC, NET_RECV_BYTES_PER_SEC, DISK_FREE_BYTES,
+                                    LOAD_AVG_1M, CPU_COUNT, ACTIVE_RECORDINGS, REPORTED_AT)
+                            VALUES (:instance_id, :write_bps, :recv_bps, :disk_free,
+                                    :load_avg, :cpu_count, :active, SYSTIMESTAMP)
+                    """, {
+                        'instance_id': INSTANCE_ID,
+                        'write_bps': write_bps,
+                        'recv_bps': recv_bps,
+                        'disk_free': disk_free,
+                        'load_avg': load_avg,
+                        'cpu_count': os.cpu_count(),
+                        'active': active_recordings,
+                    })
+                except cx_Oracle.DatabaseError as e:
+                    error_obj, = e.args
+                    if error_obj.code != 942:  # ORA-00942: 表不存在
+                        raise
+                    metrics_state['table_available'] = False
+                    logging.warning("ADMIN.INSTANCE_METRICS 不存在，只上报心跳")
+        GLOBAL_CONN.commit()
+
+        if write_bps is not None:
+            logging.debug(
+                f"[{INSTANCE_ID}] 上报指标: 写入 {write_bps / 1024 ** 2:.1f}MB/s | 下载 {recv_bps / 1024 ** 2:.1f}MB/s | "
+                f"剩余磁盘 {(disk_free or 0) / 1024 ** 3:.0f}GB | 负载 {load_avg} | 录制中 {active_recordings}"
+            )
+    except cx_Oracle.Error as e:
+        logging.error(f"上报心跳/资源指标失败（连接可能失效）: {e}")
+        GLOBAL_CONN = None
+    except Exception as e:
+        logging.error(f"上报心跳/资源指标失败: {e}")
+
 def get_latest_subfolder(member_id: str):
     """
     获取指定成员的最新子文件夹。
@@ -208,7 +308,7 @@ def get_latest_subfolder(member_id: str):
         return None
         
     member_name_en = member_data.get('name_en', member_id) 
-    name_parts_lower = member_name_en.lower().split()
+    name_parts_lower = member_data.get('name_tokens') or member_name_en.lower().split()
     
     today = datetime.now()
     yesterday = today - timedelta(days=1)
@@ -587,6 +687,9 @@ def monitor_all_members():
         
         # 阶段3：批量查询直播状态（只查询1次！）
         live_status = read_all_live_status()
+
+        # 阶段3.5：上报心跳与资源指标（供检测器按容量/资源放置新直播）
+        report_instance_metrics(len(system_processes))
         
         # 阶段4：处理已存在的进程
         handled_members = set()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+直播场次索引：按成员把文件夹分成同一场直播（断线重连会产生多个文件夹）
+供 checker.py / checker_4c.py 调用，代替每轮对相邻文件夹 glob + 逐个 stat 片段
+
+    - 每个文件夹一条记录: 最早 / 最晚片段时间、片段数，随新片段增量更新
+        * checker.py 有片段索引时直接从索引读取（不 stat）
+        * 没有索引时按目录 mtime 判断是否有新文件，只有变化的文件夹才 scandir 一次
+    - 分组只看记录，对文件夹排序后合并相邻区间，O(文件夹数)
+        * 前一个文件夹最晚片段 与 当前文件夹最早片段 相差 < gap 秒 → 同一场
+        * 任一侧没有片段时退回文件夹 ctime 相差 < fallback_gap 秒（与原逻辑一致）
+    - 持久化: 整个索引存成一个 JSON（重启后直接复用）；
+      另外每个文件夹可导出 .stream_session.json，随片段同步到 4C，4C 直接用 3C 的时间分组
+      （rsync 不保留 ctime，4C 本地只能用 mtime）
+
+本模块不依赖 config.py
+"""
+
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from collections import defaultdict
+
+SESSION_FILE = ".stream_session.json"
+
+
+class StreamSessionIndex:
+    """
+    path:         索引持久化文件（None 时不持久化）
+    time_field:   本地扫描片段时用的时间（3C 用 ctime，4C 用 mtime）
+    member_of:    文件夹名 → 成员 ID
+    """
+
+    def __init__(self, path: Path = None, member_of=None, time_field: str = "ctime",
+                 gap: float = 300, fallback_gap: float = 14400, suffix: str = ".ts",
+                 save_interval: float = 60):
+        self.path = Path(path) if path else None
+        self.member_of = member_of
+        self.time_field = time_field
+        self.gap = gap
+        self.fallback_gap = fallback_gap
+        self.suffix = suffix
+        self.save_interval = save_interval
+        # {folder_name: {'first', 'last', 'last_mtime', 'count', 'dir_mtime_ns', 'source'}}
+        self.records = {}
+        self._dirty = False
+        self._last_save = 0.0
+        self.stats = {'scans': 0, 'skipped': 0, 'imported': 0}
+        self.load()
+
+    # ---------------- 更新 ----------------
+
+    def update(self, folder: Path, first, last, last_mtime, count: int):
+        """用片段索引的数据更新（没有片段时 first/last 为 None）"""
+        record = self.records.get(folder.name)
+        if record and record.get('source') == 'session':
+            return  # 3C 导出的记录优先
+        new = {'first': first, 'last': last, 'last_mtime': last_mtime, 'count': count,
+               'dir_mtime_ns': record.get('dir_mtime_ns') if record else None, 'source': 'index'}
+        if record != new:
+            self.records[folder.name] = new
+            self._dirty = True
+
+    def refresh(self, folder: Path):
+        """没有片段索引时：目录 mtime 变了（有文件增删）才重新扫描该文件夹"""
+        try:
+            dir_mtime_ns = folder.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        record = self.records.get(folder.name)
+        if record and record.get('dir_mtime_ns') == dir_mtime_ns:
+            self.stats['skipped'] += 1
+            return
+        if self._import_session(folder, dir_mtime_ns):
+            return
+
+        self.stats['scans'] += 1
+        first = last = last_mtime = None
+        count = 0
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(self.suffix) or not entry.is_file():
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    t = st.st_ctime if self.time_field == "ctime" else st.st_mtime
+                    count += 1
+                    first = t if first is None else min(first, t)
+                    last = t if last is None else max(last, t)
+                    last_mtime = st.st_mtime if last_mtime is None else max(last_mtime, st.st_mtime)
+        except FileNotFoundError:
+            return
+        self.records[folder.name] = {'first': first, 'last': last, 'last_mtime': last_mtime, 'count': count,
+                                     'dir_mtime_ns': dir_mtime_ns, 'source': 'scan'}
+        self._dirty = True
+
+    def _import_session(self, folder: Path, dir_mtime_ns: int) -> bool:
+        """文件夹里有 3C 导出的 .stream_session.json 时直接采用"""
+        try:
+            with open(folder / SESSION_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            record = {k: data.get(k) for k in ('first', 'last', 'last_mtime', 'count')}
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"读取场次记录失败 {folder.name}: {e}")
+            return False
+        record.update(dir_mtime_ns=dir_mtime_ns, source='session')
+        self.records[folder.name] = record
+        self._dirty = True
+        self.stats['imported'] += 1
+        return True
+
+    def export(self, folder: Path):
+        """把该文件夹的记录写成 .stream_session.json（最终检查时调用，随 filelist 一起同步到 4C）"""
+        record = self.records.get(folder.name)
+        if not record:
+            return None
+        target = folder / SESSION_FILE
+        data = {k: record.get(k) for k in ('first', 'last', 'last_mtime', 'count')}
+        data['member'] = self.member_of(folder.name) if self.member_of else None
+        tmp = target.with_name(target.name + ".tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, target)
+        except OSError as e:
+            logging.warning(f"写入场次记录失败 {folder.name}: {e}")
+            return None
+        return target
+
+    def time_range(self, folder: Path):
+        """(最早, 最晚, 最晚 mtime)，没有片段时返回 None"""
+        record = self.records.get(folder.name)
+        if not record or not record.get('count') or record.get('first') is None:
+            return None
+        return record['first'], record['last'], record['last_mtime']
+
+    # ---------------- 分组 ----------------
+
+    def groups(self, folders, with_ctime: bool = False) -> dict:
+        """
+        {group_key: [folder, ...]}，key 格式与原来的 group_folders_by_member 相同:
+            "{日期}_{成员}_{序号}"，with_ctime=True 时再加 "_{最早文件夹 ctime}"（checker_4c 的格式）
+        """
+        groups = {}
+        member_folders = defaultdict(list)
+        ctimes = {}
+        for folder in folders:
+            try:
+                ctimes[folder] = folder.stat().st_ctime
+            except FileNotFoundError:
+                continue
+            member_id = self.member_of(folder.name) if self.member_of else None
+            if member_id:
+                member_folders[member_id].append(folder)
+            else:
+                # 解析失败的单独分组
+                groups[f"unknown_{folder.name}"] = [folder]
+
+        def key_for(member_id, group_index, group):
+            key = f"{group[0].name[:6]}_{member_id}_{group_index}"
+            return f"{key}_{int(ctimes[group[0]])}" if with_ctime else key
+
+        for member_id, member_folder_list in member_folders.items():
+            # 按文件夹创建时间排序
+            member_folder_list.sort(key=lambda x: ctimes[x])
+            current_group = [member_folder_list[0]]
+            group_index = 0
+            for folder in member_folder_list[1:]:
+                prev_folder = current_group[-1]  # 用当前组的最后一个文件夹
+                current_range = self.time_range(folder)
+                prev_range = self.time_range(prev_folder)
+                if current_range and prev_range:
+                    # 正常情况下ts文件每2秒一个,gap(5分钟)已经很宽松了
+                    time_gap = current_range[0] - prev_range[1]
+                    same = time_gap < self.gap
+                    if same:
+                        logging.debug(f"文件夹 {folder.name} 与前一个文件夹ts时间差 {time_gap:.0f}秒,判定为同一场直播")
+                    else:
+                        logging.info(f"文件夹 {folder.name} 与前一个文件夹ts时间差 {time_gap:.0f}秒,判定为新直播")
+                else:
+                    # 任一侧没有ts文件,按文件夹时间判断(降级处理)
+                    same = ctimes[folder] - ctimes[prev_folder] < self.fallback_gap
+                if same:
+                    current_group.append(folder)
+                else:
+                    groups[key_for(member_id, group_index, current_group)] = current_group
+                    group_index += 1
+                    current_group = [folder]
+            groups[key_for(member_id, group_index, current_group)] = current_group
+        return groups
+
+    # ---------------- 持久化 ----------------
+
+    def load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            if isinstance(records, dict):
+                self.records = records
+                logging.info(f"📒 载入 {len(records)} 条直播场次记录")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"读取场次索引失败，重新建立: {e}")
+
+    def prune(self, existing_names):
+        """删除已不存在的文件夹的记录"""
+        existing = set(existing_names)
+        stale = [name for name in self.records if name not in existing]
+        for name in stale:
+            del self.records[name]
+        if stale:
+            self._dirty = True
+        return len(stale)
+
+    def save(self, force: bool = False):
+        """有变化且距上次保存超过 save_interval 秒时写盘（原子替换）"""
+        if not self.path or not self._dirty:
+            return
+        now = time.time()
+        if not force and now - self._last_save < self.save_interval:
+            return
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.records, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self._dirty = False
+            self._last_save = now
+        except OSError as e:
+            logging.warning(f"保存场次索引失败: {e}")
+
+
+if __name__ == "__main__":
+    # 自检：与逐个 stat 的原分组逻辑结果一致，并统计 stat 次数
+    import tempfile
+    import shutil
+
+    logging.basicConfig(level=logging.WARNING)
+    tmp = Path(tempfile.mkdtemp(prefix="stream_index_"))
+    try:
+        now = time.time()
+        layout = {
+            # 文件夹: (第一个片段时间, 片段数) —— 每个片段间隔 2 秒
+            "250206 Showroom - Team A Haruna Hashimoto 190000": (now - 9000, 300),
+            "250206 Showroom - Team A Haruna Hashimoto 191100": (now - 9000 + 600 + 60, 200),  # 重连: 间隔 60 秒
+            "250206 Showroom - Team A Haruna Hashimoto 220000": (now - 2000, 100),             # 新直播
+            "250206 Showroom - Team B Yui Oguri 190000": (now - 8000, 50),
+        }
+        folders = []
+        for name, (start, n) in layout.items():
+            folder = tmp / name
+            folder.mkdir()
+            for i in range(n):
+                f = folder / f"{i}.ts"
+                f.write_bytes(b"")
+                os.utime(f, (start + i * 2, start + i * 2))
+            folders.append(folder)
+
+        member_of = lambda name: "_".join(name.split(" - ")[1].split()[-3:-1]).lower()
+        index = StreamSessionIndex(tmp / "index.json", member_of=member_of, time_field="mtime", save_interval=0)
+        for folder in folders:
+            index.refresh(folder)
+        grouped = index.groups(folders)
+        print({k: [f.name[-6:] for f in v] for k, v in grouped.items()})
+        assert sorted(len(v) for v in grouped.values()) == [1, 1, 2], "应分成 3 组: 重连的两个文件夹为一组"
+
+        # 第二轮：没有新文件，不再扫描
+        for folder in folders:
+            index.refresh(folder)
+        assert index.stats['scans'] == 4 and index.stats['skipped'] == 4, index.stats
+        index.save()
+
+        # 重启：从 JSON 载入后直接分组，无需扫描
+        reloaded = StreamSessionIndex(tmp / "index.json", member_of=member_of, time_field="mtime")
+        assert reloaded.groups(folders).keys() == grouped.keys()
+
+        # 4C：有 .stream_session.json 时直接采用 3C 的记录
+        index.export(folders[1])
+        remote = StreamSessionIndex(member_of=member_of, time_field="mtime")
+        for folder in folders:
+            remote.refresh(folder)
+        assert remote.stats['imported'] == 1 and remote.groups(folders).keys() == grouped.keys()
+        print(f"✅ 自检通过: {index.stats} / 4C {remote.stats}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
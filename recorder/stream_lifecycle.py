@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+直播生命周期：把数据库 IS_LIVE 与片段写入活跃度合成 "直播结束" 事件
+供 checker.py 调用
+
+    - 每轮主循环对所有有文件夹的成员做一次批量 IS_LIVE 查询（不再每组一次）
+    - 每个直播组一个状态: live → quiet（数据库已下播，片段还在宽限期内）→ ended
+      ended 时触发 on_ended(group_key, ended_at)，ended_at 为最后一个片段写入的时间（没有片段时为判定时间）；
+      之后又开播 / 又有新片段会回到 live
+    - 两轮之间由 poll() 按需检查：只有片段已经静默超过宽限期、但上次读到仍在直播的组，
+      才对这些成员补查一次数据库（最多每 recheck_interval 秒一次），
+      结束条件满足时立即返回，主循环不必等到下一个 CHECK_INTERVAL
+
+本模块不依赖 config.py / 数据库：
+    fetch_live(member_ids) -> {member_id: bool}，失败时抛异常
+        （这些成员按未在直播处理，由片段静默是否超过宽限期决定是否结束，与原来的 read_is_live 一致）
+    last_activity(folder)  -> 该文件夹最后一个片段的 mtime，没有片段时 None
+"""
+
+import time
+import logging
+
+LIVE = 'live'
+QUIET = 'quiet'
+ENDED = 'ended'
+
+
+class StreamLifecycle:
+
+    def __init__(self, fetch_live, last_activity, grace: float = 60, recheck_interval: float = 10,
+                 on_ended=None):
+        self.fetch_live = fetch_live
+        self.last_activity = last_activity
+        self.grace = grace
+        self.recheck_interval = recheck_interval
+        self.on_ended = on_ended
+        self.live = {}              # {member_id: bool} 最近一次读到的数据库状态
+        self.groups = {}            # {group_key: (member_id, [folder, ...])}
+        self.states = {}            # {group_key: LIVE / QUIET / ENDED}
+        self._last_fetch = 0.0
+        self.stats = {'queries': 0, 'rechecks': 0, 'failures': 0, 'ended': 0}
+
+    # ---------------- 数据库 ----------------
+
+    def refresh(self, member_ids, now: float = None) -> bool:
+        """
+        批量读取成员的 IS_LIVE（一次往返）
+        失败时这些成员按未在直播处理（交给片段静默判断），并同样记下查询时间，
+        poll() 不会每次都重试数据库
+        """
+        member_ids = sorted({m for m in member_ids if m})
+        if not member_ids:
+            return True
+        self.stats['queries'] += 1
+        try:
+            result = self.fetch_live(member_ids)
+        except Exception as e:
+            self.stats['failures'] += 1
+            self._last_fetch = now if now is not None else time.time()
+            logging.error(f"批量查询直播状态失败 (数据库可能未开启)，按片段活跃度判断: {e}")
+            for member_id in member_ids:
+                self.live[member_id] = False
+            return False
+        for member_id in member_ids:
+            is_live = bool(result.get(member_id, False))
+            if self.live.get(member_id) != is_live:
+                logging.info(f"数据库状态: {member_id} is_live={is_live}")
+            self.live[member_id] = is_live
+        self._last_fetch = now if now is not None else time.time()
+        return True
+
+    def is_live(self, member_id) -> bool:
+        return bool(self.live.get(member_id, False))
+
+    # ---------------- 状态机 ----------------
+
+    def track(self, groups: dict):
+        """主循环每轮分组后调用: {group_key: (member_id, [folder, ...])}"""
+        self.groups = groups
+        for key in [k for k in self.states if k not in groups]:
+            del self.states[key]
+
+    def _group_activity(self, folders):
+        times = [t for t in (self.last_activity(f) for f in folders) if t is not None]
+        return max(times) if times else None
+
+    def evaluate(self, now: float = None) -> list:
+        """按当前数据库状态与片段活跃度更新所有组的状态，返回本次新进入 ended 的组"""
+        now = now if now is not None else time.time()
+        ended = []
+        for key, (member_id, folders) in self.groups.items():
+            last = self._group_activity(folders)
+            files_active = last is not None and now - last <= self.grace
+            if self.is_live(member_id):
+                state = LIVE
+            elif files_active:
+                state = QUIET
+            else:
+                state = ENDED
+            previous = self.states.get(key)
+            self.states[key] = state
+            if state == ENDED and previous in (LIVE, QUIET):
+                ended.append(key)
+                self.stats['ended'] += 1
+                logging.info(f"🏁 [{key}] 直播结束（数据库已下播，片段静默 {now - last:.0f} 秒）" if last
+                             else f"🏁 [{key}] 直播结束")
+                if self.on_ended:
+                    self.on_ended(key, last if last is not None else now)
+            elif previous == ENDED and state != ENDED:
+                logging.info(f"🔁 [{key}] 直播恢复")
+        return ended
+
+    def poll(self, now: float = None) -> list:
+        """
+        两轮之间调用：片段已静默超过宽限期、但上次读到仍在直播的组，补查一次数据库，
+        然后重新评估；返回新进入 ended 的组
+        """
+        now = now if now is not None else time.time()
+        if now - self._last_fetch >= self.recheck_interval:
+            suspects = set()
+            for key, (member_id, folders) in self.groups.items():
+                if self.states.get(key) == ENDED or not self.is_live(member_id):
+                    continue
+                last = self._group_activity(folders)
+                if last is None or now - last > self.grace:
+                    suspects.add(member_id)
+            if suspects:
+                self.stats['rechecks'] += 1
+                self.refresh(suspects, now)
+        return self.evaluate(now)
+
+    def state(self, group_key):
+        return self.states.get(group_key)
+
+
+if __name__ == "__main__":
+    # 自检：下播后片段静默满宽限期的那一刻就能发出 ended，而不是等到下一轮主循环
+    db = {"haruna": True, "yui": True}
+    activity = {"A1": 1000.0, "A2": 1000.0, "B1": 1000.0}
+    queries = []
+
+    def fetch(ids):
+        queries.append(list(ids))
+        return {m: db[m] for m in ids}
+
+    ended_events = []
+    lc = StreamLifecycle(fetch, activity.get, grace=60, recheck_interval=10,
+                         on_ended=lambda key, ended_at: ended_events.append((key, ended_at)))
+    lc.track({"g_haruna": ("haruna", ["A1", "A2"]), "g_yui": ("yui", ["B1"])})
+    lc.refresh(["haruna", "yui"], now=1000)
+    assert lc.evaluate(now=1000) == [] and len(queries) == 1, "一轮只查一次数据库"
+
+    # 1010 秒 haruna 下播，片段最后写入在 1005 秒
+    db["haruna"] = False
+    activity["A2"] = 1005.0
+    events = []
+    for t in range(1010, 1100):
+        events += [(t, k) for k in lc.poll(now=t)]
+    first_end = events[0][0]
+    print(f"数据库查询 {len(queries)} 次（静默后才补查），ended 事件: {events}")
+    assert events and events[0][1] == "g_haruna" and first_end <= 1005 + 60 + 10
+    assert ended_events[0] == ("g_haruna", 1005.0), "结束时间是最后一个片段的写入时间，而不是判定时间"
+    # yui 仍在直播（数据库为 True），片段也静默了，但不应结束
+    assert lc.state("g_yui") == LIVE
+
+    # 重连：又有新片段 → 恢复 live/quiet
+    activity["A2"] = 1200.0
+    lc.evaluate(now=1201)
+    assert lc.state("g_haruna") == QUIET
+
+    # 数据库不可用：按未在直播处理，片段静默满宽限期即结束；失败后同样等 recheck_interval 再重试
+    def broken(ids):
+        queries.append(list(ids))
+        raise RuntimeError("数据库连接池不可用")
+
+    db["haruna"] = True
+    activity["A2"] = 1300.0
+    lc.refresh(["haruna"], now=1300)
+    assert lc.evaluate(now=1300) == [] and lc.state("g_haruna") == LIVE
+    lc.fetch_live = broken
+    lc.refresh(["haruna"], now=1310)
+    before = len(queries)
+    assert lc.poll(now=1311) == [] and lc.state("g_haruna") == QUIET
+    assert len(queries) == before, "失败后不立即重试"
+    # 1361 秒补查 yui 也失败：两组都按片段静默结束（不会因为数据库故障一直挂着）
+    assert lc.poll(now=1361) == ["g_haruna", "g_yui"] and lc.stats['failures'] == 2
+    print(f"✅ 自检通过: 结束事件在片段静默 {first_end - 1005} 秒后发出, 统计 {lc.stats}")
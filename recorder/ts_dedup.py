@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+跨文件夹片段去重（断线重连后服务器会重放最后几个片段）
+供 checker.py 调用
+
+    - 指纹: 1 字节模式 + 16 字节摘要 + 8 字节文件大小，共 25 字节定长二进制
+      摘要优先用 xxhash (xxh3_128)，没装时用 blake2b(digest_size=16)；都比 MD5 快
+    - 两种取样: head 读开头 head_bytes（默认 512KB，与旧实现一致）；
+      sparse 读开头 / 中间 / 结尾各 sample_bytes，读的字节更少，且能区分只有结尾不同的文件
+    - 每个成员一个按插入时间排序的 OrderedDict：过期（TTL）与超出上限的记录从最老的一端弹出，
+      不再每 1000 次插入整表扫描
+    - 线程安全：读文件算指纹不持锁，只有查表/插入持锁
+
+指纹以十六进制字符串对外（写入检查缓存）；模式不同的旧指纹会被忽略并重新计算
+
+本模块不依赖 config.py
+"""
+
+import os
+import time
+import struct
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+MODE_HEAD = 'head'
+MODE_SPARSE = 'sparse'
+_MODE_TAGS = {MODE_HEAD: 1, MODE_SPARSE: 2}
+DIGEST_SIZE = 16
+FINGERPRINT_SIZE = 1 + DIGEST_SIZE + 8
+
+
+def _new_hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+
+class Fingerprinter:
+    """计算片段指纹，并统计读取的字节数"""
+
+    def __init__(self, mode: str = MODE_SPARSE, head_bytes: int = 512 * 1024, sample_bytes: int = 64 * 1024):
+        if mode not in _MODE_TAGS:
+            raise ValueError(f"未知的指纹模式: {mode}")
+        self.mode = mode
+        self.tag = _MODE_TAGS[mode]
+        self.head_bytes = head_bytes
+        self.sample_bytes = sample_bytes
+        self._lock = threading.Lock()
+        self.stats = {'files': 0, 'bytes_read': 0}
+
+    def _ranges(self, size: int):
+        if self.mode == MODE_HEAD:
+            return [(0, min(size, self.head_bytes))]
+        sample = self.sample_bytes
+        if size <= sample * 3:
+            return [(0, size)]
+        return [(0, sample), ((size - sample) // 2, sample), (size - sample, sample)]
+
+    def compute(self, ts_file: Path) -> bytes:
+        """25 字节二进制指纹（文件不存在时抛 OSError）"""
+        hasher = _new_hasher()
+        read = 0
+        with open(ts_file, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            for offset, length in self._ranges(size):
+                f.seek(offset)
+                chunk = f.read(length)
+                read += len(chunk)
+                hasher.update(chunk)
+        with self._lock:
+            self.stats['files'] += 1
+            self.stats['bytes_read'] += read
+        return bytes([self.tag]) + hasher.digest() + struct.pack('>Q', size)
+
+    def parse(self, fingerprint) -> bytes:
+        """十六进制字符串 / bytes → 二进制指纹；格式或模式不符时返回 None"""
+        if isinstance(fingerprint, str):
+            try:
+                fingerprint = bytes.fromhex(fingerprint)
+            except ValueError:
+                return None
+        if not isinstance(fingerprint, bytes) or len(fingerprint) != FINGERPRINT_SIZE or fingerprint[0] != self.tag:
+            return None
+        return fingerprint
+
+
+class TSDeduplicator:
+    """
+    按成员记录最近见过的片段指纹
+        ttl:            记录保留秒数（12 小时足以覆盖同一场长直播的任何断线重连）
+        max_per_member: 每个成员最多保留多少条，超出时淘汰最老的
+        member_of:      文件夹名 → 成员 ID 的函数（None 时直接用文件夹名）
+    """
+
+    def __init__(self, ttl: float = 43200, max_per_member: int = 20000,
+                 fingerprinter: Fingerprinter = None, member_of=None):
+        self.ttl = ttl
+        self.max_per_member = max_per_member
+        self.fingerprinter = fingerprinter or Fingerprinter()
+        self.member_of = member_of
+        self._members = {}      # {member_id: OrderedDict{fingerprint: 首次出现时间}}
+        self._lock = threading.Lock()
+        self.stats = {'checked': 0, 'duplicates': 0, 'expired': 0, 'evicted': 0}
+
+    def compute_fingerprint(self, ts_file: Path) -> str:
+        """十六进制指纹（写入检查缓存用）"""
+        return self.fingerprinter.compute(ts_file).hex()
+
+    def _member(self, ts_file: Path) -> str:
+        folder_name = Path(ts_file).parent.name
+        member_id = self.member_of(folder_name) if self.member_of else folder_name
+        return member_id or "unknown"
+
+    def _expire(self, seen: OrderedDict, now: float):
+        """从最老的一端弹出过期 / 超出上限的记录（调用方持有锁）"""
+        while seen:
+            oldest, first_seen = next(iter(seen.items()))
+            if now - first_seen >= self.ttl:
+                self.stats['expired'] += 1
+            elif len(seen) > self.max_per_member:
+                self.stats['evicted'] += 1
+            else:
+                break
+            del seen[oldest]
+
+    def check_and_add(self, ts_file: Path, fingerprint=None) -> bool:
+        """
+        检查文件是否重复。返回 True 表示重复，False 表示是新文件
+        fingerprint: 检查缓存里已有的指纹，格式有效时不再读文件
+        """
+        key = self.fingerprinter.parse(fingerprint) if fingerprint else None
+        if key is None:
+            try:
+                key = self.fingerprinter.compute(ts_file)
+            except OSError:
+                # 降级：文件读不了时按文件名 + 大小去重
+                try:
+                    size = Path(ts_file).stat().st_size
+                except OSError:
+                    size = 0
+                key = f"{Path(ts_file).name}_{size}".encode()
+        member_id = self._member(ts_file)
+        now = time.time()
+
+        with self._lock:
+            self.stats['checked'] += 1
+            seen = self._members.get(member_id)
+            if seen is None:
+                seen = self._members[member_id] = OrderedDict()
+            first_seen = seen.get(key)
+            if first_seen is not None and now - first_seen < self.ttl:
+                self.stats['duplicates'] += 1
+                return True  # 拦截！是重复回放
+            seen.pop(key, None)
+            seen[key] = now
+            self._expire(seen, now)
+            return False  # 放行！是新文件
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(seen) for seen in self._members.values())
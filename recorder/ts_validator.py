@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+进程内 MPEG-TS 片段校验
+供 checker.py 调用：代替每个片段两次 ffprobe 子进程（视频流 / 音频流各一次）
+
+通过 mmap 读取片段，按 188 字节包解析:
+    PAT → PMT → 各 ES 的 stream_type，判断是否至少有一路视频和一路音频
+    ES 的 PES 包头 (00 00 01) → 确认该 PID 确实有数据，可选取首尾 PTS
+    H.264 SPS → 可选取分辨率
+
+结论 verdict:
+    valid      有视频和音频且都有 PES 数据
+    invalid    没有同步字节 / PMT 里缺视频或音频 / 声明了但没有任何数据
+    ambiguous  找不到 PAT/PMT、私有流类型等无法确定的情况，调用方应回退到 ffprobe
+
+本模块不依赖 config.py
+"""
+
+import os
+import mmap
+
+TS_PACKET_SIZE = 188
+SYNC_BYTE = 0x47
+
+VALID = 'valid'
+INVALID = 'invalid'
+AMBIGUOUS = 'ambiguous'
+
+# ISO/IEC 13818-1 stream_type
+VIDEO_STREAM_TYPES = {0x01: 'mpeg1video', 0x02: 'mpeg2video', 0x10: 'mpeg4', 0x1B: 'h264', 0x24: 'hevc', 0x42: 'cavs'}
+AUDIO_STREAM_TYPES = {0x03: 'mp2', 0x04: 'mp2', 0x0F: 'aac', 0x11: 'aac_latm', 0x81: 'ac3', 0x87: 'eac3'}
+PRIVATE_STREAM_TYPES = (0x06,)
+
+# SPS 里带 chroma_format_idc 等字段的 profile
+_HIGH_PROFILES = (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135)
+
+# 取 SPS 时最多拼接视频第一个 PES 的多少字节
+_SPS_SEARCH_BYTES = 4096
+
+
+def _find_sync(data, size: int) -> int:
+    """第一个连续三个包都对齐的同步字节位置，找不到返回 -1"""
+    for offset in range(min(TS_PACKET_SIZE, size)):
+        if data[offset] != SYNC_BYTE:
+            continue
+        if all(offset + k * TS_PACKET_SIZE >= size or data[offset + k * TS_PACKET_SIZE] == SYNC_BYTE
+               for k in (1, 2)):
+            return offset
+    return -1
+
+
+def _payload_offset(data, pos: int):
+    """包内负载的起始偏移，没有负载时返回 None"""
+    afc = (data[pos + 3] >> 4) & 0x03
+    if not afc & 0x01:
+        return None
+    start = pos + 4
+    if afc & 0x02:
+        start += 1 + data[pos + 4]
+    if start >= pos + TS_PACKET_SIZE:
+        return None
+    return start
+
+
+def _section(data, pos: int, start: int):
+    """PUSI 包里的 PSI 段（只处理一个包内装得下的段，PAT/PMT 通常如此）"""
+    pointer = data[start]
+    begin = start + 1 + pointer
+    end = pos + TS_PACKET_SIZE
+    if begin + 3 > end:
+        return None
+    section_length = ((data[begin + 1] & 0x0F) << 8) | data[begin + 2]
+    if begin + 3 + section_length > end or section_length < 9:
+        return None
+    return bytes(data[begin:begin + 3 + section_length])
+
+
+def _parse_pat(section: bytes) -> list:
+    if section[0] != 0x00:
+        return []
+    pmt_pids = []
+    for i in range(8, len(section) - 4, 4):
+        program_number = (section[i] << 8) | section[i + 1]
+        pid = ((section[i + 2] & 0x1F) << 8) | section[i + 3]
+        if program_number != 0:
+            pmt_pids.append(pid)
+    return pmt_pids
+
+
+def _parse_pmt(section: bytes) -> dict:
+    """{es_pid: stream_type}"""
+    if section[0] != 0x02:
+        return {}
+    program_info_length = ((section[10] & 0x0F) << 8) | section[11]
+    i = 12 + program_info_length
+    streams = {}
+    while i + 5 <= len(section) - 4:
+        stream_type = section[i]
+        pid = ((section[i + 1] & 0x1F) << 8) | section[i + 2]
+        es_info_length = ((section[i + 3] & 0x0F) << 8) | section[i + 4]
+        streams[pid] = stream_type
+        i += 5 + es_info_length
+    return streams
+
+
+def _read_pts(data, start: int, end: int):
+    """PES 包头里的 PTS（90kHz），没有时返回 None"""
+    if end - start < 14 or data[start] != 0 or data[start + 1] != 0 or data[start + 2] != 1:
+        return None
+    if not data[start + 7] & 0x80:
+        return None
+    p = start + 9
+    return (((data[p] >> 1) & 0x07) << 30 | data[p + 1] << 22 | (data[p + 2] >> 1) << 15
+            | data[p + 3] << 7 | data[p + 4] >> 1)
+
+
+# ========================= H.264 SPS =========================
+
+class _BitReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def bit(self) -> int:
+        byte = self.data[self.pos >> 3]
+        value = (byte >> (7 - (self.pos & 7))) & 1
+        self.pos += 1
+        return value
+
+    def bits(self, n: int) -> int:
+        value = 0
+        for _ in range(n):
+            value = (value << 1) | self.bit()
+        return value
+
+    def ue(self) -> int:
+        zeros = 0
+        while self.bit() == 0:
+            zeros += 1
+            if zeros > 31:
+                raise ValueError("exp-golomb 溢出")
+        return (1 << zeros) - 1 + self.bits(zeros)
+
+    def se(self) -> int:
+        value = self.ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+
+def _unescape_rbsp(nal: bytes) -> bytes:
+    return nal.replace(b"\x00\x00\x03", b"\x00\x00")
+
+
+def parse_h264_sps(nal: bytes):
+    """从 SPS NAL（含 1 字节 NAL 头）解析 (宽, 高)，失败返回 None"""
+    try:
+        r = _BitReader(_unescape_rbsp(nal[1:]))
+        profile_idc = r.bits(8)
+        r.bits(16)                       # constraint flags + level_idc
+        r.ue()                           # seq_parameter_set_id
+        chroma_format_idc = 1
+        if profile_idc in _HIGH_PROFILES:
+            chroma_format_idc = r.ue()
+            if chroma_format_idc == 3:
+                r.bit()                  # separate_colour_plane_flag
+            r.ue()                       # bit_depth_luma_minus8
+            r.ue()                       # bit_depth_chroma_minus8
+            r.bit()                      # qpprime_y_zero_transform_bypass_flag
+            if r.bit():                  # seq_scaling_matrix_present_flag
+                for i in range(8 if chroma_format_idc != 3 else 12):
+                    if r.bit():
+                        last, nxt = 8, 8
+                        for _ in range(16 if i < 6 else 64):
+                            if nxt:
+                                nxt = (last + r.se() + 256) % 256
+                            last = nxt or last
+        r.ue()                           # log2_max_frame_num_minus4
+        poc_type = r.ue()
+        if poc_type == 0:
+            r.ue()
+        elif poc_type == 1:
+            r.bit()
+            r.se()
+            r.se()
+            for _ in range(r.ue()):
+                r.se()
+        r.ue()                           # max_num_ref_frames
+        r.bit()                          # gaps_in_frame_num_value_allowed_flag
+        width_mbs = r.ue() + 1
+        height_units = r.ue() + 1
+        frame_mbs_only = r.bit()
+        if not frame_mbs_only:
+            r.bit()
+        r.bit()                          # direct_8x8_inference_flag
+        crop = (0, 0, 0, 0)
+        if r.bit():
+            crop = (r.ue(), r.ue(), r.ue(), r.ue())
+        sub_width, sub_height = (2, 2) if chroma_format_idc == 1 else ((2, 1) if chroma_format_idc == 2 else (1, 1))
+        if chroma_format_idc == 0:
+            sub_width, sub_height = 1, 1
+        crop_x = sub_width
+        crop_y = sub_height * (2 - frame_mbs_only)
+        width = width_mbs * 16 - (crop[0] + crop[1]) * crop_x
+        height = (2 - frame_mbs_only) * height_units * 16 - (crop[2] + crop[3]) * crop_y
+        if width <= 0 or height <= 0:
+            return None
+        return width, height
+    except (IndexError, ValueError):
+        return None
+
+
+def _find_h264_sps(es: bytes):
+    """在 ES 字节里找 SPS NAL (type 7)"""
+    i = es.find(b"\x00\x00\x01")
+    while i != -1 and i + 3 < len(es):
+        nal_type = es[i + 3] & 0x1F
+        nxt = es.find(b"\x00\x00\x01", i + 3)
+        if nal_type == 7:
+            return es[i + 3:nxt if nxt != -1 else len(es)]
+        i = nxt
+    return None
+
+
+# ========================= 校验 =========================
+
+def validate_ts(path, details: bool = False) -> dict:
+    """
+    校验一个 TS 片段
+    参数:
+        details: 为 True 时额外取首尾 PTS 与视频分辨率（会从文件尾部反向扫描一次）
+    返回:
+        {'verdict', 'reason', 'video': [{'pid', 'codec'}], 'audio': [...],
+         'width', 'height', 'pts_start', 'pts_end', 'packets'}
+    """
+    result = {'verdict': INVALID, 'reason': None, 'video': [], 'audio': [],
+              'width': None, 'height': None, 'pts_start': None, 'pts_end': None, 'packets': 0}
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < TS_PACKET_SIZE:
+                result['reason'] = 'too_small'
+                return result
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return _validate(data, size, details, result)
+    except (OSError, ValueError) as e:
+        result['verdict'] = AMBIGUOUS
+        result['reason'] = f"read_error: {e}"
+        return result
+
+
+def _validate(data, size: int, details: bool, result: dict) -> dict:
+    offset = _find_sync(data, size)
+    if offset < 0:
+        result['reason'] = 'no_sync'
+        return result
+
+    pmt_pids = set()
+    streams = None                   # {pid: stream_type}
+    pes_seen = {}                    # {pid: PES 起始次数}
+    first_pts = {}
+    video_es = bytearray()
+    sps_pid = None
+    sps_done = not details
+    resyncs = 0
+    packets = 0
+
+    pos = offset
+    last = size - TS_PACKET_SIZE
+    while pos <= last:
+        if data[pos] != SYNC_BYTE:
+            # 丢失同步：向后找下一个对齐的同步字节
+            resyncs += 1
+            nxt = data.find(b"\x47", pos + 1)
+            while nxt != -1 and nxt + TS_PACKET_SIZE <= last and data[nxt + TS_PACKET_SIZE] != SYNC_BYTE:
+                nxt = data.find(b"\x47", nxt + 1)
+            if nxt == -1:
+                break
+            pos = nxt
+            continue
+
+        packets += 1
+        b1 = data[pos + 1]
+        pid = ((b1 & 0x1F) << 8) | data[pos + 2]
+        pusi = b1 & 0x40
+        start = _payload_offset(data, pos)
+        if start is None or pid == 0x1FFF:
+            pos += TS_PACKET_SIZE
+            continue
+
+        if pid == 0 and pusi and not pmt_pids:
+            section = _section(data, pos, start)
+            if section:
+                pmt_pids.update(_parse_pat(section))
+        elif pid in pmt_pids and pusi and streams is None:
+            section = _section(data, pos, start)
+            if section:
+                streams = _parse_pmt(section) or None
+                if streams:
+                    sps_pid = next((p for p, t in streams.items() if t == 0x1B), None)
+                    if sps_pid is None:
+                        sps_done = True
+        elif streams is not None and pid in streams:
+            end = pos + TS_PACKET_SIZE
+            if pusi:
+                if data[start] == 0 and data[start + 1] == 0 and data[start + 2] == 1:
+                    pes_seen[pid] = pes_seen.get(pid, 0) + 1
+                    if details and pid not in first_pts:
+                        pts = _read_pts(data, start, end)
+                        if pts is not None:
+                            first_pts[pid] = pts
+                    if pid == sps_pid and not sps_done:
+                        header_end = start + 9 + data[start + 8]
+                        video_es += data[header_end:end]
+            elif pid == sps_pid and not sps_done and video_es:
+                video_es += data[start:end]
+            if pid == sps_pid and not sps_done and len(video_es) >= _SPS_SEARCH_BYTES:
+                sps_done = True
+
+            # 结构已确认且不需要更多细节时提前结束
+            if sps_done and _has_both(streams, pes_seen) and (not details or len(first_pts) >= len(pes_seen)):
+                break
+        pos += TS_PACKET_SIZE
+
+    result['packets'] = packets
+    if resyncs:
+        result['resyncs'] = resyncs
+    if streams is None:
+        # 没有 PAT/PMT 时 ffprobe 仍可能靠探测 PES 识别出流
+        result['verdict'] = AMBIGUOUS
+        result['reason'] = 'no_pat' if not pmt_pids else 'no_pmt'
+        return result
+
+    for pid, stream_type in sorted(streams.items()):
+        if stream_type in VIDEO_STREAM_TYPES:
+            result['video'].append({'pid': pid, 'codec': VIDEO_STREAM_TYPES[stream_type], 'pes': pes_seen.get(pid, 0)})
+        elif stream_type in AUDIO_STREAM_TYPES:
+            result['audio'].append({'pid': pid, 'codec': AUDIO_STREAM_TYPES[stream_type], 'pes': pes_seen.get(pid, 0)})
+
+    if details:
+        if sps_pid is not None:
+            sps = _find_h264_sps(bytes(video_es))
+            if sps:
+                dims = parse_h264_sps(sps)
+                if dims:
+                    result['width'], result['height'] = dims
+        _fill_pts_range(data, offset, size, streams, first_pts, result)
+
+    has_private = any(t in PRIVATE_STREAM_TYPES for t in streams.values())
+    if not result['video'] or not result['audio']:
+        # 私有流 (0x06) 可能是 Opus / AC-3 等，交给 ffprobe 判断
+        result['verdict'] = AMBIGUOUS if has_private else INVALID
+        result['reason'] = 'no_video' if not result['video'] else 'no_audio'
+        return result
+    if not any(s['pes'] for s in result['video']):
+        result['reason'] = 'no_video_payload'
+        return result
+    if not any(s['pes'] for s in result['audio']):
+        result['reason'] = 'no_audio_payload'
+        return result
+
+    result['verdict'] = VALID
+    return result
+
+
+def _has_both(streams: dict, pes_seen: dict) -> bool:
+    video = audio = False
+    for pid in pes_seen:
+        stream_type = streams.get(pid)
+        video = video or stream_type in VIDEO_STREAM_TYPES
+        audio = audio or stream_type in AUDIO_STREAM_TYPES
+    return video and audio
+
+
+def _fill_pts_range(data, offset: int, size: int, streams: dict, first_pts: dict, result: dict):
+    """从文件尾部反向找各 ES 最后一个带 PTS 的 PES，得到整个片段的 PTS 范围"""
+    if not first_pts:
+        return
+    last_pts = {}
+    pos = offset + ((size - offset) // TS_PACKET_SIZE - 1) * TS_PACKET_SIZE
+    while pos >= offset and len(last_pts) < len(first_pts):
+        if data[pos] == SYNC_BYTE and data[pos + 1] & 0x40:
+            pid = ((data[pos + 1] & 0x1F) << 8) | data[pos + 2]
+            if pid in first_pts and pid not in last_pts:
+                start = _payload_offset(data, pos)
+                if start is not None:
+                    pts = _read_pts(data, start, pos + TS_PACKET_SIZE)
+                    if pts is not None:
+                        last_pts[pid] = pts
+        pos -= TS_PACKET_SIZE
+    result['pts_start'] = min(first_pts.values())
+    result['pts_end'] = max(last_pts.values()) if last_pts else None
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+    for arg in sys.argv[1:]:
+        print(arg, json.dumps(validate_ts(arg, details=True), ensure_ascii=False))
@@ -7,7 +7,6 @@ Oracle对象存储上传模块 (使用数据库Wallet认证)
 import oci
 import logging
 import sys
-import subprocess
 from pathlib import Path
 from datetime import datetime
 
@@ -21,6 +20,7 @@ sys.path.insert(0, str(_project_root / "recorder"))
 
 from logger_config import setup_logger
 setup_logger()
+from probe_service import probe
 
 # 导入项目配置
 from config import (
@@ -163,9 +163,8 @@ class OracleBucketUploader:
             is_high_quality = False
             try:
                 # 快速检测分辨率高度
-                cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=height", "-of", "csv=p=0", str(video_file)]
-                height = int(subprocess.check_output(cmd).decode().strip())
-                if height > 720:
+                height = probe(video_file).height
+                if height and height > 720:
                     is_high_quality = True
             except Exception:
                 pass # 检测失败当作低画质处理，直接上传不等待
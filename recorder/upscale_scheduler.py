@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+拉伸任务调度器
+供 checker_4c.py 调用：代替主循环里逐个文件夹、逐个 chunk 串行调用 upscale_file
+
+    - 固定数量的常驻工作线程，每个线程同一时刻跑一个 ffmpeg 编码进程；
+      并发编码数与每个编码的 x264 -threads 按 CPU 核数分配（默认 核数/2 个任务 × 2 线程）
+    - 优先队列: 已结束直播的收尾 chunk 优先（它们卡着合并），其次直播开始得早的优先，
+      同一直播内按 chunk 顺序；直播转入收尾时，已排队的 chunk 随之提前
+    - 任务状态持久化为 JSON（queued / running / done / failed）：
+      重启后未完成的任务直接恢复排队，失败的任务冷却一段时间后才重试
+    - 指标: 每 log_metrics 间隔内完成的视频秒数 / 墙钟秒数（编码吞吐，倍速），以及工作线程占用率
+
+run_job(key, inputs, options, threads) -> (成功与否, 产出的视频秒数或 None)，由调用方实现（实际的 ffmpeg 调用）
+options 为提交时给的编码参数（可 JSON 序列化），原样传回
+
+plan_chunks() 负责把片段序号切成 chunk：按固定网格（每 size 个序号一格）切，
+直播中某一格写满（后面已经出现了 settle 个之后的片段）就可以拉伸，不必等直播结束；
+格内有缺号时要等缺口稳定（缺口之后的片段已经存在 gap_stable 秒，缺的片段仍未到达）才切开，
+3C 按探测完成的顺序同步，短暂的缺口很常见，不能一出现就把格切碎
+
+本模块不依赖 config.py
+"""
+
+import os
+import json
+import time
+import heapq
+import bisect
+import logging
+import threading
+from pathlib import Path
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def plan_workers(cores: int = None, workers: int = None, threads_per_job: int = None):
+    """(并发编码数, 每个编码的线程数)；未指定时按核数分配，两者乘积不超过核数"""
+    cores = cores or os.cpu_count() or 4
+    if not workers:
+        workers = max(1, cores // 2)
+    if not threads_per_job:
+        threads_per_job = max(1, cores // workers)
+    return workers, threads_per_job
+
+
+def plan_chunks(numbers, covered, size: int = 60, settle: int = 5, final: bool = False,
+                arrival_of=None, gap_stable: float = 60, now: float = None) -> list:
+    """
+    numbers: 文件夹中已有片段的序号（升序）；covered: 已有 / 正在拉伸的 chunk 覆盖的 [(first, last)]
+    arrival_of: 序号 → 片段到达时间（时间戳），用来判断缺口是否稳定；为 None 时有缺口的格一直等到 final
+    返回现在可以拉伸的 [(first, last)]，每个都是连续序号、且落在同一网格内:
+        - 网格按绝对序号对齐（first // size 相同），chunk 名在直播过程中保持稳定
+        - 序号断层处切开（与原来的连续段规则一致）
+        - 直播中，最大序号越过该格末尾 settle 个之后才拉伸（片段可能乱序到达）；final 时剩下的全部拉伸
+        - 格内有缺号时，缺口之后最早到达的片段已存在 gap_stable 秒才拉伸这一格（缺的片段大概率不会再来）
+        - 已被覆盖的序号跳过，迟到的片段单独成一个小 chunk，不与已拉伸的 chunk 重叠
+    """
+    if not numbers:
+        return []
+    covered = sorted(covered)
+
+    def is_covered(n):
+        i = bisect.bisect_right(covered, (n, float('inf'))) - 1
+        return i >= 0 and covered[i][0] <= n <= covered[i][1]
+
+    newest = numbers[-1]
+    pieces, current = [], []
+    for n in numbers:
+        if is_covered(n):
+            if current:
+                pieces.append(current)
+                current = []
+            continue
+        if current and (n != current[-1] + 1 or n // size != current[-1] // size):
+            pieces.append(current)
+            current = []
+        current.append(n)
+    if current:
+        pieces.append(current)
+
+    present = set(numbers)
+    now = now if now is not None else time.time()
+    stable_cells = {}
+
+    def cell_stable(cell):
+        """格内（从直播第一个片段算起）没有缺号，或缺口已经稳定"""
+        if cell not in stable_cells:
+            cell_first, cell_last = max(cell * size, numbers[0]), (cell + 1) * size - 1
+            missing = next((n for n in range(cell_first, cell_last + 1)
+                            if n not in present and not is_covered(n)), None)
+            if missing is None:
+                stable_cells[cell] = True
+            elif arrival_of is None:
+                stable_cells[cell] = False
+            else:
+                after = [n for n in range(missing + 1, cell_last + settle + 1) if n in present]
+                opened = min(arrival_of(n) for n in after) if after else now
+                stable_cells[cell] = now - opened >= gap_stable
+        return stable_cells[cell]
+
+    ready = []
+    for piece in pieces:
+        cell = piece[-1] // size
+        cell_last = (cell + 1) * size - 1
+        if final or (newest >= cell_last + settle and cell_stable(cell)):
+            ready.append((piece[0], piece[-1]))
+    return ready
+
+
+class UpscaleScheduler:
+
+    def __init__(self, run_job, workers: int = None, threads_per_job: int = None, state_path: Path = None,
+                 retry_delay: float = 1800, keep_done: float = 86400, name: str = "UpscaleWorker"):
+        self.run_job = run_job
+        self.workers, self.threads_per_job = plan_workers(workers=workers, threads_per_job=threads_per_job)
+        self.state_path = Path(state_path) if state_path else None
+        self.retry_delay = retry_delay
+        self.keep_done = keep_done
+        self.name = name
+        # {key: {'state', 'priority', 'inputs', 'options', 'attempts', 'duration', 'elapsed', 'finished'}}
+        self.jobs = {}
+        self._heap = []           # [(priority, seq, key)]，优先级变化时旧条目出堆时丢弃
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads = []
+        self._window = {'since': time.time(), 'jobs': 0, 'video': 0.0, 'busy': 0.0}
+        self.stats = {'submitted': 0, 'done': 0, 'failed': 0, 'video_seconds': 0.0}
+        self.load()
+
+    # ---------------- 持久化 ----------------
+
+    def load(self):
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                jobs = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"读取拉伸任务状态失败，重新开始: {e}")
+            return
+        for key, job in jobs.items():
+            if job.get('state') == RUNNING:
+                job['state'] = QUEUED  # 上次运行中被中断
+            job['priority'] = tuple(job.get('priority') or (1, 0, 0))
+            if 'options' not in job:
+                job['options'] = job.pop('fps', None)  # 旧版本的状态文件只记录了帧率
+            self.jobs[key] = job
+            if job['state'] == QUEUED:
+                self._push(key, job)
+        queued = sum(1 for job in self.jobs.values() if job['state'] == QUEUED)
+        logging.info(f"📒 载入 {len(self.jobs)} 个拉伸任务记录，其中 {queued} 个恢复排队")
+
+    def _save(self):
+        """调用方持有锁"""
+        if not self.state_path:
+            return
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.jobs, f, ensure_ascii=False)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            logging.warning(f"保存拉伸任务状态失败: {e}")
+
+    # ---------------- 提交 ----------------
+
+    def _push(self, key, job):
+        self._seq += 1
+        heapq.heappush(self._heap, (job['priority'], self._seq, key))
+
+    def submit(self, key: str, inputs, options, final: bool = False, stream_start: float = 0,
+               order: int = 0) -> bool:
+        """
+        提交一个 chunk（key 通常为输出文件路径）；已排队 / 运行中的不重复提交
+        （调用方只在输出文件不存在时提交，所以已完成的任务再被提交说明产出丢了，重新排队）
+        options: 编码参数，执行时原样传给 run_job
+        final: 该直播已结束（收尾 chunk 优先）；stream_start: 直播开始时间（越早越优先）；order: 直播内的顺序
+        返回是否新加入了队列
+        """
+        priority = (0 if final else 1, stream_start, order)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("调度器已关闭")
+            job = self.jobs.get(key)
+            if job:
+                state = job['state']
+                if state == QUEUED and priority < job['priority']:
+                    job['priority'] = priority
+                    self._push(key, job)  # 提前（旧条目出堆时丢弃）
+                if state in (QUEUED, RUNNING):
+                    return False
+                if state == FAILED and time.time() - job.get('finished', 0) < self.retry_delay:
+                    return False
+            self.jobs[key] = job = {
+                'state': QUEUED, 'priority': priority, 'inputs': [str(p) for p in inputs], 'options': options,
+                'attempts': job.get('attempts', 0) if job else 0, 'duration': None, 'elapsed': None,
+                'finished': None,
+            }
+            self._push(key, job)
+            self.stats['submitted'] += 1
+            self._save()
+            self._cond.notify()
+            return True
+
+    def state(self, key):
+        job = self.jobs.get(key)
+        return job['state'] if job else None
+
+    def active_keys(self) -> list:
+        """排队中 / 运行中的任务"""
+        with self._cond:
+            return [key for key, job in self.jobs.items() if job['state'] in (QUEUED, RUNNING)]
+
+    def depth(self) -> int:
+        with self._cond:
+            return sum(1 for job in self.jobs.values() if job['state'] == QUEUED)
+
+    # ---------------- 执行 ----------------
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, daemon=True, name=f"{self.name}-{i}")
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"🧵 拉伸调度器启动: {self.workers} 个并发编码 × 每个 {self.threads_per_job} 线程")
+        return self
+
+    def _next(self):
+        """取优先级最高的排队任务（调用方持有锁）"""
+        while self._heap:
+            priority, _, key = heapq.heappop(self._heap)
+            job = self.jobs.get(key)
+            if job and job['state'] == QUEUED and job['priority'] == priority:
+                return key, job
+        return None, None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                key, job = self._next()
+                while key is None and not self._closed:
+                    self._cond.wait()
+                    key, job = self._next()
+                if key is None:
+                    return
+                job['state'] = RUNNING
+                job['attempts'] += 1
+                self._save()
+                inputs, options = [Path(p) for p in job['inputs']], job['options']
+
+            start = time.time()
+            try:
+                ok, duration = self.run_job(key, inputs, options, self.threads_per_job)
+            except Exception as e:
+                logging.error(f"❌ 拉伸任务异常 {Path(key).name}: {e}")
+                ok, duration = False, None
+            elapsed = time.time() - start
+
+            with self._cond:
+                job.update(state=DONE if ok else FAILED, duration=duration, elapsed=elapsed, finished=time.time())
+                self._window['busy'] += elapsed
+                if ok:
+                    self.stats['done'] += 1
+                    self._window['jobs'] += 1
+                    if duration:
+                        self.stats['video_seconds'] += duration
+                        self._window['video'] += duration
+                        logging.info(f"📈 {Path(key).name}: {duration:.0f} 秒视频用时 {elapsed:.0f} 秒 "
+                                     f"({duration / elapsed if elapsed else 0:.2f}x)")
+                else:
+                    self.stats['failed'] += 1
+                    logging.error(f"❌ 拉伸失败 {Path(key).name}（第 {job['attempts']} 次），"
+                                  f"{self.retry_delay / 60:.0f} 分钟后才会重试")
+                self._save()
+
+    def close(self, wait: bool = False):
+        """停止接收新任务；排队中的任务保留在状态文件里，下次启动时恢复"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            self._save()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    # ---------------- 维护与指标 ----------------
+
+    def prune(self, now: float = None) -> int:
+        """删除完成 / 失败超过 keep_done 秒的任务记录"""
+        now = now if now is not None else time.time()
+        with self._cond:
+            stale = [key for key, job in self.jobs.items()
+                     if job['state'] in (DONE, FAILED) and now - (job.get('finished') or now) > self.keep_done]
+            for key in stale:
+                del self.jobs[key]
+            if stale:
+                self._save()
+            return len(stale)
+
+    def log_metrics(self):
+        """输出本统计窗口内的编码吞吐（视频秒 / 墙钟秒）与线程占用率，并开始新窗口"""
+        now = time.time()
+        with self._cond:
+            window = self._window
+            wall = max(now - window['since'], 1e-6)
+            queued = sum(1 for job in self.jobs.values() if job['state'] == QUEUED)
+            running = sum(1 for job in self.jobs.values() if job['state'] == RUNNING)
+            self._window = {'since': now, 'jobs': 0, 'video': 0.0, 'busy': 0.0}
+        logging.info(f"📊 拉伸吞吐: 近 {wall / 60:.0f} 分钟完成 {window['jobs']} 个 chunk, "
+                     f"{window['video'] / wall:.2f} 视频秒/墙钟秒, "
+                     f"线程占用 {window['busy'] / (wall * self.workers) * 100:.0f}% | "
+                     f"排队 {queued}, 运行中 {running}")
+        return window['video'] / wall
+
+
+if __name__ == "__main__":
+    # 自检：并发数按核数分配；收尾 chunk 先于直播中的 chunk；重启后恢复排队；吞吐统计
+    import shutil
+    import tempfile
+
+    logging.basicConfig(level=logging.WARNING)
+    assert plan_workers(cores=4) == (2, 2) and plan_workers(cores=8) == (4, 2) and plan_workers(cores=1) == (1, 1)
+
+    # 切分：直播中只拉伸已写满的格；断层处切开；final 时收尾；迟到片段不与已拉伸的重叠
+    live = list(range(0, 122))
+    assert plan_chunks(live, [], 60, 5) == [(0, 59)]                       # 60..119 还差 settle 个
+    assert plan_chunks(live + [122, 123, 124], [], 60, 5) == [(0, 59), (60, 119)]
+    assert plan_chunks(live, [(0, 59), (60, 119)], 60, 5, final=True) == [(120, 121)]
+    gapped = [n for n in range(0, 200) if not 70 <= n < 75]
+    # 缺口刚出现（75 之后的片段 10 秒前才到）：这一格先不切；缺口稳定 60 秒后才切开
+    arrived = {n: 1000.0 if n < 70 else 1090.0 for n in range(0, 200)}
+    assert plan_chunks(gapped, [], 60, 5, arrival_of=arrived.get, now=1100) == [(0, 59), (120, 179)]
+    assert plan_chunks(gapped, [], 60, 5) == [(0, 59), (120, 179)]        # 没有 mtime 时等到 final
+    assert plan_chunks(sorted(gapped + list(range(70, 75))), [], 60, 5, arrival_of=arrived.get, now=1100) == \
+        [(0, 59), (60, 119), (120, 179)]                                   # 迟到的片段补齐，整格拉伸
+    assert plan_chunks(gapped, [], 60, 5, arrival_of=arrived.get, now=1150) == [(0, 59), (60, 69), (75, 119), (120, 179)]
+    assert plan_chunks(gapped, [], 60, 5, final=True) == [(0, 59), (60, 69), (75, 119), (120, 179), (180, 199)]
+    assert plan_chunks(sorted(gapped + [72]), [(0, 59), (60, 69), (75, 119)], 60, 5,
+                       arrival_of=arrived.get, now=1200) == [(72, 72), (120, 179)]
+    assert plan_chunks(list(range(123, 300)), [], 60, 5) == [(123, 179), (180, 239)]  # 直播不从 0 开始不算缺口
+    assert plan_chunks(list(range(0, 600)), [(0, 499)], 60, 5, final=True) == [(500, 539), (540, 599)]
+
+    tmp = Path(tempfile.mkdtemp(prefix="upscale_scheduler_"))
+    try:
+        order, gate = [], threading.Event()
+
+        def fake_job(key, inputs, options, threads):
+            gate.wait()
+            order.append(key)
+            time.sleep(0.02)
+            return True, 10.0 * len(inputs)
+
+        state = tmp / "jobs.json"
+        scheduler = UpscaleScheduler(fake_job, workers=1, threads_per_job=4, state_path=state)
+        scheduler.start()
+        scheduler.submit("new_live/chunk_1", ["a"] * 3, "40", stream_start=200, order=1)
+        time.sleep(0.05)  # 第一个任务已被工作线程取走，卡在 gate
+        scheduler.submit("old_live/chunk_2", ["a"], "40", stream_start=100, order=2)
+        scheduler.submit("old_live/chunk_1", ["a"], "40", stream_start=100, order=1)
+        scheduler.submit("new_live/chunk_2", ["a"], "40", stream_start=200, order=2)
+        scheduler.submit("ended/chunk_9", ["a"], "40", final=True, stream_start=300, order=9)
+        # 直播转入收尾：已排队的 chunk 提前
+        assert not scheduler.submit("new_live/chunk_2", ["a"], "40", final=True, stream_start=200, order=2)
+        assert not scheduler.submit("new_live/chunk_1", ["a"], "40")  # 运行中不重复提交
+        gate.set()
+        while scheduler.depth() or any(j['state'] == RUNNING for j in scheduler.jobs.values()):
+            time.sleep(0.01)
+        print("执行顺序:", order)
+        assert order == ["new_live/chunk_1", "new_live/chunk_2", "ended/chunk_9",
+                         "old_live/chunk_1", "old_live/chunk_2"], order
+        throughput = scheduler.log_metrics()
+        assert throughput > 0
+        scheduler.close(wait=True)
+
+        # 重启：排队中的任务恢复，已完成的不重复
+        with open(state) as f:
+            jobs = json.load(f)
+        jobs["old_live/chunk_3"] = {'state': RUNNING, 'priority': [1, 100, 3], 'inputs': ["a"], 'fps': "40",
+                                    'attempts': 1, 'duration': None, 'elapsed': None, 'finished': None}
+        with open(state, 'w') as f:
+            json.dump(jobs, f)
+        order.clear()
+        restarted = UpscaleScheduler(fake_job, workers=2, state_path=state).start()
+        assert restarted.state("old_live/chunk_1") == DONE
+        while restarted.depth() or any(j['state'] == RUNNING for j in restarted.jobs.values()):
+            time.sleep(0.01)
+        assert order == ["old_live/chunk_3"], order
+        restarted.close(wait=True)
+        print(f"✅ 自检通过: {scheduler.stats} / 重启后 {restarted.stats}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
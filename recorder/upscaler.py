@@ -5,6 +5,7 @@ import logging
 import os
 from pathlib import Path
 import time
+from probe_service import probe
 
 def get_frame_rate(input_paths) -> str:
     if isinstance(input_paths, Path):
@@ -16,34 +17,104 @@ def get_frame_rate(input_paths) -> str:
     sample = input_paths[mid]
     
     try:
-        result = subprocess.run([
-            "ffprobe", "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "stream=r_frame_rate,avg_frame_rate",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            str(sample)
-        ], capture_output=True, text=True, timeout=30)
-        
-        lines = [l for l in result.stdout.strip().split('\n') if l and l != '0/0']
-        
-        rates = []
-        for line in lines:
-            if '/' in line:
-                num, den = line.split('/')
-                if int(den) > 0:
-                    rates.append(int(num) // int(den))
-        
+        # 共享探测服务：同一片段已被其他模块探测过时不再启动 ffprobe
+        video = probe(sample, timeout=30).video
+        rates = [int(r) for r in (video.fps, video.avg_fps) if r] if video else []
         if rates:
             return str(max(rates))  # 取较大值，即 r_frame_rate
-    except:
+    except Exception:
         pass
     return "40"
 
-def upscale_file(input_path: Path, output_path: Path, fps: str = "40", is_filelist: bool = False) -> bool:
+PIPELINE_PIPE = "pipe"            # concat 解复用 → mpegts 管道 → 编码，中间不落盘
+PIPELINE_TWO_PASS = "two_pass"    # 旧流程：先写完整的 pre_merge mp4，再读回来编码
+
+
+def _video_filter(profile: dict) -> str:
+    width, height = profile.get('target') or (1920, 1080)
+    vf = f"scale={width}:{height}:flags={profile.get('scaler') or 'lanczos'}"
+    return f"{vf},fps={profile['fps']}" if profile.get('fps') else vf
+
+
+def _encode_cmd(input_arg: str, output_path: Path, profile: dict, threads: int = None,
+                input_format: str = None) -> list:
+    return [
+        "nice", "-n", "15",
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-fflags", "+genpts", # 强制重新生成时间戳，双保险
+        *(["-f", input_format] if input_format else []),
+        "-i", input_arg,
+        "-c:v", "libx264",
+        "-preset", profile.get('preset') or "ultrafast",
+        "-crf", str(profile.get('crf', 18)),
+        *(["-threads", str(threads)] if threads else []),
+        "-c:a", "copy",
+        "-vf", _video_filter(profile),
+        # 帧率未知时不强制恒定帧率，保持源时间轴
+        *(["-vsync", "cfr"] if profile.get('fps') else []),
+        "-f", "mp4",
+        str(output_path)
+    ]
+
+
+def _run_piped(filelist: Path, encode_cmd: list, timeout: float):
+    """
+    两个 ffmpeg 之间用管道连接：第一个用 concat 解复用器拼接片段（时间轴在这里被拼成连续的），
+    以 mpegts 写到 stdout；第二个从 stdin 读入，+genpts 补时间戳后编码
+    """
+    demux_cmd = [
+        "nice", "-n", "15",
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", str(filelist),
+        "-c", "copy", "-f", "mpegts", "pipe:1"
+    ]
+    demux = subprocess.Popen(demux_cmd, stdout=subprocess.PIPE)
+    try:
+        encode = subprocess.Popen(encode_cmd, stdin=demux.stdout)
+    except Exception:
+        demux.kill()
+        demux.wait()
+        raise
+    demux.stdout.close()  # 编码进程提前退出时，解复用进程能收到 SIGPIPE
+    try:
+        encode_code = encode.wait(timeout=timeout)
+        demux_code = demux.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        for proc in (encode, demux):
+            proc.kill()
+            proc.wait()
+        raise
+    if demux_code != 0:
+        raise subprocess.CalledProcessError(demux_code, demux_cmd)
+    if encode_code != 0:
+        raise subprocess.CalledProcessError(encode_code, encode_cmd)
+
+
+def _copy_cmd(input_path: Path, output_path: Path, is_filelist: bool) -> list:
+    """源已达目标分辨率时不拉伸，只封装成 mp4"""
+    source = ["-f", "concat", "-safe", "0", "-i", str(input_path)] if is_filelist else ["-i", str(input_path)]
+    return [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-fflags", "+genpts",
+        *source,
+        "-c", "copy",
+        "-f", "mp4",
+        str(output_path)
+    ]
+
+
+def upscale_file(input_path: Path, output_path: Path, fps: str = "40", is_filelist: bool = False,
+                 threads: int = None, pipeline: str = PIPELINE_PIPE, profile: dict = None) -> bool:
     """
     调用 ffmpeg 将输入文件拉伸到 1080p
     加强版：带中间过程日志与稳定性预处理
+    threads: x264 编码线程数（多个编码并行时由调度器按核数分配，None 时由 ffmpeg 自己决定）
+    pipeline: 片段列表的处理方式，"pipe" 拼接与编码之间走管道（每个 chunk 只写一次盘），
+              "two_pass" 先写 pre_merge mp4 再编码；管道失败时自动用 two_pass 重试一次
+    profile: encode_profile 算出的编码参数（帧率 / 目标分辨率 / 缩放算法 / preset / CRF / 是否拉伸），
+             没有时沿用 fps 参数与 1080p / lanczos / ultrafast / CRF 18
     """
+    profile = dict(profile) if profile else {'fps': fps}
     if output_path.exists() and output_path.stat().st_size > 0:
         return True
 
@@ -54,9 +125,36 @@ def upscale_file(input_path: Path, output_path: Path, fps: str = "40", is_fileli
     actual_input = input_path
 
     try:
+        if temp_output_path.exists():
+            temp_output_path.unlink()
+
+        # --- 源已达目标分辨率: 只封装，不编码 ---
+        if profile.get('upscale') is False:
+            logging.info(f"📦 [封装] 源已达原生分辨率，跳过拉伸: {output_path.name}")
+            start_copy = time.time()
+            subprocess.run(_copy_cmd(input_path, temp_output_path, is_filelist), check=True, timeout=600)
+            os.rename(temp_output_path, output_path)
+            logging.info(f"✨ [任务完成] 成功产出: {output_path.name}，封装耗时 {time.time() - start_copy:.2f}s")
+            return True
+
+        # --- 管道模式: 拼接与编码同时进行，不写中间文件 ---
+        if is_filelist and pipeline == PIPELINE_PIPE:
+            logging.info(f"🔥 [拉伸中] 拼接 → 1080p 编码 (管道): {output_path.name}")
+            start_upscale = time.time()
+            try:
+                _run_piped(input_path, _encode_cmd("pipe:0", temp_output_path, profile, threads, input_format="mpegts"),
+                           timeout=900)
+                os.rename(temp_output_path, output_path)
+                logging.info(f"✨ [任务完成] 成功产出: {output_path.name}，编码耗时 {time.time() - start_upscale:.2f}s")
+                return True
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                logging.warning(f"⚠️ [管道拉伸失败] {input_path.name}: {e}，改用两步流程重试")
+                if temp_output_path.exists(): temp_output_path.unlink()
+
         # --- 步骤 1: 预处理 (仅针对 TS 列表) ---
         if is_filelist:
-            temp_combined_path = output_path.parent / f"pre_merge_{int(time.time())}.mp4"
+            # 按输出文件命名：同一文件夹的多个 chunk 并行预处理时不会撞名
+            temp_combined_path = output_path.parent / f"pre_merge_{output_path.stem}.mp4"
             logging.info(f"🔄 [1/2 预处理] 正在合并片段以稳定时间轴: {input_path.name}")
             
             merge_cmd = [
@@ -72,25 +170,9 @@ def upscale_file(input_path: Path, output_path: Path, fps: str = "40", is_fileli
             actual_input = temp_combined_path
 
         # --- 步骤 2: 正式拉伸 ---
-        if temp_output_path.exists():
-            temp_output_path.unlink()
-
         logging.info(f"🔥 [2/2 拉伸中] 正在进行 1080p 编码: {output_path.name}")
         
-        cmd = [
-            "nice", "-n", "15",
-            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-            "-fflags", "+genpts", # 强制重新生成时间戳，双保险
-            "-i", str(actual_input),
-            "-c:v", "libx264",
-            "-preset", "ultrafast",
-            "-crf", "18",
-            "-c:a", "copy",
-            "-vf", f"scale=1920:1080:flags=lanczos,fps={fps}",
-            "-vsync", "cfr",
-            "-f", "mp4",
-            str(temp_output_path)
-        ]
+        cmd = _encode_cmd(str(actual_input), temp_output_path, profile, threads)
 
         start_upscale = time.time()
         subprocess.run(cmd, check=True, timeout=600) 
@@ -118,4 +200,4 @@ def upscale_file(input_path: Path, output_path: Path, fps: str = "40", is_fileli
                 temp_combined_path.unlink()
                 logging.debug(f"🧹 已清理临时中间文件")
             except Exception as e:
-                logging.warning(f"⚠️ 清理临时文件失败: {e}")
\ No newline at end of file
+                logging.warning(f"⚠️ 清理临时文件失败: {e}")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+片段检查结果的持久化缓存
+供 checker.py 调用：checker 重启后不再对进行中的直播重新 ffprobe 每个片段
+
+每个直播文件夹里一个追加写的 JSONL (.fragment_checks.jsonl)，每行一条记录:
+    {"name": "123.ts", "size": 1234, "mtime_ns": ..., "valid": true,
+     "streams": {"video": "0", "audio": "1"}, "error": null, "fingerprint": "02ab...（ts_dedup 十六进制指纹）"}
+    {"name": "123.ts", "size": 1234, "mtime_ns": ..., "synced": true}
+同一片段的多行按顺序合并；(name, size, mtime_ns) 任一变化即视为新文件，旧结果作废
+
+    - 按文件夹懒加载：第一次查询某个文件夹时才读取它的缓存文件
+    - 只追加、不改写：进程中途被杀最多丢最后一行，读取时跳过损坏的行
+    - 文件夹出现 .merged 标记后删除缓存文件（merger.py 合并完成时也会直接删除）
+
+本模块不依赖 config.py
+"""
+
+import os
+import json
+import logging
+import threading
+from pathlib import Path
+
+CACHE_NAME = ".fragment_checks.jsonl"
+MERGED_MARKER = ".merged"
+
+
+def prune_folder(folder: Path):
+    """删除文件夹的检查缓存（合并完成后调用）"""
+    try:
+        (Path(folder) / CACHE_NAME).unlink()
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"删除检查缓存失败 {Path(folder).name}: {e}")
+
+
+class _FolderCache:
+    """单个文件夹的缓存：{name: record}"""
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+        self.path = folder / CACHE_NAME
+        self.entries = {}
+        self._torn_tail = False     # 上次被中断时最后一行没写完，下次追加前先补换行
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._torn_tail = not line.endswith("\n")
+                    try:
+                        record = json.loads(line)
+                        key = (record["size"], record["mtime_ns"])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    name = record.pop("name", None)
+                    if not name:
+                        continue
+                    current = self.entries.get(name)
+                    if current is not None and (current["size"], current["mtime_ns"]) == key:
+                        current.update(record)
+                    else:
+                        self.entries[name] = record
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"读取检查缓存失败 {self.folder.name}: {e}")
+
+    def get(self, name: str, st: os.stat_result):
+        record = self.entries.get(name)
+        if record is None or record["size"] != st.st_size or record["mtime_ns"] != st.st_mtime_ns:
+            return None
+        return record
+
+    def append(self, name: str, st: os.stat_result, fields: dict):
+        record = self.get(name, st)
+        if record is None:
+            record = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            self.entries[name] = record
+        record.update(fields)
+        line = json.dumps(dict(fields, name=name, size=st.st_size, mtime_ns=st.st_mtime_ns), ensure_ascii=False)
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(("\n" if self._torn_tail else "") + line + "\n")
+            self._torn_tail = False
+        except OSError as e:
+            # 写缓存失败不影响检查本身，只是重启后需要重新检查
+            logging.warning(f"写入检查缓存失败 {self.folder.name}: {e}")
+
+
+class ValidationCache:
+    """所有直播文件夹的检查缓存（线程安全，检查线程池里并发调用）"""
+
+    def __init__(self):
+        self._folders = {}          # {folder: _FolderCache}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'pruned': 0}
+
+    def _folder(self, folder: Path) -> _FolderCache:
+        cache = self._folders.get(folder)
+        if cache is None:
+            cache = _FolderCache(folder)
+            self._folders[folder] = cache
+            if cache.entries:
+                logging.info(f"📒 [{folder.name}] 载入 {len(cache.entries)} 条片段检查缓存")
+        return cache
+
+    def lookup(self, ts_file: Path, st: os.stat_result = None):
+        """
+        已缓存的检查结果（字典），没有或文件已变化时返回 None
+        st: 调用方已经 stat 过时传入，避免重复 stat
+        """
+        try:
+            st = st or ts_file.stat()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            record = self._folder(ts_file.parent).get(ts_file.name, st)
+            if record is not None and 'valid' in record:
+                self.stats['hits'] += 1
+                return dict(record)
+            self.stats['misses'] += 1
+            return None
+
+    def record(self, ts_file: Path, valid: bool, streams: dict = None, error: str = None,
+               fingerprint: str = None, st: os.stat_result = None):
+        """写入一次检查结果"""
+        try:
+            st = st or ts_file.stat()
+        except FileNotFoundError:
+            return
+        fields = {'valid': bool(valid), 'streams': streams or {}, 'error': error}
+        if fingerprint:
+            fields['fingerprint'] = fingerprint
+        with self._lock:
+            self._folder(ts_file.parent).append(ts_file.name, st, fields)
+            self.stats['writes'] += 1
+
+    def is_synced(self, ts_file: Path) -> bool:
+        try:
+            st = ts_file.stat()
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            record = self._folder(ts_file.parent).get(ts_file.name, st)
+            return bool(record and record.get('synced'))
+
+    def mark_synced(self, ts_file: Path):
+        try:
+            st = ts_file.stat()
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._folder(ts_file.parent).append(ts_file.name, st, {'synced': True})
+            self.stats['writes'] += 1
+
+    def prune_merged(self) -> int:
+        """已载入的文件夹出现 .merged 标记后删除缓存文件并释放内存"""
+        with self._lock:
+            merged = [folder for folder in self._folders if (folder / MERGED_MARKER).exists()
+                      or not folder.exists()]
+            for folder in merged:
+                self._folders.pop(folder, None)
+                prune_folder(folder)
+            self.stats['pruned'] += len(merged)
+        return len(merged)
@@ -76,15 +76,31 @@ DB_HISTORY_TABLE = "SHOWROOM_LIVE_HISTORY"
 CHECK_INTERVAL = 30  # 每次检测间隔秒数
 LIVE_INACTIVE_THRESHOLD = 60  # 判定直播结束的空闲秒数
 MAX_WORKERS = 16  # 并发线程数
+PROBE_WORKERS = min(MAX_WORKERS, (os.cpu_count() or 4) * 2)  # 片段检查调度器常驻线程数（全局上限，所有直播共用）
+PROBE_METRICS_INTERVAL = 300  # 检查调度器指标日志间隔秒数
+# 跨文件夹去重（断线重连后的重放片段）
+DEDUP_TTL = 43200                  # 指纹保留秒数（12 小时）
+DEDUP_MAX_PER_MEMBER = 20000       # 每个成员最多保留的指纹数
+DEDUP_FINGERPRINT_MODE = "sparse"  # "sparse": 开头/中间/结尾各取样; "head": 读开头 512KB
+DEDUP_SAMPLE_BYTES = 64 * 1024     # sparse 模式每段取样字节数
 LIVE_CHECK_INTERVAL = 90  # 直播中检查文件的间隔秒数
 MIN_FILES_FOR_CHECK = 5  # 开始检查的最小文件数量
 FILE_STABLE_TIME = 5  # 文件稳定时间（秒），超过这个时间没修改的文件才检查
 FINAL_INACTIVE_THRESHOLD = 60  # 1分钟文件无活动才确认结束（秒）
+LIFECYCLE_DB_RECHECK_INTERVAL = 10  # 两轮之间片段已静默的直播，最多每隔多少秒补查一次数据库（秒）
 
 # 多文件夹处理配置
 PROCESS_ALL_FOLDERS = True  # 是否处理所有文件夹（True）还是只处理最新的（False）
 MAX_CONCURRENT_FOLDERS_PER_LIVE = 50  # 最大同时处理的文件夹数量（防止内存占用过多）
 FOLDER_CLEANUP_DELAY = 120  # 完成的文件夹状态保留时间（秒），防止重复处理
+# 片段索引 (recorder/fragment_watcher.py)：用 inotify 事件代替每轮 glob + stat
+FRAGMENT_WATCH_BACKEND = 'auto'  # 'auto'(优先 inotify) / 'inotify' / 'poll'(scandir 回退) / 'off'(旧的 glob 扫描)
+FRAGMENT_RESCAN_INTERVAL = 300  # 全量重扫兜底间隔（秒）
+FRAGMENT_FAST_CHECK_INTERVAL = 3  # 两轮之间多久处理一次片段事件，新写完的片段在几秒内检查（秒）
+# 直播场次索引 (recorder/stream_index.py)：断线重连产生的多个文件夹归为同一场
+STREAM_INDEX_FILE = PARENT_DIR / ".stream_sessions.json"  # 场次索引持久化文件（4C 上为 INCOMING_DIR 下同名文件）
+STREAM_GROUP_GAP = 300             # 前一文件夹最后片段与后一文件夹第一个片段相差小于该秒数视为同一场
+STREAM_GROUP_FALLBACK_GAP = 14400  # 没有片段时按文件夹 ctime 相差判断（秒）
 
 # ============================================================
 # 4. 视频合并与字幕配置 (FFmpeg/FFprobe)
@@ -97,6 +113,13 @@ MERGE_LOCK_TIMEOUT = 300
 FFMPEG_LOGLEVEL = "error"
 FFMPEG_HIDE_BANNER = True
 FFPROBE_TIMEOUT = 3
+# 片段检查方式: "python" 进程内解析 PAT/PMT/PES（判断不了的片段再交给 ffprobe）, "ffprobe" 每个片段都跑 ffprobe
+TS_VALIDATOR = "python"
+PROBE_CACHE_SIZE = 1024          # 共享 ffprobe 探测结果缓存条数（按 路径+大小+mtime）
+STREAM_HEIGHT_CACHE_SIZE = 256   # 直播场次分辨率缓存条数
+# 滚动合并：直播中就把有效片段按顺序追加到中间 TS 文件，结束后只需封装一次（直播期间多占一份片段大小的磁盘）
+ROLLING_MERGE = True
+ROLLING_MERGE_DIR = OUTPUT_DIR / ".rolling"
 
 # 字幕合并配置
 TEMP_MERGED_DIR = PARENT_DIR / "temp_merged"  # 临时合并文件目录
@@ -229,6 +252,60 @@ FILE_INACTIVITY_THRESHOLD = 120 #文件不活动触发重启的阈值（秒）
 SHOWROOM_SCRIPT_DIR = Path("/home/ubuntu/showroom")
 SHOWROOM_SCRIPT_PATH = SHOWROOM_SCRIPT_DIR / "showroom.py"
 
+# LIVE_STATUS 差分写入：只 MERGE 状态变化的成员，其余成员低频批量刷新 CHECK_TIME
+DB_DELTA_WRITE = True
+DB_HEARTBEAT_INTERVAL = 60     # 未变化成员刷新 CHECK_TIME 的间隔（秒）
+
+# LIVE_STATUS 写入管道：asyncio 有界队列 + 微批次，满行数或到时间即提交
+DB_QUEUE_MAXSIZE = 1000         # 队列上限，满了以后轮询端等待（反压）
+DB_BATCH_MAX_ROWS = 300         # 每批最多行数（按 member_id 合并后）
+DB_BATCH_MAX_DELAY = 0.25       # 每批从第一条入队起最多等待秒数
+
+# 自适应轮询：按 SHOWROOM_LIVE_HISTORY 的开播规律分级调整每个成员的检查频率
+ADAPTIVE_POLLING = True
+POLL_INTERVAL_LIVE = 5          # 直播中/刚下播的成员
+POLL_INTERVAL_HOT = 5           # 当前时段大概率开播的成员
+POLL_INTERVAL_WARM = 15         # 当前时段偶尔开播/近期活跃的成员
+POLL_INTERVAL_DORMANT_MIN = 30  # 休眠成员（越久没开播越接近上限）
+POLL_INTERVAL_DORMANT_MAX = 60
+POLL_MAX_LATENCY = 60           # 任何成员两次检查之间的硬上限（秒）
+POLL_HOT_PROBABILITY = 0.2      # 当前时段开播概率阈值
+POLL_WARM_PROBABILITY = 0.05
+POLL_HISTORY_DAYS = 60          # 统计开播规律的历史窗口（天）
+POLL_HISTORY_REFRESH = 3600     # 重新加载开播历史的间隔（秒）
+
+# onlives 批量发现：每轮 1 次 /api/live/onlives 请求代替全员单房间请求，
+# 只对新开播/疑似下播的成员发单房间请求确认（同时拿到 started_at）
+ONLIVES_DISCOVERY = False
+ONLIVES_VERIFY_INTERVAL = 60    # 每个成员至少每隔多久做一次单房间校验（防止 onlives 漏项）
+
+# 出口 IP 池：按健康度与速率选择 IP，被限流的 IP 自动隔离，探测成功后重新启用
+IP_POOL_ENABLED = True
+IP_RATE_PER_SECOND = 3.0        # 单 IP 令牌桶速率（请求/秒）
+IP_RATE_BURST = 5               # 单 IP 令牌桶容量
+IP_HEALTH_WINDOW = 300          # 健康统计滑动窗口（秒）
+IP_MIN_SUCCESS_RATE = 0.6       # 窗口成功率低于该值时隔离
+IP_QUARANTINE_SECONDS = 60      # 首次隔离时长（秒），再次隔离时翻倍
+IP_QUARANTINE_MAX = 900         # 隔离时长上限（秒）
+
+# 录制器放置：遵守 MAX_CAPACITY 与心跳，按录制器上报的资源指标（ADMIN.INSTANCE_METRICS）加权
+PLACEMENT_MODE = 'resource'             # least_loaded / capacity / resource
+RECORDER_HEARTBEAT_TIMEOUT = 180        # 录制器心跳超过该秒数视为失联，不再分配
+RECORDER_METRICS_INTERVAL = 30          # 录制器上报心跳与资源指标的间隔（秒）
+RECORDER_MIN_FREE_DISK_GB = 20          # 录制器剩余磁盘低于该值时不再分配
+RECORDER_BANDWIDTH_BUDGET_MB = 50       # 单台录制器写入带宽预算（MB/s），用于归一化
+PLACEMENT_STICKY = True                 # 断线重连时优先回到上次的录制器
+PLACEMENT_STICKY_SECONDS = 1800         # 下播后多久内重新开播仍视为重连
+
+# 多检测器分片：按 ADMIN.INSTANCES 中心跳未过期的检测器做一致性哈希
+SHARD_VNODES = 128                      # 每个检测器在哈希环上的虚拟节点数
+SHARD_REFRESH_INTERVAL = 15             # 续约心跳并重算分片的间隔（秒）
+SHARD_HANDOFF_GRACE = 30                # 失去的成员继续轮询多久再放手（秒），应不小于刷新间隔
+MONITOR_HEARTBEAT_TIMEOUT = 45          # 检测器心跳超过该秒数视为退出，其成员由其它实例接管
+
+# 成员配置增量刷新：每隔该秒数探测一次成员表版本，只有变化的成员才重新加载
+MEMBER_RELOAD_INTERVAL = 60
+
 # ============================================================
 # 9. 数据库辅助函数
 # ============================================================
@@ -332,4 +409,25 @@ MAIN_MEMBER_ID = "hashimoto_haruna"
 # === 4C 专用路径配置 ===
 INCOMING_DIR = Path("/mnt/video/data/incoming_ts")   # 3C 传过来的源
 PROCESSED_DIR = Path("/mnt/video/data/processed_ts") # 拉伸后的存放地
+UPSCALE_WORKERS = None            # 并发编码数（None: CPU 核数 / 2）
+UPSCALE_THREADS_PER_JOB = None    # 每个编码的 x264 线程数（None: CPU 核数 / 并发编码数）
+UPSCALE_STATE_FILE = PROCESSED_DIR / ".upscale_jobs.json"  # 拉伸任务状态持久化文件
+UPSCALE_METRICS_INTERVAL = 600    # 拉伸吞吐指标日志间隔秒数
+UPSCALE_PIPELINE = "pipe"         # "pipe": 拼接与编码之间走管道，不写 pre_merge 中间文件; "two_pass": 旧的两步流程
+UPSCALE_CHUNK_FRAGMENTS = 60      # 每个拉伸 chunk 的片段数（按序号网格对齐，直播中写满一格就拉伸）
+UPSCALE_CHUNK_SETTLE = 5          # 最大序号越过一格末尾多少个之后才拉伸这一格（等乱序到达的片段）
+UPSCALE_CHUNK_GAP_STABLE = 60     # 格内有缺号时，缺口持续多少秒（按片段到达时间）才在缺口处切开
+# 每场直播的编码参数（encode_profile.py）：源高度 ≥ UPSCALE_NATIVE_HEIGHT 时不拉伸，只封装
+UPSCALE_NATIVE_HEIGHT = 720
+UPSCALE_TARGET = (1920, 1080)
+UPSCALE_SCALER = "lanczos"
+UPSCALE_HIGH_CPU_THREADS = 4      # 每个编码分到的线程数 ≥ 该值时用 'high' 档
+UPSCALE_PROFILE_TABLE = [
+    # 源高度上限（含）→ 各 CPU 档位的 (preset, CRF)
+    {'max_height': 480, 'low': ('ultrafast', 18), 'high': ('superfast', 18)},
+    {'max_height': 719, 'low': ('ultrafast', 20), 'high': ('superfast', 20)},
+]
+# bench_encode.py 在本机跑出的结果（有时优先于上表）：SSIM 不低于最佳结果 ENCODE_MAX_SSIM_DROP 的最快参数
+ENCODE_BENCH_FILE = Path("~/encode_bench.json").expanduser()
+ENCODE_MAX_SSIM_DROP = 0.01
 OUTPUT_DIR = Path("/mnt/video/merged")               # 合并后的 MP4
\ No newline at end of file
@@ -12,6 +12,7 @@ import sys
 import json
 import time
 import logging
+import threading
 import cx_Oracle
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
@@ -62,102 +63,276 @@ def get_db_pool():
     return _db_pool
 
 
+# ============================================
+# 成员注册表（增量刷新）
+# ============================================
+# 一次查询取全部成员 + 一次批量取 tags（替代每个成员两次额外查询）；
+# CLOB 直接按字符串取回，不再逐行 .read()
+_MEMBERS_SQL = """
+    SELECT 
+        m.ID,
+        m.MEMBER_ID,
+        m.ROOM_ID,
+        m.NAME_JP,
+        m.NAME_EN,
+        m.TEAM,
+        m.ROOM_URL_KEY,
+        m.ENABLED,
+        g.NAME as GROUP_NAME,
+        yc.TITLE_TEMPLATE,
+        yc.DESCRIPTION_TEMPLATE,
+        yc.CATEGORY_ID,
+        yc.PRIVACY_STATUS,
+        yc.PLAYLIST_ID,
+        yc.USE_PRIMARY_ACCOUNT
+    FROM ADMIN.MEMBERS m
+    JOIN ADMIN.GROUPS g ON m.GROUP_ID = g.ID
+    LEFT JOIN ADMIN.YOUTUBE_CONFIGS yc ON m.ID = yc.MEMBER_ID
+"""
+
+# 增量条件：行所在块的 SCN 超过水位线（ORA_ROWSCN 对所有表都可用，不需要额外的 UPDATED_AT 列）
+_CHANGED_WHERE = """
+    WHERE m.ORA_ROWSCN > :scn
+       OR g.ORA_ROWSCN > :scn
+       OR yc.ORA_ROWSCN > :scn
+       OR m.ID IN (SELECT t.MEMBER_ID FROM ADMIN.YOUTUBE_TAGS t WHERE t.ORA_ROWSCN > :scn)
+"""
+
+# 版本探测：一次往返拿到水位线与行数（行数变化说明有删除，做一次全量加载）
+_VERSION_SQL = """
+    SELECT 
+        GREATEST(
+            NVL((SELECT MAX(ORA_ROWSCN) FROM ADMIN.MEMBERS), 0),
+            NVL((SELECT MAX(ORA_ROWSCN) FROM ADMIN.GROUPS), 0),
+            NVL((SELECT MAX(ORA_ROWSCN) FROM ADMIN.YOUTUBE_CONFIGS), 0),
+            NVL((SELECT MAX(ORA_ROWSCN) FROM ADMIN.YOUTUBE_TAGS), 0)
+        ),
+        (SELECT COUNT(*) FROM ADMIN.MEMBERS),
+        (SELECT COUNT(*) FROM ADMIN.YOUTUBE_CONFIGS),
+        (SELECT COUNT(*) FROM ADMIN.YOUTUBE_TAGS)
+    FROM DUAL
+"""
+
+
+def _clob_as_string(cursor, name, default_type, size, precision, scale):
+    """把 CLOB 列直接取成字符串，避免每行一次 LOB 往返"""
+    if default_type == cx_Oracle.DB_TYPE_CLOB:
+        return cursor.var(cx_Oracle.DB_TYPE_LONG, arraysize=cursor.arraysize)
+
+
+def build_member(row, tags: List[str]) -> Dict:
+    """
+    由查询行构建成员字典(与YAML格式一致)，并预先计算派生字段:
+        group_name / team_name: TEAM 按第一个空格拆分（原来在检测器每轮重算）
+        name_tokens: 英文名小写分词，用于匹配录制文件夹
+    """
+    (db_id, member_id, room_id, name_jp, name_en, team, room_url_key, enabled, group,
+     title_template, description_template, category_id, privacy_status, playlist_id, use_primary) = row
+    team = team or ''
+    team_parts = team.split(" ", 1)
+    name_en = name_en or ''
+    return {
+        'id': member_id,
+        'room_id': room_id,
+        'name_jp': name_jp,
+        'name_en': name_en,
+        'team': team,
+        'enabled': bool(enabled),
+        'room_url_key': room_url_key,  # 为空时由 status_poller 用 generate_key 生成
+        'db_id': db_id,
+        'group_name': team_parts[0] if len(team_parts) > 0 else "",
+        'team_name': team_parts[1] if len(team_parts) > 1 else "",
+        'name_tokens': tuple(name_en.lower().split()),
+        'youtube': {
+            'title_template': title_template or '',
+            'description_template': description_template or '',
+            'tags': tags,
+            'category_id': category_id or '22',
+            'privacy_status': privacy_status or 'public',
+            'playlist_id': playlist_id or '',
+            'use_primary_account': bool(use_primary)
+        }
+    }
+
+
+class MemberRegistry:
+    """
+    启用成员的内存注册表
+        refresh():      探测版本，没有变化时只有一次轻量查询；有变化时只取变化的成员
+        subscribe(cb):  成员变化时回调 cb(added, updated, removed)（三个 member_id 集合）
+        members():      按组名 / 英文名排序的启用成员列表
+    """
+
+    def __init__(self, check_interval: float = 60, full_reload_interval: float = 1800):
+        """
+        参数:
+            check_interval: maybe_refresh() 的最小探测间隔（秒）
+            full_reload_interval: 兜底的全量加载间隔（秒）
+        """
+        self.check_interval = check_interval
+        self.full_reload_interval = full_reload_interval
+        self.version = 0                  # 每次成员集合变化加 1
+
+        self._lock = threading.RLock()
+        self._members = {}                # {member_id: member}，包含未启用的成员
+        self._order_keys = {}             # {member_id: (组名, 英文名)}，与原查询的 ORDER BY 一致
+        self._ordered = []                # 启用成员的有序列表（只读快照）
+        self._subscribers = []
+        self._scn = None                  # 上次加载时的水位线
+        self._counts = None               # 上次加载时各表行数
+        self._last_check = 0
+        self._last_full = 0
+        self.stats = {'checks': 0, 'full_loads': 0, 'incremental_loads': 0, 'rows_fetched': 0}
+
+    # ========================= 读取 =========================
+
+    def members(self) -> List[Dict]:
+        return self._ordered
+
+    def get(self, member_id: str) -> Optional[Dict]:
+        member = self._members.get(member_id)
+        return member if member and member['enabled'] else None
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    # ========================= 刷新 =========================
+
+    def maybe_refresh(self, now: float = None) -> bool:
+        """距上次探测超过 check_interval 时刷新；返回成员是否变化"""
+        now = now if now is not None else time.time()
+        if self._scn is not None and now - self._last_check < self.check_interval:
+            return False
+        return self.refresh(now=now)
+
+    def refresh(self, force_full: bool = False, now: float = None) -> bool:
+        """探测版本并按需加载；数据库不可用时保留现有成员，返回 False"""
+        now = now if now is not None else time.time()
+        pool = get_db_pool()
+        if not pool:
+            logging.error("无法连接数据库,保留当前成员列表")
+            return False
+
+        with self._lock:
+            self._last_check = now
+            self.stats['checks'] += 1
+            try:
+                with pool.acquire() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(_VERSION_SQL)
+                        row = cursor.fetchone()
+                        scn, counts = row[0], tuple(row[1:])
+
+                        full = (force_full or self._scn is None or counts != self._counts
+                                or now - self._last_full >= self.full_reload_interval)
+                        if not full and scn == self._scn:
+                            return False
+
+                        cursor.outputtypehandler = _clob_as_string
+                        if full:
+                            fetched = self._fetch(cursor, None)
+                        else:
+                            fetched = self._fetch(cursor, self._scn)
+            except Exception as e:
+                logging.error(f"✗ 从数据库加载成员失败: {e}")
+                import traceback
+                traceback.print_exc()
+                return False
+
+            if full:
+                self._last_full = now
+                self.stats['full_loads'] += 1
+            else:
+                self.stats['incremental_loads'] += 1
+            self.stats['rows_fetched'] += len(fetched)
+            self._scn, self._counts = scn, counts
+            return self._apply(fetched, full)
+
+    def _fetch(self, cursor, since_scn) -> Dict[str, Dict]:
+        """取成员与 tags（since_scn 为 None 时全量），返回 {member_id: member}"""
+        params = {}
+        sql = _MEMBERS_SQL
+        if since_scn is not None:
+            sql += _CHANGED_WHERE
+            params['scn'] = since_scn
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        if not rows:
+            return {}
+
+        # 一次批量取 tags（增量时只取变化成员的）
+        tags_by_db_id = {}
+        tags_sql = "SELECT t.MEMBER_ID, t.TAG FROM ADMIN.YOUTUBE_TAGS t"
+        if since_scn is not None:
+            tags_sql += f" WHERE t.MEMBER_ID IN (SELECT m.ID FROM ADMIN.MEMBERS m JOIN ADMIN.GROUPS g ON m.GROUP_ID = g.ID LEFT JOIN ADMIN.YOUTUBE_CONFIGS yc ON m.ID = yc.MEMBER_ID {_CHANGED_WHERE})"
+        cursor.execute(tags_sql + " ORDER BY t.MEMBER_ID, t.SORT_ORDER", params)
+        for db_id, tag in cursor.fetchall():
+            tags_by_db_id.setdefault(db_id, []).append(tag)
+
+        fetched = {}
+        for row in rows:
+            member = build_member(row, tags_by_db_id.get(row[0], []))
+            fetched[member['id']] = member
+            self._order_keys[member['id']] = (row[8] or '', member['name_en'])
+        return fetched
+
+    def _apply(self, fetched: Dict[str, Dict], full: bool) -> bool:
+        """合并加载结果，计算变化并通知订阅者"""
+        old = self._members
+        new = dict(fetched) if full else dict(old, **fetched)
+
+        enabled_old = {k for k, m in old.items() if m['enabled']}
+        enabled_new = {k for k, m in new.items() if m['enabled']}
+        added = enabled_new - enabled_old
+        removed = enabled_old - enabled_new
+        updated = {k for k in enabled_new & enabled_old
+                   if k in fetched and fetched[k] != old[k]}
+
+        self._members = new
+        if not (added or removed or updated):
+            if full and not old:
+                logging.info("✓ 从数据库加载了 0 个启用的成员")
+            return False
+
+        self._ordered = sorted((m for m in new.values() if m['enabled']),
+                               key=lambda m: self._order_keys.get(m['id'], ('', '')))
+        self.version += 1
+        if old:
+            logging.info(f"✓ 成员配置变化: +{len(added)} ~{len(updated)} -{len(removed)} (共 {len(self._ordered)} 个启用)")
+        else:
+            logging.info(f"✓ 从数据库加载了 {len(self._ordered)} 个启用的成员")
+
+        for callback in list(self._subscribers):
+            try:
+                callback(added, updated, removed)
+            except Exception as e:
+                logging.error(f"成员变化回调失败: {e}")
+        return True
+
+
+_registry = None
+
+
+def get_member_registry() -> MemberRegistry:
+    """进程内共享的成员注册表"""
+    global _registry
+    if _registry is None:
+        _registry = MemberRegistry(check_interval=_cache_ttl)
+    return _registry
+
+
 def load_members_from_db() -> Tuple[List[Dict], Dict]:
     """
-    从数据库加载成员配置
+    从数据库加载成员配置（全量）
     
     返回:
         (all_enabled_members, global_templates)
         - all_enabled_members: 启用的成员列表
         - global_templates: 全局模板字典(暂时为空,保持兼容性)
     """
-    all_enabled_members = []
-    global_templates = {}
-    
-    pool = get_db_pool()
-    if not pool:
-        logging.error("无法连接数据库,返回空成员列表")
-        return all_enabled_members, global_templates
-    
-    try:
-        with pool.acquire() as conn:
-            with conn.cursor() as cursor:
-                # 查询所有启用的成员及其完整配置
-                cursor.execute("""
-                    SELECT 
-                        m.MEMBER_ID,
-                        m.ROOM_ID,
-                        m.NAME_JP,
-                        m.NAME_EN,
-                        m.TEAM,
-                        m.ROOM_URL_KEY,
-                        g.NAME as GROUP_NAME,
-                        yc.TITLE_TEMPLATE,
-                        yc.DESCRIPTION_TEMPLATE,
-                        yc.CATEGORY_ID,
-                        yc.PRIVACY_STATUS,
-                        yc.PLAYLIST_ID,
-                        yc.USE_PRIMARY_ACCOUNT
-                    FROM ADMIN.MEMBERS m
-                    JOIN ADMIN.GROUPS g ON m.GROUP_ID = g.ID
-                    LEFT JOIN ADMIN.YOUTUBE_CONFIGS yc ON m.ID = yc.MEMBER_ID
-                    WHERE m.ENABLED = 1
-                    ORDER BY g.NAME, m.NAME_EN
-                """)
-                
-                members_data = cursor.fetchall()
-                
-                for row in members_data:
-                    member_db_id_query = """
-                        SELECT ID FROM ADMIN.MEMBERS WHERE MEMBER_ID = :member_id
-                    """
-                    cursor.execute(member_db_id_query, {'member_id': row[0]})
-                    member_db_id = cursor.fetchone()[0]
-                    
-                    # 获取tags
-                    cursor.execute("""
-                        SELECT TAG 
-                        FROM ADMIN.YOUTUBE_TAGS
-                        WHERE MEMBER_ID = :member_id
-                        ORDER BY SORT_ORDER
-                    """, {'member_id': member_db_id})
-                    
-                    tags = [tag[0] for tag in cursor.fetchall()]
-                    
-                    # 读取CLOB字段
-                    title_template = row[7].read() if row[7] else ''
-                    description_template = row[8].read() if row[8] else ''
-                    
-                    # 构建成员字典(与YAML格式完全一致)
-                    member = {
-                        'id': row[0],
-                        'room_id': row[1],
-                        'name_jp': row[2],
-                        'name_en': row[3],
-                        'team': row[4],
-                        'enabled': True,  # 查询已经过滤了enabled=1
-                        'room_url_key': row[5],
-                        'youtube': {
-                            'title_template': title_template,
-                            'description_template': description_template,
-                            'tags': tags,
-                            'category_id': row[9] or '22',
-                            'privacy_status': row[10] or 'public',
-                            'playlist_id': row[11] or '',
-                            'use_primary_account': bool(row[12])
-                        }
-                    }
-                    
-                    all_enabled_members.append(member)
-                
-                logging.info(f"✓ 从数据库加载了 {len(all_enabled_members)} 个启用的成员")
-    
-    except Exception as e:
-        logging.error(f"✗ 从数据库加载成员失败: {e}")
-        import traceback
-        traceback.print_exc()
-    
-    return all_enabled_members, global_templates
+    registry = get_member_registry()
+    registry.refresh(force_full=True)
+    return registry.members(), {}
 
 
 def get_enabled_members() -> List[Dict]:
@@ -171,42 +346,27 @@ def get_enabled_members() -> List[Dict]:
     return members
 
 
-# 模块级缓存,避免每次都查数据库
-_cached_members = None
-_cache_timestamp = 0
-_cache_ttl = 60  # 缓存60秒
+# 注册表的探测间隔（秒）
+_cache_ttl = 60
 
 
 def load_members_from_db_cached() -> Tuple[List[Dict], Dict]:
     """
-    从数据库加载成员配置(带缓存)
+    从数据库加载成员配置(增量)
+    超过 _cache_ttl 秒才探测一次版本，没有变化时不重新取数据
     
     返回:
         (all_enabled_members, global_templates)
     """
-    global _cached_members, _cache_timestamp
-    
-    import time
-    current_time = time.time()
-    
-    # 如果缓存有效,直接返回
-    if _cached_members is not None and (current_time - _cache_timestamp) < _cache_ttl:
-        return _cached_members
-    
-    # 否则重新加载
-    result = load_members_from_db()
-    _cached_members = result
-    _cache_timestamp = current_time
-    
-    return result
+    registry = get_member_registry()
+    registry.maybe_refresh()
+    return registry.members(), {}
 
 
 # 为了方便,提供一个刷新缓存的函数
 def refresh_members_cache():
-    """强制刷新成员缓存"""
-    global _cached_members, _cache_timestamp
-    _cached_members = None
-    _cache_timestamp = 0
+    """强制全量刷新成员"""
+    get_member_registry().refresh(force_full=True)
     return load_members_from_db_cached()
 
 
@@ -223,5 +383,10 @@ if __name__ == "__main__":
         if 'youtube' in member:
             print(f"    YouTube标签: {', '.join(member['youtube']['tags'][:3])}")
     
+    registry = get_member_registry()
+    start = time.time()
+    changed = registry.refresh()
+    print(f"\n增量刷新: 变化={changed}, 耗时 {(time.time() - start) * 1000:.1f}ms, 统计 {registry.stats}")
+    
     if len(members) > 5:
         print(f"  ... 还有 {len(members) - 5} 个成员")
\ No newline at end of file
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+共享的 ffprobe 探测服务
+checker.py / sync_module.py / upscaler.py / upload_oracle_bucket_wallet.py 都通过这里探测文件，
+每个文件只跑一次 ffprobe (-show_streams -show_format -of json)，结果按 (路径, 大小, mtime) 缓存
+
+    - 有界 LRU：超过 max_entries 时淘汰最久没用的记录，长时间运行也不会无限增长
+    - 文件大小或 mtime 变化（还在写入的片段、被覆盖的视频）即视为新文件，重新探测
+    - ffprobe 跑完但没有解析出流的结果也缓存（同一个坏文件不会反复探测）；
+      超时、文件不存在、找不到 ffprobe 等临时错误直接抛异常，不缓存
+
+本模块不依赖 config.py，缓存大小由第一个调用 get_probe_service() 的模块决定
+"""
+
+import os
+import json
+import logging
+import threading
+import subprocess
+from pathlib import Path
+from collections import OrderedDict
+
+
+class LRUCache:
+    """线程安全的有界 LRU 字典"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max(1, int(max_entries))
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def _fraction(value):
+    """'30000/1001' → 29.97；'0/0'、缺失或无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        if '/' in value:
+            num, den = value.split('/', 1)
+            return int(num) / int(den) if int(den) else None
+        return float(value)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _number(value, kind=float):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class StreamInfo:
+    """单条流的探测结果"""
+
+    __slots__ = ('index', 'codec_type', 'codec_name', 'width', 'height',
+                 'fps', 'avg_fps', 'duration', 'start_pts', 'start_time')
+
+    def __init__(self, raw: dict):
+        self.index = _number(raw.get('index'), int)
+        self.codec_type = raw.get('codec_type')
+        self.codec_name = raw.get('codec_name')
+        self.width = _number(raw.get('width'), int)
+        self.height = _number(raw.get('height'), int)
+        self.fps = _fraction(raw.get('r_frame_rate'))
+        self.avg_fps = _fraction(raw.get('avg_frame_rate'))
+        self.duration = _number(raw.get('duration'))
+        self.start_pts = _number(raw.get('start_pts'), int)
+        self.start_time = _number(raw.get('start_time'))
+
+    def __repr__(self):
+        return f"StreamInfo({self.index}, {self.codec_type}, {self.codec_name})"
+
+
+class ProbeResult:
+    """
+    一个文件的探测结果
+        streams:   [StreamInfo, ...]
+        video / audio: 第一条视频 / 音频流（没有时为 None）
+        height / fps / duration / start_pts / codec: 常用字段的快捷方式（取第一条视频流）
+        error:     ffprobe 报错信息（没有流时多半有值）
+    """
+
+    def __init__(self, path: Path, streams: list, format_info: dict = None, error: str = None):
+        self.path = path
+        self.streams = streams
+        self.error = error
+        format_info = format_info or {}
+        self.format_duration = _number(format_info.get('duration'))
+        self.format_start_time = _number(format_info.get('start_time'))
+        self.video = next((s for s in streams if s.codec_type == 'video'), None)
+        self.audio = next((s for s in streams if s.codec_type == 'audio'), None)
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.streams)
+
+    @property
+    def has_video(self) -> bool:
+        return self.video is not None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio is not None
+
+    def indexes(self, codec_type: str) -> list:
+        return [s.index for s in self.streams if s.codec_type == codec_type]
+
+    @property
+    def codec(self):
+        return self.video.codec_name if self.video else None
+
+    @property
+    def height(self):
+        return self.video.height if self.video else None
+
+    @property
+    def fps(self):
+        """优先 r_frame_rate，为空时取 avg_frame_rate"""
+        if not self.video:
+            return None
+        return self.video.fps or self.video.avg_fps
+
+    @property
+    def duration(self):
+        if self.video and self.video.duration:
+            return self.video.duration
+        return self.format_duration
+
+    @property
+    def start_pts(self):
+        return self.video.start_pts if self.video else None
+
+    def __repr__(self):
+        return f"ProbeResult({self.path.name}, streams={self.streams}, error={self.error!r})"
+
+
+class ProbeService:
+    """ffprobe 调用 + 有界缓存（线程安全，检查线程池里并发调用）"""
+
+    def __init__(self, max_entries: int = 1024, timeout: float = 10,
+                 loglevel: str = "error", hide_banner: bool = True):
+        self.cache = LRUCache(max_entries)
+        self.timeout = timeout
+        self.loglevel = loglevel
+        self.hide_banner = hide_banner
+        self._stats_lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'errors': 0}
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def command(self, path: Path) -> list:
+        cmd = ["ffprobe"]
+        if self.hide_banner:
+            cmd.append("-hide_banner")
+        cmd.extend(["-v", self.loglevel, "-show_streams", "-show_format", "-of", "json", str(path)])
+        return cmd
+
+    def probe(self, path, timeout: float = None) -> ProbeResult:
+        """
+        探测文件（命中缓存时不启动子进程）
+        异常: FileNotFoundError（文件或 ffprobe 不存在）、subprocess.TimeoutExpired
+        """
+        path = Path(path)
+        st = os.stat(path)
+        key = (str(path), st.st_size, st.st_mtime_ns)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count('hits')
+            return cached
+        self._count('misses')
+
+        proc = subprocess.run(self.command(path), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              text=True, timeout=timeout or self.timeout)
+        try:
+            data = json.loads(proc.stdout or "{}")
+        except ValueError:
+            data = {}
+        streams = [StreamInfo(s) for s in data.get('streams', [])]
+        error = proc.stderr.strip() or (None if proc.returncode == 0 else f"ffprobe 返回码 {proc.returncode}")
+        if not streams:
+            self._count('errors')
+        result = ProbeResult(path, streams, data.get('format'), error)
+        self.cache.put(key, result)
+        return result
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_probe_service(max_entries: int = 1024, timeout: float = 10,
+                      loglevel: str = "error", hide_banner: bool = True) -> ProbeService:
+    """进程内共享的探测服务（参数只在第一次调用时生效）"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ProbeService(max_entries, timeout, loglevel, hide_banner)
+        return _service
+
+
+def probe(path, timeout: float = None) -> ProbeResult:
+    return get_probe_service().probe(path, timeout)
+
+
+if __name__ == "__main__":
+    # 用法: python probe_service.py 文件 [文件 ...]
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    service = get_probe_service()
+    for arg in sys.argv[1:]:
+        for _ in range(2):
+            result = service.probe(arg)
+        print(f"{arg}: 视频 {result.codec} {result.height}p {result.fps} fps, 时长 {result.duration}, "
+              f"起始 PTS {result.start_pts}, 音频 {result.audio.codec_name if result.audio else None}")
+    print(f"统计: {service.stats}, 缓存 {len(service.cache)} 条")
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+字幕（*comments.json）索引
+供 checker.py / checker_4c.py / github_pages_publisher.py 调用，代替每次查询都 rglob 整个字幕目录
+
+    - 第一次查询时遍历一次目录树；之后按目录 mtime 水位增量刷新：
+      只有 mtime 变了的目录（有文件增删）才重新列出，其余目录只 stat 一次
+    - 文件名按其中每个 6 位数字窗口分桶（日期一定落在某个窗口里），
+      查询 (日期, 成员名) 时只看该日期桶，再按成员名过滤，结果按时间戳排序后缓存，用 bisect 找最接近的
+    - 直播中的 comments.json 还在追加写入，ctime/mtime 在查询时对候选文件现取（候选通常只有几个）
+
+匹配规则与原来的 rglob 版本一致:
+    文件名包含日期和成员名；时间戳取去掉日期后的第一个 6 位数字
+
+本模块不依赖 config.py
+"""
+
+import os
+import re
+import time
+import bisect
+import logging
+import threading
+from pathlib import Path
+from collections import defaultdict
+
+_SIX_DIGITS = re.compile(r'(\d{6})')
+_DIGIT_RUN = re.compile(r'\d{6,}')
+
+
+def _date_windows(stem: str) -> set:
+    """文件名中所有 6 位数字窗口（长度超过 6 的数字串取每个偏移）"""
+    windows = set()
+    for run in _DIGIT_RUN.findall(stem):
+        for i in range(len(run) - 5):
+            windows.add(run[i:i + 6])
+    return windows
+
+
+class SubtitleIndex:
+    """某个字幕根目录下所有 *comments.json 的索引（线程安全）"""
+
+    def __init__(self, root: Path, suffix: str = "comments.json", min_refresh_interval: float = 5):
+        self.root = Path(root)
+        self.suffix = suffix
+        self.min_refresh_interval = min_refresh_interval
+        self._dirs = {}                       # {dir: (mtime_ns, [子目录], [字幕文件])}
+        self._by_date = defaultdict(set)      # {6位数字: {path}}
+        self._queries = {}                    # {(date, name): (version, [(s_time, path)], [path])}
+        self._version = 0
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'refreshes': 0, 'listed_dirs': 0, 'files': 0, 'queries': 0}
+
+    # ---------------- 刷新 ----------------
+
+    def refresh(self, force: bool = False):
+        """按目录 mtime 增量刷新（min_refresh_interval 内重复调用直接返回）"""
+        with self._lock:
+            now = time.time()
+            if not force and now - self._last_refresh < self.min_refresh_interval:
+                return
+            self._last_refresh = now
+            self.stats['refreshes'] += 1
+            seen = set()
+            self._walk(self.root, seen)
+            for gone in [d for d in self._dirs if d not in seen]:
+                self._drop_dir(gone)
+
+    def _walk(self, directory: Path, seen: set):
+        try:
+            mtime_ns = directory.stat().st_mtime_ns
+        except OSError:
+            return
+        seen.add(directory)
+        cached = self._dirs.get(directory)
+        if cached is None or cached[0] != mtime_ns:
+            subdirs, files = [], []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(Path(entry.path))
+                            elif entry.name.endswith(self.suffix):
+                                files.append(Path(entry.path))
+                        except OSError:
+                            continue
+            except OSError:
+                return
+            self.stats['listed_dirs'] += 1
+            if cached is not None:
+                self._remove_files(set(cached[2]) - set(files))
+            self._add_files(set(files) - set(cached[2] if cached else ()))
+            cached = self._dirs[directory] = (mtime_ns, subdirs, files)
+        for subdir in cached[1]:
+            self._walk(subdir, seen)
+
+    def _add_files(self, paths):
+        for path in paths:
+            for window in _date_windows(path.stem):
+                self._by_date[window].add(path)
+            self.stats['files'] += 1
+        if paths:
+            self._version += 1
+
+    def _remove_files(self, paths):
+        for path in paths:
+            for window in _date_windows(path.stem):
+                bucket = self._by_date.get(window)
+                if bucket:
+                    bucket.discard(path)
+            self.stats['files'] -= 1
+        if paths:
+            self._version += 1
+
+    def _drop_dir(self, directory: Path):
+        cached = self._dirs.pop(directory, None)
+        if cached:
+            self._remove_files(set(cached[2]))
+
+    # ---------------- 查询 ----------------
+
+    def _candidates(self, date: str, name: str):
+        """(按时间戳排序的 [(s_time, path)], 该日期+成员的全部文件)"""
+        key = (date, name)
+        with self._lock:
+            cached = self._queries.get(key)
+            if cached and cached[0] == self._version:
+                return cached[1], cached[2]
+            members = [p for p in self._by_date.get(date, ()) if name in p.stem]
+            timed = []
+            for path in members:
+                match = _SIX_DIGITS.search(path.stem.replace(date, "", 1))  # 排除掉日期后的第一个6位数字
+                if match:
+                    timed.append((int(match.group(1)), path))
+            timed.sort()
+            if len(self._queries) > 1024:
+                self._queries.clear()
+            self._queries[key] = (self._version, timed, members)
+            self.stats['queries'] += 1
+            return timed, members
+
+    def find_nearest(self, date: str, name: str, v_time: int, threshold: float):
+        """时间戳与 v_time 相差小于 threshold 的最接近的字幕: (path, diff)，没有时 (None, None)"""
+        self.refresh()
+        timed, _ = self._candidates(date, name)
+        if not timed:
+            return None, None
+        keys = [t for t, _ in timed]
+        i = bisect.bisect_left(keys, v_time)
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < len(timed):
+                diff = abs(v_time - timed[j][0])
+                if diff < threshold and (best is None or diff < best[1]):
+                    best = (timed[j][1], diff)
+        return best if best else (None, None)
+
+    def find_chain(self, date: str, name: str, v_time: int, initial_threshold: float,
+                   continuation_threshold: float) -> list:
+        """
+        第一个 JSON 按时间戳匹配，之后链式查找后续 JSON:
+        创建时间不早于当前 JSON、且与当前 JSON 最后修改时间相差小于 continuation_threshold 的最接近者
+        返回按创建时间排序的路径列表
+        """
+        first, _ = self.find_nearest(date, name, v_time, initial_threshold)
+        if not first:
+            return []
+        _, members = self._candidates(date, name)
+        times = {}
+        for path in members:
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            times[path] = (st.st_ctime, st.st_mtime)
+        if first not in times:
+            return []
+        by_ctime = sorted((ct, str(p), p) for p, (ct, _) in times.items())
+        ctimes = [item[0] for item in by_ctime]
+
+        matched = [first]
+        current = first
+        while True:
+            current_ctime, current_mtime = times[current]
+            lo = bisect.bisect_left(ctimes, max(current_ctime, current_mtime - continuation_threshold))
+            hi = bisect.bisect_right(ctimes, current_mtime + continuation_threshold)
+            next_json, min_time_diff = None, None
+            for ctime, _, path in by_ctime[lo:hi]:
+                if path in matched:
+                    continue
+                time_diff = abs(ctime - current_mtime)
+                if time_diff < continuation_threshold and (min_time_diff is None or time_diff < min_time_diff):
+                    next_json, min_time_diff = path, time_diff
+            if not next_json:
+                break
+            matched.append(next_json)
+            logging.debug(f"找到后续 JSON: {next_json.name} (间隔 {min_time_diff:.0f}秒)")
+            current = next_json
+        matched.sort(key=lambda p: times[p][0])
+        return matched
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_subtitle_index(root: Path) -> SubtitleIndex:
+    """每个字幕根目录一个进程内共享的索引"""
+    root = Path(root)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = SubtitleIndex(root)
+        return index
+
+
+if __name__ == "__main__":
+    # 自检 + 小基准：与 rglob 逐个匹配的旧逻辑结果一致，且刷新只列出有变化的目录
+    import sys
+    import shutil
+    import tempfile
+
+    def legacy_nearest(root, v_date, v_name, v_time, threshold):
+        best, min_diff = None, 999999
+        for sub_file in root.rglob("*comments.json"):
+            sub_name = sub_file.stem
+            if v_date in sub_name and v_name in sub_name:
+                m = re.search(r'(\d{6})', sub_name.replace(v_date, "", 1))
+                if m:
+                    diff = abs(v_time - int(m.group(1)))
+                    if diff < threshold and diff < min_diff:
+                        best, min_diff = sub_file, diff
+        return best
+
+    tmp = Path(tempfile.mkdtemp(prefix="subtitle_index_"))
+    try:
+        members = ["Haruna Hashimoto", "小栗有以", "Yui Oguri"]
+        days = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+        queries = []
+        for d in range(days):
+            date = f"25{(d // 28) + 1:02d}{(d % 28) + 1:02d}"
+            day_dir = tmp / date
+            day_dir.mkdir()
+            for m, member in enumerate(members):
+                hhmmss = 190000 + m * 1000
+                for part in range(3):
+                    t = hhmmss + part * 100
+                    (day_dir / f"{date} Showroom - {member} {t:06d} comments.json").write_text("[]")
+                queries.append((date, member, hhmmss + 30))
+
+        index = SubtitleIndex(tmp, min_refresh_interval=0)
+        start = time.perf_counter()
+        results = [index.find_nearest(date, member, v_time, 60)[0] for date, member, v_time in queries]
+        indexed = time.perf_counter() - start
+        for (date, member, v_time), found in zip(queries, results):
+            assert found == legacy_nearest(tmp, date, member, v_time, 60), (date, member)
+        start = time.perf_counter()
+        for date, member, v_time in queries[:20]:
+            legacy_nearest(tmp, date, member, v_time, 60)
+        legacy = (time.perf_counter() - start) / 20 * len(queries)
+        listed = index.stats['listed_dirs']
+        index.refresh(force=True)
+        assert index.stats['listed_dirs'] == listed, "没有变化时不应重新列目录"
+
+        chain = index.find_chain(queries[0][0], queries[0][1], queries[0][2], 60, 180)
+        assert len(chain) == 3, chain
+        print(f"✅ 自检通过: {len(queries)} 次查询, 索引 {indexed * 1000:.1f}ms vs rglob ≈{legacy * 1000:.0f}ms, "
+              f"统计 {index.stats}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -7,12 +7,16 @@ from pathlib import Path
 from config import (
     REMOTE_IP, REMOTE_PORT, REMOTE_VIDEO_DIR, 
     SYNC_MODE, MAIN_MEMBER_ID, 
-    SUBTITLES_SOURCE_ROOT
+    SUBTITLES_SOURCE_ROOT,
+    FFPROBE_TIMEOUT, FFMPEG_LOGLEVEL, FFMPEG_HIDE_BANNER,
+    PROBE_CACHE_SIZE, STREAM_HEIGHT_CACHE_SIZE
 )
+from probe_service import get_probe_service, LRUCache
 
 # ==================== 【全局缓存】 ====================
-# 改成按目录(直播场次)缓存
-_stream_height_cache = {}  # 格式: {"hashimoto_haruna_20250206": 720}
+# 单个文件的探测结果由共享探测服务缓存；这里只按目录(直播场次)缓存分辨率，两者都有上限
+probe_service = get_probe_service(PROBE_CACHE_SIZE, FFPROBE_TIMEOUT, FFMPEG_LOGLEVEL, FFMPEG_HIDE_BANNER)
+_stream_height_cache = LRUCache(STREAM_HEIGHT_CACHE_SIZE)  # 格式: {"/.../hashimoto_haruna_20250206": 720}
 
 def get_video_height_for_stream(stream_dir):
     """
@@ -23,18 +27,17 @@ def get_video_height_for_stream(stream_dir):
     cache_key = str(stream_dir)
     
     # 1. 查缓存
-    if cache_key in _stream_height_cache:
-        cached = _stream_height_cache[cache_key]
-        if isinstance(cached, int):
-            return cached
-        elif cached == 'FAILED':
-            return None
+    cached = _stream_height_cache.get(cache_key)
+    if isinstance(cached, int):
+        return cached
+    elif cached == 'FAILED':
+        return None
     
     # 2. 获取目录下所有 .ts 文件
     ts_files = sorted(stream_dir.glob("*.ts"))
     
     if not ts_files:
-        _stream_height_cache[cache_key] = 'FAILED'
+        _stream_height_cache.put(cache_key, 'FAILED')
         return None
     
     # 3. 尝试检测前5个文件
@@ -42,37 +45,12 @@ def get_video_height_for_stream(stream_dir):
     
     for i in range(max_attempts):
         test_file = ts_files[i]
-        
-        cmd = [
-            "ffprobe", 
-            "-v", "error", 
-            "-select_streams", "v:0", 
-            "-show_entries", "stream=height", 
-            "-of", "csv=p=0", 
-            str(test_file.resolve())
-        ]
-        
         try:
-            result = subprocess.run(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True, 
-                timeout=5
-            )
-            
-            if result.returncode == 0:
-                output = result.stdout.strip()
-                if output:
-                    # === 【关键修复:只取第一行】 ===
-                    first_line = output.split('\n')[0].strip()
-                    if first_line.isdigit():
-                        height = int(first_line)
-                        _stream_height_cache[cache_key] = height
-                        logging.info(f"✅ 分辨率: {stream_dir.name} = {height}p")
-                        return height
-                    # ================================
-            
+            height = probe_service.probe(test_file.resolve(), timeout=5).height
+            if height:
+                _stream_height_cache.put(cache_key, height)
+                logging.info(f"✅ 分辨率: {stream_dir.name} = {height}p")
+                return height
         except subprocess.TimeoutExpired:
             logging.debug(f"⏰ ffprobe 超时: {test_file.name}")
             continue
@@ -81,7 +59,7 @@ def get_video_height_for_stream(stream_dir):
             continue
     
     # 4. 所有文件都失败
-    _stream_height_cache[cache_key] = 'FAILED'
+    _stream_height_cache.put(cache_key, 'FAILED')
     logging.warning(f"⚠️ 分辨率检测失败(已尝试{max_attempts}个文件): {stream_dir.name}")
     return None
 
@@ -90,40 +68,16 @@ def get_video_height(file_path):
     """
     【工具】获取视频高度 (入口函数)
     - .ts 文件: 按目录检测(调用 get_video_height_for_stream)
-    - 其他文件: 按文件检测
+    - 其他文件: 按文件检测（结果由共享探测服务按 大小+mtime 缓存）
     """
     path_obj = Path(file_path)
     
     if path_obj.suffix == '.ts':
         # .ts 文件交给场次检测逻辑
         return get_video_height_for_stream(path_obj.parent)
-    else:
-        # 其他文件(如 .mp4)仍按原逻辑单独检测
-        cache_key = str(path_obj)
-        
-        if cache_key in _stream_height_cache:
-            cached = _stream_height_cache[cache_key]
-            return cached if isinstance(cached, int) else None
-        
-        # 单文件检测逻辑(保持原样)
-        cmd = [
-            "ffprobe", "-v", "error", 
-            "-select_streams", "v:0", 
-            "-show_entries", "stream=height", 
-            "-of", "csv=p=0", 
-            str(path_obj)
-        ]
-        try:
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=2)
-            output = result.stdout.strip()
-            if output and output.isdigit():
-                height = int(output)
-                _stream_height_cache[cache_key] = height
-                return height
-        except Exception:
-            pass
-        
-        _stream_height_cache[cache_key] = 'FAILED'
+    try:
+        return probe_service.probe(path_obj, timeout=2).height
+    except Exception:
         return None
 
 # ==================== 【裁判逻辑】 ====================
@@ -185,6 +139,10 @@ class RemoteSyncer:
         if len(self.synced_set) > 15000:
             self.synced_set.clear()
 
+    def mark_synced(self, local_path):
+        """记录已经同步过的文件（例如重启后从检查缓存恢复），审计时不再重复 rsync"""
+        self._mark_synced(str(local_path))
+
     def sync_to_4c(self, local_path, member_id=None):
         """同步单个文件到 4C"""
         if not REMOTE_IP or not REMOTE_PORT or SYNC_MODE == "off":
@@ -0,0 +1,14 @@
+"""
+测试公共设置
+recorder/ 与 monitor/ 里的脚本互相按模块名直接 import，这里把两个目录加进 sys.path
+被测模块都不依赖 config.py（不需要 cx_Oracle / 数据库）
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+for sub in ("recorder", "monitor"):
+    path = str(ROOT / sub)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,166 @@
+"""
+ip_pool.IPPoolManager
+用本地假 Showroom 服务器 (fake_showroom_server.py) 对指定来源地址限流，
+客户端分别绑定 127.0.0.x，请求经 StatusPoller.check_single_member 走与生产相同的路径
+"""
+
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from fake_showroom_server import FakeShowroomServer, make_rooms
+from ip_pool import IPPoolManager, HEALTHY, QUARANTINED
+from showroom_api import HttpxFetcher
+from status_poller import StatusPoller
+
+IPS = ["127.0.0.2", "127.0.0.3", "127.0.0.4", "127.0.0.5"]
+MEMBERS = [{'id': f"bench_{i:04d}", 'room_url_key': f"48_Bench_{i:04d}"} for i in range(4)]
+
+
+@pytest.fixture
+def server():
+    server = FakeShowroomServer(make_rooms(len(MEMBERS)), latency_median_ms=2, latency_sigma=0.1).start()
+    yield server
+    server.stop()
+
+
+def run_with_pool(server, scenario, ips=IPS, **pool_kwargs):
+    """建立绑定 ips 的客户端与 IP 池，运行 scenario(pool, poller)"""
+    async def main():
+        clients = []
+        for ip in ips:
+            client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(local_address=ip), timeout=5)
+            client._bound_ip = ip
+            clients.append(client)
+        pool = IPPoolManager(clients, **pool_kwargs)
+        poller = StatusPoller(clients, on_status=lambda *args: None,
+                              fetcher=HttpxFetcher(server.base_url), ip_pool=pool)
+        try:
+            return await scenario(pool, poller)
+        finally:
+            for client in clients:
+                await client.aclose()
+    return asyncio.run(main())
+
+
+async def poll(poller, count: int) -> list:
+    """顺序发出 count 个单房间请求"""
+    return [await poller.check_single_member(MEMBERS[i % len(MEMBERS)]) for i in range(count)]
+
+
+async def poll_until_quarantined(pool, poller, ip: str, limit: int = 500):
+    """一直请求到 ip 被隔离（被限流的 IP 权重下降后被选中的概率很低，次数不固定）"""
+    for i in range(limit):
+        if pool.stats_snapshot()[ip]['state'] == QUARANTINED:
+            return
+        await poller.check_single_member(MEMBERS[i % len(MEMBERS)])
+    raise AssertionError(f"{ip} 请求 {limit} 次后仍未被隔离")
+
+
+def test_throttled_ips_are_quarantined(server):
+    server.set_ip_rule("127.0.0.3", {"mode": "429"})
+    server.set_ip_rule("127.0.0.4", {"mode": "html"})
+
+    async def scenario(pool, poller):
+        await poll_until_quarantined(pool, poller, "127.0.0.3")
+        await poll_until_quarantined(pool, poller, "127.0.0.4")
+        await poll(poller, 40)
+        return pool.stats_snapshot()
+
+    snapshot = run_with_pool(server, scenario, rate_per_second=1000, burst=1000, max_consecutive_failures=3)
+    assert snapshot["127.0.0.3"]['state'] == QUARANTINED
+    assert snapshot["127.0.0.4"]['state'] == QUARANTINED
+    # 隔离后不再有请求落到被限流的地址上
+    assert server.requests_by_ip["127.0.0.3"] == 3
+    assert server.requests_by_ip["127.0.0.4"] == 3
+    assert snapshot["127.0.0.3"]['window_throttled'] == 3
+    assert snapshot["127.0.0.4"]['window_invalid_json'] == 3
+    assert snapshot["127.0.0.3"]['quarantine_remaining'] > 0
+    for ip in ("127.0.0.2", "127.0.0.5"):
+        assert snapshot[ip]['state'] == HEALTHY
+        assert snapshot[ip]['success_rate'] == 1.0
+        assert snapshot[ip]['latency_p50'] <= snapshot[ip]['latency_p99']
+    assert server.requests_by_ip["127.0.0.2"] + server.requests_by_ip["127.0.0.5"] >= 40
+
+
+def test_slow_ip_gets_less_traffic(server):
+    # 延迟下限 latency_floor 默认 50ms，额外延迟要明显超过它才会影响权重
+    server.set_ip_rule("127.0.0.5", {"extra_latency_ms": 200})
+
+    async def scenario(pool, poller):
+        await poll(poller, 120)
+        return pool.stats_snapshot()
+
+    snapshot = run_with_pool(server, scenario, rate_per_second=1000, burst=1000)
+    fast = [server.requests_by_ip[ip] for ip in IPS[:3]]
+    assert server.requests_by_ip["127.0.0.5"] < min(fast)
+    assert snapshot["127.0.0.5"]['weight'] < min(snapshot[ip]['weight'] for ip in IPS[:3])
+
+
+def test_probe_readmits_ip_once_throttling_stops(server):
+    server.set_ip_rule("127.0.0.3", {"mode": "429"})
+
+    async def scenario(pool, poller):
+        await poll_until_quarantined(pool, poller, "127.0.0.3")
+        quarantined = pool.stats_snapshot()["127.0.0.3"]
+        server.set_ip_rule("127.0.0.3", None)
+        await asyncio.sleep(0.25)
+        before = server.requests_by_ip["127.0.0.3"]
+        await poll(poller, 20)
+        return quarantined, pool.stats_snapshot()["127.0.0.3"], server.requests_by_ip["127.0.0.3"] - before
+
+    quarantined, readmitted, probes = run_with_pool(
+        server, scenario, rate_per_second=1000, burst=1000,
+        max_consecutive_failures=2, quarantine_seconds=0.2, probe_successes=2)
+    assert quarantined['state'] == QUARANTINED
+    assert readmitted['state'] == HEALTHY
+    assert readmitted['quarantine_count'] == 1
+    assert probes >= 2
+
+
+def test_failed_probe_doubles_quarantine(server):
+    server.set_ip_rule("127.0.0.3", {"mode": "429"})
+
+    async def scenario(pool, poller):
+        await poll_until_quarantined(pool, poller, "127.0.0.3")
+        await asyncio.sleep(0.25)
+        await poll(poller, 20)
+        return pool.stats_snapshot()["127.0.0.3"]
+
+    stats = run_with_pool(server, scenario, rate_per_second=1000, burst=1000,
+                          max_consecutive_failures=2, quarantine_seconds=0.2)
+    assert stats['state'] == QUARANTINED
+    assert stats['quarantine_count'] == 2
+    assert stats['quarantine_remaining'] > 0.2
+    # 第一次隔离前 2 次 + 一次失败的探测
+    assert server.requests_by_ip["127.0.0.3"] == 3
+
+
+def test_token_bucket_limits_rate_per_ip(server):
+    ips = IPS[:2]
+
+    async def scenario(pool, poller):
+        start = time.monotonic()
+        await asyncio.gather(*(poller.check_single_member(MEMBERS[i % len(MEMBERS)]) for i in range(30)))
+        return time.monotonic() - start
+
+    elapsed = run_with_pool(server, scenario, ips=ips, rate_per_second=20, burst=2)
+    # 2 个 IP 各 20 次/秒、桶容量 2：30 个请求至少要 (30 - 4) / 40 秒
+    assert elapsed >= 0.6
+    assert sum(server.requests_by_ip[ip] for ip in ips) == 30
+
+
+def test_requests_continue_when_every_ip_is_quarantined(server):
+    server.set_ip_rule("127.0.0.2", {"mode": "429"})
+
+    async def scenario(pool, poller):
+        results = await asyncio.wait_for(poll(poller, 3), timeout=5)
+        return results, pool.stats_snapshot()["127.0.0.2"]
+
+    results, stats = run_with_pool(server, scenario, ips=IPS[:1], max_consecutive_failures=1,
+                                   quarantine_seconds=60)
+    assert results == [None, None, None]
+    assert server.requests_by_ip["127.0.0.2"] == 3
+    assert stats['quarantine_count'] == 3
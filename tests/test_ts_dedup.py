@@ -0,0 +1,135 @@
+"""
+ts_dedup.TSDeduplicator
+重点是断线重连边界：服务器会在新文件夹开头重放上一场最后几个片段
+"""
+
+import time
+import random
+import threading
+
+import pytest
+
+from ts_dedup import TSDeduplicator, Fingerprinter, MODE_HEAD, MODE_SPARSE
+
+
+def member_of(folder_name: str) -> str:
+    # 测试用文件夹名: 成员_场次序号
+    return folder_name.rsplit('_', 1)[0]
+
+
+@pytest.fixture(scope="module")
+def fragments():
+    rng = random.Random(16)
+    return [rng.randbytes(rng.randrange(300_000, 900_000)) for _ in range(8)]
+
+
+@pytest.fixture
+def write(tmp_path):
+    def _write(relative: str, data: bytes):
+        path = tmp_path / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return path
+    return _write
+
+
+@pytest.fixture(params=[MODE_HEAD, MODE_SPARSE])
+def dedup(request):
+    return TSDeduplicator(fingerprinter=Fingerprinter(request.param), member_of=member_of)
+
+
+def record_session(dedup, write, folder: str, data: list) -> list:
+    """按顺序录入一个文件夹的片段，返回每个片段是否被判为重复"""
+    return [dedup.check_and_add(write(f"{folder}/{n}.ts", d)) for n, d in enumerate(data)]
+
+
+def test_replayed_fragments_after_reconnect_are_dropped(dedup, write, fragments):
+    assert record_session(dedup, write, "haruna_1", fragments[:6]) == [False] * 6
+    # 重连后的新文件夹：开头重放 4、5，再接新片段 6、7
+    replay = [fragments[4], fragments[5], fragments[6], fragments[7]]
+    assert record_session(dedup, write, "haruna_2", replay) == [True, True, False, False]
+    assert dedup.stats['duplicates'] == 2
+
+
+def test_replay_is_caught_across_several_reconnects(dedup, write, fragments):
+    record_session(dedup, write, "haruna_1", fragments[:3])
+    record_session(dedup, write, "haruna_2", fragments[2:5])
+    # 第三个文件夹重放的是第一场的片段，也要拦截
+    assert record_session(dedup, write, "haruna_3", [fragments[1], fragments[5]]) == [True, False]
+
+
+def test_same_bytes_for_another_member_are_kept(dedup, write, fragments):
+    record_session(dedup, write, "haruna_1", fragments[:3])
+    assert record_session(dedup, write, "other_1", fragments[:3]) == [False] * 3
+
+
+def test_truncated_replay_is_not_a_duplicate(dedup, write, fragments):
+    record_session(dedup, write, "haruna_1", fragments[:1])
+    # 断线时写了一半的片段大小不同，必须保留
+    assert not dedup.check_and_add(write("haruna_2/0.ts", fragments[0][:-1000]))
+
+
+def test_cached_fingerprint_is_reused_and_stale_formats_ignored(dedup, write, fragments):
+    path = write("haruna_1/0.ts", fragments[0])
+    fingerprint = dedup.compute_fingerprint(path)
+    assert not dedup.check_and_add(path, fingerprint)
+    assert dedup.check_and_add(write("haruna_2/0.ts", fragments[0]), fingerprint)
+    # 旧版本的 md5_size 指纹与格式错误的指纹不可信，重新读文件计算
+    assert dedup.check_and_add(write("haruna_3/0.ts", fragments[0]), "d41d8cd98f00b204e9800998ecf8427e_123")
+    assert not dedup.check_and_add(write("haruna_4/1.ts", fragments[1]), "0" * 50)
+
+
+def test_sparse_mode_separates_fragments_differing_only_at_the_end(write):
+    body = random.Random(3).randbytes(800_000)
+    a = write("haruna_1/0.ts", body + b"A" * 1000)
+    b = write("haruna_2/0.ts", body + b"B" * 1000)
+    sparse = TSDeduplicator(fingerprinter=Fingerprinter(MODE_SPARSE), member_of=member_of)
+    assert not sparse.check_and_add(a)
+    assert not sparse.check_and_add(b)
+
+
+def test_sparse_mode_reads_less_than_head_mode(write, fragments):
+    paths = [write(f"haruna_1/{i}.ts", d) for i, d in enumerate(fragments)]
+    head, sparse = Fingerprinter(MODE_HEAD), Fingerprinter(MODE_SPARSE)
+    for p in paths:
+        head.compute(p)
+        sparse.compute(p)
+    assert sparse.stats['bytes_read'] < head.stats['bytes_read']
+
+
+def test_replay_after_ttl_is_accepted_again(write, fragments):
+    dedup = TSDeduplicator(ttl=0.05, member_of=member_of)
+    record_session(dedup, write, "haruna_1", fragments[:2])
+    time.sleep(0.06)
+    assert record_session(dedup, write, "haruna_2", fragments[:2]) == [False, False]
+    assert dedup.stats['expired'] >= 1
+
+
+def test_member_limit_evicts_oldest(write, fragments):
+    dedup = TSDeduplicator(max_per_member=3, member_of=member_of)
+    record_session(dedup, write, "haruna_1", fragments[:5])
+    assert len(dedup) == 3
+    assert dedup.stats['evicted'] == 2
+    # 最老的两个已被淘汰，最近的仍能拦截
+    assert record_session(dedup, write, "haruna_2", [fragments[0], fragments[4]]) == [False, True]
+
+
+def test_concurrent_replays_pass_each_fragment_once(write, fragments):
+    # 8 个重连文件夹内容相同，每个线程提交一个文件夹，同一片段在线程间竞争
+    dedup = TSDeduplicator(member_of=member_of)
+    copies = [write(f"haruna_{t}/{i}.ts", fragments[i]) for t in range(8) for i in range(8)]
+    passed = []
+    lock = threading.Lock()
+
+    def worker(paths):
+        for p in paths:
+            if not dedup.check_and_add(p):
+                with lock:
+                    passed.append(p.name)
+
+    threads = [threading.Thread(target=worker, args=(copies[t * 8:(t + 1) * 8],)) for t in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(passed) == sorted(f"{i}.ts" for i in range(8))
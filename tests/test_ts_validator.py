@@ -0,0 +1,119 @@
+"""
+ts_validator.validate_ts
+合成片段由 bench_ts_validator.py 的生成器构造；装了 ffprobe 时再对照 ffprobe 的结论
+"""
+
+import random
+import shutil
+
+import pytest
+
+from bench_ts_validator import KINDS, make_fragment, corrupt, ffprobe_verdict
+from ts_validator import validate_ts, VALID, INVALID, AMBIGUOUS, TS_PACKET_SIZE
+
+
+@pytest.fixture
+def rng():
+    return random.Random(48)
+
+
+@pytest.fixture
+def fragment(tmp_path):
+    def _fragment(data: bytes, name: str = "0.ts"):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return path
+    return _fragment
+
+
+def test_audio_and_video_with_payload_is_valid(rng, fragment):
+    result = validate_ts(fragment(make_fragment(rng)))
+    assert result['verdict'] == VALID
+    assert [s['codec'] for s in result['video']] == ['h264']
+    assert [s['codec'] for s in result['audio']] == ['aac']
+
+
+@pytest.mark.parametrize("width, height", [(1280, 720), (1920, 1080), (854, 480)])
+def test_details_read_resolution_from_sps(rng, fragment, width, height):
+    result = validate_ts(fragment(make_fragment(rng, width=width, height=height)), details=True)
+    assert (result['width'], result['height']) == (width, height)
+
+
+def test_details_read_pts_range(rng, fragment):
+    result = validate_ts(fragment(make_fragment(rng, seconds=2.0)), details=True)
+    # 生成器的首个 PTS 是 1.4 秒 (126000)，片段约 2 秒
+    assert result['pts_start'] == 126000
+    assert 1.9 * 90000 <= result['pts_end'] - result['pts_start'] <= 2.0 * 90000
+
+
+def test_details_are_skipped_by_default(rng, fragment):
+    result = validate_ts(fragment(make_fragment(rng)))
+    assert result['width'] is None
+    assert result['pts_start'] is None
+
+
+@pytest.mark.parametrize("kwargs, reason", [
+    ({'video': False}, 'no_video'),
+    ({'audio': False}, 'no_audio'),
+    ({'audio_payload': False}, 'no_audio_payload'),
+])
+def test_missing_stream_is_invalid(rng, fragment, kwargs, reason):
+    result = validate_ts(fragment(make_fragment(rng, **kwargs)))
+    assert result['verdict'] == INVALID
+    assert result['reason'] == reason
+
+
+def test_private_audio_stream_falls_back_to_ffprobe(rng, fragment):
+    # stream_type 0x06 可能是 Opus / AC-3，进程内无法判断
+    assert validate_ts(fragment(make_fragment(rng, audio_type=0x06)))['verdict'] == AMBIGUOUS
+
+
+def test_missing_pat_falls_back_to_ffprobe(rng, fragment):
+    data = make_fragment(rng)
+    # 去掉开头的 PAT 包
+    assert validate_ts(fragment(data[TS_PACKET_SIZE:]))['verdict'] == AMBIGUOUS
+
+
+def test_leading_junk_before_sync_is_skipped(rng, fragment):
+    assert validate_ts(fragment(b"\x00" * 100 + make_fragment(rng)))['verdict'] == VALID
+
+
+@pytest.mark.parametrize("data, reason", [
+    (b"", 'too_small'),
+    (b"\x47" * 100, 'too_small'),
+    (bytes(200_000), 'no_sync'),
+])
+def test_non_ts_data_is_invalid(fragment, data, reason):
+    result = validate_ts(fragment(data))
+    assert result['verdict'] == INVALID
+    assert result['reason'] == reason
+
+
+def test_truncated_before_any_payload_is_invalid(rng, fragment):
+    # 只剩 PAT / PMT 两个包
+    result = validate_ts(fragment(make_fragment(rng)[:TS_PACKET_SIZE * 2]))
+    assert result['verdict'] == INVALID
+    assert result['reason'] == 'no_video_payload'
+
+
+def test_corrupted_fragment_does_not_raise(rng, fragment):
+    for i in range(20):
+        result = validate_ts(fragment(corrupt(rng, make_fragment(rng)), f"{i}.ts"))
+        assert result['verdict'] in (VALID, INVALID, AMBIGUOUS)
+
+
+def test_unreadable_file_falls_back_to_ffprobe(tmp_path):
+    result = validate_ts(tmp_path / "missing.ts")
+    assert result['verdict'] == AMBIGUOUS
+    assert result['reason'].startswith('read_error')
+
+
+@pytest.mark.skipif(shutil.which("ffprobe") is None, reason="需要 ffprobe")
+# 随机损坏的片段两边都可能给出任一结论，一致率由 bench_ts_validator.py 统计
+@pytest.mark.parametrize("kind", sorted(set(KINDS) - {'corrupted'}))
+def test_agrees_with_ffprobe(rng, fragment, kind):
+    for i in range(3):
+        path = fragment(KINDS[kind](rng), f"{kind}_{i}.ts")
+        verdict = validate_ts(path)['verdict']
+        if verdict != AMBIGUOUS:
+            assert verdict == ffprobe_verdict(path)